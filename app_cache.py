@@ -0,0 +1,149 @@
+"""On-disk cache shared by the converter tools (analysis data, stats files).
+
+Cached entries are keyed by file_key(), a cheap identity for media files:
+size, mtime and a fixed number of sampled blocks (head, tail and evenly
+strided in between), so keying a multi-GB file reads about 1 MB. Set
+FFMPEG_TOOLS_FULL_HASH=1 to key by a full content hash instead, e.g. to
+verify that the sampled keys are not colliding for a workload.
+
+    python app_cache.py bench FILE...   # partial vs full hashing cost
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+
+CACHE_ROOT = os.environ.get(
+    "FFMPEG_TOOLS_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+
+
+def cache_dir(*parts):
+    """Returns (and creates) a directory under the cache root."""
+    path = os.path.join(CACHE_ROOT, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+BLOCK_SIZE = 64 * 1024
+SAMPLE_BLOCKS = 16  # head + tail + 14 strided blocks
+FULL_HASH = os.environ.get("FFMPEG_TOOLS_FULL_HASH", "") not in ("", "0")
+
+
+def full_hash(path, chunk_size=1024 * 1024):
+    """Returns the SHA-1 of the whole file."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _sample_offsets(size):
+    last = size - BLOCK_SIZE
+    return sorted({last * i // (SAMPLE_BLOCKS - 1) for i in range(SAMPLE_BLOCKS)})
+
+
+def partial_hash(path):
+    """Returns a hash of size, mtime and SAMPLE_BLOCKS sampled blocks (the whole file if small)."""
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode("ascii"))
+    if stat.st_size <= BLOCK_SIZE * SAMPLE_BLOCKS:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+    offsets = _sample_offsets(stat.st_size)
+    if hasattr(os, "pread"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            for offset in offsets:
+                digest.update(os.pread(fd, BLOCK_SIZE, offset))
+        finally:
+            os.close(fd)
+    else:
+        import mmap  # No pread on Windows
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for offset in offsets:
+                digest.update(view[offset:offset + BLOCK_SIZE])
+    return digest.hexdigest()
+
+
+def file_key(path, full=None):
+    """Returns a key identifying a media file's content (sampled unless full/FULL_HASH)."""
+    if full if full is not None else FULL_HASH:
+        return "f" + full_hash(path)
+    return "p" + partial_hash(path)
+
+
+def benchmark(paths, repeat=3):
+    """Times partial vs full hashing per file; returns [(path, size, partial_s, full_s)]."""
+    results = []
+    for path in paths:
+        timings = []
+        for func in (partial_hash, full_hash):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func(path)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append(best)
+        results.append((path, os.path.getsize(path), timings[0], timings[1]))
+    return results
+
+
+def load_json(path, default=None):
+    """Loads a JSON cache file, returning default if missing or corrupt."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return default
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Holds an exclusive lock on the file at path (created if missing), across processes."""
+    with open(path, "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after about 10 s
+                    pass
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save_json(path, data):
+    """Writes a JSON cache file atomically."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "bench":
+        print("usage: python app_cache.py bench FILE...")
+        sys.exit(2)
+    # Warm runs; pass cold files (after dropping the page cache) to measure disk cost
+    for path, size, partial_s, full_s in benchmark(sys.argv[2:]):
+        ratio = full_s / partial_s if partial_s else float("inf")
+        print(f"{path}: {size / (1024 * 1024):.1f} MB  partial {partial_s * 1000:.2f} ms  "
+              f"full {full_s * 1000:.1f} ms  ({ratio:.0f}x)")
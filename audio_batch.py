@@ -0,0 +1,280 @@
+"""Batch audio re-compression for compress_audio.py.
+
+Each file's audio tracks are decoded and encoded to MP3 (CPU-bound) in a
+process pool sized to the cores; the final remux (stream copy, disk-bound)
+runs in a small thread pool of REMUX_WORKERS. Progress is read from
+ffmpeg's time= stats against each file's duration, per file and overall.
+
+With segment_long, tracks of SEGMENT_MIN_SECONDS or more are themselves
+split across the cores by segment_audio (MP3 without the bit reservoir).
+
+Files are started in eta order (shortest predicted first by default), and
+each finished file's encode and remux seconds go into the eta history.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import queue as queue_module
+import re
+import subprocess
+import tempfile
+import time
+
+import eta
+import ffmpeg_common
+import ffmpeg_metrics
+import governor
+import output_cache
+import output_sink
+import segment_audio
+import track_map
+from ffmpeg_command import FfmpegCommand
+
+ENCODE_WORKERS = os.cpu_count() or 1
+REMUX_WORKERS = int(os.environ.get("FFMPEG_TOOLS_REMUX_WORKERS", "2"))
+ENCODE_SHARE = 0.85  # Share of a file's progress spent encoding (the remux is a copy)
+SEGMENT_MIN_SECONDS = 2 * segment_audio.SEGMENT_SECONDS
+_TIME_RE = re.compile(r"time=\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def parse_time(text):
+    """Returns the last time= position in ffmpeg stats output in seconds, or None."""
+    matches = _TIME_RE.findall(text or "")
+    if not matches:
+        return None
+    hours, minutes, seconds = matches[-1]
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def encode_command(ffmpeg_path, in_file, track_index, out_file):
+    """Decodes one audio track straight to MP3 (44.1 kHz stereo, LAME VBR -q:a 2)."""
+    command = FfmpegCommand(ffmpeg_path, "-hide_banner", "-loglevel", "warning", "-stats", "-y")
+    source = command.add_input(in_file)
+    command.add_output(out_file, {
+        "-vn": None,
+        "-ar": "44100",
+        "-ac": "2",
+        "-sample_fmt": "s16p",  # Same samples LAME got from the old 16-bit WAV intermediate
+        "-acodec": "libmp3lame",
+        "-q:a": "2",
+    }).map(source, track_index)
+    return command
+
+
+def _run_traced(args, stage, duration, report=None, lease=None):
+    # Runs ffmpeg to completion, reporting 0..1 progress from its stats lines
+    process = ffmpeg_metrics.TracedPopen(
+        args,
+        stage=stage,
+        lease=lease,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        **ffmpeg_common.hidden_window_kwargs()
+    )
+    output = []
+    for line in iter(process.stdout.readline, ""):
+        output.append(line)
+        process.feed(line)
+        position = parse_time(line)
+        if report and position is not None and duration > 0:
+            report(min(1.0, position / duration))
+    process.stdout.close()
+    return_code = process.wait()
+    if return_code != 0:
+        raise subprocess.CalledProcessError(return_code, args, output="".join(output))
+
+
+def _encode_track(job):
+    # Runs in a worker process; progress goes back through the manager queue
+    command, segment, duration, priority, key, progress_queue = job
+    report = lambda fraction: progress_queue.put((key, fraction))
+    if segment:
+        ffmpeg_path, in_file, track_index, out_file = segment
+        # This already runs in one of the ENCODE_WORKERS processes: chunk threads come out of the lease
+        with governor.lease("segment_audio", priority) as budget:
+            segment_audio.encode_segmented(ffmpeg_path, in_file, track_index, out_file, "mp3",
+                                           workers=budget.threads or 1, progress=report, priority=priority)
+    else:
+        with governor.lease("compress_audio", priority) as budget:
+            started = time.monotonic()
+            _run_traced(budget.apply(command).build(), "compress_audio", duration, report, budget)
+            return key, time.monotonic() - started
+    return key, None  # Split encodes time their chunks in parallel: not a single-encode timing
+
+
+class FileJob:
+    """One input/output pair: its encode commands, remux command and progress."""
+
+    def __init__(self, in_file, out_file):
+        self.in_file = in_file
+        self.out_file = out_file
+        self.duration = 0.0
+        self.encodes = []
+        self.segments = []  # per encode: (ffmpeg, in_file, track, out_file) when split, else None
+        self.remux = None
+        self.cache_key = None
+        self.features = None
+        self.predicted = None
+        self.seconds = 0.0  # Encode time so far; None once a split encode makes it unrepresentative
+        self.encode_progress = []
+        self.remux_progress = 0.0
+        self.done = False
+        self.cached = False
+        self.error = None
+
+    def prepare(self, ffmpeg_path, work_dir, number, segment_long=False):
+        # Every stream, chapter and metadata is kept; each audio track is compressed
+        info = ffmpeg_common.probe(self.in_file)
+        self.duration = ffmpeg_common.probe_duration(self.in_file, info)
+        plan = track_map.TrackPlan(info)
+        segmented = segment_long and self.duration >= SEGMENT_MIN_SECONDS
+        for track_number, track in enumerate(plan.audio_tracks()):
+            temp_audio_mp3 = os.path.join(work_dir, f"audio_{number}_{track_number}.mp3")
+            self.encodes.append(encode_command(ffmpeg_path, self.in_file, track.index, temp_audio_mp3))
+            self.segments.append((ffmpeg_path, self.in_file, track.index, temp_audio_mp3) if segmented else None)
+            plan.replace(track, temp_audio_mp3, "copy")
+        self.encode_progress = [0.0] * len(self.encodes)
+
+        self.remux = FfmpegCommand(ffmpeg_path, "-hide_banner", "-loglevel", "warning", "-stats", "-y")
+        source = self.remux.add_input(self.in_file)
+        # Local file (faststart/fragmented MP4 layout) or fragmented MP4 on stdout for upload
+        output = output_sink.add_output(self.remux, self.out_file)
+        plan.apply(self.remux, source, output)
+        output.set("-shortest")
+        if not output_sink.is_remote(self.out_file):
+            # Split encodes differ from single-pass ones (no bit reservoir), so they key separately
+            extra = [{"segmented": segment_audio.CODECS["mp3"][1]}] if segmented else []
+            self.cache_key = output_cache.job_key([self.in_file], self.encodes + [self.remux] + extra)
+        # Audio work only: a video stream in the file is copied, so it is priced per media second
+        self.features = dict(eta.job_features("compress_audio", info, encoder="libmp3lame"), pixel_rate=0.0)
+        self.predicted = eta.predict(self.features)
+
+    def progress(self):
+        if self.done:
+            return 1.0
+        encoded = sum(self.encode_progress) / len(self.encode_progress) if self.encode_progress else 1.0
+        return ENCODE_SHARE * encoded + (1 - ENCODE_SHARE) * self.remux_progress
+
+    def fail(self, error):
+        if self.error is None:
+            if isinstance(error, subprocess.CalledProcessError):
+                self.error = f"ffmpeg failed (code {error.returncode}):\n{(error.output or '')[-500:]}"
+            else:
+                self.error = f"{type(error).__name__}: {error}"
+        self.done = True
+
+    def run_remux(self, priority=governor.INTERACTIVE):
+        def report(fraction):
+            self.remux_progress = fraction
+
+        def report_text(text):
+            position = parse_time(text)
+            if position is not None and self.duration > 0:
+                report(min(1.0, position / self.duration))
+
+        started = time.monotonic()
+        with governor.lease("replace_audio", priority) as budget:
+            budget.apply(self.remux)
+            if output_sink.is_remote(self.out_file):
+                # Stream straight to the upload endpoint
+                return_code, output = output_sink.run_to_sink(
+                    self.remux.build(), output_sink.open_sink(self.out_file), progress=report_text,
+                    stage="replace_audio", lease=budget)
+                if return_code != 0:
+                    raise subprocess.CalledProcessError(return_code, self.remux.build(), output=output)
+            else:
+                _run_traced(self.remux.build(), "replace_audio", self.duration, report, budget)
+        if not output_sink.is_remote(self.out_file):
+            output_cache.store(self.cache_key, self.out_file)
+            if self.seconds is not None:
+                eta.record(self.features, self.seconds + time.monotonic() - started)
+
+
+def overall_progress(jobs):
+    """Duration-weighted progress of a batch, 0..1."""
+    weights = [job.duration or 1.0 for job in jobs]
+    total = sum(weights)
+    return sum(w * job.progress() for w, job in zip(weights, jobs)) / total if total else 1.0
+
+
+def run_batch(items, ffmpeg_path="ffmpeg", progress=None, encode_workers=None, remux_workers=None,
+              segment_long=False, priority=None, order=eta.ORDER_SJF):
+    """Compresses the audio of every (in_file, out_file) pair; returns the FileJob list (in input order).
+
+    progress(jobs) is called from this thread whenever progress changes.
+    A failing file records its error and does not stop the others. Batches
+    of several files run at background priority unless priority is given.
+    Files are submitted in eta order (order is one of eta.ORDERS).
+    """
+    if order not in eta.ORDERS:
+        raise ValueError(f"Unknown order '{order}'. Expected one of: {', '.join(eta.ORDERS)}.")
+    jobs = [FileJob(in_file, out_file) for in_file, out_file in items]
+    if priority is None:
+        priority = governor.INTERACTIVE if len(jobs) == 1 else governor.BACKGROUND
+    with tempfile.TemporaryDirectory() as work_dir, multiprocessing.Manager() as manager:
+        progress_queue = manager.Queue()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=encode_workers or ENCODE_WORKERS) as encoders, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=remux_workers or REMUX_WORKERS) as remuxers:
+            pending = {}  # future -> (job number, track number or None for the remux)
+            remaining = {}
+
+            def start_remux(number):
+                pending[remuxers.submit(jobs[number].run_remux, priority)] = (number, None)
+
+            runnable = []
+            for number, job in enumerate(jobs):
+                try:
+                    job.prepare(ffmpeg_path, work_dir, number, segment_long)
+                except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                    job.fail(e)
+                    continue
+                # Same input, plan and ffmpeg version as an earlier run: reuse its output
+                if job.cache_key and output_cache.fetch(job.cache_key, job.out_file):
+                    job.done = job.cached = True
+                    continue
+                runnable.append(number)
+
+            # The pools take work in submission order
+            for number in eta.order(runnable, order, key=lambda number: {"predicted": jobs[number].predicted}):
+                job = jobs[number]
+                remaining[number] = len(job.encodes)
+                for track_number, command in enumerate(job.encodes):
+                    job_args = (command, job.segments[track_number], job.duration, priority,
+                                (number, track_number), progress_queue)
+                    pending[encoders.submit(_encode_track, job_args)] = (number, track_number)
+                if not job.encodes:
+                    start_remux(number)
+            if progress:
+                progress(jobs)
+
+            while pending:
+                done, _ = concurrent.futures.wait(pending, timeout=0.25, return_when=concurrent.futures.FIRST_COMPLETED)
+                while True:
+                    try:
+                        (number, track_number), fraction = progress_queue.get_nowait()
+                    except queue_module.Empty:
+                        break
+                    jobs[number].encode_progress[track_number] = fraction
+                for future in done:
+                    number, track_number = pending.pop(future)
+                    job = jobs[number]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        job.fail(e)
+                        continue
+                    if track_number is not None:
+                        job.seconds = None if result[1] is None or job.seconds is None else job.seconds + result[1]
+                    if track_number is None:
+                        job.done = True
+                    elif not job.done:
+                        job.encode_progress[track_number] = 1.0
+                        remaining[number] -= 1
+                        if remaining[number] == 0:
+                            start_remux(number)
+                if progress:
+                    progress(jobs)
+    return jobs
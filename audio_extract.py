@@ -0,0 +1,86 @@
+"""Single-decode extraction of one audio track to several formats at once.
+
+ffmpeg decodes an input stream once and feeds every output that maps it,
+so WAV for editing, MP3 for distribution, AAC and FLAC can all come out of
+one pass instead of one full decode each:
+
+    audio_extract.extract("ffmpeg", "talk.mp4", [("talk.wav", "wav"), ("talk.mp3", "mp3")])
+
+Each output keeps its own settings (FORMATS, plus per-output overrides).
+How much decode time that saves depends on the decode's share of each run,
+so it is only reported where it is measured: bench times both ways.
+
+    python audio_extract.py bench INPUT [FORMAT ...]   # one pass vs one run per format
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import ffmpeg_common
+from ffmpeg_command import FfmpegCommand
+
+# name -> (extension, output options); the settings the tools use for each
+FORMATS = {
+    "wav": (".wav", {"-acodec": "pcm_s16le", "-ar": "44100", "-ac": "2"}),  # FfmpegApp.extract_audio
+    "mp3": (".mp3", {"-acodec": "libmp3lame", "-q:a": "2", "-ar": "44100", "-ac": "2"}),  # run_compression
+    "aac": (".m4a", {"-acodec": "aac", "-q:a": "2"}),  # select_audio_and_merge
+    "flac": (".flac", {"-acodec": "flac", "-compression_level": "5"}),
+}
+
+
+def output_path(in_file, fmt, directory=None):
+    """Default output name for a format: <input name>_audio.<ext> next to the input."""
+    base = os.path.splitext(os.path.basename(in_file))[0]
+    return os.path.join(directory or os.path.dirname(in_file), f"{base}_audio{FORMATS[fmt][0]}")
+
+
+def extract_command(ffmpeg_path, in_file, outputs, stream="a:0"):
+    """One command writing every (path, format[, option overrides]) output from a single decode."""
+    if not outputs:
+        raise ValueError("No outputs to extract.")
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    source = command.add_input(in_file)
+    for item in outputs:
+        path, fmt = item[0], item[1]
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown audio format '{fmt}'. Expected one of {', '.join(FORMATS)}.")
+        output = command.add_output(path, {"-vn": None})
+        output.map(source, stream)
+        output.update(FORMATS[fmt][1])
+        if len(item) > 2 and item[2]:
+            output.update(item[2])
+    return command
+
+
+def extract(ffmpeg_path, in_file, outputs, stream="a:0"):
+    """Runs the single-pass extraction; returns {"seconds"}, its wall-clock time."""
+    command = extract_command(ffmpeg_path, in_file, outputs, stream)
+    started = time.monotonic()
+    ffmpeg_common.run_command(command.build(), stage="extract_audio")
+    return {"seconds": time.monotonic() - started}
+
+
+def benchmark(ffmpeg_path, in_file, formats=("wav", "mp3", "aac", "flac"), stream="a:0"):
+    """Returns (separate_seconds, single_pass_seconds) for extracting formats from in_file."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        outputs = [(output_path(in_file, fmt, work_dir), fmt) for fmt in formats]
+        started = time.monotonic()
+        for item in outputs:
+            ffmpeg_common.run_command(extract_command(ffmpeg_path, in_file, [item], stream).build(), stage="extract_audio")
+        separate = time.monotonic() - started
+        started = time.monotonic()
+        ffmpeg_common.run_command(extract_command(ffmpeg_path, in_file, outputs, stream).build(), stage="extract_audio")
+        return separate, time.monotonic() - started
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "bench":
+        print("usage: python audio_extract.py bench INPUT [FORMAT ...]")
+        sys.exit(2)
+    chosen = sys.argv[3:] or list(FORMATS)
+    separate, single = benchmark(shutil.which("ffmpeg") or "ffmpeg", sys.argv[2], chosen)
+    print(f"{', '.join(chosen)}:")
+    print(f"  one run per format: {separate:.2f}s")
+    print(f"  single decode:      {single:.2f}s ({separate - single:.2f}s saved)")
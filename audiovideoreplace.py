@@ -4,10 +4,20 @@ from tkinter import filedialog, messagebox
 import os
 import json
 
+import av_sync
+import engine
+import ffmpeg_common
+import ffmpeg_metrics
+import output_mux
+import track_map
+from ffmpeg_command import FfmpegCommand
+
 # Define constants for frequently used filenames
 CODEC_INFO_FILENAME = "codec_info.json"
 EXTRACTED_AUDIO_WAV = "extracted_audio.wav"
-CONVERTED_AUDIO_AAC = "converted_audio.aac"
+
+# Set by build_gui: whether to auto-correct the replacement audio's sync
+auto_sync_var = None
 
 # --- Function to load codec info ---
 def _load_codec_info():
@@ -53,43 +63,30 @@ def select_video_and_get_info(): # Renamed function for clarity
 
     try:
         # Remove audio extraction from this step
-        # --- Get video codec info ---
-        ffprobe_codec_command = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=codec_name",
-            "-of", "default=nw=1:nk=1",
-            video_path,
-        ]
-        codec_name = subprocess.check_output(ffprobe_codec_command).strip().decode("utf-8")
+        # --- One probe (header parse for MP4/MKV, ffprobe otherwise) ---
+        probe_info = ffmpeg_common.probe(video_path)
+        video_stream = ffmpeg_common.first_stream(probe_info, "video") or {}
+        codec_name = video_stream.get("codec_name", "")
 
         # --- Get container format info ---
-        ffprobe_format_command = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "format=format_name",
-            "-of", "default=nk=1:nw=1",
-            "-i", video_path,
-        ]
-        format_names = subprocess.check_output(ffprobe_format_command).strip().decode("utf-8").split(',')
-        format_name = format_names[0]
+        format_name = probe_info.get("format", {}).get("format_name", "").split(',')[0]
 
         # --- Get start time (potential delay) ---
-        ffprobe_delay_command = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "format=start_time",
-            "-of", "default=nk=1:nw=1",
-            "-i", video_path,
-        ]
-        start_time_str = subprocess.check_output(ffprobe_delay_command).strip().decode("utf-8")
+        start_time_str = probe_info.get("format", {}).get("start_time", "")
         start_time = 0.0
         try:
             start_time = float(start_time_str)
         except ValueError:
             print(f"Warning: Could not parse start_time '{start_time_str}'. Defaulting to 0.0.")
 
+        # --- Get audio start time (audio delay relative to the container start) ---
+        audio_stream = ffmpeg_common.first_stream(probe_info, "audio") or {}
+        audio_start_offset = 0.0
+        try:
+            audio_start_offset = float(audio_stream.get("start_time", "")) - start_time
+        except ValueError:
+            pass # No audio stream or no start time
+
 
         info = {
             "video_path": video_path,
@@ -97,6 +94,7 @@ def select_video_and_get_info(): # Renamed function for clarity
             "codec_name": codec_name,
             "format_name": format_name,
             "start_time": start_time,
+            "audio_start_offset": audio_start_offset,
         }
 
         # Save codec information
@@ -105,7 +103,7 @@ def select_video_and_get_info(): # Renamed function for clarity
                 "Success", f"Video selected and codec information saved to {CODEC_INFO_FILENAME}." # Updated message
             )
     except subprocess.CalledProcessError as e:
-        error_message = f"Failed get video info.\nFFprobe Error:\n{e.stderr.decode() if e.stderr else str(e)}" # Updated message
+        error_message = f"Failed get video info.\nFFprobe Error:\n{e.stderr or str(e)}" # Updated message
         messagebox.showerror("Error", error_message)
     except Exception as e:
         messagebox.showerror("Error", f"An unexpected error occurred: {e}")
@@ -124,18 +122,9 @@ def extract_audio_from_video(): # New function for audio extraction
     audio_path_wav = os.path.join(app_work_dir, EXTRACTED_AUDIO_WAV) # Define extraction target
 
     try:
-        # Perform audio extraction using loaded video path
-        extract_command = [
-            "ffmpeg",
-            "-i", video_path,
-            "-vn",                # Disable video recording
-            "-acodec", "pcm_s16le", # Use signed 16-bit little-endian PCM for quality WAV
-            "-ar", "44100",       # Standard sample rate
-            "-ac", "2",           # Stereo audio channels
-            audio_path_wav,
-            '-y',                 # Overwrite output file without asking
-        ]
-        subprocess.run(extract_command, check=True, capture_output=True) # Capture output, check errors
+        # Perform audio extraction using loaded video path: 16-bit PCM WAV, 44.1 kHz stereo,
+        # through the configured engine (ffmpeg CLI or PyAV)
+        engine.get(ffmpeg_path="ffmpeg").extract_audio(video_path, audio_path_wav, "wav")
 
         # Update info dictionary with the path of the extracted audio
         info["audio_path_wav"] = audio_path_wav
@@ -145,21 +134,20 @@ def extract_audio_from_video(): # New function for audio extraction
              messagebox.showinfo("Success", f"Audio extracted to {EXTRACTED_AUDIO_WAV} and info updated.")
 
     except subprocess.CalledProcessError as e:
-        error_message = f"Failed to extract audio.\nFFmpeg Error:\n{e.stderr.decode() if e.stderr else str(e)}"
+        error_message = f"Failed to extract audio.\nFFmpeg Error:\n{e.output or str(e)}"
         messagebox.showerror("Error", error_message)
     except Exception as e:
         messagebox.showerror("Error", f"An unexpected error occurred during audio extraction: {e}")
 
 
 def select_audio_and_merge(): # Renamed function for clarity
-    # Prompt user for the (potentially edited) WAV file
-    audio_path_wav_input = filedialog.askopenfilename(filetypes=[("Audio files", "*.wav")]) # Keep prompting for edited wav
-    if not audio_path_wav_input:
+    # Prompt user for the (potentially edited) WAV file(s), one per audio track to replace
+    audio_paths_wav_input = filedialog.askopenfilenames(filetypes=[("Audio files", "*.wav")]) # Keep prompting for edited wav
+    if not audio_paths_wav_input:
         return
 
     app_work_dir = os.getcwd()
     # codec_info_path = os.path.join(app_work_dir, CODEC_INFO_FILENAME) # Path generation moved to helper
-    converted_audio_path = os.path.join(app_work_dir, CONVERTED_AUDIO_AAC)
 
     info, codec_info_path = _load_codec_info() # Load existing info
     if info is None:
@@ -172,18 +160,25 @@ def select_audio_and_merge(): # Renamed function for clarity
     # Note: We ignore info.get("audio_path_wav") as the user provides the potentially edited WAV
 
     try:
-        # Convert the SELECTED WAV (not necessarily the originally extracted one) to high-quality AAC
-        convert_aac_command = [
-            "ffmpeg",
-            "-i", audio_path_wav_input, # Use the user-selected WAV file
-            "-c:a", "aac",      # Specify AAC codec
-            "-q:a", "2",        # High quality VBR setting
-            converted_audio_path,
-            "-y",               # Overwrite output file without asking
-        ]
-        subprocess.run(convert_aac_command, check=True, capture_output=True) # Capture output, check errors
+        # Keep every other stream, chapters and metadata; each selected WAV replaces one audio
+        # track (by language suffix like _eng.wav, otherwise in track order) as high-quality AAC
+        plan = track_map.TrackPlan(ffmpeg_common.probe(video_path))
+        replaced = plan.replace_audio_files(audio_paths_wav_input, "aac", {"q": "2"})
+
+        # Measure each SELECTED WAV's offset/drift against the original track it replaces
+        synced = []
+        if auto_sync_var is not None and auto_sync_var.get():
+            try:
+                for track in replaced:
+                    if track.index is None:
+                        continue
+                    track.filters, sync = av_sync.sync_filters(
+                        "ffmpeg", video_path, track.source, base_delay=track.start_offset,
+                        reference_stream=str(track.index))
+                    synced.append(f"Track {track.index}: offset {sync['offset']:+.4f}s, drift {sync['drift'] * 1e6:+.1f} ppm")
+            except (RuntimeError, ValueError, subprocess.CalledProcessError) as e:  # ValueError: unreadable probe
+                messagebox.showwarning("Auto-sync skipped", str(e))
 
-        # --- Merging logic remains the same ---
         extension_mapping = {
             "mp4": "mp4", "mov": "mov", "mkv": "mkv", "flv": "flv",
             "avi": "avi", "webm": "mkv", "wmv": "wmv", "mpegts": "ts",
@@ -197,28 +192,20 @@ def select_audio_and_merge(): # Renamed function for clarity
         )
         final_video_path = os.path.join(app_work_dir, final_video_name)
 
-        merge_command = [
-            "ffmpeg",
-            "-i", video_path,
-            "-i", converted_audio_path,
-            "-c:v", "copy",
-            "-c:a", "copy",
-            "-map", "0:v:0",
-            "-map", "1:a:0",
-            "-shortest",
-            "-y",
-            final_video_path,
-        ]
-        # Optional start_time offset logic (remains same)
-        # if info.get("start_time", 0.0) != 0.0:
-        #     merge_command.insert(4, "-itsoffset")
-        #     merge_command.insert(5, str(info["start_time"]))
+        # Single pass: copy video and untouched tracks, encode the WAVs with sync correction
+        merge_command = FfmpegCommand("ffmpeg", "-y")
+        video_input = merge_command.add_input(video_path)
+        merge_output = merge_command.add_output(final_video_path)
+        plan.apply(merge_command, video_input, merge_output) # the user-selected WAV files become inputs 1..n
+        merge_output.set("-shortest")
+        output_mux.apply(merge_output)
 
-        subprocess.run(merge_command, check=True, capture_output=True) # Capture output, check errors
+        ffmpeg_metrics.run(merge_command.build(), stage="merge_audio", check=True, capture_output=True) # Capture output, check errors
 
         messagebox.showinfo(
             "Success",
-            f"High-quality audio re-encoded and merged.\nFinal video saved as: {final_video_path}",
+            f"High-quality audio re-encoded and merged.\nFinal video saved as: {final_video_path}"
+            + ("\n\nAuto-sync:\n" + "\n".join(synced) if synced else ""),
         )
     # Error handling remains largely the same, adjusted message for JSON loading
     except (json.JSONDecodeError, FileNotFoundError) as e:
@@ -231,20 +218,31 @@ def select_audio_and_merge(): # Renamed function for clarity
 
 
 # --- GUI Setup ---
-root = tk.Tk()
-root.title("FFmpeg Audio/Video Processor")
-root.geometry("350x200") # Adjusted height for the extra button
-
-# Button 1: Select Video and Get Info
-select_video_info_btn = tk.Button(root, text="1. Select Video & Get Info", command=select_video_and_get_info) # Updated command
-select_video_info_btn.pack(pady=5, padx=10, fill=tk.X) # Adjusted padding
-
-# Button 2: Extract Audio
-extract_audio_btn = tk.Button(root, text="2. Extract Audio (WAV)", command=extract_audio_from_video) # New button
-extract_audio_btn.pack(pady=5, padx=10, fill=tk.X) # Adjusted padding
-
-# Button 3: Select Edited Audio and Merge
-select_merge_audio_btn = tk.Button(root, text="3. Select Edited WAV & Merge", command=select_audio_and_merge) # Updated command and text
-select_merge_audio_btn.pack(pady=5, padx=10, fill=tk.X) # Adjusted padding
-
-root.mainloop()
+def build_gui(root):
+    root.title("FFmpeg Audio/Video Processor")
+    root.geometry("350x230") # Adjusted height for the extra controls
+
+    # Button 1: Select Video and Get Info
+    select_video_info_btn = tk.Button(root, text="1. Select Video & Get Info", command=select_video_and_get_info) # Updated command
+    select_video_info_btn.pack(pady=5, padx=10, fill=tk.X) # Adjusted padding
+
+    # Button 2: Extract Audio
+    extract_audio_btn = tk.Button(root, text="2. Extract Audio (WAV)", command=extract_audio_from_video) # New button
+    extract_audio_btn.pack(pady=5, padx=10, fill=tk.X) # Adjusted padding
+
+    # Button 3: Select Edited Audio and Merge
+    select_merge_audio_btn = tk.Button(root, text="3. Select Edited WAV & Merge", command=select_audio_and_merge) # Updated command and text
+    select_merge_audio_btn.pack(pady=5, padx=10, fill=tk.X) # Adjusted padding
+
+    # Auto-sync toggle for step 3
+    global auto_sync_var
+    auto_sync_var = tk.BooleanVar(master=root, value=True)
+    tk.Checkbutton(root, text="Auto-sync edited audio to original", variable=auto_sync_var).pack(pady=2)
+    return root
+
+
+if __name__ == "__main__":
+    ffmpeg_metrics.serve_from_env()
+    root = tk.Tk()
+    build_gui(root)
+    root.mainloop()
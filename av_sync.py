@@ -0,0 +1,131 @@
+"""Automatic A/V sync: measure a replacement track's offset and drift against the original audio.
+
+Both tracks are decoded as mono PCM downsampled to ANALYSIS_RATE (through
+the configured engine: an ffmpeg pipe, or PyAV in process) and cross-correlated with NumPy FFTs. Offset is measured on a
+window at the start and, for long tracks, again near the end to derive a
+linear drift. The result is cached per (video, replacement) content pair and
+turned into audio filters applied in the single merge pass.
+
+NumPy is optional; measure() raises RuntimeError when it is not installed,
+and SyncError (a RuntimeError) when a window is too short, silent, or its
+correlation peak is below MIN_CONFIDENCE.
+"""
+import os
+
+import app_cache
+import engine
+import ffmpeg_common
+
+ANALYSIS_RATE = 8000
+WINDOW_SECONDS = 90.0
+MAX_LAG_SECONDS = 10.0
+MIN_DRIFT = 2e-5  # Ignore drift below 20 ppm (~0.07 s per hour)
+MIN_SECONDS = 1.0  # Shortest window worth correlating
+MIN_CONFIDENCE = 0.1  # Normalized correlation peak; unrelated audio stays near 0.01
+
+
+class SyncError(RuntimeError):
+    """Raised when the tracks cannot be aligned (too short, silent, or no clear match)."""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Automatic sync needs NumPy (pip install numpy).")
+    return numpy
+
+
+def _read_pcm(ffmpeg_path, path, start, seconds, stream="a:0"):
+    # Decoded, downmixed and resampled straight into memory
+    _numpy()
+    samples = engine.get(ffmpeg_path=ffmpeg_path).read_audio(path, start, seconds, ANALYSIS_RATE, 1, stream)[:, 0]
+    return samples - samples.mean() if samples.size else samples
+
+
+def _lag_seconds(reference, other, max_lag_seconds=MAX_LAG_SECONDS):
+    """Returns (seconds, confidence): how much later `other` carries the content of `reference`
+    (negative: earlier) and the peak's normalized correlation (0..1)."""
+    np = _numpy()
+    if min(len(reference), len(other)) < MIN_SECONDS * ANALYSIS_RATE:
+        raise SyncError(f"Less than {MIN_SECONDS:g}s of audio to compare.")
+    energy = float(np.sqrt(np.dot(reference, reference) * np.dot(other, other)))
+    if energy == 0:
+        raise SyncError("One of the tracks is silent.")
+    size = 1 << int(np.ceil(np.log2(len(reference) + len(other))))
+    corr = np.fft.irfft(np.fft.rfft(reference, size) * np.conj(np.fft.rfft(other, size)), size)
+    max_lag = int(max_lag_seconds * ANALYSIS_RATE)
+    # corr[k] = sum(reference[n + k] * other[n]); negative lags wrap to the end
+    lags = np.concatenate((np.arange(0, max_lag + 1), np.arange(-max_lag, 0)))
+    window = np.concatenate((corr[:max_lag + 1], corr[-max_lag:]))
+    peak = int(np.argmax(window))
+    confidence = float(window[peak]) / energy
+    if confidence < MIN_CONFIDENCE:
+        raise SyncError(f"No clear match between the tracks (confidence {confidence:.2f}).")
+    lag = float(lags[peak])
+    # Parabolic interpolation for sub-sample precision
+    if 0 < peak < len(window) - 1:
+        left, centre, right = window[peak - 1], window[peak], window[peak + 1]
+        denom = left - 2 * centre + right
+        if denom != 0:
+            lag += 0.5 * (left - right) / denom
+    return float(-lag / ANALYSIS_RATE), confidence  # NumPy 2 keeps float32 through the FFT
+
+
+def _cache_path(video_path, audio_path, reference_stream):
+    key = f"{app_cache.file_key(video_path)}_{reference_stream.replace(':', '-')}_{app_cache.file_key(audio_path)}"
+    return os.path.join(app_cache.cache_dir("av_sync"), f"{key}.json")
+
+
+def measure(ffmpeg_path, video_path, audio_path, reference_stream="a:0"):
+    """Returns {'offset': seconds, 'drift': ratio, 'confidence'} of audio_path relative to video_path's audio.
+
+    reference_stream selects the original track to align to (e.g. "a:1" or
+    an absolute stream index when several language tracks are replaced).
+
+    offset > 0 means the replacement starts late (its head is trimmed);
+    drift > 0 means it runs progressively later (it is sped up).
+    """
+    cache_path = _cache_path(video_path, audio_path, str(reference_stream))
+    cached = app_cache.load_json(cache_path)
+    if cached:
+        return cached
+
+    duration = ffmpeg_common.probe_duration(audio_path)
+    window = min(WINDOW_SECONDS, duration) if duration > 0 else WINDOW_SECONDS
+    start_offset, confidence = _lag_seconds(_read_pcm(ffmpeg_path, video_path, 0.0, window, reference_stream),
+                                _read_pcm(ffmpeg_path, audio_path, 0.0, window))
+    drift = 0.0
+    tail_start = duration - WINDOW_SECONDS - MAX_LAG_SECONDS
+    if tail_start > 3 * WINDOW_SECONDS:
+        end_offset, _ = _lag_seconds(_read_pcm(ffmpeg_path, video_path, tail_start, WINDOW_SECONDS, reference_stream),
+                                  _read_pcm(ffmpeg_path, audio_path, tail_start, WINDOW_SECONDS))
+        drift = (end_offset - start_offset) / tail_start
+        if abs(drift) < MIN_DRIFT:
+            drift = 0.0
+
+    result = {"offset": start_offset, "drift": drift, "confidence": confidence}
+    app_cache.save_json(cache_path, result)
+    return result
+
+
+def correction_filters(offset, drift, sample_rate, base_delay=0.0):
+    """Returns the audio filter chain that applies offset/drift (plus the container start delay)."""
+    filters = []
+    shift = base_delay - offset
+    shift_samples = int(round(abs(shift) * sample_rate))
+    if shift_samples and shift > 0:
+        filters.append(f"adelay={shift_samples}S:all=1")
+    elif shift_samples:
+        filters.append(f"atrim=start_sample={shift_samples},asetpts=PTS-STARTPTS")
+    if drift:
+        filters.append(f"atempo={1 + drift:.6f}")
+    return filters
+
+
+def sync_filters(ffmpeg_path, video_path, audio_path, base_delay=0.0, reference_stream="a:0"):
+    """Measures (or loads) the sync for a file pair and returns (filters, measurement)."""
+    sync = measure(ffmpeg_path, video_path, audio_path, reference_stream)
+    stream = ffmpeg_common.first_stream(ffmpeg_common.probe(audio_path), "audio") or {}
+    sample_rate = int(stream.get("sample_rate") or 44100)
+    return correction_filters(sync["offset"], sync["drift"], sample_rate, base_delay), sync
@@ -0,0 +1,92 @@
+"""Cached ffmpeg capability detection (binaries, version, encoders, filters).
+
+Results are stored per ffmpeg binary (path, size and mtime) so only the first
+start after installing or upgrading ffmpeg pays for the probe subprocesses.
+A failed probe is not saved; its message is returned under "error" for the
+tools' status line.
+"""
+import os
+import threading
+
+import app_cache
+import ffmpeg_common
+
+_lock = threading.Lock()
+_memo = {}
+
+
+def _cache_path():
+    return os.path.join(app_cache.cache_dir(), "capabilities.json")
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{os.path.realpath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def _listed_names(output):
+    # Names from `ffmpeg -encoders` / `-filters` rows ("flags name description")
+    names = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] != "=" and parts[0] != "------":
+            names.append(parts[1])
+    return names
+
+
+def _probe(ffmpeg_path, ffprobe_path):
+    version = ffmpeg_common.run_command([ffmpeg_path, "-hide_banner", "-version"], stage="capability_check")
+    encoders = ffmpeg_common.run_command([ffmpeg_path, "-hide_banner", "-encoders"], stage="capability_check")
+    filters = ffmpeg_common.run_command([ffmpeg_path, "-hide_banner", "-filters"], stage="capability_check")
+    return {
+        "ffmpeg": ffmpeg_path,
+        "ffprobe": ffprobe_path,
+        "version": version.splitlines()[0] if version else "",
+        "encoders": _listed_names(encoders),
+        "filters": _listed_names(filters),
+    }
+
+
+def detect(refresh=False):
+    """Returns the capability dict; 'ffmpeg'/'ffprobe' are None when not installed.
+
+    'error' holds the message of a failed probe (encoders and filters are then empty).
+    """
+    ffmpeg_path = ffmpeg_common.find_ffmpeg()
+    ffprobe_path = ffmpeg_common.find_ffprobe()
+    if not ffmpeg_path:
+        return {"ffmpeg": None, "ffprobe": ffprobe_path, "version": "", "encoders": [], "filters": []}
+
+    key = _fingerprint(ffmpeg_path)
+    with _lock:
+        if not refresh and key in _memo:
+            return _memo[key]
+        cache = app_cache.load_json(_cache_path(), {})
+        caps = None if refresh else cache.get(key)
+        if caps is None:
+            try:
+                caps = _probe(ffmpeg_path, ffprobe_path)
+            except Exception as e:
+                caps = {"ffmpeg": ffmpeg_path, "ffprobe": ffprobe_path, "version": "", "encoders": [], "filters": [],
+                        "error": f"Capability check failed: {e}"}
+            else:
+                cache[key] = caps
+                app_cache.save_json(_cache_path(), cache)
+        caps["ffprobe"] = ffprobe_path
+        _memo[key] = caps
+        return caps
+
+
+def detect_async(callback):
+    """Runs detect() on a background thread and passes the result to callback (off the UI thread)."""
+    thread = threading.Thread(target=lambda: callback(detect()), daemon=True)
+    thread.start()
+    return thread
+
+
+def has_encoder(caps, name):
+    return name in caps.get("encoders", [])
+
+
+def has_filter(caps, name):
+    return name in caps.get("filters", [])
@@ -0,0 +1,352 @@
+"""Checkpointed, resumable encodes: closed-GOP video segments plus a manifest.
+
+run(command) takes the one-input, one-output FfmpegCommand a tool would
+otherwise run and splits it in two:
+
+1. the video encode, written as SEGMENT_SECONDS Matroska segments to
+   <output>.checkpoint/ (forced keyframes at every boundary, closed GOPs,
+   absolute timestamps). Each finished segment is fsynced and recorded in
+   manifest.json as it completes;
+2. a join that concatenates the segments losslessly (concat demuxer, -c:v
+   copy) and adds the audio from the source with the command's audio and
+   muxer options.
+
+After a crash (power loss, OOM, closed window) the next run() of the same
+job verifies the recorded segments (size; a full decode for any segment
+finished but not yet recorded), deletes the partial one and restarts the
+encode at the first missing frame (-ss, with -initial_offset keeping the
+timestamps continuous). A manifest from a different input or different
+settings is discarded. The work directory is removed after a successful
+join.
+
+    python checkpoint.py encode INPUT OUTPUT [SEGMENT_SECONDS]   # libx264/AAC, resumable
+    python checkpoint.py status OUTPUT                           # segments done so far
+"""
+import csv
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import app_cache
+import ffmpeg_common
+import ffmpeg_metrics
+import output_cache
+from ffmpeg_command import FfmpegCommand
+
+SEGMENT_SECONDS = 60
+WORK_SUFFIX = ".checkpoint"
+MANIFEST = "manifest.json"
+SEGMENT_PATTERN = "seg%05d.mkv"
+STATUS_SECONDS = 1.0  # Minimum interval between progress callbacks
+TIMELINE_OFFSET = 10.0  # Segment timestamps are source time + this, so B-frame dts never go negative
+
+_AUDIO_FLAGS = {"-an", "-ar", "-ac", "-af", "-aq", "-shortest"}
+_MUX_FLAGS = {"-f", "-movflags", "-metadata", "-map_metadata", "-map_chapters", "-timecode", "-brand"}
+_FRAME_RATE_FLAGS = {"-r", "-fps_mode", "-vsync"}
+# Muxers ffmpeg gives variable frame rate output by default (by -f name and by extension)
+_VFR_FORMATS = {"matroska", "webm", "flv", "nut", "asf"}
+_VFR_EXTENSIONS = {".mkv", ".webm", ".flv", ".nut", ".asf", ".wmv"}
+
+
+def work_dir(out_file):
+    """Directory holding the segments and manifest of out_file's checkpointed encode."""
+    return out_file + WORK_SUFFIX
+
+
+def _is_join_flag(flag):
+    # Audio and muxer options belong to the join; everything else to the video encode
+    return flag in _AUDIO_FLAGS or flag in _MUX_FLAGS or flag.endswith(":a") or ":a:" in flag
+
+
+def _fps_mode(output):
+    # The segment muxer alone would get constant frame rate; match what the real container gets
+    format_name = output.get("-f")
+    if format_name:
+        return "vfr" if format_name in _VFR_FORMATS else "cfr"
+    return "vfr" if os.path.splitext(output.path)[1].lower() in _VFR_EXTENSIONS else "cfr"
+
+
+def supports(command):
+    """True when run() can checkpoint command (one input, one output, video re-encoded, no filter graph)."""
+    return (len(command.inputs) == 1 and len(command.outputs) == 1 and not command.filter_graph
+            and command.outputs[0].get("-c:v") != "copy" and not command.outputs[0].path.startswith("pipe:"))
+
+
+def load_manifest(out_file):
+    """The manifest of an interrupted encode of out_file, or None."""
+    return app_cache.load_json(os.path.join(work_dir(out_file), MANIFEST))
+
+
+def _save_manifest(directory, manifest):
+    # Atomic and durable: the manifest must never list a segment that is not on disk
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _sync_file(path):
+    with open(path, "r+b") as f:
+        os.fsync(f.fileno())
+
+
+def _segment_info(path):
+    """{"file", "start", "end", "frames", "size"} from the segment's video packets."""
+    command = [ffmpeg_common.find_ffprobe() or "ffprobe", "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0", path]
+    result = ffmpeg_metrics.run(command, stage="checkpoint_probe", capture_output=True, text=True, check=True,
+                                **ffmpeg_common.hidden_window_kwargs())
+    packets = []
+    for line in result.stdout.split():
+        fields = line.split(",")
+        try:
+            packets.append((float(fields[0]), float(fields[1]) if len(fields) > 1 and fields[1] else 0.0))
+        except ValueError:
+            continue  # pts N/A
+    if not packets:
+        raise ValueError(f"Segment {os.path.basename(path)} has no video packets.")
+    last = max(packets)
+    return {"file": os.path.basename(path), "start": min(packets)[0], "end": last[0] + last[1],
+            "frames": len(packets), "size": os.path.getsize(path)}
+
+
+def _source_frame_time(path, approx, tolerance=0.0015):
+    """Exact time (from the file start) of the source frame that Matroska's millisecond approx stands for."""
+    start = float(ffmpeg_common.probe(path).get("format", {}).get("start_time") or 0.0)
+    command = [ffmpeg_common.find_ffprobe() or "ffprobe", "-v", "error", "-select_streams", "v:0",
+               "-read_intervals", f"{max(0.0, start + approx - 2):.6f}%{start + approx + 2:.6f}",
+               "-show_entries", "packet=pts_time", "-of", "csv=p=0", path]
+    result = ffmpeg_metrics.run(command, stage="checkpoint_probe", capture_output=True, text=True,
+                                **ffmpeg_common.hidden_window_kwargs())
+    times = []
+    for value in result.stdout.split():
+        try:
+            times.append(float(value.strip(",")) - start)
+        except ValueError:
+            continue
+    return min((t for t in times if abs(t - approx) <= tolerance), key=lambda t: abs(t - approx), default=approx)
+
+
+def _decodes(ffmpeg_path, path):
+    command = [ffmpeg_path, "-v", "error", "-xerror", "-nostdin", "-i", path, "-f", "null", "-"]
+    result = ffmpeg_metrics.run(command, stage="checkpoint_verify", capture_output=True, text=True,
+                                **ffmpeg_common.hidden_window_kwargs())
+    return result.returncode == 0 and not result.stderr.strip()
+
+
+def _contiguous(segments, info):
+    if not segments:
+        return True
+    half_frame = (info["end"] - info["start"]) / max(info["frames"], 1) / 2
+    return abs(info["start"] - segments[-1]["end"]) <= half_frame
+
+
+def _listed(directory):
+    """Segment files the segment muxer reported finished, across all runs, in order."""
+    names = set()
+    for list_path in glob.glob(os.path.join(directory, "run*.csv")):
+        with open(list_path, newline="") as f:
+            names.update(row[0] for row in csv.reader(f) if row)
+    return sorted(names)
+
+
+def _record_new(ffmpeg_path, directory, manifest, decode_check):
+    """Adds finished segments missing from the manifest; returns False at the first bad one."""
+    known = {segment["file"] for segment in manifest["segments"]}
+    for name in _listed(directory):
+        if name in known:
+            continue
+        path = os.path.join(directory, name)
+        if not os.path.exists(path) or (decode_check and not _decodes(ffmpeg_path, path)):
+            return False
+        _sync_file(path)
+        info = _segment_info(path)
+        if not _contiguous(manifest["segments"], info):
+            return False
+        manifest["segments"].append(info)
+        _save_manifest(directory, manifest)
+    return True
+
+
+def _resume_state(ffmpeg_path, directory, key, segment_seconds):
+    """Verified manifest for key; invalid or foreign segments are deleted."""
+    manifest = app_cache.load_json(os.path.join(directory, MANIFEST))
+    if not manifest or manifest.get("key") != key:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        manifest = {"key": key, "segment_seconds": segment_seconds, "runs": 0, "complete": False, "segments": []}
+        _save_manifest(directory, manifest)
+        return manifest
+    valid = []
+    for segment in manifest["segments"]:
+        path = os.path.join(directory, segment["file"])
+        if not os.path.exists(path) or os.path.getsize(path) != segment["size"]:
+            break
+        valid.append(segment)
+    if len(valid) < len(manifest["segments"]):
+        manifest["complete"] = False
+    manifest["segments"] = valid
+    # Finished before the crash but not yet recorded: decode them to be sure
+    if not manifest["complete"]:
+        _record_new(ffmpeg_path, directory, manifest, decode_check=True)
+    keep = {segment["file"] for segment in manifest["segments"]}
+    for path in glob.glob(os.path.join(directory, "seg*.mkv")):
+        if os.path.basename(path) not in keep:
+            os.remove(path)  # The partial segment (and anything after a bad one)
+    for path in glob.glob(os.path.join(directory, "run*.csv")):
+        os.remove(path)  # Consumed; the next run reuses the deleted segment names
+    _save_manifest(directory, manifest)
+    return manifest
+
+
+def _segment_command(command, directory, manifest):
+    source, output = command.inputs[0], command.outputs[0]
+    segments = manifest["segments"]
+    resume = timeline = 0.0
+    if segments:
+        # Within half a frame: a source that starts off the frame grid has its frames rounded onto it
+        timeline = segments[-1]["end"] - TIMELINE_OFFSET
+        half_frame = (segments[-1]["end"] - segments[-1]["start"]) / max(segments[-1]["frames"], 1) / 2
+        resume = _source_frame_time(source.path, timeline, half_frame)
+        if abs(resume - timeline) <= 0.0015:
+            timeline = resume  # Exact, rather than Matroska's milliseconds
+    seconds = manifest["segment_seconds"]
+    encode = FfmpegCommand(command.binary, *command.global_options)
+    if "-y" not in encode.global_options:
+        encode.global_options.insert(0, "-y")
+    video_in = encode.add_input(source.path).extend(source.items())
+    if resume > 0:
+        # Just before the first missing frame so it is kept; timestamps continue from resume
+        video_in.set("-ss", f"{max(0.0, resume - 0.0005):.6f}")
+    out = encode.add_output(os.path.join(directory, SEGMENT_PATTERN))
+    video_maps = [spec for spec in output.maps if ":v" in spec]
+    for spec in video_maps or [f"{video_in.index}:v:0"]:
+        out.map(spec)
+    out.extend((flag, value) for flag, value in output.items() if not _is_join_flag(flag))
+    if not any(flag in _FRAME_RATE_FLAGS for flag, _ in output.items()):
+        out.set("-fps_mode", _fps_mode(output))
+    out.update({
+        "-an": None, "-sn": None, "-dn": None,
+        "-flags": "+cgop",
+        "-avoid_negative_ts": "disabled",  # Shifting would move each run's timeline by the B-frame delay
+        "-force_key_frames": f"expr:gte(t,n_forced*{seconds})",
+        "-f": "segment", "-segment_format": "matroska", "-segment_time": seconds,
+        "-reset_timestamps": "0", "-segment_start_number": len(segments),
+        "-initial_offset": f"{timeline + TIMELINE_OFFSET:.6f}",
+        "-segment_list": os.path.join(directory, f"run{manifest['runs']}.csv"), "-segment_list_type": "csv",
+    })
+    return encode, resume
+
+
+def _join_command(command, directory, manifest):
+    source, output = command.inputs[0], command.outputs[0]
+    segments = manifest["segments"]
+    list_path = os.path.join(directory, "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for segment, following in zip(segments, segments[1:] + [None]):
+            # Explicit in points and durations: segment files keep absolute timestamps (and a
+            # one-frame segment has no start time), so their own start/duration would be wrong
+            end = following["start"] if following else segment["end"]
+            f.write(f"file '{segment['file']}'\ninpoint {segment['start']:.6f}\nduration {end - segment['start']:.6f}\n")
+    join = FfmpegCommand(command.binary, *command.global_options)
+    video = join.add_input(list_path, {"-f": "concat", "-safe": "0"})
+    delay = segments[0]["start"] - TIMELINE_OFFSET
+    if delay > 0:
+        video.set("-itsoffset", f"{delay:.6f}")  # Concat starts at 0; keep the source's video delay
+    audio = join.add_input(source.path)
+    out = join.add_output(output.path)
+    out.map(video, "v:0")
+    other_maps = [spec for spec in output.maps if ":v" not in spec]
+    for spec in other_maps:
+        out.map(f"{audio.index}{spec[spec.index(':'):]}" if ":" in spec else str(audio.index))
+    if not output.maps:
+        out.map(audio, "a:0", optional=True)
+    out.set("-c:v", "copy")
+    out.extend((flag, value) for flag, value in output.items() if _is_join_flag(flag))
+    return join
+
+
+def _run_encode(encode, ffmpeg_path, directory, manifest, lease, progress, stage):
+    process = ffmpeg_metrics.TracedPopen(encode.build(), stage=stage, lease=lease, stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace",
+                                         **ffmpeg_common.hidden_window_kwargs())
+    list_path = encode.outputs[0].get("-segment_list")
+    full_output = ""
+    listed_size = 0
+    last_status = 0.0
+    for line in process.stdout:
+        full_output += line
+        process.feed(line)
+        if "frame=" not in line and "time=" not in line:
+            continue
+        # Checkpoint each segment as soon as the muxer lists it as finished
+        size = os.path.getsize(list_path) if os.path.exists(list_path) else 0
+        if size != listed_size:
+            listed_size = size
+            _record_new(ffmpeg_path, directory, manifest, decode_check=False)
+        if progress and time.monotonic() - last_status >= STATUS_SECONDS:
+            last_status = time.monotonic()
+            progress(f"Segment {len(manifest['segments']) + 1} (checkpointed): {line.strip()}")
+    return process.wait(), full_output
+
+
+def run(command, segment_seconds=SEGMENT_SECONDS, lease=None, progress=None, stage="convert"):
+    """Runs command as a checkpointed encode, resuming an interrupted one; returns (returncode, output)."""
+    if not supports(command):
+        raise ValueError("Checkpointed encodes need one input, one output and a re-encoded video stream.")
+    out_file = command.outputs[0].path
+    directory = work_dir(out_file)
+    key = output_cache.job_key([command.inputs[0].path], [command, {"segment_seconds": segment_seconds}])
+    manifest = _resume_state(command.binary, directory, key, segment_seconds)
+    if not manifest["complete"]:
+        encode, resume = _segment_command(command, directory, manifest)
+        if progress and manifest["segments"]:
+            progress(f"Resuming at {resume:.1f}s ({len(manifest['segments'])} segments verified)...")
+        manifest["runs"] += 1
+        _save_manifest(directory, manifest)
+        returncode, full_output = _run_encode(encode, command.binary, directory, manifest, lease, progress, stage)
+        if returncode != 0:
+            return returncode, full_output  # Segments so far stay for the next run
+        if not _record_new(command.binary, directory, manifest, decode_check=False) or not manifest["segments"]:
+            shutil.rmtree(directory, ignore_errors=True)  # Would fail the same way on every resume
+            return 1, full_output + "\nCheckpointed encode left a gap between segments; they were discarded.\n"
+        manifest["complete"] = True
+        _save_manifest(directory, manifest)
+    if progress:
+        progress(f"Joining {len(manifest['segments'])} segments...")
+    try:
+        join_output = ffmpeg_common.run_command(_join_command(command, directory, manifest).build(),
+                                                stage=stage + "_join", lease=lease)
+    except subprocess.CalledProcessError as e:
+        return e.returncode, e.output or ""
+    shutil.rmtree(directory, ignore_errors=True)
+    return 0, join_output
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "status":
+        state = load_manifest(sys.argv[2])
+        if not state:
+            print("No checkpointed encode in progress.")
+        else:
+            done = state["segments"][-1]["end"] - TIMELINE_OFFSET if state["segments"] else 0.0
+            print(f"{len(state['segments'])} segments, {done:.1f}s encoded over {state['runs']} run(s)"
+                  f"{', ready to join' if state['complete'] else ''}")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "encode":
+        job = FfmpegCommand(ffmpeg_common.find_ffmpeg() or "ffmpeg", "-y", "-hide_banner", "-stats")
+        job_source = job.add_input(sys.argv[2])
+        job_output = job.add_output(sys.argv[3], {"-c:v": "libx264", "-preset": "veryfast", "-crf": "23",
+                                                  "-pix_fmt": "yuv420p", "-c:a": "aac", "-b:a": "192k"})
+        job_output.map(job_source, "v:0").map(job_source, "a:0", optional=True)
+        code, text = run(job, int(sys.argv[4]) if len(sys.argv) > 4 else SEGMENT_SECONDS, progress=print)
+        print("Done." if code == 0 else text[-2000:])
+        sys.exit(code)
+    else:
+        print("usage: python checkpoint.py encode INPUT OUTPUT [SEGMENT_SECONDS] | status OUTPUT")
+        sys.exit(2)
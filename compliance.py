@@ -0,0 +1,49 @@
+"""Decides per stream whether an input can be copied into a YouTube-ready MP4."""
+COPY = "copy"
+TRANSCODE = "transcode"
+
+COMPLIANT_VIDEO_CODECS = {"h264"}
+COMPLIANT_PIX_FMTS = {"yuv420p", "yuvj420p"}
+COMPLIANT_H264_PROFILES = {"Constrained Baseline", "Baseline", "Main", "High"}
+COMPLIANT_AUDIO_CODECS = {"aac"}
+COMPLIANT_SAMPLE_RATES = {"44100", "48000"}
+
+
+def video_action(stream):
+    """Returns COPY for H.264 8-bit 4:2:0 video, TRANSCODE otherwise."""
+    if stream is None:
+        return None
+    if stream.get("codec_name") not in COMPLIANT_VIDEO_CODECS:
+        return TRANSCODE
+    if stream.get("pix_fmt") not in COMPLIANT_PIX_FMTS:
+        return TRANSCODE
+    profile = stream.get("profile")
+    if profile and profile not in COMPLIANT_H264_PROFILES:
+        return TRANSCODE
+    return COPY
+
+
+def audio_action(stream):
+    """Returns COPY for AAC-LC at 44.1/48 kHz, TRANSCODE otherwise."""
+    if stream is None:
+        return None
+    if stream.get("codec_name") not in COMPLIANT_AUDIO_CODECS:
+        return TRANSCODE
+    if stream.get("profile") not in (None, "LC"):
+        return TRANSCODE
+    if str(stream.get("sample_rate")) not in COMPLIANT_SAMPLE_RATES:
+        return TRANSCODE
+    return COPY
+
+
+def plan_streams(info):
+    """Returns {'video': action, 'audio': action} for the first video/audio streams of probe info."""
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    return {"video": video_action(video), "audio": audio_action(audio)}
+
+
+def is_remux_only(plan):
+    """True when no stream needs re-encoding."""
+    return TRANSCODE not in plan.values()
@@ -3,14 +3,17 @@ from tkinter import filedialog, messagebox, ttk
 import subprocess
 import threading
 import os
-import tempfile
 import shutil
 
+import audio_batch
+import ffmpeg_metrics
+import output_sink
+
 class AudioCompressorApp:
 	def __init__(self, master):
 		self.master = master
 		master.title("HEVC Audio Compressor")
-		master.geometry("600x300") # Set initial size
+		master.geometry("600x450") # Set initial size
 
 		# Style
 		style = ttk.Style()
@@ -45,8 +48,20 @@ class AudioCompressorApp:
 		self.output_button.pack(side=tk.LEFT, padx=5)
 
 		# --- Action Button ---
-		self.action_button = ttk.Button(master, text="Compress and Replace Audio", command=self.start_compression_thread)
-		self.action_button.pack(pady=15, ipady=5) # Internal padding
+		self.action_frame = ttk.Frame(master)
+		self.action_frame.pack(pady=15)
+
+		self.action_button = ttk.Button(self.action_frame, text="Compress and Replace Audio", command=self.start_compression_thread)
+		self.action_button.pack(side=tk.LEFT, padx=5, ipady=5) # Internal padding
+
+		# Many files at once, outputs named like the single-file suggestion (<name>_AAC.<ext>)
+		self.batch_button = ttk.Button(self.action_frame, text="Batch Compress Files...", command=self.start_batch_thread)
+		self.batch_button.pack(side=tk.LEFT, padx=5, ipady=5)
+
+		# Split very long recordings into chunks encoded on all cores
+		self.segment_var = tk.BooleanVar(value=False)
+		self.segment_check = ttk.Checkbutton(master, text="Split long recordings across cores", variable=self.segment_var)
+		self.segment_check.pack()
 
 		# --- Progress Bar ---
 		self.progress = ttk.Progressbar(master, orient=tk.HORIZONTAL, length=580, mode='determinate')
@@ -56,6 +71,10 @@ class AudioCompressorApp:
 		self.status_label = ttk.Label(master, text="Status: Ready", anchor=tk.W)
 		self.status_label.pack(fill=tk.X, padx=10, pady=5)
 
+		# --- Per-file Progress ---
+		self.file_list = tk.Listbox(master, height=6)
+		self.file_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
 		# Check for ffmpeg on startup
 		self.check_ffmpeg()
 
@@ -110,6 +129,8 @@ class AudioCompressorApp:
 		self.output_entry.config(state=state)
 		self.output_button.config(state=state)
 		self.action_button.config(state=state)
+		self.batch_button.config(state=state)
+		self.segment_check.config(state=state)
 
 	def start_compression_thread(self):
 		# Run compression in thread
@@ -122,7 +143,7 @@ class AudioCompressorApp:
 		if not os.path.exists(input_p):
 			messagebox.showerror("Error", f"Input file not found:\n{input_p}")
 			return
-		if os.path.dirname(output_p) and not os.path.exists(os.path.dirname(output_p)):
+		if not output_sink.is_remote(output_p) and os.path.dirname(output_p) and not os.path.exists(os.path.dirname(output_p)):
 			messagebox.showerror("Error", f"Output directory does not exist:\n{os.path.dirname(output_p)}")
 			return
 		if input_p == output_p:
@@ -135,83 +156,69 @@ class AudioCompressorApp:
 		self.set_ui_state(False)
 		self.update_status("Starting compression...", 0)
 
-		thread = threading.Thread(target=self.run_compression, args=(input_p, output_p), daemon=True)
+		thread = threading.Thread(target=self.run_compression, args=(input_p, output_p, self.segment_var.get()), daemon=True)
 		thread.start()
 
-	def run_command(self, command_list):
-		# Execute ffmpeg command
-		process = subprocess.Popen(
-			command_list,
-			stdout=subprocess.PIPE,
-			stderr=subprocess.STDOUT, # Combine output
-			universal_newlines=True,
-			encoding='utf-8',
-			creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0 # Hide console on Win
+	def start_batch_thread(self):
+		# Pick many files and compress them all
+		file_paths = filedialog.askopenfilenames(
+			title="Select Video Files",
+			filetypes=[("HEVC Video Files", "*.mkv *.mp4 *.mov"), ("All Files", "*.*")]
 		)
-		output = ""
-		for line in iter(process.stdout.readline, ''):
-			output += line
-			# Basic progress parsing could go here if needed
-			# For simplicity, we just let it run.
-		process.stdout.close()
-		return_code = process.wait()
-		if return_code != 0:
-			# Log detailed error
-			print(f"FFmpeg Error:\nCommand: {' '.join(command_list)}\nOutput:\n{output}")
-			raise subprocess.CalledProcessError(return_code, command_list, output=output)
-		return output
-
-	def run_compression(self, input_path, output_path):
-		# Main ffmpeg logic
+		if not file_paths:
+			return
+		if shutil.which("ffmpeg") is None:
+			self.check_ffmpeg()
+			return
+		items = []
+		for file_path in file_paths:
+			base, ext = os.path.splitext(file_path)
+			items.append((file_path, f"{base}_AAC{ext}"))
+
+		self.set_ui_state(False)
+		self.update_status(f"Starting batch of {len(items)} files...", 0)
+		thread = threading.Thread(target=self.run_jobs, args=(items, self.segment_var.get()), daemon=True)
+		thread.start()
+
+	def report_batch_progress(self, jobs):
+		# Called from the batch thread: snapshot the jobs here, touch widgets only on the Tk thread
+		rows = []
+		for job in jobs:
+			state = "failed" if job.error else "cached" if job.cached else f"{job.progress() * 100:.0f}%"
+			rows.append(f"{state:>7}  {os.path.basename(job.in_file)}")
+		finished = sum(1 for job in jobs if job.done)
+		overall = audio_batch.overall_progress(jobs) * 100
+		message = f"Compressing: {finished}/{len(jobs)} files done ({overall:.0f}%)"
+		self.master.after(0, self.show_batch_progress, rows, message, overall)
+
+	def show_batch_progress(self, rows, message, overall):
+		# Runs on the Tk thread
+		self.file_list.delete(0, tk.END)
+		for row in rows:
+			self.file_list.insert(tk.END, row)
+		self.update_status(message, overall)
+
+	def run_compression(self, input_path, output_path, segment_long=False):
+		# Main ffmpeg logic (a batch of one)
+		self.run_jobs([(input_path, output_path)], segment_long)
+
+	def run_jobs(self, items, segment_long=False):
+		# Encodes in a process pool, remuxes in a thread pool; real per-file and overall progress
 		try:
-			with tempfile.TemporaryDirectory() as temp_dir:
-				temp_audio_raw = os.path.join(temp_dir, "temp_audio.wav") # Extracted PCM
-				temp_audio_mp3 = os.path.join(temp_dir, "temp_audio.mp3") # Compressed MP3
-
-				# 1. Extract Audio (as PCM s16le)
-				self.update_status("Extracting audio...", 10)
-				cmd_extract = [
-					"ffmpeg", "-hide_banner", "-loglevel", "warning", # Less verbose
-					"-i", input_path,
-					"-vn",                 # No video
-					"-acodec", "pcm_s16le", # Force specific PCM
-					"-ar", "44100",        # Standard sample rate
-					"-ac", "2",            # Stereo
-					"-y",                  # Overwrite output
-					temp_audio_raw
-				]
-				self.run_command(cmd_extract)
-
-				# 2. Compress Audio to MP3 (VBR -q:a 2)
-				self.update_status("Compressing audio to MP3...", 40)
-				cmd_compress = [
-					"ffmpeg", "-hide_banner", "-loglevel", "warning",
-					"-i", temp_audio_raw,
-					"-vn",                 # No video
-					"-acodec", "libmp3lame",# Use LAME MP3 encoder
-					"-q:a", "2",           # VBR quality (0-9, lower=better)
-					"-y",                  # Overwrite output
-					temp_audio_mp3
-				]
-				self.run_command(cmd_compress)
-
-				# 3. Replace Audio Stream
-				self.update_status("Replacing audio in video...", 70)
-				cmd_replace = [
-					"ffmpeg", "-hide_banner", "-loglevel", "warning",
-					"-i", input_path,      # Input video
-					"-i", temp_audio_mp3,  # Input compressed audio
-					"-map", "0:v:0",       # Map video from first input
-					"-map", "1:a:0",       # Map audio from second input
-					"-c:v", "copy",        # Copy video stream (FAST)
-					"-c:a", "copy",        # Copy audio stream (FAST)
-					"-shortest",           # Finish when shortest stream ends
-					"-y",                  # Overwrite output
-					output_path
-				]
-				self.run_command(cmd_replace)
-
-				self.update_status(f"Success! Output saved to {os.path.basename(output_path)}", 100)
+			jobs = audio_batch.run_batch(items, progress=self.report_batch_progress, segment_long=segment_long)
+			failed = [job for job in jobs if job.error]
+			for job in failed:
+				print(f"FFmpeg Error:\nInput: {job.in_file}\n{job.error}")
+			if failed:
+				error_msg = f"{len(failed)} of {len(jobs)} file(s) failed. See console/log for details."
+				self.update_status(error_msg, error=True)
+				details = "\n\n".join(f"{os.path.basename(job.in_file)}:\n{job.error}" for job in failed[:3])
+				messagebox.showerror("Processing Error", f"{error_msg}\n\n{details}")
+			elif len(jobs) == 1:
+				reused = " (reused cached output)" if jobs[0].cached else ""
+				self.update_status(f"Success! Output saved to {os.path.basename(jobs[0].out_file)}{reused}", 100)
+			else:
+				self.update_status(f"Success! {len(jobs)} files compressed.", 100)
 
 		except FileNotFoundError:
 			# Should be caught by check_ffmpeg, but belt-and-suspenders
@@ -239,6 +246,7 @@ class AudioCompressorApp:
 
 
 if __name__ == "__main__":
+	ffmpeg_metrics.serve_from_env()
 	root = tk.Tk()
 	app = AudioCompressorApp(root)
 	root.mainloop()
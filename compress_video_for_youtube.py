@@ -5,32 +5,70 @@ import threading
 import os
 import shutil
 import queue
+import time
+
+import capabilities
+import checkpoint
+import compliance
+import eta
+import ffmpeg_common
+from ffmpeg_command import FfmpegCommand
+import ffmpeg_metrics
+import governor
+import output_cache
+import output_mux
+import output_sink
+import proxy
+# crf_search, preset_budget and rate_control are imported when their mode is used
+
+# Rate control modes offered in the UI
+RATE_MODE_QUALITY = "Quality (CQ/CRF 23)"
+RATE_MODE_SIZE = "Target size (MB)"
+RATE_MODE_BITRATE = "Target bitrate (kbps)"
+RATE_MODE_ADAPTIVE = "Adaptive CRF (CPU, quality floor)"
+RATE_MODE_DEADLINE = "Deadline (CPU, secs or Nx speed)"
+RATE_MODES = [RATE_MODE_QUALITY, RATE_MODE_SIZE, RATE_MODE_BITRATE, RATE_MODE_ADAPTIVE, RATE_MODE_DEADLINE]
 
 class VideoConverterApp:
 	def __init__(self, root_window):
 		self.root = root_window
 		self.root.title("Video Converter")
-		self.root.geometry("600x300") # Initial size
+		self.root.geometry("600x400") # Initial size
 
 		self.ffmpeg_path = self._find_ffmpeg()
-		self.has_cuda = self._check_cuda_support() if self.ffmpeg_path else False
+		self.has_cuda = False # Set once the background capability check finishes
 
 		self.input_var = tk.StringVar()
 		self.output_var = tk.StringVar()
+		self.rate_mode_var = tk.StringVar(value=RATE_MODE_QUALITY)
+		self.rate_value_var = tk.StringVar()
+		self.copy_compliant_var = tk.BooleanVar(value=True)
+		self.proxy_var = tk.BooleanVar(value=False)
+		self.resumable_var = tk.BooleanVar(value=False)
 		self.status_var = tk.StringVar()
 		self.status_var.set("Ready. Select files.")
 
 		self._create_widgets()
 
-		# Initial status based on FFmpeg/CUDA check
+		# Initial status based on FFmpeg check; CUDA check runs in background
 		if not self.ffmpeg_path:
 			self.status_var.set("Error: FFmpeg not found in PATH.")
 			messagebox.showerror("Setup Error", "FFmpeg not found. Please install it and add to PATH.")
 			self.start_button.config(state=tk.DISABLED)
-		elif self.has_cuda:
-			self.status_var.set("Ready (CUDA available).")
 		else:
-			self.status_var.set("Ready (CUDA not found, using CPU).")
+			self.status_var.set("Ready (checking encoders...).")
+			capabilities.detect_async(lambda caps: self.root.after(0, self._apply_capabilities, caps))
+
+	def _apply_capabilities(self, caps):
+		# Capability results (UI thread)
+		self.has_cuda = capabilities.has_encoder(caps, "h264_nvenc")
+		if self.status_var.get().startswith("Ready"):
+			if caps.get("error"):
+				self.status_var.set(f"Ready ({caps['error']}; using CPU).")
+			elif self.has_cuda:
+				self.status_var.set("Ready (CUDA available).")
+			else:
+				self.status_var.set("Ready (CUDA not found, using CPU).")
 
 
 	def _find_ffmpeg(self):
@@ -38,23 +76,8 @@ class VideoConverterApp:
 		return shutil.which("ffmpeg")
 
 	def _check_cuda_support(self):
-		# Check nvenc
-		try:
-			startupinfo = None
-			if os.name == 'nt': # Hide console on Win
-				startupinfo = subprocess.STARTUPINFO()
-				startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-				startupinfo.wShowWindow = subprocess.SW_HIDE
-
-			result = subprocess.run(
-				[self.ffmpeg_path, "-encoders"],
-				capture_output=True, text=True, check=True,
-				encoding='utf-8', errors='ignore', # Handle potential decode errors
-				startupinfo=startupinfo
-			)
-			return "h264_nvenc" in result.stdout
-		except (subprocess.CalledProcessError, FileNotFoundError, OSError):
-			return False # FFmpeg error
+		# Check nvenc (cached per ffmpeg binary)
+		return capabilities.has_encoder(capabilities.detect(), "h264_nvenc")
 
 	def _create_widgets(self):
 		# Create GUI elements
@@ -75,6 +98,27 @@ class VideoConverterApp:
 		ttk.Entry(output_frame, textvariable=self.output_var).pack(side=tk.LEFT, fill=tk.X, expand=True)
 		ttk.Button(output_frame, text="Browse...", command=self._select_output).pack(side=tk.LEFT, padx=(5, 0))
 
+		# Rate control selection
+		rate_frame = ttk.Frame(main_frame)
+		rate_frame.pack(fill=tk.X, pady=5)
+		ttk.Label(rate_frame, text="Rate Control:").pack(side=tk.LEFT, padx=(0, 5))
+		ttk.Combobox(rate_frame, textvariable=self.rate_mode_var, values=RATE_MODES, state="readonly", width=24).pack(side=tk.LEFT)
+		ttk.Label(rate_frame, text="Value:").pack(side=tk.LEFT, padx=(10, 5))
+		ttk.Entry(rate_frame, textvariable=self.rate_value_var, width=10).pack(side=tk.LEFT)
+		ttk.Checkbutton(rate_frame, text="Copy compliant streams", variable=self.copy_compliant_var).pack(side=tk.LEFT, padx=(10, 0))
+
+		# Editing proxy (540p, same decode pass)
+		proxy_frame = ttk.Frame(main_frame)
+		proxy_frame.pack(fill=tk.X, pady=5)
+		ttk.Checkbutton(proxy_frame, text="Also write 540p editing proxy", variable=self.proxy_var).pack(side=tk.LEFT)
+		self.proxy_button = ttk.Button(proxy_frame, text="Proxies Only...", command=self._start_proxy_thread)
+		self.proxy_button.pack(side=tk.RIGHT)
+
+		# Checkpointed encode: rerunning the same job after a crash resumes it
+		resume_frame = ttk.Frame(main_frame)
+		resume_frame.pack(fill=tk.X)
+		ttk.Checkbutton(resume_frame, text="Resumable (checkpointed segments)", variable=self.resumable_var).pack(side=tk.LEFT)
+
 		# Start button
 		self.start_button = ttk.Button(main_frame, text="Start Conversion", command=self._start_conversion_thread)
 		self.start_button.pack(pady=15)
@@ -133,6 +177,33 @@ class VideoConverterApp:
 		conversion_thread = threading.Thread(target=self._run_conversion, daemon=True)
 		conversion_thread.start()
 
+	def _start_proxy_thread(self):
+		# Proxy-only mode for existing files (background priority)
+		paths = filedialog.askopenfilenames(
+			title="Select Videos for Proxies",
+			filetypes=[("Video Files", "*.mkv *.mp4 *.mov *.m4v *.mxf"), ("All Files", "*.*")]
+		)
+		if not paths:
+			return
+		self.start_button.config(state=tk.DISABLED)
+		self.proxy_button.config(state=tk.DISABLED)
+		self.progress_bar.start(10)
+		threading.Thread(target=self._run_proxies, args=(paths,), daemon=True).start()
+
+	def _run_proxies(self, paths):
+		try:
+			results = proxy.make_proxies(paths, self.ffmpeg_path, progress=lambda done, total, name: self._update_status(
+				f"Proxies: {done}/{total} ({os.path.basename(name)})"))
+			failed = [f"{os.path.basename(name)}: {error}" for name, error in results.items() if isinstance(error, Exception)]
+			if failed:
+				self._update_status(f"Proxies done, {len(failed)} failed.")
+				self._show_message("Proxy Errors", "\n".join(failed[:10]), "error")
+			else:
+				self._update_status(f"Proxies done ({len(results)} files).")
+				self._show_message("Success", f"Proxies written to '{proxy.PROXY_DIR}' next to each file.")
+		finally:
+			self._reset_gui_state()
+
 	def _run_conversion(self):
 		# FFmpeg logic
 		in_file = self.input_var.get()
@@ -150,8 +221,9 @@ class VideoConverterApp:
 			self._reset_gui_state()
 			return
 
-		# Ensure output dir exists
-		out_dir = os.path.dirname(out_file)
+		# Ensure output dir exists (http(s) outputs are streamed to an upload sink)
+		streaming = output_sink.is_remote(out_file)
+		out_dir = "" if streaming else os.path.dirname(out_file)
 		if out_dir and not os.path.exists(out_dir):
 			try:
 				os.makedirs(out_dir, exist_ok=True)
@@ -161,87 +233,157 @@ class VideoConverterApp:
 				self._reset_gui_state()
 				return
 
+		# Target size/bitrate modes use the two-pass encoder
+		rate_mode = self.rate_mode_var.get()
+		if rate_mode in (RATE_MODE_SIZE, RATE_MODE_BITRATE):
+			if streaming:
+				self._update_status("Error: Two-pass modes need a local output file.")
+				self._show_message("Error", "Target size/bitrate modes cannot stream to an upload URL.", "error")
+				self._reset_gui_state()
+				return
+			self._run_target_conversion(in_file, out_file, rate_mode)
+			return
+
 		# Run FFmpeg process
 		try:
 			# Base command
 			# -y: overwrite output
 			# -hide_banner: less verbose
 			# -stats: show progress
-			ffmpeg_cmd = [self.ffmpeg_path, "-y", "-hide_banner", "-stats", "-i", in_file]
+			ffmpeg_cmd = FfmpegCommand(self.ffmpeg_path, "-y", "-hide_banner", "-stats")
+			source = ffmpeg_cmd.add_input(in_file)
+
+			# Output: local file (shared faststart/fragmented layout) or fragmented MP4 on stdout for upload
+			output = output_sink.add_output(ffmpeg_cmd, out_file)
 
 			# Map streams (simple case: 1st video, 1st audio)
-			ffmpeg_cmd.extend(["-map", "0:v:0", "-map", "0:a:0"])
+			output.map(source, "v:0").map(source, "a:0")
+
+			# Adaptive mode picks the CRF from sampled segments (libx264 only)
+			crf = "23"
+			preset = "ultrafast"
+			use_cuda = self.has_cuda
+			if rate_mode == RATE_MODE_ADAPTIVE:
+				use_cuda = False
+				crf = str(self._search_crf(in_file))
+
+			# Deadline mode picks the slowest preset that fits the time budget
+			job_pixels = 0
+			if rate_mode == RATE_MODE_DEADLINE:
+				use_cuda = False
+				import preset_budget
+				preset, estimate, job_pixels = preset_budget.pick_preset(
+					self.ffmpeg_path, in_file, self.rate_value_var.get(), status=self._update_status)
+				if estimate is None:
+					self._update_status(f"Deadline mode: unknown frame size or duration, using x264 preset '{preset}'")
+				else:
+					self._update_status(f"Deadline mode: x264 preset '{preset}', about {eta.format_seconds(estimate)}")
+
+			# Probed once for stream compliance, the run time prediction and the proxy timecode
+			try:
+				info = ffmpeg_common.probe(in_file)
+			except ffmpeg_common.PROBE_ERRORS:
+				info = None  # Unreadable header: transcode, no prediction; ffmpeg reports real input errors
+
+			# Copy streams that are already H.264 yuv420p / AAC (quality mode only)
+			plan = {"video": compliance.TRANSCODE, "audio": compliance.TRANSCODE}
+			if rate_mode == RATE_MODE_QUALITY and self.copy_compliant_var.get() and info is not None:
+				self._update_status("Checking stream compliance...")
+				plan = compliance.plan_streams(info)
 
 			# Video codec options
-			if self.has_cuda:
+			if plan["video"] == compliance.COPY:
+				output.set("-c:v", "copy")
+			elif use_cuda:
 				# Use NVENC H.264
 				# p6: slower preset = better quality
 				# rc vbr: variable bitrate mode
 				# cq 23: quality level (lower=better)
 				# qmin/qmax: quality range
-				ffmpeg_cmd.extend(["-c:v", "h264_nvenc", "-preset", "p6", "-rc", "vbr", "-cq", "23", "-qmin", "18", "-qmax", "28"])
+				output.update({"-c:v": "h264_nvenc", "-preset": "p6", "-rc": "vbr", "-cq": "23", "-qmin": "18", "-qmax": "28"})
 				self._update_status("Encoding video with CUDA (h264_nvenc)...")
 			else:
 				# Use libx264 (CPU)
-				# preset ultrafast: fastest speed
+				# preset ultrafast: fastest speed (unless deadline mode picked one)
 				# crf 23: quality level (lower=better)
-				ffmpeg_cmd.extend(["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"])
-				self._update_status("Encoding video with CPU (libx264)...")
+				output.update({"-c:v": "libx264", "-preset": preset, "-crf": crf})
+				self._update_status(f"Encoding video with CPU (libx264 {preset}, CRF {crf})...")
 
 			# Audio codec options
 			# c:a aac: AAC codec
 			# b:a 320k: High CBR
-			ffmpeg_cmd.extend(["-c:a", "aac", "-b:a", "320k"]) # Set high quality CBR
+			if plan["audio"] == compliance.COPY:
+				output.set("-c:a", "copy")
+			else:
+				output.update({"-c:a": "aac", "-b:a": "320k"}) # Set high quality CBR
 
 			# Pixel format (compatibility)
-			ffmpeg_cmd.extend(["-pix_fmt", "yuv420p"])
+			if plan["video"] != compliance.COPY:
+				output.set("-pix_fmt", "yuv420p")
 
-			# Output file
-			ffmpeg_cmd.append(out_file)
+			# Remux-only: nothing to encode
+			if compliance.is_remux_only(plan):
+				self._update_status("Input already compliant, remuxing (stream copy)...")
+
+			# Predicted run time from earlier jobs (refined by live progress once running);
+			# without probe info the progress bar stays indeterminate
+			features = eta.job_features("convert", info, ffmpeg_cmd) if info is not None else None
+			tracker = eta.Progress(features["duration"], eta.predict(features)) if features else None
 
 			# Execute command
-			self._update_status(f"Running FFmpeg...") # Final status before run
-
-
-			startupinfo = None
-			creationflags = 0
-			if os.name == 'nt': # Hide console window on Windows
-				startupinfo = subprocess.STARTUPINFO()
-				startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-				startupinfo.wShowWindow = subprocess.SW_HIDE # Hide the window
-				creationflags = subprocess.CREATE_NO_WINDOW # No console either
-
-			process = subprocess.Popen(
-				ffmpeg_cmd,
-				stdout=subprocess.PIPE,
-				stderr=subprocess.STDOUT, # Redirect stderr to stdout
-				text=True,
-				encoding='utf-8',
-				errors='replace', # Handle weird chars from ffmpeg
-				startupinfo=startupinfo,
-				creationflags=creationflags
-			)
-
-			# Read output line by line
-			full_output = ""
-			while True:
-				line = process.stdout.readline()
-				if not line and process.poll() is not None:
-					break # Process finished
-				if line:
-					full_output += line
-					# Update status sparsely with progress lines
-					# Avoid flooding TK mainloop
-					if "frame=" in line or "size=" in line:
-						# Only update UI occasionally
-						if len(full_output) % 1000 < 100: # Simple throttle
-							self._update_status(f"Processing: {line.strip()}")
-			# Wait for process completion
-			retcode = process.wait()
+			estimate = f" (about {eta.format_seconds(tracker.predicted)})" if tracker and tracker.predicted is not None else ""
+			self._update_status(f"Running FFmpeg...{estimate}") # Final status before run
+
+			started = time.monotonic()
+			cache_key = None if streaming else output_cache.job_key([in_file], [ffmpeg_cmd])
+			make_proxy = self.proxy_var.get() and not streaming
+			if cache_key and output_cache.fetch(cache_key, out_file):
+				# Identical input, plan and ffmpeg version: reuse the earlier output
+				retcode, full_output, job_pixels, cache_key, features = 0, "", 0, None, None
+				if make_proxy and not proxy.is_current(out_file, proxy.proxy_path(out_file)):
+					self._update_status("Writing editing proxy...")
+					ffmpeg_common.run_command(proxy.proxy_command(
+						self.ffmpeg_path, in_file, proxy.proxy_path(out_file)).build(), stage="proxy")
+			else:
+				# Segmented encode that survives crashes (quality-style single-pass modes, local output)
+				resumable = self.resumable_var.get() and not streaming and checkpoint.supports(ffmpeg_cmd)
+				if make_proxy and not resumable:
+					# Second output from the same decode (the cache key above covers the main output only)
+					proxy.add_output(ffmpeg_cmd, source, proxy.proxy_path(out_file),
+						timecode=proxy.source_timecode(info) if info is not None else None)
+				# Thread budget shared with other running jobs
+				with governor.lease("convert") as budget:
+					budget.apply(ffmpeg_cmd)
+					if streaming:
+						# Fragmented MP4 from stdout straight into the multipart uploader
+						retcode, full_output = output_sink.run_to_sink(
+							ffmpeg_cmd.build(), output_sink.open_sink(out_file), progress=self._update_status,
+							stage="convert", lease=budget)
+					elif resumable:
+						retcode, full_output = checkpoint.run(ffmpeg_cmd, lease=budget, progress=self._update_status)
+					else:
+						retcode, full_output = self._run_ffmpeg_process(ffmpeg_cmd.build(), budget, tracker)
+				elapsed = time.monotonic() - started
+				# Only a plain whole-file encode times the job the models price: a resumed run
+				# encodes part of it, a same-pass proxy or an upload adds work of its own
+				if resumable or make_proxy or streaming:
+					job_pixels, features = 0, None
+				if retcode == 0 and make_proxy and resumable:
+					self._update_status("Writing editing proxy...")
+					ffmpeg_common.run_command(proxy.proxy_command(
+						self.ffmpeg_path, out_file, proxy.proxy_path(out_file)).build(), stage="proxy")
 
 			if retcode == 0:
+				if cache_key:
+					output_cache.store(cache_key, out_file)
+				if job_pixels:
+					import preset_budget
+					preset_budget.record_job(preset, job_pixels, elapsed)
+				if features:
+					eta.record(features, elapsed)
 				self._update_status(f"Success: Conversion complete!")
-				self._show_message("Success", f"File saved as:\n{out_file}")
+				proxy_note = f"\nProxy: {proxy.proxy_path(out_file)}" if make_proxy else ""
+				self._show_message("Success", f"File saved as:\n{out_file}{proxy_note}")
 			else:
 				self._update_status(f"Error: FFmpeg failed (code {retcode}). See logs.")
 				# Show last few lines of output in message box
@@ -263,21 +405,135 @@ class VideoConverterApp:
 			# Always reset GUI state
 			self._reset_gui_state()
 
+	def _run_ffmpeg_process(self, ffmpeg_cmd, lease=None, tracker=None):
+		# Run ffmpeg, streaming its output into the status bar (and progress bar with a tracker)
+		startupinfo = None
+		creationflags = 0
+		if os.name == 'nt': # Hide console window on Windows
+			startupinfo = subprocess.STARTUPINFO()
+			startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+			startupinfo.wShowWindow = subprocess.SW_HIDE # Hide the window
+			creationflags = subprocess.CREATE_NO_WINDOW # No console either
+
+		process = ffmpeg_metrics.TracedPopen(
+			ffmpeg_cmd,
+			stage="convert",
+			lease=lease,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT, # Redirect stderr to stdout
+			text=True,
+			encoding='utf-8',
+			errors='replace', # Handle weird chars from ffmpeg
+			startupinfo=startupinfo,
+			creationflags=creationflags
+		)
+
+		# Read output line by line
+		full_output = ""
+		while True:
+			line = process.stdout.readline()
+			if not line and process.poll() is not None:
+				break # Process finished
+			if line:
+				full_output += line
+				process.feed(line)
+				# Update status sparsely with progress lines
+				# Avoid flooding TK mainloop
+				if "frame=" in line or "size=" in line:
+					if tracker and tracker.update(line) is not None:
+						# Percent done and time left (stats lines come about twice a second)
+						self.root.after(0, self._show_progress, tracker.fraction, f"Processing: {tracker.describe()}")
+					# Only update UI occasionally
+					elif len(full_output) % 1000 < 100: # Simple throttle
+						self._update_status(f"Processing: {line.strip()}")
+		# Wait for process completion
+		return process.wait(), full_output
+
+	def _search_crf(self, in_file):
+		# Pick CRF from sampled segments; value field is an optional quality floor
+		import crf_search
+		floor = None
+		if self.rate_value_var.get().strip():
+			floor = float(self.rate_value_var.get())
+		crf, metric, worst = crf_search.search_crf(self.ffmpeg_path, in_file, floor=floor, status=self._update_status)
+		self._update_status(f"CRF search: CRF {crf} (worst sample {metric.upper()} {worst[crf]:.3f})")
+		return crf
+
+	def _run_target_conversion(self, in_file, out_file, rate_mode):
+		# Two-pass encode to a size/bitrate target
+		import rate_control
+		try:
+			try:
+				target = float(self.rate_value_var.get())
+				if target <= 0:
+					raise ValueError
+			except ValueError:
+				self._update_status("Error: Invalid rate control value.")
+				self._show_message("Error", f"Please enter a positive number for '{rate_mode}'.", "error")
+				return
+
+			# Same input, target and encoder as an earlier run: reuse its output
+			cache_key = output_cache.job_key([in_file], [{"rate_mode": rate_mode, "target": target,
+				"cuda": self.has_cuda, "mux": output_mux.DEFAULT_MODE, "ext": os.path.splitext(out_file)[1].lower()}])
+			if output_cache.fetch(cache_key, out_file):
+				size = os.path.getsize(out_file)
+			elif rate_mode == RATE_MODE_SIZE:
+				size = rate_control.encode_to_target(self.ffmpeg_path, in_file, out_file, self.has_cuda,
+					target_mb=target, status=self._update_status)
+				output_cache.store(cache_key, out_file)
+			else:
+				size = rate_control.encode_to_target(self.ffmpeg_path, in_file, out_file, self.has_cuda,
+					target_kbps=target, status=self._update_status)
+				output_cache.store(cache_key, out_file)
+
+			self._update_status(f"Success: Conversion complete ({size / (1024 * 1024):.1f} MB)!")
+			self._show_message("Success", f"File saved as:\n{out_file}")
+		except rate_control.TargetSizeMissed as e:
+			self._update_status("Error: Output is over the target size.")
+			self._show_message("Error", f"Could not fit the video under the target size.\n\n{e}\n\n"
+				"Try a larger target or a lower resolution.", "error")
+		except subprocess.CalledProcessError as e:
+			self._update_status(f"Error: FFmpeg failed (code {e.returncode}). See logs.")
+			error_summary = "\n".join((e.output or "").strip().split('\n')[-10:])
+			self._show_message("Error", f"FFmpeg conversion failed (code {e.returncode}).\n\nOutput summary:\n{error_summary}", "error")
+			print(f"FFMPEG ERROR:\n{e.output}") # Log full output
+		except FileNotFoundError:
+			self._update_status("Fatal Error: FFmpeg not found during execution.")
+			self._show_message("Error", "FFmpeg executable not found. Please ensure it's installed and in PATH.", "error")
+		except Exception as e:
+			error_details = str(e)
+			self._update_status(f"Error: {error_details}")
+			self._show_message("Error", f"An unexpected error occurred:\n{error_details}", "error")
+			print(f"PYTHON ERROR: {e}") # Log Python error
+		finally:
+			self._reset_gui_state()
+
 	def _reset_gui_state(self):
 		# Reset UI elements (thread-safe)
 		self.root.after(0, self._do_reset_gui_state)
 
+	def _show_progress(self, fraction, message):
+		# Determinate progress bar once the job reports its position (UI thread)
+		if str(self.progress_bar['mode']) != 'determinate':
+			self.progress_bar.stop()
+			self.progress_bar.config(mode='determinate', maximum=100)
+		self.progress_bar['value'] = fraction * 100
+		self.status_var.set(message)
+
 	def _do_reset_gui_state(self):
 		# Actual GUI updates
 		self.progress_bar.stop()
+		self.progress_bar.config(mode='indeterminate')
 		self.progress_bar['value'] = 0
 		self.start_button.config(state=tk.NORMAL if self.ffmpeg_path else tk.DISABLED)
+		self.proxy_button.config(state=tk.NORMAL)
 		# Reset status if it was left at "Starting..."
 		if self.status_var.get() == "Starting...":
 			self.status_var.set("Ready.")
 
 
 if __name__ == "__main__":
+	ffmpeg_metrics.serve_from_env()
 	root = tk.Tk()
 	app = VideoConverterApp(root)
 	root.mainloop()
@@ -0,0 +1,1022 @@
+"""In-process MP4/MOV and Matroska header parser: probing without spawning ffprobe.
+
+probe(path) reads only the container headers through mmap (the moov box;
+the EBML segment info, tracks, attachments and first clusters) and returns
+the part of ffprobe's -show_format -show_streams JSON the tools use:
+
+    format:  filename, format_name, nb_streams, start_time, duration
+    streams: index, codec_type, codec_name, profile, width, height, pix_fmt,
+             color_range, avg_frame_rate, r_frame_rate, sample_rate, channels,
+             start_time, duration, tags (language, timecode, Matroska title),
+             disposition (default; forced in Matroska)
+
+It returns None for anything it does not fully understand (other
+containers, fragmented MP4, unknown codecs, Matroska video without a
+default frame duration); ffmpeg_common.probe then runs ffprobe as before.
+pix_fmt and color_range come from the H.264/HEVC sequence parameter set
+in the codec configuration record (full range reads as yuvj420p, as
+ffmpeg's decoders report it). FFMPEG_TOOLS_FAST_PROBE=0 turns the fast
+path off.
+
+    python container_probe.py fixtures DIR    # generate test files with ffmpeg
+    python container_probe.py parity FILE ... # compare fields with ffprobe
+    python container_probe.py bench FILE ...  # header parse vs ffprobe spawn
+"""
+import fractions
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+
+ENABLED = os.environ.get("FFMPEG_TOOLS_FAST_PROBE", "1") != "0"
+MOV_FORMAT = "mov,mp4,m4a,3gp,3g2,mj2"
+MATROSKA_FORMAT = "matroska,webm"
+SCAN_BYTES = 16 * 1024 * 1024  # Matroska: how far into the clusters to look for each track's first block
+START_SAMPLES = 64  # MP4: samples checked for the earliest presentation time
+
+_MOV_TOP_BOXES = {"ftyp", "moov", "mdat", "free", "skip", "wide", "pnot", "uuid"}
+_MOV_CODECS = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "av01": "av1", "vp09": "vp9",
+    "mp4v": "mpeg4", "jpeg": "mjpeg", "apch": "prores", "apcn": "prores", "apcs": "prores",
+    "apco": "prores", "ap4h": "prores", "ap4x": "prores",
+    "mp4a": "aac", ".mp3": "mp3", "ac-3": "ac3", "ec-3": "eac3", "Opus": "opus", "fLaC": "flac",
+    "alac": "alac", "sowt": "pcm_s16le", "twos": "pcm_s16be", "tx3g": "mov_text",
+}
+_MOV_HANDLERS = {"vide": "video", "soun": "audio", "sbtl": "subtitle", "subt": "subtitle", "text": "subtitle",
+                 "tmcd": "data"}
+_ESDS_OBJECT_TYPES = {0x40: "aac", 0x66: "aac", 0x67: "aac", 0x68: "aac", 0x69: "mp3", 0x6B: "mp3",
+                      0x20: "mpeg4", 0xA5: "ac3", 0xA6: "eac3"}
+_PRORES_PROFILES = {"apco": "Proxy", "apcs": "LT", "apcn": "Standard", "apch": "HQ", "ap4h": "4444", "ap4x": "4444XQ"}
+# Macintosh language codes (QuickTime) ffmpeg maps to ISO 639-2
+_MAC_LANGUAGES = ["eng", "fra", "ger", "ita", "dut", "swe", "spa", "dan", "por", "nor", "heb", "jpn", "ara",
+                  "fin", "gre", "ice", "mlt", "tur", "hr ", "chi", "urd", "hin", "tha", "kor", "lit", "pol"]
+
+_MKV_CODECS = {
+    "V_MPEG4/ISO/AVC": "h264", "V_MPEGH/ISO/HEVC": "hevc", "V_AV1": "av1", "V_VP8": "vp8", "V_VP9": "vp9",
+    "V_MPEG2": "mpeg2video", "V_MPEG4/ISO/ASP": "mpeg4", "V_MJPEG": "mjpeg", "V_PRORES": "prores",
+    "A_AAC": "aac", "A_OPUS": "opus", "A_VORBIS": "vorbis", "A_AC3": "ac3", "A_EAC3": "eac3", "A_DTS": "dts",
+    "A_FLAC": "flac", "A_MPEG/L3": "mp3", "A_MPEG/L2": "mp2", "A_TRUEHD": "truehd", "A_ALAC": "alac",
+    "S_TEXT/UTF8": "subrip", "S_TEXT/ASS": "ass", "S_TEXT/SSA": "ass", "S_ASS": "ass", "S_SSA": "ass",
+    "S_TEXT/WEBVTT": "webvtt", "S_HDMV/PGS": "hdmv_pgs_subtitle", "S_VOBSUB": "dvd_subtitle",
+    "S_DVBSUB": "dvb_subtitle",
+}
+_MKV_TRACK_TYPES = {1: "video", 2: "audio", 17: "subtitle"}
+_FONT_MIME_TYPES = {"application/x-truetype-font": "ttf", "font/ttf": "ttf", "application/x-font": "ttf",
+                    "application/vnd.ms-opentype": "otf", "font/otf": "otf"}
+
+_AAC_PROFILES = {1: "Main", 2: "LC", 3: "SSR", 4: "LTP", 5: "HE-AAC", 29: "HE-AACv2"}
+_AAC_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350]
+_H264_PROFILES = {66: "Baseline", 77: "Main", 88: "Extended", 100: "High", 110: "High 10", 122: "High 4:2:2",
+                  244: "High 4:4:4 Predictive", 44: "CAVLC 4:4:4"}
+_HEVC_PROFILES = {1: "Main", 2: "Main 10", 3: "Main Still Picture", 4: "Rext"}
+_CHROMA = {0: "gray", 1: "yuv420p", 2: "yuv422p", 3: "yuv444p"}
+_H264_FULL_RANGE = {"yuv420p": "yuvj420p", "yuv422p": "yuvj422p", "yuv444p": "yuvj444p"}
+_HEVC_FULL_RANGE = {"yuv420p": "yuvj420p"}
+
+
+def _seconds(value):
+    return f"{value:.6f}"
+
+
+def _rate(fraction):
+    return f"{fraction.numerator}/{fraction.denominator}" if fraction else "0/0"
+
+
+def _pix_fmt(chroma, bit_depth):
+    name = _CHROMA.get(chroma)
+    if name and bit_depth > 8:
+        name += f"{bit_depth}le"
+    return name
+
+
+class _Bits:
+    # MSB-first bit reader for codec configuration records
+    def __init__(self, data):
+        self.data, self.pos = data, 0
+
+    def read(self, count):
+        value = 0
+        for _ in range(count):
+            value = (value << 1) | ((self.data[self.pos >> 3] >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self):
+        zeros = 0
+        while not self.read(1):
+            zeros += 1
+        return (1 << zeros) - 1 + self.read(zeros)
+
+    def se(self):
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+    def skip(self, count):
+        self.pos += count
+
+
+def _audio_specific_config(config):
+    # Returns (profile, sample rate, channels) from an AAC AudioSpecificConfig
+    bits = _Bits(config)
+
+    def object_type():
+        value = bits.read(5)
+        return 32 + bits.read(6) if value == 31 else value
+
+    def frequency():
+        index = bits.read(4)
+        return bits.read(24) if index == 15 else (_AAC_RATES[index] if index < len(_AAC_RATES) else 0)
+
+    profile = object_type()
+    rate = frequency()
+    channels = bits.read(4)
+    if profile in (5, 29):
+        rate = frequency()  # SBR: output rate
+    return _AAC_PROFILES.get(profile), rate, channels
+
+
+def _rbsp(nal, header):
+    # NAL payload without its header and emulation prevention bytes
+    return nal[header:].replace(b"\x00\x00\x03", b"\x00\x00")
+
+
+def _signal_range(bits):
+    # VUI up to video_full_range_flag: "pc", "tv" or None when not signalled
+    if bits.read(1) and bits.read(8) == 255:  # aspect_ratio_info_present_flag, aspect_ratio_idc
+        bits.skip(32)
+    if bits.read(1):  # overscan_info_present_flag
+        bits.skip(1)
+    if not bits.read(1):  # video_signal_type_present_flag
+        return None
+    bits.skip(3)
+    return "pc" if bits.read(1) else "tv"
+
+
+def _avc_sps(sps):
+    # Returns (chroma_format_idc, bit depth, range) from an H.264 SPS NAL unit
+    bits = _Bits(_rbsp(sps, 1))
+    profile_idc = bits.read(8)
+    bits.skip(16)
+    bits.ue()
+    chroma, depth = 1, 8
+    if profile_idc in (100, 110, 122, 144, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135):
+        chroma = bits.ue()
+        if chroma == 3:
+            bits.skip(1)
+        depth = bits.ue() + 8
+        bits.ue()
+        bits.skip(1)
+        if bits.read(1):  # seq_scaling_matrix_present_flag
+            for index in range(8 if chroma != 3 else 12):
+                if bits.read(1):
+                    last = following = 8
+                    for _ in range(16 if index < 6 else 64):
+                        if following:
+                            following = (last + bits.se()) % 256
+                        last = following or last
+    bits.ue()
+    poc_type = bits.ue()
+    if poc_type == 0:
+        bits.ue()
+    elif poc_type == 1:
+        bits.skip(1)
+        bits.se()
+        bits.se()
+        for _ in range(bits.ue()):
+            bits.se()
+    bits.ue()
+    bits.skip(1)
+    bits.ue()
+    bits.ue()
+    if not bits.read(1):  # frame_mbs_only_flag
+        bits.skip(1)
+    bits.skip(1)
+    if bits.read(1):  # frame_cropping_flag
+        for _ in range(4):
+            bits.ue()
+    return chroma, depth, _signal_range(bits) if bits.read(1) else None
+
+
+def _hevc_sps(sps):
+    # Returns (chroma_format_idc, bit depth, range) from an HEVC SPS NAL unit
+    bits = _Bits(_rbsp(sps, 2))
+    bits.skip(4)
+    sub_layers = bits.read(3)
+    bits.skip(1 + 88 + 8)  # temporal_id_nesting_flag, general profile_tier_level
+    present = [(bits.read(1), bits.read(1)) for _ in range(sub_layers)]
+    if sub_layers:
+        bits.skip(2 * (8 - sub_layers))
+    for profile_present, level_present in present:
+        bits.skip(88 * profile_present + 8 * level_present)
+    bits.ue()
+    chroma = bits.ue()
+    if chroma == 3:
+        bits.skip(1)
+    bits.ue()
+    bits.ue()
+    if bits.read(1):  # conformance_window_flag
+        for _ in range(4):
+            bits.ue()
+    depth = bits.ue() + 8
+    bits.ue()
+    poc_bits = bits.ue() + 4
+    for _ in range(sub_layers + 1 if bits.read(1) else 1):
+        bits.ue()
+        bits.ue()
+        bits.ue()
+    for _ in range(6):
+        bits.ue()
+    if bits.read(1) and bits.read(1):  # scaling_list_enabled_flag, sps_scaling_list_data_present_flag
+        for size in range(4):
+            for _ in range(0, 6, 3 if size == 3 else 1):
+                if not bits.read(1):
+                    bits.ue()
+                    continue
+                if size > 1:
+                    bits.se()
+                for _ in range(min(64, 1 << (4 + (size << 1)))):
+                    bits.se()
+    bits.skip(2)
+    if bits.read(1):  # pcm_enabled_flag
+        bits.skip(8)
+        bits.ue()
+        bits.ue()
+        bits.skip(1)
+    delta_pocs = []
+    for index in range(bits.ue()):
+        if index and bits.read(1):  # inter_ref_pic_set_prediction_flag
+            bits.skip(1)
+            bits.ue()
+            count = 0
+            for _ in range(delta_pocs[-1] + 1):
+                count += bool(bits.read(1) or bits.read(1))
+            delta_pocs.append(count)
+        else:
+            negative, positive = bits.ue(), bits.ue()
+            for _ in range(negative + positive):
+                bits.ue()
+                bits.skip(1)
+            delta_pocs.append(negative + positive)
+    if bits.read(1):  # long_term_ref_pics_present_flag
+        for _ in range(bits.ue()):
+            bits.skip(poc_bits + 1)
+    bits.skip(2)
+    return chroma, depth, _signal_range(bits) if bits.read(1) else None
+
+
+def _color(stream, chroma, depth, color_range, full_range_formats):
+    stream["pix_fmt"] = _pix_fmt(chroma, depth)
+    if color_range:
+        stream["color_range"] = color_range
+    if color_range == "pc":
+        stream["pix_fmt"] = full_range_formats.get(stream["pix_fmt"], stream["pix_fmt"])
+
+
+def _parameter_sets(config, pos, count):
+    # Length-prefixed NAL units of a configuration record
+    for _ in range(count):
+        size = struct.unpack_from(">H", config, pos)[0]
+        yield config[pos + 2:pos + 2 + size]
+        pos += 2 + size
+
+
+def _avc_config(config, stream):
+    # avcC: profile and chroma format / bit depth (stored for High profiles)
+    profile_idc, constraints = config[1], config[2]
+    name = _H264_PROFILES.get(profile_idc)
+    if profile_idc == 66 and constraints & 0x40:
+        name = "Constrained Baseline"
+    if name:
+        stream["profile"] = name
+    sps = next(_parameter_sets(config, 6, config[5] & 0x1F), None)
+    if sps:
+        _color(stream, *_avc_sps(sps), _H264_FULL_RANGE)
+        return
+    chroma, depth = 1, 10 if profile_idc == 110 else 8
+    if profile_idc in (100, 110, 122, 144, 244):
+        # High profiles may append chroma_format and bit depths after the SPS/PPS lists
+        pos, count = 6, config[5] & 0x1F
+        for _ in range(count):
+            pos += 2 + struct.unpack_from(">H", config, pos)[0]
+        count, pos = config[pos], pos + 1
+        for _ in range(count):
+            pos += 2 + struct.unpack_from(">H", config, pos)[0]
+        if pos + 2 <= len(config):
+            chroma, depth = config[pos] & 3, (config[pos + 1] & 7) + 8
+    stream["pix_fmt"] = _pix_fmt(chroma, depth)
+
+
+def _hevc_config(config, stream):
+    profile = _HEVC_PROFILES.get(config[1] & 0x1F)
+    if profile:
+        stream["profile"] = profile
+    if len(config) <= 18:
+        return
+    stream["pix_fmt"] = _pix_fmt(config[16] & 3, (config[17] & 7) + 8)
+    pos = 23
+    for _ in range(config[22] if len(config) > 22 else 0):
+        kind, count = config[pos] & 0x3F, struct.unpack_from(">H", config, pos + 1)[0]
+        if kind == 33 and count:  # SPS
+            _color(stream, *_hevc_sps(next(_parameter_sets(config, pos + 3, 1))), _HEVC_FULL_RANGE)
+            return
+        for nal in _parameter_sets(config, pos + 3, count):
+            pos += 2 + len(nal)
+        pos += 3
+
+
+# --- MP4 / QuickTime ---
+
+def _boxes(data, start, end):
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size, header = struct.unpack_from(">Q", data, pos + 8)[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind.decode("latin-1"), pos + header, pos + size
+        pos += size
+
+
+def _find(data, start, end, *path):
+    for kind, child_start, child_end in _boxes(data, start, end):
+        if kind == path[0]:
+            return (child_start, child_end) if len(path) == 1 else _find(data, child_start, child_end, *path[1:])
+    return None
+
+
+def _mov_language(code):
+    if code == 0x7FFF:
+        return None  # Unspecified: ffmpeg sets no tag
+    if code < 0x400:
+        return _MAC_LANGUAGES[code] if code < len(_MAC_LANGUAGES) else None
+    return "".join(chr(((code >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+
+
+def _timecode_string(counter, fps, drop, wrap):
+    if drop and fps in (30, 60):
+        # Drop-frame: skip 2 (4 at 60 fps) frame numbers each minute except every tenth
+        dropped = fps // 15
+        per_ten = fps * 600 - dropped * 9
+        tens, rest = divmod(counter, per_ten)
+        counter += dropped * 9 * tens + (dropped * ((rest - dropped) // (fps * 60 - dropped)) if rest > dropped else 0)
+    frames = counter % fps
+    seconds = counter // fps
+    hours = seconds // 3600
+    if wrap:
+        hours %= 24
+    return f"{hours:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}{';' if drop else ':'}{frames:02d}"
+
+
+def _mov_timecode(data, entry, stbl):
+    # First sample of a tmcd track: a frame counter at the first chunk offset
+    flags, timescale, frame_duration, fps = struct.unpack_from(">IIIB", data, entry + 20)
+    chunk = _find(data, stbl[0], stbl[1], "stco")
+    if chunk:
+        offset = struct.unpack_from(">I", data, chunk[0] + 8)[0]
+    else:
+        chunk = _find(data, stbl[0], stbl[1], "co64")
+        if not chunk:
+            return None
+        offset = struct.unpack_from(">Q", data, chunk[0] + 8)[0]
+    if not fps or offset + 4 > len(data):
+        return None
+    counter = struct.unpack_from(">I", data, offset)[0]
+    return _timecode_string(counter, fps, bool(flags & 1), bool(flags & 2))
+
+
+def _mov_track(data, start, end, movie_timescale):
+    hdlr = _find(data, start, end, "mdia", "hdlr")
+    mdhd = _find(data, start, end, "mdia", "mdhd")
+    stbl = _find(data, start, end, "mdia", "minf", "stbl")
+    if not (hdlr and mdhd and stbl):
+        return None
+    handler = data[hdlr[0] + 8:hdlr[0] + 12].decode("latin-1")
+    codec_type = _MOV_HANDLERS.get(handler)
+    if not codec_type:
+        return None
+    if data[mdhd[0]] == 1:
+        timescale, media_duration = struct.unpack_from(">IQ", data, mdhd[0] + 20)
+        language = struct.unpack_from(">H", data, mdhd[0] + 32)[0]
+    else:
+        timescale, media_duration = struct.unpack_from(">II", data, mdhd[0] + 12)
+        language = struct.unpack_from(">H", data, mdhd[0] + 20)[0]
+    if not timescale:
+        return None
+    stream = {"codec_type": codec_type, "time_base": f"1/{timescale}", "tags": {}}
+    tkhd = _find(data, start, end, "tkhd")
+    if tkhd:
+        stream["disposition"] = {"default": data[tkhd[0] + 3] & 1}  # Track enabled flag
+    language = _mov_language(language & 0x7FFF)
+    if language:
+        stream["tags"]["language"] = language
+
+    stsd = _find(data, stbl[0], stbl[1], "stsd")
+    if not stsd or struct.unpack_from(">I", data, stsd[0] + 4)[0] < 1:
+        return None
+    entry = stsd[0] + 8
+    entry_end = entry + struct.unpack_from(">I", data, entry)[0]
+    fourcc = data[entry + 4:entry + 8].decode("latin-1")
+
+    # Sample timing: stts (decode deltas) and ctts (presentation offsets)
+    stts = _find(data, stbl[0], stbl[1], "stts")
+    runs = []
+    if stts:
+        count = struct.unpack_from(">I", data, stts[0] + 4)[0]
+        runs = [struct.unpack_from(">II", data, stts[0] + 8 + 8 * i) for i in range(count)]
+    sample_count = sum(n for n, _ in runs)
+    total_duration = sum(n * delta for n, delta in runs)
+    earliest = 0
+    ctts = _find(data, stbl[0], stbl[1], "ctts")
+    if ctts and runs:
+        offsets = []
+        count = struct.unpack_from(">I", data, ctts[0] + 4)[0]
+        for i in range(count):
+            n, offset = struct.unpack_from(">Ii", data, ctts[0] + 8 + 8 * i)
+            offsets.extend([offset] * min(n, START_SAMPLES - len(offsets)))
+            if len(offsets) >= START_SAMPLES:
+                break
+        dts, deltas = 0, [delta for n, delta in runs for _ in range(min(n, START_SAMPLES))]
+        presentation = []
+        for offset, delta in zip(offsets, deltas):
+            presentation.append(dts + offset)
+            dts += delta
+        earliest = min(presentation) if presentation else 0
+
+    # Edit list: leading empty edits delay the track; media_time skips into it
+    start_time = earliest / timescale
+    duration = media_duration / timescale
+    elst = _find(data, start, end, "edts", "elst")
+    if elst:
+        version = data[elst[0]]
+        count = struct.unpack_from(">I", data, elst[0] + 4)[0]
+        size, layout = (20, ">Qq") if version == 1 else (12, ">Ii")
+        delay, media_time, edited = 0, None, 0
+        for i in range(count):
+            segment, time_offset = struct.unpack_from(layout, data, elst[0] + 8 + size * i)
+            if time_offset == -1:
+                delay += segment
+            else:
+                media_time = time_offset if media_time is None else media_time
+                edited += segment
+        start_time = delay / movie_timescale + max(0, earliest - (media_time or 0)) / timescale
+        if edited:
+            duration = edited / movie_timescale
+    stream["start_time"] = _seconds(start_time)
+    stream["duration"] = _seconds(duration)
+
+    if codec_type == "data":
+        timecode = _mov_timecode(data, entry, stbl) if fourcc == "tmcd" else None
+        if timecode:
+            stream["tags"]["timecode"] = timecode
+        return stream
+    codec = _MOV_CODECS.get(fourcc)
+    if not codec:
+        return None
+    stream["codec_name"] = codec
+    stream["codec_tag_string"] = fourcc
+
+    if codec_type == "video":
+        stream["width"], stream["height"] = struct.unpack_from(">HH", data, entry + 32)
+        for kind, child_start, child_end in _boxes(data, entry + 86, entry_end):
+            if kind == "avcC":
+                _avc_config(data[child_start:child_end], stream)
+            elif kind == "hvcC":
+                _hevc_config(data[child_start:child_end], stream)
+        if codec == "prores":
+            stream["profile"] = _PRORES_PROFILES[fourcc]
+            if fourcc not in ("ap4h", "ap4x"):
+                stream["pix_fmt"] = "yuv422p10le"
+        average = fractions.Fraction(timescale * sample_count, total_duration) if total_duration else None
+        stream["avg_frame_rate"] = _rate(average)
+        # ffmpeg takes the real frame rate straight from a constant stts
+        if len(runs) == 1 or (len(runs) == 2 and runs[1][0] == 1):
+            stream["r_frame_rate"] = _rate(fractions.Fraction(timescale, runs[0][1]))
+        else:
+            stream["r_frame_rate"] = stream["avg_frame_rate"]
+    elif codec_type == "audio":
+        version = struct.unpack_from(">H", data, entry + 16)[0]
+        if version == 2:
+            rate = struct.unpack_from(">d", data, entry + 40)[0]
+            channels = struct.unpack_from(">I", data, entry + 48)[0]
+            children = entry + 72
+        else:
+            channels = struct.unpack_from(">H", data, entry + 24)[0]
+            rate = struct.unpack_from(">I", data, entry + 32)[0] >> 16
+            children = entry + (52 if version == 1 else 36)
+        if fourcc == "mp4a":
+            # QuickTime (version 1/2 entries) nests it in a 'wave' box
+            esds = _find(data, children, entry_end, "esds") or _find(data, children, entry_end, "wave", "esds")
+            if not esds or not _mov_esds(data[esds[0] + 4:esds[1]], stream):
+                return None
+            codec = stream["codec_name"]
+        if codec == "aac" and stream.get("_asc"):
+            profile, asc_rate, asc_channels = stream.pop("_asc")
+            if profile:
+                stream["profile"] = profile
+            rate = asc_rate or rate
+            channels = asc_channels or channels
+        stream.pop("_asc", None)
+        stream["sample_rate"] = str(int(rate))
+        stream["channels"] = channels
+        stream["avg_frame_rate"] = stream["r_frame_rate"] = "0/0"
+    return stream
+
+
+def _descriptor(data, pos):
+    # MPEG-4 descriptor: tag, variable-length size; returns (tag, payload start, payload end)
+    tag, pos, size = data[pos], pos + 1, 0
+    for _ in range(4):
+        byte = data[pos]
+        pos += 1
+        size = (size << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, pos, pos + size
+
+
+def _mov_esds(data, stream):
+    try:
+        tag, pos, end = _descriptor(data, 0)
+        if tag != 3:
+            return False
+        flags = data[pos + 2]
+        pos += 3
+        if flags & 0x80:
+            pos += 2
+        if flags & 0x40:
+            pos += 1 + data[pos]
+        if flags & 0x20:
+            pos += 2
+        tag, pos, end = _descriptor(data, pos)
+        if tag != 4:
+            return False
+        codec = _ESDS_OBJECT_TYPES.get(data[pos])
+        if not codec:
+            return False
+        stream["codec_name"] = codec
+        if codec == "aac" and pos + 13 < end:
+            tag, config_start, config_end = _descriptor(data, pos + 13)
+            if tag == 5:
+                stream["_asc"] = _audio_specific_config(data[config_start:config_end])
+        return True
+    except IndexError:
+        return False
+
+
+def _probe_mov(data):
+    top = list(_boxes(data, 0, len(data)))
+    if not top or top[0][0] not in _MOV_TOP_BOXES:
+        return None
+    moov = next(((start, end) for kind, start, end in top if kind == "moov"), None)
+    if not moov or _find(data, moov[0], moov[1], "mvex"):
+        return None  # No header, or fragmented (durations live in the fragments)
+    mvhd = _find(data, moov[0], moov[1], "mvhd")
+    if not mvhd:
+        return None
+    if data[mvhd[0]] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, mvhd[0] + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, mvhd[0] + 12)
+    if not timescale:
+        return None
+    streams, timecode_of = [], {}
+    for kind, start, end in _boxes(data, moov[0], moov[1]):
+        if kind != "trak":
+            continue
+        stream = _mov_track(data, start, end, timescale)
+        if stream is None:
+            return None
+        stream["index"] = len(streams)
+        tkhd = _find(data, start, end, "tkhd")
+        track_id = struct.unpack_from(">I", data, tkhd[0] + (20 if data[tkhd[0]] == 1 else 12))[0] if tkhd else 0
+        reference = _find(data, start, end, "tref", "tmcd")
+        if reference and reference[1] - reference[0] >= 4:
+            stream["_tmcd"] = struct.unpack_from(">I", data, reference[0])[0]
+        stream["_id"] = track_id
+        streams.append(stream)
+    # A video track referencing a timecode track shows its timecode too
+    for stream in streams:
+        if stream["codec_type"] == "data" and "timecode" in stream["tags"]:
+            timecode_of[stream["_id"]] = stream["tags"]["timecode"]
+    for stream in streams:
+        if stream.get("_tmcd") in timecode_of:
+            stream["tags"]["timecode"] = timecode_of[stream["_tmcd"]]
+        stream.pop("_tmcd", None)
+        stream.pop("_id", None)
+    starts = [float(s["start_time"]) for s in streams]
+    return {
+        "streams": streams,
+        "format": {
+            "nb_streams": len(streams),
+            "format_name": MOV_FORMAT,
+            "start_time": _seconds(min(starts) if starts else 0.0),
+            "duration": _seconds(duration / timescale),
+        },
+    }
+
+
+# --- Matroska / WebM ---
+
+_EBML = 0x1A45DFA3
+_SEGMENT = 0x18538067
+_SEEK_HEAD = 0x114D9B74
+_INFO = 0x1549A966
+_TRACKS = 0x1654AE6B
+_ATTACHMENTS = 0x1941A469
+_CLUSTER = 0x1F43B675
+_LEVEL1 = {_SEEK_HEAD, _INFO, _TRACKS, _CLUSTER, _ATTACHMENTS, 0x1C53BB6B, 0x1043A770, 0x1254C367}
+
+
+def _vint(data, pos, keep_marker=False):
+    # EBML variable-length integer; returns (value, next position, unknown size)
+    first = data[pos]
+    if not first:
+        raise ValueError("Invalid EBML length")
+    length = 9 - first.bit_length()
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, pos + length, unknown
+
+
+def _header(data, pos, end):
+    # Element at pos: (id, payload start, payload end, unknown size)
+    element_id, pos, _ = _vint(data, pos, keep_marker=True)
+    size, pos, unknown = _vint(data, pos)
+    return element_id, pos, end if unknown else min(pos + size, end), unknown
+
+
+def _elements(data, start, end):
+    pos = start
+    while pos < end:
+        element_id, payload, stop, unknown = _header(data, pos, end)
+        yield element_id, payload, stop
+        pos = stop
+
+
+def _uint(data, start, end):
+    return int.from_bytes(data[start:end], "big")
+
+
+def _float(data, start, end):
+    return struct.unpack(">f" if end - start == 4 else ">d", data[start:end])[0]
+
+
+def _text(data, start, end):
+    return bytes(data[start:end]).split(b"\0", 1)[0].decode("utf-8", errors="replace")
+
+
+def _mkv_track(data, start, end):
+    track = {"language": "eng", "codec_delay": 0, "default": 1, "forced": 0}
+    for element_id, child_start, child_end in _elements(data, start, end):
+        if element_id == 0xD7:
+            track["number"] = _uint(data, child_start, child_end)
+        elif element_id == 0x83:
+            track["type"] = _uint(data, child_start, child_end)
+        elif element_id == 0x86:
+            track["codec_id"] = _text(data, child_start, child_end)
+        elif element_id == 0x22B59C:
+            track["language"] = _text(data, child_start, child_end)
+        elif element_id == 0x536E:
+            track["name"] = _text(data, child_start, child_end)
+        elif element_id == 0x88:
+            track["default"] = _uint(data, child_start, child_end)
+        elif element_id == 0x55AA:
+            track["forced"] = _uint(data, child_start, child_end)
+        elif element_id == 0x23E383:
+            track["default_duration"] = _uint(data, child_start, child_end)
+        elif element_id == 0x63A2:
+            track["private"] = bytes(data[child_start:child_end])
+        elif element_id == 0x56AA:
+            track["codec_delay"] = _uint(data, child_start, child_end)
+        elif element_id in (0xE0, 0xE1):
+            for sub_id, sub_start, sub_end in _elements(data, child_start, child_end):
+                if sub_id == 0xB0:
+                    track["width"] = _uint(data, sub_start, sub_end)
+                elif sub_id == 0xBA:
+                    track["height"] = _uint(data, sub_start, sub_end)
+                elif sub_id == 0xB5:
+                    track["rate"] = _float(data, sub_start, sub_end)
+                elif sub_id == 0x9F:
+                    track["channels"] = _uint(data, sub_start, sub_end)
+                elif sub_id == 0x6264:
+                    track["bit_depth"] = _uint(data, sub_start, sub_end)
+    return track
+
+
+def _mkv_codec(track):
+    codec_id = track.get("codec_id", "")
+    if codec_id.startswith("A_AAC"):
+        return "aac"
+    if codec_id.startswith("A_PCM/"):
+        depth = track.get("bit_depth", 16)
+        if codec_id == "A_PCM/FLOAT/IEEE":
+            return f"pcm_f{depth}le"
+        return f"pcm_s{depth}{'be' if codec_id == 'A_PCM/INT/BIG' else 'le'}" if depth > 8 else "pcm_u8"
+    return _MKV_CODECS.get(codec_id)
+
+
+def _mkv_stream(track):
+    codec_type = _MKV_TRACK_TYPES.get(track.get("type"))
+    codec = _mkv_codec(track)
+    if not codec_type or not codec:
+        return None
+    stream = {"codec_type": codec_type, "codec_name": codec, "time_base": "1/1000", "tags": {},
+              "disposition": {"default": int(bool(track["default"])), "forced": int(bool(track["forced"]))}}
+    if track["language"] != "und":
+        stream["tags"]["language"] = track["language"]
+    if track.get("name"):
+        stream["tags"]["title"] = track["name"]
+    private = track.get("private")
+    if codec_type == "video":
+        if not track.get("default_duration"):
+            return None  # ffprobe would measure the frame rate from the packets
+        stream["width"], stream["height"] = track.get("width"), track.get("height")
+        if private and codec == "h264":
+            _avc_config(private, stream)
+        elif private and codec == "hevc" and len(private) > 18:
+            _hevc_config(private, stream)
+        # As ffmpeg: av_reduce(1e9, DefaultDuration, 30000)
+        rate = fractions.Fraction(1000000000, track["default_duration"]).limit_denominator(30000)
+        stream["avg_frame_rate"] = stream["r_frame_rate"] = _rate(rate)
+    elif codec_type == "audio":
+        rate, channels = track.get("rate", 8000.0), track.get("channels", 1)
+        if codec == "aac" and private:
+            profile, asc_rate, asc_channels = _audio_specific_config(private)
+            if profile:
+                stream["profile"] = profile
+            rate, channels = asc_rate or rate, asc_channels or channels
+        stream["sample_rate"] = str(int(rate))
+        stream["channels"] = channels
+        stream["avg_frame_rate"] = stream["r_frame_rate"] = "0/0"
+    return stream
+
+
+def _mkv_first_blocks(data, start, end, timestamp_scale, first):
+    # Records each track's first block time (seconds) in a cluster; returns
+    # where an unknown-size cluster ended (the next level-1 element), else None
+    cluster_time, pos = 0, start
+    while pos < end:
+        element_id, payload, stop, _ = _header(data, pos, end)
+        if element_id in _LEVEL1:
+            return pos
+        if element_id == 0xE7:
+            cluster_time = _uint(data, payload, stop)
+        elif element_id in (0xA3, 0xA0):
+            if element_id == 0xA0:
+                payload = next((s for i, s, _ in _elements(data, payload, stop) if i == 0xA1), None)
+            if payload is not None:
+                number, block, _ = _vint(data, payload)
+                relative = struct.unpack_from(">h", data, block)[0]
+                first.setdefault(number, (cluster_time + relative) * timestamp_scale / 1e9)
+        pos = stop
+    return None
+
+
+def _probe_matroska(data):
+    element_id, start, end, _ = _header(data, 0, len(data))
+    if element_id != _EBML:
+        return None
+    doc_type = next((_text(data, s, e) for i, s, e in _elements(data, start, end) if i == 0x4282), "matroska")
+    if doc_type not in ("matroska", "webm"):
+        return None
+    element_id, segment, segment_end, _ = _header(data, end, len(data))
+    if element_id != _SEGMENT:
+        return None
+
+    found, seeks, first = {}, {}, {}
+    timestamp_scale, scan_limit = 1000000, None
+    pos = segment
+    # Level-1 elements up to the first clusters (headers only; clusters are skipped by size)
+    while pos < segment_end:
+        element_id, payload, stop, unknown = _header(data, pos, segment_end)
+        if element_id == _SEEK_HEAD:
+            for i, s, e in _elements(data, payload, stop):
+                if i == 0x4DBB:
+                    fields = {child: (cs, ce) for child, cs, ce in _elements(data, s, e)}
+                    if 0x53AB in fields and 0x53AC in fields:
+                        seeks[_uint(data, *fields[0x53AB])] = segment + _uint(data, *fields[0x53AC])
+        elif element_id in (_INFO, _TRACKS, _ATTACHMENTS):
+            found.setdefault(element_id, (payload, stop))
+        elif element_id == _CLUSTER:
+            if _INFO in found:
+                timestamp_scale = next((_uint(data, s, e) for i, s, e in _elements(data, *found[_INFO])
+                                        if i == 0x2AD7B1), 1000000)
+            scan_limit = scan_limit or pos + SCAN_BYTES
+            tracks_wanted = _TRACKS in found and len(first) < sum(
+                1 for i, _, _ in _elements(data, *found[_TRACKS]) if i == 0xAE)
+            if not tracks_wanted or pos > scan_limit:
+                break
+            resume = _mkv_first_blocks(data, payload, stop, timestamp_scale, first)
+            if unknown:
+                if resume is None:
+                    break
+                pos = resume
+                continue
+        pos = stop
+
+    # Elements stored after the clusters are reached through the SeekHead
+    for element_id in (_INFO, _TRACKS, _ATTACHMENTS):
+        if element_id not in found and element_id in seeks and seeks[element_id] < segment_end:
+            seek_id, payload, stop, _ = _header(data, seeks[element_id], segment_end)
+            if seek_id == element_id:
+                found[element_id] = (payload, stop)
+    if _TRACKS not in found:
+        return None
+
+    duration = None
+    for i, s, e in _elements(data, *found.get(_INFO, (0, 0))):
+        if i == 0x2AD7B1:
+            timestamp_scale = _uint(data, s, e)
+        elif i == 0x4489:
+            duration = _float(data, s, e)
+    streams = []
+    for i, s, e in _elements(data, *found[_TRACKS]):
+        if i != 0xAE:
+            continue
+        track = _mkv_track(data, s, e)
+        stream = _mkv_stream(track)
+        if stream is None:
+            return None
+        if track.get("number") in first:
+            stream["start_time"] = _seconds(first[track["number"]] - track["codec_delay"] / 1e9)
+        stream["index"] = len(streams)
+        streams.append(stream)
+    for i, s, e in _elements(data, *found.get(_ATTACHMENTS, (0, 0))):
+        if i != 0x61A7:
+            continue
+        fields = {child: _text(data, cs, ce) for child, cs, ce in _elements(data, s, e) if child in (0x466E, 0x4660)}
+        stream = {"index": len(streams), "codec_type": "attachment",
+                  "tags": {"filename": fields.get(0x466E, ""), "mimetype": fields.get(0x4660, "")}}
+        codec = _FONT_MIME_TYPES.get(fields.get(0x4660, "").lower())
+        if codec:
+            stream["codec_name"] = codec
+        streams.append(stream)
+
+    starts = [float(s["start_time"]) for s in streams if "start_time" in s]
+    info_format = {
+        "nb_streams": len(streams),
+        "format_name": MATROSKA_FORMAT,
+        "start_time": _seconds(min(starts) if starts else 0.0),
+    }
+    if duration:
+        info_format["duration"] = _seconds(duration * timestamp_scale / 1e9)
+    return {"streams": streams, "format": info_format}
+
+
+def probe(path):
+    """Returns ffprobe-style info for an MP4/MOV/Matroska file, or None when ffprobe is needed."""
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(12)
+            if len(magic) < 12:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if magic[:4] == b"\x1a\x45\xdf\xa3":
+                    info = _probe_matroska(data)
+                elif magic[4:8].decode("latin-1") in _MOV_TOP_BOXES:
+                    info = _probe_mov(data)
+                else:
+                    return None
+    except (OSError, ValueError, IndexError, struct.error, StopIteration):
+        return None  # Unreadable, truncated or malformed header: let ffprobe decide
+    if info is not None:
+        info["format"]["filename"] = path
+    return info
+
+
+# --- Fixtures, parity and benchmark ---
+
+FIXTURES = {
+    "h264_aac.mp4": ["-f", "lavfi", "-i", "testsrc2=size=640x360:rate=25", "-f", "lavfi", "-i", "sine=r=48000",
+                     "-t", "3", "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-metadata:s:a", "language=eng"],
+    "h264_high_bframes.mp4": ["-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=30000/1001", "-t", "3",
+                              "-c:v", "libx264", "-preset", "medium", "-profile:v", "high"],
+    "delayed_audio.mov": ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=24", "-f", "lavfi", "-i", "sine",
+                          "-t", "3", "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-af", "adelay=500",
+                          "-timecode", "01:00:00:00"],
+    "hevc_10bit.mp4": ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=30", "-t", "2", "-c:v", "libx265",
+                       "-pix_fmt", "yuv420p10le", "-tag:v", "hvc1", "-x265-params", "log-level=error"],
+    "audio_only.m4a": ["-f", "lavfi", "-i", "sine=r=44100", "-t", "3", "-c:a", "aac", "-ac", "2"],
+    "h264_subs.mkv": ["-f", "lavfi", "-i", "testsrc2=size=640x480:rate=30", "-f", "lavfi", "-i", "sine",
+                      "-t", "3", "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "flac",
+                      "-metadata:s:a:0", "language=ger"],
+    "vp9_opus.webm": ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-f", "lavfi", "-i", "sine=r=48000",
+                      "-t", "2", "-c:v", "libvpx-vp9", "-deadline", "realtime", "-c:a", "libopus"],
+    "h264_full_range.mp4": ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-t", "1", "-c:v", "libx264",
+                            "-preset", "ultrafast", "-x264-params", "cqm=jvt", "-color_range", "pc"],
+    "h264_tv_range.mkv": ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-t", "1", "-c:v", "libx264",
+                          "-preset", "ultrafast", "-pix_fmt", "yuv422p", "-color_range", "tv", "-colorspace", "bt709"],
+    "hevc_full_range.mkv": ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-t", "1", "-c:v", "libx265",
+                            "-x265-params", "log-level=error", "-color_range", "pc"],
+}
+# Two audio tracks with titles and dispositions, in both container families
+for _extension in ("mkv", "mp4"):
+    FIXTURES[f"titled_tracks.{_extension}"] = [
+        "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-f", "lavfi", "-i", "sine", "-f", "lavfi",
+        "-i", "sine=f=880", "-t", "2", "-map", "0:v", "-map", "1:a", "-map", "2:a", "-c:v", "libx264",
+        "-preset", "ultrafast", "-c:a", "aac", "-metadata:s:a:0", "title=Main", "-metadata:s:a:1", "title=Commentary",
+        "-metadata:s:a:1", "language=fre", "-disposition:a:0", "default", "-disposition:a:1", "0"]
+
+
+def make_fixture(ffmpeg_path, directory, name):
+    """Generates the FIXTURES file name in directory with ffmpeg; returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    subprocess.run([ffmpeg_path, "-v", "error", "-y"] + FIXTURES[name] + [path], check=True)
+    return path
+
+
+def make_fixtures(ffmpeg_path, directory):
+    """Generates all FIXTURES files; returns their paths."""
+    return [make_fixture(ffmpeg_path, directory, name) for name in FIXTURES]
+
+
+def _ffprobe(ffprobe_path, path):
+    import json
+    result = subprocess.run([ffprobe_path, "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", path],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def _close(fast, slow, tolerance):
+    try:
+        return abs(float(fractions.Fraction(fast)) - float(fractions.Fraction(slow))) <= tolerance
+    except (ValueError, ZeroDivisionError):
+        return fast == slow
+
+
+def parity(path, ffprobe_path="ffprobe", tolerance=0.002):
+    """Returns a list of differences between probe(path) and ffprobe (empty when they agree).
+
+    Only fields the fast path reports are compared; times and rates within
+    tolerance (seconds or frames/s) count as equal.
+    """
+    fast = probe(path)
+    if fast is None:
+        return ["fast path declined (ffprobe fallback)"]
+    slow = _ffprobe(ffprobe_path, path)
+    differences = []
+    for key in ("format_name", "nb_streams", "start_time", "duration"):
+        if key in fast["format"] and str(fast["format"][key]) != str(slow["format"].get(key)):
+            if not (key in ("start_time", "duration") and _close(fast["format"][key], slow["format"].get(key, "nan"), tolerance)):
+                differences.append(f"format.{key}: {fast['format'][key]} != {slow['format'].get(key)}")
+    for fast_stream, slow_stream in zip(fast["streams"], slow.get("streams", [])):
+        prefix = f"stream {fast_stream['index']}"
+        for key, value in fast_stream.items():
+            if key in ("tags", "disposition"):
+                for tag, tag_value in value.items():
+                    if slow_stream.get(key, {}).get(tag) != tag_value:
+                        differences.append(f"{prefix} {key}.{tag}: {tag_value} != {slow_stream.get(key, {}).get(tag)}")
+            elif key in ("start_time", "duration", "avg_frame_rate", "r_frame_rate"):
+                if key in slow_stream and not _close(value, slow_stream[key], tolerance):
+                    differences.append(f"{prefix} {key}: {value} != {slow_stream[key]}")
+            elif key != "time_base" and str(value) != str(slow_stream.get(key)):
+                differences.append(f"{prefix} {key}: {value} != {slow_stream.get(key)}")
+    return differences
+
+
+def benchmark(paths, ffprobe_path="ffprobe", repeat=5):
+    """Returns (header parse ms, ffprobe ms) per file, averaged over repeat runs."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            probe(path)
+    fast = (time.perf_counter() - started) * 1000 / (repeat * len(paths))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            _ffprobe(ffprobe_path, path)
+    return fast, (time.perf_counter() - started) * 1000 / (repeat * len(paths))
+
+
+if __name__ == "__main__":
+    import shutil
+    if len(sys.argv) < 3 or sys.argv[1] not in ("fixtures", "parity", "bench"):
+        print("usage: python container_probe.py fixtures DIR | parity FILE ... | bench FILE ...")
+        sys.exit(2)
+    if sys.argv[1] == "fixtures":
+        for fixture in make_fixtures(shutil.which("ffmpeg") or "ffmpeg", sys.argv[2]):
+            print(fixture)
+    elif sys.argv[1] == "parity":
+        mismatched = 0
+        for target in sys.argv[2:]:
+            found = parity(target, shutil.which("ffprobe") or "ffprobe")
+            mismatched += bool(found)
+            print(f"{'OK  ' if not found else 'DIFF'} {target}")
+            for line in found:
+                print(f"     {line}")
+        sys.exit(1 if mismatched else 0)
+    else:
+        parse_ms, spawn_ms = benchmark(sys.argv[2:], shutil.which("ffprobe") or "ffprobe")
+        print(f"header parse: {parse_ms:.3f} ms/file")
+        print(f"ffprobe:      {spawn_ms:.1f} ms/file ({spawn_ms / parse_ms:.0f}x)")
@@ -0,0 +1,119 @@
+"""Per-title CRF search: encode sampled segments and keep the highest CRF above a quality floor.
+
+Sample jobs run in a process pool sized by a governor lease (workers times
+-threads stays within the lease), and results are cached per source
+content, floor, preset, candidates and ffmpeg version, so rerunning a job
+reaches the output cache without searching again.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import app_cache
+import capabilities
+import ffmpeg_common
+import governor
+from ffmpeg_command import FfmpegCommand
+
+CANDIDATE_CRFS = (20, 23, 26, 29, 32)
+SAMPLE_COUNT = 4
+SAMPLE_SECONDS = 4.0
+VMAF_FLOOR = 93.0
+SSIM_FLOOR = 0.98
+
+_VMAF_RE = re.compile(r"VMAF score[:=]\s*([\d.]+)")
+_SSIM_RE = re.compile(r"SSIM .*All:([\d.]+)")
+
+
+def has_libvmaf():
+    """Checks whether this ffmpeg build includes the libvmaf filter."""
+    return capabilities.has_filter(capabilities.detect(), "libvmaf")
+
+
+def sample_offsets(duration, count=SAMPLE_COUNT, length=SAMPLE_SECONDS):
+    """Returns segment start times spread evenly through the source."""
+    if duration <= length:
+        return [0.0]
+    count = max(1, min(count, int(duration // length)))
+    step = (duration - length) / count
+    return [round(step * (i + 0.5), 3) for i in range(count)]
+
+
+def _score_sample(job):
+    # Runs in a worker process: encode one segment at one CRF and score it
+    ffmpeg_path, in_file, start, length, crf, preset, metric, work_dir, threads = job
+    sample_path = os.path.join(work_dir, f"sample_{start:.3f}_{crf}.mkv")
+    encode = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    source = encode.add_input(in_file, {"-ss": start, "-t": length})
+    sample = encode.add_output(sample_path).map(source, "v:0").update({
+        "-an": None, "-c:v": "libx264", "-preset": preset, "-crf": crf, "-pix_fmt": "yuv420p",
+    })
+    if threads:
+        sample.set("-threads", threads)
+    ffmpeg_common.run_command(encode.build(), stage="crf_sample_encode")
+    if metric == "vmaf":
+        graph = "[0:v]setpts=PTS-STARTPTS[d];[1:v]format=yuv420p,setpts=PTS-STARTPTS[r];[d][r]libvmaf"
+        pattern = _VMAF_RE
+    else:
+        graph = "[0:v]setpts=PTS-STARTPTS[d];[1:v]format=yuv420p,setpts=PTS-STARTPTS[r];[d][r]ssim"
+        pattern = _SSIM_RE
+    score = FfmpegCommand(ffmpeg_path, "-hide_banner", "-nostats")
+    score.add_input(sample_path)
+    score.add_input(in_file, {"-ss": start, "-t": length})
+    score.set_filter_complex(graph)
+    score.add_output("-", {"-f": "null"})
+    if threads:
+        score.global_options += ["-filter_threads", str(threads)]
+    output = ffmpeg_common.run_command(score.build(), stage="crf_sample_score")
+    os.remove(sample_path)
+    match = pattern.search(output)
+    if not match:
+        raise RuntimeError(f"Could not read {metric.upper()} score for CRF {crf} at {start}s.")
+    return crf, float(match.group(1))
+
+
+def search_crf(ffmpeg_path, in_file, floor=None, preset="ultrafast", crfs=CANDIDATE_CRFS,
+               max_workers=None, status=None):
+    """Returns (crf, metric, scores) for the highest CRF whose worst sample meets the floor.
+
+    Falls back to the lowest candidate CRF when nothing reaches the floor.
+    """
+    metric = "vmaf" if has_libvmaf() else "ssim"
+    if floor is None:
+        floor = VMAF_FLOOR if metric == "vmaf" else SSIM_FLOOR
+    try:
+        key = json.dumps([app_cache.file_key(in_file), metric, floor, preset, list(crfs),
+                          SAMPLE_COUNT, SAMPLE_SECONDS, capabilities.detect()["version"]])
+        cache_path = os.path.join(app_cache.cache_dir("crf_search"), hashlib.sha1(key.encode()).hexdigest() + ".json")
+    except OSError:
+        cache_path = None  # URL or unreadable path: always search
+    cached = app_cache.load_json(cache_path) if cache_path else None
+    if cached is not None:
+        return cached["crf"], metric, {int(crf): score for crf, score in cached["worst"].items()}
+    offsets = sample_offsets(ffmpeg_common.probe_duration(in_file))
+    if status:
+        status(f"Searching CRF on {len(offsets)} samples ({metric.upper()} floor {floor})...")
+
+    scores = {crf: [] for crf in crfs}
+    with tempfile.TemporaryDirectory() as work_dir, governor.lease("crf_search") as budget:
+        # The lease's threads split between pool workers (ungoverned: one worker per core)
+        job_count = len(offsets) * len(crfs)
+        workers = max_workers or min(job_count, budget.threads or os.cpu_count() or 1)
+        threads = max(1, budget.threads // workers) if budget.threads else None
+        jobs = [
+            (ffmpeg_path, in_file, start, SAMPLE_SECONDS, crf, preset, metric, work_dir, threads)
+            for start in offsets for crf in crfs
+        ]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            for crf, score in pool.map(_score_sample, jobs):
+                scores[crf].append(score)
+
+    worst = {crf: min(values) for crf, values in scores.items()}
+    passing = [crf for crf in crfs if worst[crf] >= floor]
+    chosen = max(passing) if passing else min(crfs)
+    if cache_path:
+        app_cache.save_json(cache_path, {"crf": chosen, "worst": worst})
+    return chosen, metric, worst
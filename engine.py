@@ -0,0 +1,466 @@
+"""Pluggable processing engines: the ffmpeg CLI (default) or PyAV in process.
+
+Both engines offer the same operations:
+
+    remux(in_file, out_file)                       copy every stream into a new container
+    extract_audio(in_file, out_file, fmt, also=()) one audio track to audio_extract.FORMATS formats
+                                                   (also: more (path, format) outputs, same decode)
+    replace_audio(video_file, audio_file, out_file, process=None)
+                                                   video copied, audio re-encoded (AAC)
+    transcode(in_file, out_file, ...)              H.264/AAC (or other encoder) re-encode
+    audio_frames(in_file, stream, rate, channels)  decoded audio as float32 NumPy arrays
+    read_audio(in_file, start, seconds, rate, channels)
+
+CliEngine spawns ffmpeg for each call, exactly as the tools always have.
+PyAVEngine (pip install av numpy) runs the same work through libav* in
+this process: no spawn, no stats parsing, and decoded audio reaches Python
+as arrays wrapped around the frame buffers (np.frombuffer, no copy) instead
+of going through a WAV file. replace_audio's process(samples, seconds)
+callback edits the audio between decode and encode, so a custom effect no
+longer needs the extract/edit/replace round trip on disk.
+
+get() picks the engine from FFMPEG_TOOLS_ENGINE ("cli" or "pyav");
+unknown names or a missing PyAV fall back to the CLI. The tools' audio
+extraction steps and av_sync's analysis reads go through get(). Merges,
+conversions and upscales keep their own ffmpeg commands: track maps, sync
+filters, hardware encoders, two-pass rate control and progress parsing
+have no engine equivalent.
+
+    python engine.py bench [CLIPS] [SECONDS]   # both engines on a batch of short clips
+"""
+import contextlib
+import heapq
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import audio_extract
+import ffmpeg_common
+import ffmpeg_metrics
+from ffmpeg_command import FfmpegCommand
+
+ENGINE = os.environ.get("FFMPEG_TOOLS_ENGINE", "cli").lower()
+AUDIO_BITRATE = 192000
+CHUNK_SAMPLES = 4096  # Samples per array when reading decoded audio from the CLI
+
+# audio_extract.FORMATS re-expressed for libav encoders: format -> (codec, sample rate, channels, bit rate)
+_PYAV_AUDIO = {
+    "wav": ("pcm_s16le", 44100, 2, None),
+    "mp3": ("libmp3lame", 44100, 2, 190000),  # ~ -q:a 2 VBR
+    "aac": ("aac", None, None, AUDIO_BITRATE),
+    "flac": ("flac", None, None, None),
+}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Decoded audio arrays need NumPy (pip install numpy).")
+    return numpy
+
+
+class CliEngine:
+    """Runs every operation as an ffmpeg subprocess."""
+
+    name = "cli"
+
+    def __init__(self, ffmpeg_path=None):
+        self.ffmpeg_path = ffmpeg_path or ffmpeg_common.find_ffmpeg() or "ffmpeg"
+
+    def _command(self):
+        return FfmpegCommand(self.ffmpeg_path, "-y", "-hide_banner", "-nostdin", "-loglevel", "error")
+
+    def remux(self, in_file, out_file):
+        command = self._command()
+        source = command.add_input(in_file)
+        command.add_output(out_file, {"-c": "copy"}).map(source)
+        ffmpeg_common.run_command(command.build(), stage="remux")
+
+    def extract_audio(self, in_file, out_file, fmt="wav", stream="a:0", also=()):
+        command = audio_extract.extract_command(self.ffmpeg_path, in_file, [(out_file, fmt)] + list(also), stream)
+        command.global_options.extend(["-nostdin", "-loglevel", "error"])
+        ffmpeg_common.run_command(command.build(), stage="extract_audio")
+
+    def replace_audio(self, video_file, audio_file, out_file, process=None, stream="a:0"):
+        if process is not None:
+            return self._replace_processed(video_file, audio_file, out_file, process, stream)
+        command = self._command()
+        video = command.add_input(video_file)
+        audio = command.add_input(audio_file)
+        output = command.add_output(out_file, {"-c:v": "copy", "-c:a": "aac", "-b:a": AUDIO_BITRATE, "-shortest": None})
+        output.map(video, "v:0").map(audio, stream)
+        ffmpeg_common.run_command(command.build(), stage="replace_audio")
+
+    def _replace_processed(self, video_file, audio_file, out_file, process, stream):
+        # Decoder -> Python -> encoder through pipes; raw f32le never touches the disk
+        np = _numpy()
+        info = ffmpeg_common.first_stream(ffmpeg_common.probe(audio_file), "audio") or {}
+        rate, channels = int(info.get("sample_rate") or 48000), int(info.get("channels") or 2)
+        command = self._command()
+        video = command.add_input(video_file)
+        pcm = command.add_input("pipe:0", {"-f": "f32le", "-ar": rate, "-ac": channels})
+        output = command.add_output(out_file, {"-c:v": "copy", "-c:a": "aac", "-b:a": AUDIO_BITRATE, "-shortest": None})
+        output.map(video, "v:0").map(pcm, "a:0")
+        with tempfile.TemporaryFile() as errors:
+            encoder = ffmpeg_metrics.TracedPopen(command.build(), stage="replace_audio", stdin=subprocess.PIPE,
+                                                 stdout=subprocess.DEVNULL, stderr=errors,
+                                                 **ffmpeg_common.hidden_window_kwargs())
+            frames = self._frames(audio_file, stream, rate, channels, with_time=True)
+            try:
+                for seconds, samples in frames:
+                    result = process(samples, seconds)
+                    encoder.stdin.write(np.ascontiguousarray(samples if result is None else result, np.float32).tobytes())
+            except BrokenPipeError:
+                pass  # Encoder hit -shortest or failed; its exit code says which
+            finally:
+                frames.close()  # Stops the decoder if the encoder finished first
+                encoder.stdin.close()
+                code = encoder.wait()
+            if code:
+                errors.seek(0)
+                raise subprocess.CalledProcessError(code, command.build(), stderr=errors.read().decode(errors="replace"))
+
+    def transcode(self, in_file, out_file, video_codec="libx264", crf=23, preset="veryfast", audio_codec="aac",
+                  height=None):
+        command = self._command()
+        source = command.add_input(in_file)
+        output = command.add_output(out_file, {"-c:v": video_codec, "-crf": crf, "-preset": preset,
+                                               "-pix_fmt": "yuv420p", "-c:a": audio_codec, "-b:a": AUDIO_BITRATE})
+        output.map(source, "v:0").map(source, "a:0", optional=True)
+        if height:
+            output.set("-vf", f"scale=-2:{height}")
+        ffmpeg_common.run_command(command.build(), stage="transcode")
+
+    def _decoder(self, in_file, stream, rate, channels, start=None, seconds=None):
+        command = FfmpegCommand(self.ffmpeg_path, "-hide_banner", "-nostdin", "-loglevel", "error")
+        source = command.add_input(in_file)
+        if start:
+            source.set("-ss", f"{start:.3f}")
+        if seconds:
+            source.set("-t", f"{seconds:.3f}")
+        command.add_output("pipe:1", {"-f": "f32le", "-ar": rate, "-ac": channels}).map(source, stream)
+        return ffmpeg_metrics.TracedPopen(command.build(), stage="decode_audio", stdout=subprocess.PIPE,
+                                          stderr=subprocess.DEVNULL, **ffmpeg_common.hidden_window_kwargs())
+
+    def _frames(self, in_file, stream, rate, channels, with_time=False):
+        np = _numpy()
+        decoder = self._decoder(in_file, stream, rate, channels)
+        frame_bytes = 4 * channels
+        position = 0
+        finished = False
+        try:
+            while True:
+                # A fresh writable buffer per chunk; the array is a view of it
+                chunk = bytearray(CHUNK_SAMPLES * frame_bytes)
+                size = decoder.stdout.readinto(chunk)
+                if not size:
+                    finished = True
+                    break
+                samples = np.frombuffer(chunk, np.float32, size // 4 // channels * channels).reshape(-1, channels)
+                yield (position / rate, samples) if with_time else samples
+                position += len(samples)
+        finally:
+            decoder.stdout.close()
+            if not finished:
+                decoder.kill()  # The caller stopped reading early
+            decoder.wait()
+        if decoder.returncode:
+            raise subprocess.CalledProcessError(decoder.returncode, decoder.args)
+
+    def audio_frames(self, in_file, stream="a:0", rate=48000, channels=2):
+        """Yields decoded float32 audio as (samples, channels) arrays."""
+        return self._frames(in_file, stream, rate, channels)
+
+    def read_audio(self, in_file, start=0.0, seconds=None, rate=48000, channels=1, stream="a:0"):
+        """Returns a (samples, channels) float32 array of the decoded range."""
+        np = _numpy()
+        decoder = self._decoder(in_file, stream, rate, channels, start, seconds)
+        data, _ = decoder.communicate()
+        if decoder.returncode:
+            raise subprocess.CalledProcessError(decoder.returncode, in_file)
+        return np.frombuffer(data[:len(data) - len(data) % (4 * channels)], np.float32).reshape(-1, channels)
+
+
+class PyAVEngine:
+    """Runs every operation in process through PyAV (libav*)."""
+
+    name = "pyav"
+
+    def __init__(self, ffmpeg_path=None):
+        try:
+            import av
+        except ImportError:
+            raise RuntimeError("The PyAV engine needs PyAV (pip install av).")
+        self.av = av
+
+    @staticmethod
+    def _stream(container, spec):
+        """Stream for an ffmpeg-style specifier: "a:1", "v:0" or an absolute index."""
+        kind, _, number = str(spec).rpartition(":")
+        if not kind:
+            return container.streams[int(number)]
+        return {"a": container.streams.audio, "v": container.streams.video}[kind][int(number or 0)]
+
+    def _copy_stream(self, output, stream):
+        if hasattr(output, "add_stream_from_template"):
+            return output.add_stream_from_template(stream)
+        return output.add_stream(template=stream)  # PyAV < 13
+
+    def remux(self, in_file, out_file):
+        with self.av.open(in_file) as source, self.av.open(out_file, "w") as output:
+            streams = [s for s in source.streams if s.type in ("video", "audio", "subtitle")]
+            mapping = {s.index: self._copy_stream(output, s) for s in streams}
+            for packet in source.demux(streams):
+                if packet.dts is None:
+                    continue  # Demuxer flush packet
+                packet.stream = mapping[packet.stream.index]
+                output.mux(packet)
+
+    def _audio_encoder(self, output, fmt, source_stream):
+        codec, rate, channels, bit_rate = _PYAV_AUDIO[fmt]
+        layout = {1: "mono", 2: "stereo"}.get(channels) if channels else source_stream.layout.name
+        stream = output.add_stream(codec, rate=rate or source_stream.rate, layout=layout)
+        if bit_rate:
+            stream.bit_rate = bit_rate
+        resampler = self.av.AudioResampler(format=stream.codec_context.format.name, layout=layout,
+                                           rate=stream.rate, frame_size=stream.codec_context.frame_size or None)
+        return stream, resampler
+
+    def _encode(self, stream, resampler, frames):
+        """Encoded packets for decoded frames (None flushes), resampled to the encoder's format."""
+        for frame in frames:
+            for converted in resampler.resample(frame):
+                yield from stream.encode(converted)
+        for converted in resampler.resample(None):
+            yield from stream.encode(converted)
+        yield from stream.encode(None)
+
+    def extract_audio(self, in_file, out_file, fmt="wav", stream="a:0", also=()):
+        outputs = [(out_file, fmt)] + [tuple(item[:2]) for item in also]
+        for _, name in outputs:
+            if name not in _PYAV_AUDIO:
+                raise ValueError(f"Unknown audio format '{name}'. Expected one of {', '.join(_PYAV_AUDIO)}.")
+        with self.av.open(in_file) as source, contextlib.ExitStack() as stack:
+            audio = self._stream(source, stream)
+            targets = []
+            for path, name in outputs:
+                output = stack.enter_context(self.av.open(path, "w"))
+                targets.append((output,) + self._audio_encoder(output, name, audio))
+            # One decode feeds every encoder
+            for frame in source.decode(audio):
+                for output, encoder, resampler in targets:
+                    for converted in resampler.resample(frame):
+                        output.mux(encoder.encode(converted))
+            for output, encoder, resampler in targets:
+                for converted in resampler.resample(None):
+                    output.mux(encoder.encode(converted))
+                output.mux(encoder.encode(None))
+
+    def replace_audio(self, video_file, audio_file, out_file, process=None, stream="a:0"):
+        with self.av.open(video_file) as video_source, self.av.open(audio_file) as audio_source, \
+                self.av.open(out_file, "w") as output:
+            video = video_source.streams.video[0]
+            audio = self._stream(audio_source, stream)
+            video_out = self._copy_stream(output, video)
+            audio_out, resampler = self._audio_encoder(output, "aac", audio)
+            end = float(video.duration * video.time_base) if video.duration else None
+            frames = audio_source.decode(audio)
+            if process:
+                frames = self._processed(frames, process)
+
+            def timed(packets, stream_out):
+                for packet in packets:
+                    if packet.dts is None:
+                        continue
+                    seconds = float(packet.dts * packet.time_base)
+                    if stream_out is audio_out and end is not None and seconds >= end:
+                        break  # -shortest: stop the audio at the end of the video
+                    packet.stream = stream_out
+                    yield seconds, stream_out.index, packet
+
+            # Interleave by time so the muxer never has to buffer one whole stream
+            for _, _, packet in heapq.merge(timed(video_source.demux(video), video_out),
+                                            timed(self._encode(audio_out, resampler, frames), audio_out),
+                                            key=lambda item: item[:2]):
+                output.mux(packet)
+
+    def _packed(self, frames, rate=None, channels=None):
+        """(frame, array) pairs: packed float32 frames and (samples, channels) views of their buffers."""
+        np = _numpy()
+
+        def wrap(packed):
+            width = len(packed.layout.channels)
+            return packed, np.frombuffer(packed.planes[0], np.float32, packed.samples * width).reshape(-1, width)
+
+        resampler = None
+        for frame in frames:
+            layout = {1: "mono", 2: "stereo"}.get(channels, frame.layout.name) if channels else frame.layout.name
+            if frame.format.name == "flt" and frame.layout.name == layout and frame.rate == (rate or frame.rate):
+                yield wrap(frame)  # Already packed float: the decoder's own buffer
+                continue
+            if resampler is None:
+                resampler = self.av.AudioResampler(format="flt", layout=layout, rate=rate or frame.rate)
+            for packed in resampler.resample(frame):
+                yield wrap(packed)
+        for packed in resampler.resample(None) if resampler else ():
+            yield wrap(packed)
+
+    def _processed(self, frames, process):
+        # process() may edit the array in place (it is the frame's buffer) or return a new one
+        for frame, samples in self._packed(frames):
+            result = process(samples, float(frame.time or 0.0))
+            if result is not None and result is not samples:
+                replaced = self.av.AudioFrame.from_ndarray(
+                    _numpy().ascontiguousarray(result, "float32").reshape(1, -1), format="flt", layout=frame.layout.name)
+                replaced.sample_rate, replaced.pts, replaced.time_base = frame.sample_rate, frame.pts, frame.time_base
+                frame = replaced
+            yield frame
+
+    def transcode(self, in_file, out_file, video_codec="libx264", crf=23, preset="veryfast", audio_codec="aac",
+                  height=None):
+        with self.av.open(in_file) as source, self.av.open(out_file, "w") as output:
+            video = source.streams.video[0]
+            video.thread_type = "AUTO"  # Frame/slice threads, like the CLI
+            width, out_height = video.codec_context.width, video.codec_context.height
+            if height:
+                width, out_height = int(round(width * height / out_height / 2)) * 2, height
+            video_out = output.add_stream(video_codec, rate=video.average_rate)
+            video_out.width, video_out.height, video_out.pix_fmt = width, out_height, "yuv420p"
+            video_out.options = {"crf": str(crf), "preset": preset}
+            streams = [video]
+            if source.streams.audio:
+                fmt = next((name for name, spec in _PYAV_AUDIO.items() if spec[0] == audio_codec), None)
+                if fmt is None:
+                    raise ValueError(f"Audio codec '{audio_codec}' is not supported by the PyAV engine.")
+                audio = source.streams.audio[0]
+                audio_out, resampler = self._audio_encoder(output, fmt, audio)
+                streams.append(audio)
+            for packet in source.demux(streams):
+                for frame in packet.decode():
+                    if packet.stream.type == "video":
+                        frame = frame.reformat(width=width, height=out_height, format="yuv420p")
+                        frame.pict_type = self.av.video.frame.PictureType.NONE  # Let the encoder place keyframes
+                        output.mux(video_out.encode(frame))
+                    else:
+                        for converted in resampler.resample(frame):
+                            output.mux(audio_out.encode(converted))
+            output.mux(video_out.encode(None))
+            if len(streams) > 1:
+                for converted in resampler.resample(None):
+                    output.mux(audio_out.encode(converted))
+                output.mux(audio_out.encode(None))
+
+    def audio_frames(self, in_file, stream="a:0", rate=48000, channels=2):
+        """Yields decoded float32 audio as (samples, channels) views of the frame buffers."""
+        with self.av.open(in_file) as source:
+            for _, samples in self._packed(source.decode(self._stream(source, stream)), rate, channels):
+                yield samples
+
+    def read_audio(self, in_file, start=0.0, seconds=None, rate=48000, channels=1, stream="a:0"):
+        """Returns a (samples, channels) float32 array of the decoded range."""
+        try:
+            return self._read_audio(in_file, start, seconds, rate, channels, stream)
+        except self.av.FFmpegError as e:
+            raise RuntimeError(f"Could not decode {in_file}: {e}")
+
+    def _read_audio(self, in_file, start, seconds, rate, channels, stream):
+        np = _numpy()
+        with self.av.open(in_file) as source:
+            audio = self._stream(source, stream)
+            # Same origin as ffmpeg's -ss: the container start
+            origin = (source.start_time or 0) / 1e6 + start
+            if start:
+                source.seek(int(origin / audio.time_base), stream=audio)
+            chunks, position, wanted = [], None, int(round(seconds * rate)) if seconds else None
+            for frame, samples in self._packed(source.decode(audio), rate, channels):
+                if position is None:
+                    position = int(round((float(frame.time or 0.0) - origin) * rate))
+                skip = max(0, -position)
+                position += len(samples)
+                if skip < len(samples):
+                    chunks.append(samples[skip:])
+                if wanted is not None and sum(map(len, chunks)) >= wanted:
+                    break
+            data = np.concatenate(chunks) if chunks else np.zeros((0, channels), np.float32)
+            return data[:wanted] if wanted is not None else data
+
+
+ENGINES = {CliEngine.name: CliEngine, PyAVEngine.name: PyAVEngine}
+
+
+def get(name=None, ffmpeg_path=None):
+    """The configured engine (FFMPEG_TOOLS_ENGINE), falling back to the CLI when PyAV is missing."""
+    engine_class = ENGINES.get((name or ENGINE).lower(), CliEngine)
+    try:
+        return engine_class(ffmpeg_path)
+    except RuntimeError:
+        return CliEngine(ffmpeg_path)
+
+
+# --- Benchmark ---
+
+OPERATIONS = ("remux", "extract_audio", "replace_audio", "transcode")
+
+
+def make_clips(ffmpeg_path, directory, count=20, seconds=2.0):
+    """Short H.264/AAC test clips (the case where per-job spawn cost dominates)."""
+    clips = []
+    for number in range(count):
+        path = os.path.join(directory, f"clip{number:03d}.mp4")
+        command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner", "-nostdin", "-loglevel", "error")
+        video = command.add_input(f"testsrc2=size=640x360:rate=30:duration={seconds}", {"-f": "lavfi"})
+        audio = command.add_input(f"sine=frequency={220 + 20 * number}:sample_rate=48000:duration={seconds}",
+                                  {"-f": "lavfi"})
+        command.add_output(path, {"-c:v": "libx264", "-preset": "ultrafast", "-c:a": "aac"}).map(video).map(audio)
+        ffmpeg_common.run_command(command.build(), stage="bench_clip")
+        clips.append(path)
+    return clips
+
+
+def _halve(samples, seconds):
+    samples *= 0.5  # In place: the array is the decoded frame's buffer
+
+
+def _run(engine, operation, clip, out_dir):
+    base = os.path.join(out_dir, os.path.splitext(os.path.basename(clip))[0])
+    if operation == "remux":
+        engine.remux(clip, base + "_remux.mkv")
+    elif operation == "extract_audio":
+        engine.extract_audio(clip, base + ".wav", "wav")
+    elif operation == "replace_audio":
+        engine.replace_audio(clip, clip, base + "_replaced.mp4", process=_halve)
+    else:
+        engine.transcode(clip, base + "_360p.mp4", height=360, preset="ultrafast")
+
+
+def benchmark(clips, engines=("cli", "pyav"), operations=OPERATIONS):
+    """Returns {engine: {operation: seconds for all clips}}."""
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name in engines:
+            engine = ENGINES[name]()
+            results[name] = {}
+            for operation in operations:
+                started = time.monotonic()
+                for clip in clips:
+                    _run(engine, operation, clip, out_dir)
+                results[name][operation] = time.monotonic() - started
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "bench":
+        print("usage: python engine.py bench [CLIPS] [SECONDS]")
+        sys.exit(2)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    length = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+    available = [name for name in ENGINES if get(name).name == name]
+    with tempfile.TemporaryDirectory() as clip_dir:
+        timings = benchmark(make_clips(CliEngine().ffmpeg_path, clip_dir, count, length), available)
+    print(f"{count} clips of {length:g}s, total seconds per operation:")
+    print(f"  {'':14}" + "".join(f"{name:>10}" for name in available))
+    for operation in OPERATIONS:
+        print(f"  {operation:14}" + "".join(f"{timings[name][operation]:10.2f}" for name in available))
@@ -0,0 +1,274 @@
+"""Job duration (ETA) prediction from the history of finished runs.
+
+Every finished encode is one row of a small SQLite database under the
+cache: stage, machine, encoder, preset, codecs, output height and pixel
+rate, media duration and wall-clock seconds. predict() estimates a job's
+realtime factor (wall seconds per media second) as the median over the
+RECENT_RUNS latest runs that share its features, dropping the least
+specific features (LEVELS) until MIN_RUNS match. Video encodes are
+normalized by pixel rate, so 1080p history also prices a 4K job.
+
+    features = eta.job_features("convert", ffmpeg_common.probe(in_file), command)
+    seconds = eta.predict(features)              # None without any history
+    ...
+    eta.record(features, time.monotonic() - started)
+
+Progress turns ffmpeg's time= lines into a fraction and a remaining time
+that moves from the prediction to the live rate as the job advances.
+order() sorts jobs shortest-first or by deadline, batch_seconds() gives a
+batch's finishing time on a number of workers.
+
+    python eta.py predict STAGE [--workers=N] FILE ...   # per-file and batch ETA
+    python eta.py stats
+    python eta.py evaluate [WORKERS]   # leave-one-out error and FIFO vs SJF turnaround
+"""
+import heapq
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+import app_cache
+import ffmpeg_common
+
+MIN_RUNS = 3  # Matching runs needed before a level is trusted
+RECENT_RUNS = 50  # Latest matching runs the median is taken over
+MAX_ROWS = 5000  # History kept; older runs are pruned
+LEVELS = [
+    ("stage", "machine", "encoder", "preset", "video_codec", "height"),
+    ("stage", "machine", "encoder", "preset"),
+    ("stage", "encoder", "preset"),
+    ("stage", "machine"),
+    ("stage",),
+]
+LIVE_AFTER = 0.02  # Progress fraction from which the live rate starts to count
+ORDER_FIFO = "fifo"
+ORDER_SJF = "sjf"
+ORDER_DEADLINE = "deadline"
+ORDERS = (ORDER_FIFO, ORDER_SJF, ORDER_DEADLINE)
+
+_FIELDS = ("stage", "machine", "encoder", "preset", "video_codec", "audio_codec", "height", "pixel_rate", "duration")
+_SCALE_RE = re.compile(r"scale=(?:w=)?(-?\d+):(?:h=)?(-?\d+)")
+_TIME_RE = re.compile(r"time=\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_lock = threading.Lock()
+
+
+def _db_path():
+    return os.path.join(app_cache.cache_dir("eta"), "history.sqlite")
+
+
+def _connect():
+    db = sqlite3.connect(_db_path(), timeout=10)
+    db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, " + ", ".join(_FIELDS)
+               + ", seconds REAL, finished REAL)")
+    db.execute("CREATE INDEX IF NOT EXISTS runs_stage ON runs (stage, machine, encoder, preset)")
+    return db
+
+
+def job_features(stage, info, command=None, encoder=None, preset=None):
+    """Prediction features of a job from probe info and its FfmpegCommand (first output)."""
+    video = ffmpeg_common.first_stream(info, "video") or {}
+    audio = ffmpeg_common.first_stream(info, "audio") or {}
+    width, height = video.get("width") or 0, video.get("height") or 0
+    fps = ffmpeg_common.stream_frame_rate(video) or 0.0
+    output = command.outputs[0] if command is not None and command.outputs else None
+    if output is not None:
+        encoder = encoder or output.get("-c:v") or output.get("-vcodec")
+        preset = preset or output.get("-preset")
+        scale = _SCALE_RE.search(str(output.get("-vf") or ""))
+        if scale and int(scale.group(1)) > 0 and int(scale.group(2)) > 0:
+            width, height = int(scale.group(1)), int(scale.group(2))
+        if output.get("-r"):
+            fps = float(output.get("-r"))
+    return {
+        "stage": stage,
+        "machine": platform.node() or "local",
+        "encoder": str(encoder or ""),
+        "preset": str(preset or ""),
+        "video_codec": video.get("codec_name", ""),
+        "audio_codec": audio.get("codec_name", ""),
+        "height": int(height),
+        "pixel_rate": width * height * fps if video and encoder != "copy" else 0.0,
+        "duration": ffmpeg_common.probe_duration(None, info) if info else 0.0,
+    }
+
+
+def record(features, seconds):
+    """Adds a finished job's wall-clock seconds to the history."""
+    if seconds <= 0 or not features.get("duration"):
+        return
+    with _lock, _connect() as db:
+        db.execute(f"INSERT INTO runs ({', '.join(_FIELDS)}, seconds, finished) VALUES "
+                   f"({', '.join('?' * (len(_FIELDS) + 2))})",
+                   [features.get(field) for field in _FIELDS] + [seconds, time.time()])
+        db.execute("DELETE FROM runs WHERE id <= (SELECT MAX(id) FROM runs) - ?", (MAX_ROWS,))
+    db.close()
+
+
+def _cost(duration, seconds, pixel_rate):
+    # Wall seconds per media second, per megapixel per second for video encodes
+    return seconds / duration / (pixel_rate / 1e6 if pixel_rate else 1.0)
+
+
+def _realtime_factor(db, features, exclude=None):
+    for level in LEVELS:
+        where = " AND ".join(f"{field} = ?" for field in level)
+        rows = db.execute(f"SELECT duration, seconds, pixel_rate FROM runs WHERE {where} AND id != ? "
+                          f"ORDER BY id DESC LIMIT ?",
+                          [features.get(field) for field in level] + [exclude or -1, RECENT_RUNS]).fetchall()
+        # Video costs only price video jobs (and audio-only costs audio-only ones)
+        rows = [row for row in rows if bool(row[2]) == bool(features.get("pixel_rate")) and row[0]]
+        if len(rows) >= (MIN_RUNS if level != LEVELS[-1] else 1):
+            cost = statistics.median(_cost(*row) for row in rows)
+            return cost * (features["pixel_rate"] / 1e6 if features.get("pixel_rate") else 1.0)
+    return None
+
+
+def predict(features):
+    """Predicted wall-clock seconds for a job, or None when nothing similar has run yet."""
+    if not features.get("duration"):
+        return None
+    with _lock, _connect() as db:
+        factor = _realtime_factor(db, features)
+    db.close()
+    return factor * features["duration"] if factor is not None else None
+
+
+def rank(info, policy=ORDER_SJF):
+    """Sort key of a job under policy (lower runs first).
+
+    info has "predicted" (seconds or None) and optionally "deadline" (epoch
+    seconds): sjf ranks by predicted seconds, deadline by deadline and then
+    predicted seconds, fifo ranks every job the same. Jobs without a
+    prediction (or deadline) rank after the others.
+    """
+    predicted = info.get("predicted")
+    if policy == ORDER_FIFO:
+        return ()
+    if policy == ORDER_DEADLINE:
+        return (info.get("deadline") is None, info.get("deadline") or 0, predicted is None, predicted or 0)
+    return (predicted is None, predicted or 0)
+
+
+def order(jobs, policy=ORDER_SJF, key=lambda job: job):
+    """Jobs in run order under policy; key(job) gives the dict rank() reads. Ties keep their order."""
+    return sorted(jobs, key=lambda job: rank(key(job), policy))
+
+
+def batch_seconds(predictions, workers=1):
+    """Seconds until a batch finishes with jobs started in the given order on workers slots."""
+    slots = [0.0] * max(1, workers)
+    for seconds in predictions:
+        heapq.heappush(slots, heapq.heappop(slots) + (seconds or 0.0))
+    return max(slots)
+
+
+def format_seconds(seconds):
+    """'45s', '3m 05s' or '1h 02m'."""
+    seconds = int(round(max(0.0, seconds)))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+class Progress:
+    """Fraction done and remaining time of a running job, from its ffmpeg output."""
+
+    def __init__(self, duration, predicted=None):
+        self.duration = duration
+        self.predicted = predicted
+        self.fraction = 0.0
+        self.started = time.monotonic()
+
+    def update(self, text):
+        """Reads the last time= in text; returns the new fraction, or None if text had none."""
+        matches = _TIME_RE.findall(text or "")
+        if not matches or not self.duration:
+            return None
+        hours, minutes, seconds = matches[-1]
+        self.fraction = min(1.0, (int(hours) * 3600 + int(minutes) * 60 + float(seconds)) / self.duration)
+        return self.fraction
+
+    def remaining(self):
+        """Seconds left: the prediction at first, the observed rate as the job advances."""
+        elapsed = time.monotonic() - self.started
+        live = elapsed * (1 - self.fraction) / self.fraction if self.fraction >= LIVE_AFTER else None
+        if self.predicted is None:
+            return live
+        planned = max(0.0, self.predicted - elapsed)
+        return planned if live is None else (1 - self.fraction) * planned + self.fraction * live
+
+    def describe(self):
+        left = self.remaining()
+        return f"{self.fraction:.0%}" + (f", about {format_seconds(left)} left" if left is not None else "")
+
+
+def evaluate(workers=1):
+    """Leave-one-out error of the history and simulated mean turnaround of FIFO vs SJF order."""
+    with _lock, _connect() as db:
+        rows = db.execute(f"SELECT id, {', '.join(_FIELDS)}, seconds FROM runs ORDER BY id").fetchall()
+        jobs = []
+        for row in rows:
+            features = dict(zip(_FIELDS, row[1:-1]))
+            factor = _realtime_factor(db, features, exclude=row[0])
+            jobs.append({"actual": row[-1], "predicted": factor * features["duration"] if factor is not None else None})
+    db.close()
+    errors = [abs(job["predicted"] - job["actual"]) / job["actual"] for job in jobs if job["predicted"] is not None]
+
+    def mean_turnaround(ordered):
+        slots = [0.0] * max(1, workers)
+        total = 0.0
+        for job in ordered:
+            finish = heapq.heappop(slots) + job["actual"]
+            heapq.heappush(slots, finish)
+            total += finish
+        return total / len(ordered) if ordered else 0.0
+    return {
+        "runs": len(jobs),
+        "predicted": len(errors),
+        "median_error": statistics.median(errors) if errors else None,
+        "fifo_turnaround": mean_turnaround(jobs),
+        "sjf_turnaround": mean_turnaround(order(jobs, ORDER_SJF)),
+    }
+
+
+def _stats():
+    with _lock, _connect() as db:
+        rows = db.execute("SELECT stage, machine, encoder, preset, COUNT(*), SUM(duration), SUM(seconds) FROM runs "
+                          "GROUP BY stage, machine, encoder, preset ORDER BY stage").fetchall()
+    db.close()
+    return rows
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--workers=")]
+    worker_count = int(next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--workers=")), 1))
+    if len(args) >= 3 and args[0] == "predict":
+        estimates = []
+        for path in args[2:]:
+            estimate = predict(job_features(args[1], ffmpeg_common.probe(path)))
+            estimates.append(estimate)
+            print(f"{path}: {format_seconds(estimate) if estimate is not None else 'no history yet'}")
+        known = [estimate for estimate in estimates if estimate is not None]
+        ordered = order([{"predicted": estimate} for estimate in estimates])
+        print(f"Batch on {worker_count} worker(s), shortest first: {format_seconds(batch_seconds([job['predicted'] for job in ordered], worker_count))}"
+              + (f" ({len(estimates) - len(known)} file(s) without history not counted)" if len(known) < len(estimates) else ""))
+    elif args == ["stats"]:
+        for stage, machine, encoder, preset, count, media, wall in _stats():
+            print(f"{stage:16} {machine:16} {encoder or '-':12} {preset or '-':10} {count:5d} runs, "
+                  f"{wall / media if media else 0:.3f}x realtime factor")
+    elif args[:1] == ["evaluate"]:
+        report = evaluate(int(args[1]) if len(args) > 1 else worker_count)
+        if report["median_error"] is not None:
+            print(f"{report['predicted']}/{report['runs']} runs predictable, median error {report['median_error']:.0%}")
+        print(f"Mean turnaround: FIFO {format_seconds(report['fifo_turnaround'])}, "
+              f"shortest first {format_seconds(report['sjf_turnaround'])}")
+    else:
+        print("usage: python eta.py predict STAGE [--workers=N] FILE ... | stats | evaluate [WORKERS]")
+        sys.exit(2)
@@ -0,0 +1,457 @@
+"""Stand-in ffmpeg/ffprobe for load-testing the job handling without real encodes.
+
+The fake prints ffmpeg-like banner, stream and stats lines (and -progress
+key=value blocks), takes duration / speed seconds of wall time, writes a
+small placeholder output and fails with ffmpeg's messages and exit codes
+as configured. ffprobe answers -show_format/-show_streams as JSON. The
+tools find it through their usual PATH lookup once the shim directory is
+first on PATH:
+
+    python fake_ffmpeg.py install DIR      # writes DIR/ffmpeg and DIR/ffprobe shims
+    PATH=DIR:$PATH python compress_video_for_youtube.py
+
+FAKE_FFMPEG_CONFIG names a JSON file overriding DEFAULTS; "rules" entries
+override them again for inputs matching a glob:
+
+    {"speed": 50, "fail_rate": 0.01, "rules": [{"match": "*broken*", "fail_rate": 1.0}]}
+
+The stress benchmark queues JOBS jobs (10000 by default) and reports the
+coordinator's cost per job, the governor's lease cost, the throughput and
+per-job overhead of WORKERS threads running fake encodes with progress
+parsing, the rate and latency of the UI events they post, and memory:
+
+    python fake_ffmpeg.py stress [JOBS] [WORKERS]
+"""
+import fnmatch
+import json
+import os
+import random
+import sys
+import time
+
+DEFAULTS = {
+    "duration": 60.0,  # Seconds of media per input
+    "width": 1920,
+    "height": 1080,
+    "fps": 30.0,
+    "video_codec": "h264",
+    "audio_codec": "aac",
+    "sample_rate": 48000,
+    "channels": 2,
+    "bitrate_kbps": 5000,
+    "speed": 10.0,  # Media seconds encoded per wall-clock second
+    "startup_seconds": 0.05,
+    "stats_interval": 0.5,  # ffmpeg prints stats about twice a second
+    "fail_rate": 0.0,  # Chance that a run fails part way through
+    "fail_code": 1,
+    "fail_message": "Error while decoding stream #0:0: Invalid data found when processing input",
+    "write_outputs": True,
+    "version": "7.0-fake",
+    "encoders": ["libx264", "libx265", "aac", "libmp3lame", "pcm_s16le", "flac", "libopus"],
+    "filters": ["scale", "fps", "aresample", "adelay", "amix", "loudnorm", "volume", "concat"],
+    "rules": [],
+}
+QUIET_LEVELS = {"quiet", "panic", "fatal", "error", "warning", "-8", "0", "8", "16", "24"}
+_NULL_OUTPUTS = {"-", "pipe:", "pipe:1", "/dev/null", "NUL"}
+# Options without a value (any other option consumes the next argument)
+_BARE_FLAGS = {"-y", "-n", "-hide_banner", "-nostats", "-stats", "-nostdin", "-vn", "-an", "-sn", "-dn", "-shortest",
+               "-xerror", "-re", "-copyts", "-show_format", "-show_streams", "-show_packets", "-show_frames",
+               "-version", "-encoders", "-filters", "-codecs", "-formats"}
+
+
+def load_config(path=None):
+    """DEFAULTS updated from the FAKE_FFMPEG_CONFIG file (or path)."""
+    config = dict(DEFAULTS)
+    path = path or os.environ.get("FAKE_FFMPEG_CONFIG")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            config.update(json.load(f))
+    return config
+
+
+def media_for(config, path):
+    """Config with the rules matching path applied."""
+    media = dict(config)
+    for rule in config.get("rules", []):
+        if fnmatch.fnmatch(path, rule.get("match", "")) or fnmatch.fnmatch(os.path.basename(path), rule.get("match", "")):
+            media.update({key: value for key, value in rule.items() if key != "match"})
+    return media
+
+
+def _split_args(args):
+    # -> (inputs, outputs, options): options keeps the last value per flag (None for bare flags)
+    inputs, outputs, options = [], [], {}
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg == "-i" and index + 1 < len(args):
+            inputs.append(args[index + 1])
+            index += 2
+        elif arg.startswith("-") and len(arg) > 1 and not arg.startswith("-:"):
+            if arg in _BARE_FLAGS or index + 1 >= len(args):
+                options[arg] = None
+                index += 1
+            else:
+                options[arg] = args[index + 1]
+                index += 2
+        else:
+            outputs.append(arg)
+            index += 1
+    return inputs, outputs, options
+
+
+def _timestamp(seconds):
+    hours, rest = divmod(max(0.0, seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:05.2f}"
+
+
+def _missing(path):
+    return path not in ("-", "pipe:", "pipe:0") and "://" not in path and not path.startswith("lavfi") \
+        and not os.path.exists(path)
+
+
+def _listing(title, names, kind):
+    lines = [f"{title}:", f" {kind}..... = placeholder", " ------"]
+    lines += [f" {kind}..... {name:20} {name} (fake)" for name in names]
+    return "\n".join(lines) + "\n"
+
+
+def run_ffmpeg(args, config):
+    """The fake ffmpeg; returns its exit code."""
+    err = sys.stderr
+    if "-version" in args:
+        sys.stdout.write(f"ffmpeg version {config['version']} Copyright (c) 2000-2024 the FFmpeg developers\n")
+        return 0
+    if "-encoders" in args:
+        sys.stdout.write(_listing("Encoders", config["encoders"], "V"))
+        return 0
+    if "-filters" in args:
+        sys.stdout.write(_listing("Filters", config["filters"], "T"))
+        return 0
+    inputs, outputs, options = _split_args(args)
+    level = options.get("-v", options.get("-loglevel", "info"))
+    verbose = str(level).split("+")[-1] not in QUIET_LEVELS
+    if verbose and "-hide_banner" not in options:
+        err.write(f"ffmpeg version {config['version']} Copyright (c) 2000-2024 the FFmpeg developers\n")
+    if not outputs:
+        err.write("At least one output file must be specified\n")
+        return 1
+    for path in inputs:
+        if _missing(path):
+            err.write(f"{path}: No such file or directory\n")
+            return 1
+    media = media_for(config, inputs[0] if inputs else outputs[-1])
+    duration = float(media["duration"])
+    if options.get("-t"):
+        duration = min(duration, float(options["-t"]))
+    if verbose:
+        for number, path in enumerate(inputs):
+            err.write(f"Input #{number}, mov,mp4,m4a,3gp,3g2,mj2, from '{path}':\n"
+                      f"  Duration: {_timestamp(duration)}, start: 0.000000, bitrate: {media['bitrate_kbps']} kb/s\n"
+                      f"  Stream #{number}:0(und): Video: {media['video_codec']}, yuv420p, "
+                      f"{media['width']}x{media['height']}, {media['fps']:g} fps\n"
+                      f"  Stream #{number}:1(und): Audio: {media['audio_codec']}, {media['sample_rate']} Hz, stereo\n")
+        for number, path in enumerate(outputs):
+            err.write(f"Output #{number}, mp4, to '{path}':\n")
+        err.write("Press [q] to stop, [?] for help\n")
+    err.flush()
+    stats = "-nostats" not in options and (verbose or "-stats" in options)
+    progress_target = options.get("-progress")
+    progress_file = None
+    if progress_target in ("pipe:1", "-"):
+        progress_file = sys.stdout
+    elif progress_target == "pipe:2":
+        progress_file = err
+    elif progress_target:
+        progress_file = open(progress_target, "w")
+    rng = random.Random(media.get("seed"))
+    fail_at = rng.uniform(0.05, 0.95) * duration if rng.random() < media["fail_rate"] else None
+    speed = max(1e-6, float(media["speed"]))
+    time.sleep(media["startup_seconds"])
+    started = time.monotonic()
+    position = 0.0
+    while True:
+        position = min(duration, (time.monotonic() - started) * speed)
+        if fail_at is not None and position >= fail_at:
+            err.write(f"\n{media['fail_message']}\n")
+            err.flush()
+            return int(media["fail_code"])
+        frames = int(position * media["fps"])
+        size_kib = int(position * media["bitrate_kbps"] / 8)
+        elapsed = max(1e-6, time.monotonic() - started)
+        final = position >= duration
+        if stats:
+            err.write(f"frame={frames:6d} fps={frames / elapsed:5.0f} q=28.0 {'Lsize' if final else 'size'}="
+                      f"{size_kib:8d}KiB time={_timestamp(position)} bitrate={media['bitrate_kbps']:.1f}kbits/s "
+                      f"speed={position / elapsed:5.3g}x    {chr(10) if final else chr(13)}")
+            err.flush()
+        if progress_file:
+            progress_file.write(f"frame={frames}\nfps={frames / elapsed:.2f}\nbitrate={media['bitrate_kbps']:.1f}kbits/s\n"
+                                f"total_size={size_kib * 1024}\nout_time_us={int(position * 1e6)}\n"
+                                f"out_time_ms={int(position * 1e6)}\nout_time={_timestamp(position)}0000\n"
+                                f"speed={position / elapsed:.3g}x\nprogress={'end' if final else 'continue'}\n")
+            progress_file.flush()
+        if final:
+            break
+        time.sleep(min(media["stats_interval"], (duration - position) / speed + 0.001))
+    if progress_file not in (None, sys.stdout, err):
+        progress_file.close()
+    if verbose:
+        err.write(f"video:{size_kib * 0.9:.0f}KiB audio:{size_kib * 0.1:.0f}KiB subtitle:0KiB other streams:0KiB "
+                  f"global headers:0KiB muxing overhead: 0.1%\n")
+    if media["write_outputs"] and options.get("-f") != "null":
+        for path in outputs:
+            if path in ("pipe:1", "-"):
+                sys.stdout.buffer.write(b"\0" * 1024)
+            elif path not in _NULL_OUTPUTS:
+                with open(path, "wb") as f:
+                    f.write(b"fake ffmpeg output\n")
+    return 0
+
+
+def probe_info(path, media):
+    """ffprobe -show_format -show_streams JSON for path under media settings."""
+    return {
+        "streams": [
+            {"index": 0, "codec_name": media["video_codec"], "codec_type": "video", "width": media["width"],
+             "height": media["height"], "pix_fmt": "yuv420p", "r_frame_rate": f"{round(media['fps'] * 1000)}/1000",
+             "avg_frame_rate": f"{round(media['fps'] * 1000)}/1000", "duration": f"{media['duration']:.6f}",
+             "disposition": {"default": 1}, "tags": {"language": "und"}},
+            {"index": 1, "codec_name": media["audio_codec"], "codec_type": "audio", "sample_rate": str(media["sample_rate"]),
+             "channels": media["channels"], "duration": f"{media['duration']:.6f}",
+             "disposition": {"default": 1}, "tags": {"language": "und"}},
+        ],
+        "format": {"filename": path, "nb_streams": 2, "format_name": "mov,mp4,m4a,3gp,3g2,mj2",
+                   "duration": f"{media['duration']:.6f}", "size": str(os.path.getsize(path) if os.path.exists(path) else 0),
+                   "bit_rate": str(media["bitrate_kbps"] * 1000)},
+    }
+
+
+def run_ffprobe(args, config):
+    """The fake ffprobe; returns its exit code."""
+    if "-version" in args:
+        sys.stdout.write(f"ffprobe version {config['version']} Copyright (c) 2007-2024 the FFmpeg developers\n")
+        return 0
+    inputs, outputs, options = _split_args(args)
+    paths = inputs + outputs
+    if not paths:
+        sys.stderr.write("You have to specify one input file.\n")
+        return 1
+    if _missing(paths[0]):
+        sys.stderr.write(f"{paths[0]}: No such file or directory\n")
+        return 1
+    media = media_for(config, paths[0])
+    time.sleep(media["startup_seconds"])
+    info = probe_info(paths[0], media)
+    output_format = options.get("-print_format", options.get("-of", "default"))
+    if str(output_format).startswith("json"):
+        sys.stdout.write(json.dumps({key: info[key] for key, flag in (("streams", "-show_streams"), ("format", "-show_format"))
+                                     if flag in options}, indent=4) + "\n")
+    elif "format=duration" in str(options.get("-show_entries", "")):
+        sys.stdout.write(info["format"]["duration"] + "\n")
+    return 0
+
+
+def install(directory):
+    """Writes ffmpeg/ffprobe shims running this file into directory; returns it."""
+    os.makedirs(directory, exist_ok=True)
+    script = os.path.abspath(__file__)
+    for tool in ("ffmpeg", "ffprobe"):
+        if sys.platform == "win32":
+            with open(os.path.join(directory, tool + ".cmd"), "w") as f:
+                f.write(f'@"{sys.executable}" "{script}" {tool} %*\r\n')
+        else:
+            path = os.path.join(directory, tool)
+            with open(path, "w") as f:
+                f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" {tool} "$@"\n')
+            os.chmod(path, 0o755)
+    return directory
+
+
+# --- Stress benchmark ---
+
+class _UiLoop:
+    """Stand-in for Tk's event loop: after() from any thread, callbacks run one at a time on the loop thread."""
+
+    def __init__(self):
+        import queue
+        self._events = queue.Queue()
+        self.handled = 0
+        self.latencies = []
+
+    def after(self, ms, callback, *args):
+        self._events.put((time.monotonic() + ms / 1000.0, callback, args))
+
+    def run(self, until):
+        """Dispatches callbacks until until() is true and nothing is left to run."""
+        import heapq
+        import itertools
+        import queue
+        timers = []  # (due, order, callback, args) posted with a delay
+        order = itertools.count()
+        while not (until() and self._events.empty() and not timers):
+            wait = min(0.05, max(0.0, timers[0][0] - time.monotonic())) if timers else 0.05
+            try:
+                due, callback, args = self._events.get(timeout=wait)
+                if due > time.monotonic():
+                    heapq.heappush(timers, (due, next(order), callback, args))
+                    continue
+            except queue.Empty:
+                if not timers or timers[0][0] > time.monotonic():
+                    continue
+                due, _, callback, args = heapq.heappop(timers)
+            self.latencies.append(time.monotonic() - due)
+            callback(*args)
+            self.handled += 1
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def stress(jobs=10000, workers=None, work_dir=None):
+    """Runs the stress benchmark against the fake; returns the measurements as a dict."""
+    import resource
+    import shutil
+    import subprocess
+    import tempfile
+    import threading
+    import tracemalloc
+
+    work_dir = work_dir or tempfile.mkdtemp(prefix="fake_ffmpeg_stress_")
+    os.environ["FFMPEG_TOOLS_CACHE"] = os.path.join(work_dir, "cache")  # Keep metrics and leases out of the real cache
+    os.environ["PATH"] = install(os.path.join(work_dir, "bin")) + os.pathsep + os.environ.get("PATH", "")
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump({"duration": 2.0, "speed": 40.0, "startup_seconds": 0.0, "stats_interval": 0.01,
+                   "fail_rate": 0.01, "write_outputs": False}, f)
+    os.environ["FAKE_FFMPEG_CONFIG"] = config_path
+    import audio_batch
+    import farm
+    import ffmpeg_common
+    import ffmpeg_metrics
+    import governor
+
+    results = {"jobs": jobs}
+    source = os.path.join(work_dir, "input.mp4")
+    open(source, "wb").close()
+    specs = [{"op": "convert", "input": source, "output": os.path.join(work_dir, f"out{n}.mp4")} for n in range(jobs)]
+
+    # Coordinator: queue every job, then lease/complete them all from 8 registered workers
+    def coordinator_with_workers():
+        server = farm.Coordinator("127.0.0.1", 0)
+        return server, [server.register(f"node{n}", {"cores": 8, "encoders": [], "ops": list(farm.JOB_OPS)}, 1)
+                        for n in range(8)]
+
+    coordinator, worker_ids = coordinator_with_workers()
+    started = time.perf_counter()
+    coordinator.submit(specs)
+    results["submit_us"] = (time.perf_counter() - started) / jobs * 1e6
+    started = time.perf_counter()
+    for number in range(jobs):
+        worker_id = worker_ids[number % len(worker_ids)]
+        job = coordinator.lease(worker_id)
+        coordinator.complete(worker_id, job["id"], {"ok": True})
+    results["lease_complete_us"] = (time.perf_counter() - started) / jobs * 1e6
+    coordinator.server_close()
+    coordinator, _ = coordinator_with_workers()
+    tracemalloc.start()
+    coordinator.submit(specs)
+    results["queued_bytes_per_job"] = tracemalloc.get_traced_memory()[0] / jobs
+    tracemalloc.stop()
+    coordinator.server_close()
+
+    # Governor: acquire/release cost per launch
+    rounds = min(jobs, 2000)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        governor.lease("stress", governor.BACKGROUND).acquire().release()
+    results["governor_lease_us"] = (time.perf_counter() - started) / rounds * 1e6
+
+    # Processes: workers run the fake with the tools' launch/parse path, posting UI updates
+    import queue
+    pending = queue.Queue()
+    for spec in specs:
+        pending.put(spec)
+    ui = _UiLoop()
+    progress = {}
+    failures = []
+    finished = []
+    lock = threading.Lock()
+    simulated = 2.0 / 40.0
+    ffmpeg = ffmpeg_common.find_ffmpeg()
+
+    def work():
+        while True:
+            try:
+                spec = pending.get_nowait()
+            except queue.Empty:
+                return
+            with governor.lease("stress", governor.BACKGROUND) as budget:
+                process = ffmpeg_metrics.TracedPopen([ffmpeg, "-hide_banner", "-y", "-i", spec["input"], spec["output"]],
+                                                     stage="stress", lease=budget, stderr=subprocess.PIPE)
+                last = -1.0
+                for chunk in iter(lambda: process.stderr.read1(4096), b""):
+                    text = chunk.decode("utf-8", errors="replace")
+                    process.feed(text)
+                    position = audio_batch.parse_time(text)
+                    if position is not None and position != last:
+                        last = position
+                        ui.after(0, progress.__setitem__, spec["output"], position / 2.0)
+                code = process.wait()
+            with lock:
+                (failures if code else finished).append(spec)
+            ui.after(0, progress.pop, spec["output"], None)
+
+    def poll():  # The GUIs' 100 ms after() poll of their worker threads
+        if any(thread.is_alive() for thread in threads):
+            ui.after(100, poll)
+
+    workers = workers or max(2, (os.cpu_count() or 1) * 2)
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    tracemalloc.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    ui.after(100, poll)
+    ui.run(lambda: not any(thread.is_alive() for thread in threads))
+    wall = time.perf_counter() - started
+    results.update(
+        workers=workers,
+        jobs_per_second=jobs / wall,
+        overhead_ms_per_job=(wall * workers / jobs - simulated) * 1000,
+        ui_events_per_second=ui.handled / wall,
+        ui_latency_p50_ms=_percentile(ui.latencies, 0.5) * 1000,
+        ui_latency_p99_ms=_percentile(ui.latencies, 0.99) * 1000,
+        failed=len(failures),
+        python_peak_mb=tracemalloc.get_traced_memory()[1] / 2 ** 20,
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+    tracemalloc.stop()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command in ("ffmpeg", "ffprobe"):
+        runner = run_ffmpeg if command == "ffmpeg" else run_ffprobe
+        sys.exit(runner(sys.argv[2:], load_config()))
+    elif command == "install" and len(sys.argv) > 2:
+        print(f"Shims written; put {install(os.path.abspath(sys.argv[2]))} first on PATH.")
+    elif command == "stress":
+        report = stress(int(sys.argv[2]) if len(sys.argv) > 2 else 10000, int(sys.argv[3]) if len(sys.argv) > 3 else None)
+        print(f"{report['jobs']} jobs")
+        print(f"  coordinator: submit {report['submit_us']:.1f} us/job, lease+complete {report['lease_complete_us']:.1f}"
+              f" us/job, {report['queued_bytes_per_job']:.0f} bytes per queued job")
+        print(f"  governor:    {report['governor_lease_us']:.0f} us per lease")
+        print(f"  processes:   {report['jobs_per_second']:.1f} jobs/s on {report['workers']} workers, "
+              f"{report['overhead_ms_per_job']:.1f} ms overhead per job, {report['failed']} failed")
+        print(f"  ui:          {report['ui_events_per_second']:.0f} events/s, latency p50 {report['ui_latency_p50_ms']:.1f}"
+              f" ms, p99 {report['ui_latency_p99_ms']:.1f} ms")
+        print(f"  memory:      {report['python_peak_mb']:.1f} MB Python peak, {report['peak_rss_mb']:.0f} MB peak RSS")
+    else:
+        print("usage: python fake_ffmpeg.py ffmpeg|ffprobe ARGS... | install DIR | stress [JOBS] [WORKERS]")
+        sys.exit(2)
@@ -0,0 +1,612 @@
+"""Coordinator/worker mode for spreading jobs over several machines.
+
+A coordinator holds the job queue; workers on each node pull jobs over HTTP
+(JSON bodies), run them with the pipeline operations and write results to
+a filesystem path every node mounts. Job paths must be relative and are
+resolved against each worker's shared root (so the mount point may differ
+per node); absolute paths and ".." are refused.
+
+The coordinator listens on 127.0.0.1 unless --host says otherwise, and only
+with a shared token on any other address: every request then needs it in
+the X-Farm-Token header. Clients and workers read it from --token or
+FFMPEG_TOOLS_FARM_TOKEN.
+
+    python farm.py coordinator [--host=0.0.0.0 --token=SECRET] [--port=8765] [--order=sjf|deadline|fifo]
+    python farm.py worker URL [--shared=DIR] [--node=NAME] [--slots=N] [--cores=N] [--encoders=a,b]
+    python farm.py submit URL JOBS.json [--shared=DIR] [--wait]
+    python farm.py status URL
+    python farm.py local WORKERS JOBS.json [--shared=DIR] [--order=...]   # coordinator + local worker processes
+
+A job is a pipeline stage without id (ops compress, convert, upscale,
+replace or any pipeline operation except command) plus an output and
+optional scheduling keys:
+
+    {"op": "convert", "input": "in/talk.mov", "output": "out/talk.mp4", "preset": "veryfast",
+     "requires": ["h264_nvenc"], "min_cores": 8, "prefer": "gpu1"}
+
+Workers advertise their cores, hardware encoders and ops when they register
+and send a heartbeat with per-job progress every HEARTBEAT_SECONDS; jobs
+of a worker silent for WORKER_TIMEOUT are queued again (up to
+MAX_ATTEMPTS). Submitted jobs are dealt to the least loaded capable
+worker's queue ("prefer" picks the queue, "node" pins the job to a node);
+a worker whose own queue is empty takes from the shared queue and then
+steals from the back of the longest queue it can run jobs from.
+
+Queues are kept in the coordinator's --order: sjf (default) runs the jobs
+with the shortest predicted time first, deadline the earliest "deadline"
+(epoch seconds) first, fifo in submission order. submit adds "predicted"
+seconds from the eta history for inputs it can read (under --shared);
+workers add every finished job to their own history.
+"""
+import bisect
+import collections
+import hmac
+import http.server
+import itertools
+import json
+import ntpath
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import capabilities
+import eta
+import ffmpeg_common
+import ffmpeg_metrics
+import governor
+import pipeline
+
+DEFAULT_PORT = 8765
+HEARTBEAT_SECONDS = 5.0
+WORKER_TIMEOUT = 3 * HEARTBEAT_SECONDS
+POLL_SECONDS = 2.0  # Idle worker slots ask for work this often
+MAX_ATTEMPTS = 3  # Runs of a job lost with its worker before it is failed
+JOB_OPS = {"compress": "compress_audio", "convert": "convert", "upscale": "upscale", "replace": "replace_audio"}
+HARDWARE_ENCODER_RE = re.compile(r"_(nvenc|qsv|vaapi|amf|videotoolbox|v4l2m2m)$")
+SCHEDULING_KEYS = ("requires", "min_cores", "prefer", "node", "predicted", "deadline")
+TOKEN = os.environ.get("FFMPEG_TOOLS_FARM_TOKEN") or None
+TOKEN_HEADER = "X-Farm-Token"
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+# Fields each POST endpoint needs
+_REQUIRED = {"/submit": ("jobs",), "/register": ("node", "capabilities"), "/heartbeat": ("worker",),
+             "/lease": ("worker",), "/complete": ("worker", "job", "result")}
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def check_path(path):
+    """Raises PipelineError unless path is relative and stays under the shared root."""
+    text = str(path)
+    if (not text or os.path.isabs(text) or ntpath.isabs(text) or ntpath.splitdrive(text)[0]
+            or ".." in re.split(r"[\\/]", text)):
+        raise pipeline.PipelineError(f"Job paths must be relative to the shared root without '..' (got {text!r}).")
+    return text
+
+
+def job_op(spec):
+    """Pipeline operation name for a job spec; raises PipelineError for unknown ops or unsafe paths."""
+    if not isinstance(spec, dict):
+        raise pipeline.PipelineError(f"Job must be a JSON object (got {spec!r}).")
+    op = JOB_OPS.get(spec.get("op"), spec.get("op"))
+    if op not in pipeline.OPERATIONS or op == "command":
+        raise pipeline.PipelineError(f"Job op must be one of: {', '.join(JOB_OPS)} (got {spec.get('op')!r}).")
+    if not spec.get("output"):
+        raise pipeline.PipelineError(f"Job {spec!r} needs an output path.")
+    check_path(spec["output"])
+    for role in pipeline.OPERATIONS[op][0]:
+        refs = spec.get(role)
+        for ref in refs if isinstance(refs, list) else [refs] if refs is not None else []:
+            check_path(ref)
+    return op
+
+
+def _loopback(host):
+    return host in LOOPBACK_HOSTS or host.startswith("127.")
+
+
+def node_capabilities(cores=None, encoders=None):
+    """What this node offers: cores, hardware encoders and the ops it can run."""
+    if encoders is None:
+        encoders = [name for name in capabilities.detect()["encoders"] if HARDWARE_ENCODER_RE.search(name)]
+    return {"cores": cores or governor.CORE_BUDGET, "encoders": sorted(encoders), "ops": sorted(JOB_OPS)}
+
+
+# --- Coordinator ---
+
+class Coordinator(http.server.ThreadingHTTPServer):
+    """Job queue and worker registry, served over HTTP."""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, order=eta.ORDER_SJF, token=None):
+        if order not in eta.ORDERS:
+            raise ValueError(f"Unknown order '{order}'. Expected one of: {', '.join(eta.ORDERS)}.")
+        self.token = token or TOKEN
+        if not self.token and not _loopback(host):
+            raise ValueError(f"Listening on {host} needs a shared token (--token or FFMPEG_TOOLS_FARM_TOKEN).")
+        self.order = order
+        self.jobs = {}
+        self.queue = []  # (rank, number, job id) of jobs not dealt to a worker, kept sorted
+        self.workers = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        super().__init__((host, port), _CoordinatorHandler)
+        threading.Thread(target=self._reap_loop, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+
+    def _can_run(self, worker, job):
+        spec = job["spec"]
+        caps = worker["capabilities"]
+        return (job["op"] in [JOB_OPS.get(op, op) for op in caps.get("ops", [])]
+                and set(spec.get("requires", [])) <= set(caps.get("encoders", []))
+                and spec.get("min_cores", 0) <= caps.get("cores", 0)
+                and spec.get("node", worker["node"]) == worker["node"])
+
+    def _load(self, worker):
+        return (len(worker["queue"]) + len(worker["running"])) / max(1, worker["slots"])
+
+    def _deal(self, job_id):
+        # Into the preferred worker's queue, else the least loaded capable one, else the shared queue
+        job = self.jobs[job_id]
+        capable = [w for w in self.workers.values() if self._can_run(w, job)]
+        preferred = [w for w in capable if w["node"] == job["spec"].get("prefer")]
+        if preferred or capable:
+            target = min(preferred or capable, key=self._load)["queue"]
+        else:
+            target = self.queue
+        bisect.insort(target, (eta.rank(job["spec"], self.order), job["number"], job_id))
+
+    def submit(self, specs):
+        """Queues job specs (all or none); returns their ids."""
+        if not isinstance(specs, list):
+            raise pipeline.PipelineError("jobs must be a list of job objects.")
+        ops = [job_op(spec) for spec in specs]
+        ids = []
+        with self.lock:
+            for spec, op in zip(specs, ops):
+                number = next(self._ids)
+                job_id = f"job{number}"
+                self.jobs[job_id] = {"id": job_id, "number": number, "op": op, "spec": spec, "state": QUEUED, "worker": None,
+                                     "attempts": 0, "progress": None, "result": None, "submitted": time.time()}
+                self._deal(job_id)
+                ids.append(job_id)
+        return ids
+
+    def register(self, node, caps, slots):
+        worker_id = f"{node}-{uuid.uuid4().hex[:8]}"
+        with self.lock:
+            self.workers[worker_id] = {"id": worker_id, "node": node, "capabilities": caps, "slots": max(1, slots),
+                                       "queue": [], "running": set(), "last_seen": time.monotonic()}
+        return worker_id
+
+    def heartbeat(self, worker_id, progress):
+        """Records a worker's liveness and job progress; False if the worker is unknown (expired)."""
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker is None:
+                return False
+            worker["last_seen"] = time.monotonic()
+            for job_id, value in progress.items():
+                if job_id in worker["running"]:
+                    self.jobs[job_id]["progress"] = value
+            return True
+
+    def _take(self, worker):
+        # Own queue first, then the shared queue, then the back of the longest other queue
+        others = sorted((w["queue"] for w in self.workers.values() if w is not worker), key=len, reverse=True)
+        for source, from_back in [(worker["queue"], False), (self.queue, False)] + [(q, True) for q in others]:
+            for entry in reversed(source) if from_back else source:  # Returns right after the one removal
+                if self._can_run(worker, self.jobs[entry[2]]):
+                    source.remove(entry)
+                    return entry[2]
+        return None
+
+    def lease(self, worker_id):
+        """Hands the worker its next job (spec with id), None when there is nothing it can run."""
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker is None:
+                raise KeyError(worker_id)
+            worker["last_seen"] = time.monotonic()
+            job_id = self._take(worker)
+            if job_id is None:
+                return None
+            job = self.jobs[job_id]
+            job.update(state=RUNNING, worker=worker_id, progress=0.0, started=time.time())
+            job["attempts"] += 1
+            worker["running"].add(job_id)
+            return {"id": job_id, "op": job["op"], "spec": job["spec"]}
+
+    def complete(self, worker_id, job_id, result):
+        """Stores a job's result; ignored when the job was meanwhile given to another worker."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["worker"] != worker_id or job["state"] != RUNNING:
+                return False
+            job.update(state=DONE if result.get("ok") else FAILED, result=result, finished=time.time(), progress=None)
+            worker = self.workers.get(worker_id)
+            if worker:
+                worker["running"].discard(job_id)
+            return True
+
+    def reap(self):
+        """Drops workers past WORKER_TIMEOUT and queues their jobs again."""
+        now = time.monotonic()
+        with self.lock:
+            for worker_id, worker in list(self.workers.items()):
+                if now - worker["last_seen"] <= WORKER_TIMEOUT:
+                    continue
+                del self.workers[worker_id]
+                for job_id in list(worker["running"]) + [entry[2] for entry in worker["queue"]]:
+                    job = self.jobs[job_id]
+                    if job["state"] == RUNNING and job["attempts"] >= MAX_ATTEMPTS:
+                        job.update(state=FAILED, result={"ok": False, "error": f"Lost with worker {worker_id}."})
+                        continue
+                    job.update(state=QUEUED, worker=None, progress=None)
+                    self._deal(job_id)
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            self.reap()
+
+    def status(self):
+        with self.lock:
+            return {
+                "workers": [{"id": w["id"], "node": w["node"], "capabilities": w["capabilities"], "slots": w["slots"],
+                             "queued": [entry[2] for entry in w["queue"]], "running": sorted(w["running"])}
+                            for w in self.workers.values()],
+                "queued": [entry[2] for entry in self.queue],
+                "jobs": [dict(job) for job in self.jobs.values()],
+            }
+
+
+class _CoordinatorHandler(http.server.BaseHTTPRequestHandler):
+    def _reply(self, status, data=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode(), token.encode()):
+            self._reply(401, {"error": "missing or wrong farm token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/status":
+            self._reply(200, self.server.status())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("the body must be a JSON object")
+            missing = [field for field in _REQUIRED.get(self.path, ()) if field not in request]
+            if missing:
+                raise ValueError(f"missing {', '.join(missing)}")
+        except ValueError as e:  # Also bad JSON, bad UTF-8 and a bad Content-Length
+            self._reply(400, {"error": f"bad request: {e}"})
+            return
+        server = self.server
+        try:
+            if self.path == "/submit":
+                self._reply(200, {"ids": server.submit(request["jobs"])})
+            elif self.path == "/register":
+                worker_id = server.register(request["node"], request["capabilities"], request.get("slots", 1))
+                self._reply(200, {"worker": worker_id, "heartbeat": HEARTBEAT_SECONDS})
+            elif self.path == "/heartbeat":
+                known = server.heartbeat(request["worker"], request.get("progress", {}))
+                self._reply(200 if known else 404, {})
+            elif self.path == "/lease":
+                self._reply(200, {"job": server.lease(request["worker"])})
+            elif self.path == "/complete":
+                self._reply(200, {"accepted": server.complete(request["worker"], request["job"], request["result"])})
+            else:
+                self._reply(404, {"error": "not found"})
+        except KeyError as e:
+            self._reply(404, {"error": f"unknown {e}"})
+        except (pipeline.PipelineError, TypeError, AttributeError, ValueError) as e:
+            self._reply(400, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+# --- Worker ---
+
+def _call(url, path, data=None, token=None):
+    # POST data (GET when None) as JSON; returns (status, decoded reply)
+    body = json.dumps(data).encode() if data is not None else None
+    headers = {"Content-Type": "application/json"}
+    if token or TOKEN:
+        headers[TOKEN_HEADER] = token or TOKEN
+    request = urllib.request.Request(url.rstrip("/") + path, data=body, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def _part_path(path):
+    # Same extension, so the muxer and output_mux still see the real format
+    root, extension = os.path.splitext(path)
+    return f"{root}.part{extension}"
+
+
+class Worker:
+    """Pulls jobs from a coordinator and runs up to slots of them at a time."""
+
+    def __init__(self, url, shared=".", node=None, slots=1, cores=None, encoders=None, ffmpeg_path=None, token=None):
+        self.url = url
+        self.token = token
+        self.shared = os.path.realpath(shared)
+        self.node = node or platform.node() or "local"
+        self.slots = slots
+        self.capabilities = node_capabilities(cores, encoders)
+        self.ffmpeg_path = ffmpeg_path or ffmpeg_common.find_ffmpeg() or "ffmpeg"
+        self.worker_id = None
+        self.progress = {}
+        self.stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _register(self):
+        status, reply = _call(self.url, "/register", {"node": self.node, "capabilities": self.capabilities,
+                                                       "slots": self.slots}, self.token)
+        if status != 200:
+            raise RuntimeError(f"Coordinator refused registration: {reply}")
+        with self._lock:
+            self.worker_id = reply["worker"]
+
+    def _heartbeat_loop(self):
+        while not self.stop.wait(HEARTBEAT_SECONDS):
+            try:
+                with self._lock:
+                    worker_id, progress = self.worker_id, dict(self.progress)
+                status, _ = _call(self.url, "/heartbeat", {"worker": worker_id, "progress": progress}, self.token)
+                if status == 404:  # Expired (or the coordinator restarted): join again
+                    self._register()
+            except OSError as e:
+                print(f"Heartbeat failed: {e}")
+
+    def _path(self, path):
+        # Checked again here: the coordinator may be older or reached by other clients
+        full = os.path.realpath(os.path.join(self.shared, check_path(path)))
+        if os.path.commonpath([full, self.shared]) != self.shared:
+            raise pipeline.PipelineError(f"Job path {path!r} leaves the shared root.")
+        return full
+
+    def _features(self, op, path):
+        # ETA features are optional: unreadable media just runs without them
+        try:
+            return eta.job_features(f"farm_{op}", ffmpeg_common.probe(path) if os.path.isfile(path) else {})
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            return None
+
+    def run_job(self, job):
+        """Runs one leased job; returns the result dict sent back to the coordinator."""
+        spec = job["spec"]
+        stage = {}
+        started = time.monotonic()
+        try:
+            roles = pipeline.OPERATIONS[job_op(dict(spec, op=job["op"]))][0]
+            stage = {key: value for key, value in spec.items() if key not in SCHEDULING_KEYS}
+            stage.update(id=job["id"], op=job["op"])
+            for role in roles:
+                refs = stage.get(role)
+                stage[role] = [self._path(ref) for ref in refs] if isinstance(refs, list) else self._path(refs)
+            output = self._path(spec["output"])
+            stage["output"] = _part_path(output)
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            first_input = stage[roles[0]][0] if isinstance(stage[roles[0]], list) else stage[roles[0]]
+            features = self._features(job["op"], first_input)
+            tracker = eta.Progress(features["duration"] if features else 0.0, spec.get("predicted"))
+
+            def on_output(stage_id, text):
+                if tracker.update(text) is not None:
+                    with self._lock:
+                        self.progress[job["id"]] = tracker.fraction
+
+            pipeline.Pipeline({"stages": [stage]}).run(self.ffmpeg_path, on_output=on_output)
+            os.replace(stage["output"], output)
+            if features:
+                eta.record(features, time.monotonic() - started)
+        except Exception as e:  # Reported to the coordinator; the worker carries on
+            if stage.get("output") and os.path.exists(stage["output"]):
+                os.remove(stage["output"])
+            error = getattr(e, "output", None) or str(e)
+            return {"ok": False, "error": error[-pipeline.STDERR_TAIL:], "seconds": time.monotonic() - started}
+        finally:
+            with self._lock:
+                self.progress.pop(job["id"], None)
+        return {"ok": True, "output": spec["output"], "node": self.node, "seconds": time.monotonic() - started}
+
+    def _slot_loop(self):
+        while not self.stop.is_set():
+            try:
+                status, reply = _call(self.url, "/lease", {"worker": self.worker_id}, self.token)
+            except OSError as e:
+                print(f"Coordinator unreachable: {e}")
+                self.stop.wait(POLL_SECONDS)
+                continue
+            job = reply.get("job") if status == 200 else None
+            if not job:
+                self.stop.wait(POLL_SECONDS)
+                continue
+            print(f"[{self.node}] {job['id']}: {job['op']} -> {job['spec']['output']}")
+            result = self.run_job(job)
+            print(f"[{self.node}] {job['id']}: {'done' if result['ok'] else 'failed'} in {result['seconds']:.1f}s")
+            try:
+                _call(self.url, "/complete", {"worker": self.worker_id, "job": job["id"], "result": result}, self.token)
+            except OSError as e:
+                print(f"Could not report {job['id']}: {e}")
+
+    def run(self):
+        """Registers and works until stop is set."""
+        self._register()
+        threads = [threading.Thread(target=self._heartbeat_loop, daemon=True)]
+        threads += [threading.Thread(target=self._slot_loop, daemon=True) for _ in range(self.slots)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads[1:]):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self.stop.set()
+
+
+# --- Client ---
+
+def predict_jobs(specs, shared="."):
+    """Adds "predicted" seconds from this machine's run history to specs whose input is readable here."""
+    for spec in specs:
+        roles = pipeline.OPERATIONS[job_op(spec)][0]
+        source = spec.get(roles[0])
+        source = os.path.join(shared, source[0] if isinstance(source, list) else str(source))
+        if "predicted" in spec or not os.path.isfile(source):
+            continue
+        try:
+            spec["predicted"] = eta.predict(eta.job_features(f"farm_{job_op(spec)}", ffmpeg_common.probe(source)))
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            pass  # Unreadable media: the job is queued without a prediction
+    return specs
+
+
+def submit(url, specs, shared=None, token=None):
+    """Queues specs (with predictions when shared is given); returns the job ids."""
+    if shared is not None:
+        predict_jobs(specs, shared)
+    status, reply = _call(url, "/submit", {"jobs": specs}, token)
+    if status != 200:
+        raise pipeline.PipelineError(reply.get("error", f"HTTP {status}"))
+    return reply["ids"]
+
+
+def wait(url, ids, progress=None, interval=1.0, token=None):
+    """Polls until every job in ids is done or failed; returns their job records."""
+    while True:
+        _, state = _call(url, "/status", token=token)
+        jobs = {job["id"]: job for job in state["jobs"] if job["id"] in ids}
+        if progress:
+            progress(jobs, state["workers"])
+        if all(job["state"] in (DONE, FAILED) for job in jobs.values()):
+            return jobs
+        time.sleep(interval)
+
+
+def _print_progress(jobs, workers):
+    counts = collections.Counter(job["state"] for job in jobs.values())
+    running = ", ".join(f"{job['id']}@{job['worker'].rsplit('-', 1)[0]} {job['progress'] or 0:.0%}"
+                        for job in jobs.values() if job["state"] == RUNNING)
+    print(f"{len(workers)} workers | " + " ".join(f"{state} {counts[state]}" for state in (QUEUED, RUNNING, DONE, FAILED))
+          + (f" | {running}" if running else ""))
+
+
+def _print_results(jobs):
+    failed = 0
+    for job in jobs.values():
+        result = job["result"] or {}
+        if job["state"] == DONE:
+            print(f"{job['id']}: {result['output']} on {result['node']} ({result['seconds']:.1f}s)")
+        else:
+            failed += 1
+            print(f"{job['id']}: FAILED after {job['attempts']} attempt(s): {(result.get('error') or '')[-300:]}")
+    return 1 if failed else 0
+
+
+def run_local(worker_count, specs, shared=".", order=eta.ORDER_SJF, token=None):
+    """Coordinator plus worker_count worker processes on this machine, named node1..N; returns job records."""
+    server = Coordinator("127.0.0.1", 0, order, token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    environment = dict(os.environ, FFMPEG_TOOLS_FARM_TOKEN=server.token) if server.token else None
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", server.url,
+                                   f"--shared={shared}", f"--node=node{number}"], env=environment)
+                 for number in range(1, worker_count + 1)]
+    try:
+        return wait(server.url, submit(server.url, specs, shared, server.token), _print_progress, token=server.token)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        server.shutdown()
+
+
+def _options(args):
+    # Splits --key=value / --flag arguments from positional ones
+    options = {}
+    positional = []
+    for arg in args:
+        if arg.startswith("--"):
+            key, separator, value = arg[2:].partition("=")
+            options[key] = value if separator else True
+        else:
+            positional.append(arg)
+    return positional, options
+
+
+def _load_jobs(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("jobs", []) if isinstance(data, dict) else data
+
+
+if __name__ == "__main__":
+    ffmpeg_metrics.serve_from_env()
+    command = sys.argv[1:2]
+    positional, options = _options(sys.argv[2:])
+    farm_token = options.get("token") if isinstance(options.get("token"), str) else None
+    if command == ["coordinator"]:
+        coordinator = Coordinator(options.get("host", "127.0.0.1"), int(options.get("port", DEFAULT_PORT)),
+                                  options.get("order", eta.ORDER_SJF), farm_token)
+        print(f"Coordinator listening on {coordinator.url}")
+        coordinator.serve_forever()
+    elif command == ["worker"] and positional:
+        encoder_list = options.get("encoders")
+        Worker(positional[0], options.get("shared", "."), options.get("node"), int(options.get("slots", 1)),
+               int(options["cores"]) if "cores" in options else None,
+               encoder_list.split(",") if isinstance(encoder_list, str) else None, token=farm_token).run()
+    elif command == ["submit"] and len(positional) >= 2:
+        job_ids = submit(positional[0], _load_jobs(positional[1]), options.get("shared", "."), farm_token)
+        print("Submitted " + ", ".join(job_ids))
+        if options.get("wait"):
+            sys.exit(_print_results(wait(positional[0], job_ids, _print_progress, token=farm_token)))
+    elif command == ["status"] and positional:
+        _, farm_state = _call(positional[0], "/status", token=farm_token)
+        for farm_worker in farm_state["workers"]:
+            print(f"{farm_worker['id']}: {farm_worker['capabilities']['cores']} cores "
+                  f"{','.join(farm_worker['capabilities']['encoders']) or 'cpu'}, "
+                  f"running {farm_worker['running']}, queued {len(farm_worker['queued'])}")
+        _print_progress({job["id"]: job for job in farm_state["jobs"]}, farm_state["workers"])
+    elif command == ["local"] and len(positional) >= 2:
+        sys.exit(_print_results(run_local(int(positional[0]), _load_jobs(positional[1]), options.get("shared", "."),
+                                         options.get("order", eta.ORDER_SJF), farm_token)))
+    else:
+        print("usage: python farm.py coordinator [--host=ADDR] [--port=N] [--order=sjf|deadline|fifo] | "
+              "worker URL [--shared=DIR] [--node=NAME] [--slots=N] [--cores=N] [--encoders=a,b] | "
+              "submit URL JOBS.json [--shared=DIR] [--wait] | status URL | local WORKERS JOBS.json [--shared=DIR] "
+              "[--order=...]  (all take --token=SECRET, default $FFMPEG_TOOLS_FARM_TOKEN)")
+        sys.exit(2)
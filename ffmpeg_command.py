@@ -0,0 +1,196 @@
+"""Structured ffmpeg command builder.
+
+Commands are assembled from inputs, stream maps, an optional filter graph and
+outputs with keyed options, then validated and serialized deterministically:
+
+    cmd = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    video = cmd.add_input(video_path)
+    audio = cmd.add_input(wav_path)
+    out = cmd.add_output(output_path)
+    out.map(video, "v:0").map(audio, "a:0")
+    out.set("-c:v", "copy").set("-c:a", "aac").set("-b:a", "192k")
+    subprocess.run(cmd.build())
+
+Options are keyed by flag, so setting "-b:a" twice replaces the value instead
+of emitting it twice. Flags ffmpeg takes repeatedly (-metadata, -disposition:s:1,
+-map_metadata...) are added with append(), which keeps every value in order:
+
+    out.append("-metadata", "title=Talk").append("-metadata", "artist=Me")
+"""
+import re
+import shlex
+
+_MAP_RE = re.compile(r"^-?(\d+)(:[^?]*)?\??$")
+_LABEL_RE = re.compile(r"^\[([^\]]+)\]$")
+_GRAPH_LABEL_RE = re.compile(r"\[([^\]]+)\]")
+
+
+class CommandError(ValueError):
+    """Raised when a command fails validation."""
+
+
+def _option(flag, value):
+    if not flag.startswith("-"):
+        raise CommandError(f"Option '{flag}' must start with '-'.")
+    return flag, None if value is None else str(value)
+
+
+class _Options:
+    # Ordered (flag, value) pairs (value None for bare flags like -vn); set() keeps one
+    # value per flag in the flag's first position, append() adds another
+
+    def __init__(self):
+        self._options = []
+
+    def set(self, flag, value=None):
+        option = _option(flag, value)
+        positions = [i for i, (existing, _) in enumerate(self._options) if existing == flag]
+        if not positions:
+            self._options.append(option)
+            return self
+        self._options[positions[0]] = option
+        for i in reversed(positions[1:]):
+            del self._options[i]
+        return self
+
+    def append(self, flag, value=None):
+        """Adds flag once more, keeping earlier values (for flags ffmpeg reads repeatedly)."""
+        self._options.append(_option(flag, value))
+        return self
+
+    def update(self, options):
+        for flag, value in dict(options).items():
+            self.set(flag, value)
+        return self
+
+    def extend(self, pairs):
+        """Appends (flag, value) pairs, e.g. another item's items(), repeats included."""
+        for flag, value in pairs:
+            self.append(flag, value)
+        return self
+
+    def unset(self, flag):
+        self._options = [(existing, value) for existing, value in self._options if existing != flag]
+        return self
+
+    def get(self, flag, default=None):
+        """The flag's last value."""
+        values = self.get_all(flag)
+        return values[-1] if values else default
+
+    def get_all(self, flag):
+        return [value for existing, value in self._options if existing == flag]
+
+    def items(self):
+        return list(self._options)
+
+    def __contains__(self, flag):
+        return any(existing == flag for existing, _ in self._options)
+
+    def _args(self):
+        args = []
+        for flag, value in self._options:
+            args.append(flag)
+            if value is not None:
+                args.append(value)
+        return args
+
+
+class Input(_Options):
+    """An input file with options placed before its -i."""
+
+    def __init__(self, index, path):
+        super().__init__()
+        self.index = index
+        self.path = str(path)
+
+    def __str__(self):
+        return str(self.index)
+
+
+class Output(_Options):
+    """An output with stream maps, codec/filter/muxer options and a path."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = str(path)
+        self.maps = []
+
+    def map(self, source, stream=None, optional=False):
+        """Maps a stream: map(input, "v:0"), map("[vout]") for a graph label, or map("0:a:0")."""
+        spec = str(source) if stream is None else f"{source}:{stream}"
+        if optional and not spec.endswith("?"):
+            spec += "?"
+        self.maps.append(spec)
+        return self
+
+    def _args(self):
+        args = []
+        for spec in self.maps:
+            args.extend(["-map", spec])
+        return args + super()._args() + [self.path]
+
+
+class FfmpegCommand:
+    """A full ffmpeg invocation: global options, inputs, filter graph and outputs."""
+
+    def __init__(self, binary="ffmpeg", *global_options):
+        self.binary = binary
+        self.global_options = list(global_options)
+        self.inputs = []
+        self.outputs = []
+        self.filter_graph = None
+
+    def add_input(self, path, options=None):
+        item = Input(len(self.inputs), path)
+        if options:
+            item.update(options)
+        self.inputs.append(item)
+        return item
+
+    def add_output(self, path, options=None):
+        item = Output(path)
+        if options:
+            item.update(options)
+        self.outputs.append(item)
+        return item
+
+    def set_filter_complex(self, graph):
+        self.filter_graph = graph
+        return self
+
+    def validate(self):
+        if not self.inputs:
+            raise CommandError("Command has no inputs.")
+        if not self.outputs:
+            raise CommandError("Command has no outputs.")
+        graph_labels = set(_GRAPH_LABEL_RE.findall(self.filter_graph or ""))
+        for output in self.outputs:
+            for spec in output.maps:
+                label = _LABEL_RE.match(spec)
+                if label:
+                    if label.group(1) not in graph_labels:
+                        raise CommandError(f"Map '{spec}' refers to an unknown filter graph label.")
+                    continue
+                match = _MAP_RE.match(spec)
+                if not match or int(match.group(1)) >= len(self.inputs):
+                    raise CommandError(f"Map '{spec}' does not refer to an existing input.")
+
+    def build(self):
+        """Validates and returns the argv list."""
+        self.validate()
+        args = [self.binary] + self.global_options
+        for item in self.inputs:
+            args += item._args() + ["-i", item.path]
+        if self.filter_graph:
+            args += ["-filter_complex", self.filter_graph]
+        for output in self.outputs:
+            args += output._args()
+        return args
+
+    def key(self):
+        """Hashable, deterministic identity of the command (for memoizing plans)."""
+        return tuple(self.build())
+
+    def __str__(self):
+        return shlex.join(self.build())
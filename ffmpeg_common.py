@@ -0,0 +1,148 @@
+"""Shared ffmpeg/ffprobe helpers used by the converter tools."""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import app_cache
+import container_probe
+import ffmpeg_metrics
+from ffmpeg_command import FfmpegCommand
+
+# Upscale targets, shared by the upscaler window and the pipeline's upscale stage
+RESOLUTIONS = {
+    "Source": None,
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+FRAME_RATES = {
+    "Source": None,
+    "30fps": 30,
+    "60fps": 60,
+}
+
+
+def find_ffmpeg():
+    """Returns the ffmpeg executable path, or None if missing."""
+    return shutil.which("ffmpeg")
+
+
+def find_ffprobe():
+    """Returns the ffprobe executable path, or None if missing."""
+    return shutil.which("ffprobe")
+
+
+def hidden_window_kwargs():
+    """Popen kwargs that hide the console window on Windows."""
+    if sys.platform != "win32":
+        return {}
+    info = subprocess.STARTUPINFO()
+    info.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    info.wShowWindow = subprocess.SW_HIDE
+    return {"startupinfo": info, "creationflags": subprocess.CREATE_NO_WINDOW}
+
+
+def run_command(command, stage="ffmpeg", lease=None):
+    """Runs a command to completion, raising CalledProcessError on failure."""
+    result = ffmpeg_metrics.run(
+        command,
+        stage=stage,
+        lease=lease,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        **hidden_window_kwargs()
+    )
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, command, output=result.stdout)
+    return result.stdout
+
+
+def probe(path):
+    """Returns ffprobe's format and stream info for a file as a dict.
+
+    MP4/MOV and Matroska headers are parsed in process (container_probe),
+    which reads only the header; other files, and anything the parser
+    declines, go to ffprobe, whose result is cached per file_key.
+    """
+    if container_probe.ENABLED:
+        info = container_probe.probe(path)
+        if info is not None:
+            return info  # Cheaper to re-parse than to key (file_key samples ~1 MB) and cache
+    try:
+        cache_path = os.path.join(app_cache.cache_dir("probe"), app_cache.file_key(path) + ".json")
+    except OSError:
+        cache_path = None  # URL or unreadable path: always probe
+    cached = app_cache.load_json(cache_path) if cache_path else None
+    if cached is not None:
+        return cached
+    command = [
+        find_ffprobe() or "ffprobe",
+        "-v", "quiet",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        path,
+    ]
+    result = ffmpeg_metrics.run(command, stage="probe", capture_output=True, text=True, check=True, **hidden_window_kwargs())
+    info = json.loads(result.stdout)
+    if cache_path:
+        app_cache.save_json(cache_path, info)
+    return info
+
+
+# What probe() raises for missing tools or media it cannot read
+PROBE_ERRORS = (OSError, ValueError, subprocess.CalledProcessError)
+
+
+def probe_duration(path, info=None):
+    """Returns the container duration in seconds, or 0.0 if unknown."""
+    info = info or probe(path)
+    try:
+        return float(info.get("format", {}).get("duration", 0.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def stream_frame_rate(stream):
+    """Returns a video stream's frame rate as a float (0.0 if unknown)."""
+    fr_str = stream.get("avg_frame_rate", "0/1")
+    if fr_str in ("0/0", "0/1"):
+        fr_str = stream.get("r_frame_rate", "0/1")
+    try:
+        num, den = map(int, fr_str.split("/"))
+    except ValueError:
+        return 0.0
+    return float(num) / float(den) if den != 0 else 0.0
+
+
+def first_stream(info, codec_type):
+    """Returns the first stream of the given type from probe info, or None."""
+    return next((s for s in info.get("streams", []) if s.get("codec_type") == codec_type), None)
+
+
+def upscale_command(ffmpeg_path, in_file, out_file, width, height, fps, resolution="Source", frame_rate="Source",
+                    encoder="libx264"):
+    """The upscaler's command: scale up to a RESOLUTIONS target, change to a FRAME_RATES rate, copy audio.
+
+    width/height/fps describe the source (None or 0 when unknown); a target
+    no larger than the source is skipped, and so is the source's own rate.
+    """
+    command = FfmpegCommand(ffmpeg_path, "-hide_banner", "-y")
+    command.add_input(in_file)
+    output = command.add_output(out_file)
+    target_res = RESOLUTIONS.get(resolution)
+    if target_res and (target_res[0] > (width or 0) or target_res[1] > (height or 0)):
+        output.set("-vf", f"scale={target_res[0]}:{target_res[1]}")
+    target_fps = FRAME_RATES.get(frame_rate)
+    if target_fps and target_fps != fps:
+        output.set("-r", target_fps)
+    output.update({"-c:v": encoder, "-preset": "fast"})
+    output.set("-cq" if encoder.endswith("_nvenc") else "-crf", "23")
+    output.set("-c:a", "copy")
+    return command
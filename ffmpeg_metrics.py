@@ -0,0 +1,230 @@
+"""Per-invocation metrics and tracing for ffmpeg/ffprobe subprocesses.
+
+Every launch made through TracedPopen/run/check_output appends one JSON line
+to METRICS_PATH with the stage, command, input size, wall time, exit code,
+final ffmpeg fps/speed and the child's CPU time and peak RSS (from wait4 on
+POSIX). Past METRICS_MAX_BYTES the file is rotated to METRICS_PATH + ".1"
+(one old generation is kept), and a line that cannot be written is dropped
+rather than failing the encode. Set FFMPEG_TOOLS_METRICS_PORT to also expose
+Prometheus-style totals over HTTP; the tools' entry points start that
+endpoint with serve_from_env(), importing this module never does.
+"""
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+
+import app_cache
+
+METRICS_PATH = os.environ.get("FFMPEG_TOOLS_METRICS", os.path.join(app_cache.CACHE_ROOT, "metrics.jsonl"))
+METRICS_MAX_BYTES = int(os.environ.get("FFMPEG_TOOLS_METRICS_MAX_BYTES", 8 * 1024 * 1024))
+TAIL_CHARS = 4096  # Output kept per process for fps/speed parsing
+
+_PROGRESS_RE = re.compile(r"[^\r\n]*speed=\s*([\d.]+)x")
+_FPS_RE = re.compile(r"fps=\s*([\d.]+)")  # Absent from audio-only progress lines
+_write_lock = threading.Lock()
+_totals = {}
+_totals_lock = threading.Lock()
+_server = None
+
+
+def _input_size(command):
+    total = 0
+    for flag, value in zip(command, command[1:]):
+        if flag == "-i" and isinstance(value, str) and os.path.isfile(value):
+            total += os.path.getsize(value)
+    return total
+
+
+def parse_progress(output):
+    """Returns (fps, speed) from the last ffmpeg progress line in output, or (None, None)."""
+    last = None
+    for last in _PROGRESS_RE.finditer(output or ""):
+        pass
+    if last is None:
+        return None, None
+    fps = _FPS_RE.search(last.group(0))
+    return float(fps.group(1)) if fps else None, float(last.group(1))
+
+
+def record(entry):
+    """Appends a metrics entry as a JSON line and folds it into the Prometheus totals."""
+    line = json.dumps(entry, sort_keys=True)
+    with _write_lock:
+        try:
+            os.makedirs(os.path.dirname(METRICS_PATH) or ".", exist_ok=True)
+            if os.path.isfile(METRICS_PATH) and os.path.getsize(METRICS_PATH) >= METRICS_MAX_BYTES:
+                os.replace(METRICS_PATH, METRICS_PATH + ".1")
+            with open(METRICS_PATH, "a") as f:
+                f.write(line + "\n")
+        except OSError:
+            pass  # Read-only or full cache directory: metrics are best effort
+    key = (entry["stage"], "ok" if entry["exit_code"] == 0 else "error")
+    with _totals_lock:
+        totals = _totals.setdefault(key, {"jobs": 0, "seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_kb": 0})
+        totals["jobs"] += 1
+        totals["seconds"] += entry["duration_s"]
+        totals["cpu_seconds"] += (entry.get("cpu_user_s") or 0.0) + (entry.get("cpu_sys_s") or 0.0)
+        totals["peak_rss_kb"] = max(totals["peak_rss_kb"], entry.get("peak_rss_kb") or 0)
+
+
+class TracedPopen(subprocess.Popen):
+    """Popen that reaps the child with wait4 and records one metrics entry when it exits."""
+
+    def __init__(self, args, stage="ffmpeg", lease=None, **kwargs):
+        self.stage = stage
+        self.lease = lease  # governor.Lease: gets the process (priority) and its final speed
+        self.fps = None
+        self.speed = None
+        self._started = time.monotonic()
+        self._input_bytes = _input_size(list(args))
+        self._rusage = None
+        self._tail = ""
+        self._deferred = False
+        self._recorded = False
+        super().__init__(args, **kwargs)
+        if lease is not None:
+            lease.attach(self)
+
+    def feed(self, text):
+        """Hands process output to the tracer (used for the final fps/speed)."""
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", errors="replace")
+        if text:
+            self._tail = (self._tail + text)[-TAIL_CHARS:]
+
+    def _reap(self, options):
+        # Returns True once the child has been reaped here
+        if self.returncode is not None or not hasattr(os, "wait4"):
+            return False
+        try:
+            pid, status, rusage = os.wait4(self.pid, options)
+        except ChildProcessError:
+            return False
+        if pid == 0:
+            return False
+        self._rusage = rusage
+        self.returncode = os.waitstatus_to_exitcode(status)
+        return True
+
+    def poll(self):
+        self._reap(os.WNOHANG if hasattr(os, "WNOHANG") else 0)
+        result = super().poll()
+        if result is not None:
+            self._record()
+        return result
+
+    def wait(self, timeout=None):
+        if timeout is None:
+            self._reap(0)
+        result = super().wait(timeout)
+        self._record()
+        return result
+
+    def communicate(self, input=None, timeout=None):
+        self._deferred = True
+        try:
+            stdout, stderr = super().communicate(input, timeout)
+        finally:
+            self._deferred = False
+        self.feed(stdout)
+        self.feed(stderr)
+        self._record()
+        return stdout, stderr
+
+    def _record(self):
+        if self._recorded or self._deferred or self.returncode is None:
+            return
+        self._recorded = True
+        fps, speed = parse_progress(self._tail)
+        self.fps, self.speed = fps, speed
+        if self.lease is not None:
+            self.lease.observe(self)
+        rusage = self._rusage
+        record({
+            "ts": time.time(),
+            "stage": self.stage,
+            "command": [str(arg) for arg in self.args],
+            "input_bytes": self._input_bytes,
+            "duration_s": round(time.monotonic() - self._started, 3),
+            "exit_code": self.returncode,
+            "fps": fps,
+            "speed": speed,
+            "cpu_user_s": rusage.ru_utime if rusage else None,
+            "cpu_sys_s": rusage.ru_stime if rusage else None,
+            "peak_rss_kb": rusage.ru_maxrss if rusage else None,
+        })
+
+
+def run(command, stage="ffmpeg", check=False, **kwargs):
+    """subprocess.run equivalent that launches through TracedPopen."""
+    if kwargs.pop("capture_output", False):
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    with TracedPopen(command, stage=stage, **kwargs) as process:
+        stdout, stderr = process.communicate()
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def check_output(command, stage="ffmpeg", **kwargs):
+    """subprocess.check_output equivalent that launches through TracedPopen."""
+    return run(command, stage=stage, check=True, stdout=subprocess.PIPE, **kwargs).stdout
+
+
+# Exported families: (name, type, totals key, value format)
+_FAMILIES = [
+    ("ffmpeg_jobs_total", "counter", "jobs", "{}"),
+    ("ffmpeg_job_seconds_total", "counter", "seconds", "{:.3f}"),
+    ("ffmpeg_cpu_seconds_total", "counter", "cpu_seconds", "{:.3f}"),
+    ("ffmpeg_peak_rss_kilobytes", "gauge", "peak_rss_kb", "{}"),
+]
+
+
+def prometheus_text():
+    """Renders the in-process totals in the Prometheus text exposition format (one block per family)."""
+    with _totals_lock:
+        totals = sorted(_totals.items())
+    lines = []
+    for name, kind, key, value_format in _FAMILIES:
+        lines.append(f"# TYPE {name} {kind}")
+        for (stage, result), values in totals:
+            lines.append(f'{name}{{stage="{stage}",result="{result}"}} {value_format.format(values[key])}')
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port):
+    """Starts (once) a background HTTP endpoint serving prometheus_text()."""
+    global _server
+    if _server is None:
+        import http.server  # Only needed when the endpoint is enabled
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def serve_from_env():
+    """Starts the endpoint on FFMPEG_TOOLS_METRICS_PORT if set; returns the server or None."""
+    port = os.environ.get("FFMPEG_TOOLS_METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return serve_prometheus(int(port))
+    except OSError:
+        return None  # Another tool process already serves the endpoint
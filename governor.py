@@ -0,0 +1,300 @@
+"""Resource governor for concurrent ffmpeg jobs.
+
+Every launch takes a lease. Its thread budget is its weighted share of the
+current demand: the machine's core budget split between all active leases
+of all tool processes (tracked as small files under the cache) by weight.
+Interactive jobs weigh twice as much as background ones, and a lease may
+carry a cost factor (a video encode in a pipeline chain outweighs the audio
+stage feeding it). Grants are capped at the thread count past which that
+stage stopped getting faster in earlier runs, compared in pixels per second
+so inputs of different resolutions share one model.
+
+Leases are granted under a lock file, so concurrent processes see each
+other's grants; acquire_all() grants a set of leases that run together
+(a pipeline chain) in one step, so each gets its share rather than the
+first taking every core. A running ffmpeg keeps the -threads it started
+with: when new leases arrive the split is rebalanced at each following
+grant, and older background jobs yield the CPU through their low CPU and
+idle I/O priority.
+
+    with governor.lease("convert") as budget:
+        budget.apply(command)  # -threads per input/output, -filter_threads
+        process = ffmpeg_metrics.TracedPopen(command.build(), stage="convert", lease=budget)
+        ...
+
+TracedPopen hands the process to the lease (for nice/ionice) and reports
+the job's speed back when it exits. FFMPEG_TOOLS_CORES overrides the core
+budget and FFMPEG_TOOLS_GOVERNOR=0 turns budgeting off.
+
+    python governor.py bench INPUT [JOBS]   # aggregate fps of JOBS concurrent encodes, with and without
+"""
+import contextlib
+import itertools
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import app_cache
+import eta
+import ffmpeg_common
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+WEIGHTS = {INTERACTIVE: 2, BACKGROUND: 1}
+CORE_BUDGET = int(os.environ.get("FFMPEG_TOOLS_CORES") or os.cpu_count() or 1)
+ENABLED = os.environ.get("FFMPEG_TOOLS_GOVERNOR", "1") != "0"
+BACKGROUND_NICE = 10
+LEASE_TTL = 24 * 3600  # Lease files older than this are leftovers of killed processes
+KNEE = 0.9  # Fewest threads reaching 90% of the best measured speed
+LEARNING_RATE = 0.3
+UNIT_PIXELS = "mpx_per_s"  # Video jobs: megapixels encoded per wall second
+UNIT_REALTIME = "realtime"  # Everything else: media seconds per wall second
+
+_counter = itertools.count()
+_lock = threading.Lock()
+_FRAME_RE = re.compile(r"frame=\s*(\d+)")
+
+
+def _lease_dir():
+    return app_cache.cache_dir("governor", "leases")
+
+
+@contextlib.contextmanager
+def _file_lock():
+    # Serialises lease grants across tool processes
+    with _lock, app_cache.file_lock(os.path.join(app_cache.cache_dir("governor"), "leases.lock")):
+        yield
+
+
+def _model_path():
+    return os.path.join(app_cache.cache_dir("governor"), f"thread_rates_{platform.node() or 'local'}.json")
+
+
+def _alive(pid):
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        return True  # os.kill(pid, 0) would terminate the process on Windows; rely on LEASE_TTL
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def active_leases():
+    """Returns the lease records of all running jobs (dropping stale ones)."""
+    leases = []
+    now = time.time()
+    for name in os.listdir(_lease_dir()):
+        path = os.path.join(_lease_dir(), name)
+        record = app_cache.load_json(path)
+        if not record:
+            continue
+        if now - record.get("ts", 0) > LEASE_TTL or not _alive(record.get("pid", 0)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        leases.append(record)
+    return leases
+
+
+def _knee(stage, share):
+    # Fewest measured thread counts (<= share) within KNEE of the best; share if untested.
+    # Pixel-rate samples are preferred: x-realtime speeds only compare equal-sized inputs
+    units = app_cache.load_json(_model_path(), {}).get(stage, {})
+    samples = units.get(UNIT_PIXELS) or units.get(UNIT_REALTIME) or {}
+    speeds = {int(threads): speed for threads, speed in samples.items()}
+    tried = {threads: speed for threads, speed in speeds.items() if threads <= share}
+    if not tried or share > max(speeds):
+        return share  # Nothing measured at this budget yet: try it
+    best = max(tried.values())
+    return min(threads for threads, speed in tried.items() if speed >= KNEE * best)
+
+
+def record_speed(stage, threads, speed, unit=UNIT_REALTIME):
+    """Folds a finished job's speed (UNIT_PIXELS or UNIT_REALTIME) into the per-stage thread model."""
+    if not speed or speed <= 0 or not threads:
+        return
+    with _lock:
+        model = app_cache.load_json(_model_path(), {})
+        stage_model = model.setdefault(stage, {}).setdefault(unit, {})
+        old = stage_model.get(str(threads))
+        stage_model[str(threads)] = speed if old is None else (1 - LEARNING_RATE) * old + LEARNING_RATE * speed
+        app_cache.save_json(_model_path(), model)
+
+
+def _weight(record):
+    # Lease files written before cost factors existed carry only the priority
+    return record.get("weight") or WEIGHTS.get(record.get("priority"), 1)
+
+
+def acquire_all(leases):
+    """Grants leases that run together in one step: each gets its weighted share of the whole demand."""
+    if not ENABLED:
+        return leases
+    with _file_lock():
+        total = sum(lease.weight for lease in leases) + sum(_weight(record) for record in active_leases())
+        for lease in leases:
+            share = max(1, int(CORE_BUDGET * lease.weight // total))
+            lease.threads = _knee(lease.stage, share)
+            lease._path = os.path.join(_lease_dir(), f"{os.getpid()}_{next(_counter)}.json")
+            app_cache.save_json(lease._path, {
+                "pid": os.getpid(), "stage": lease.stage, "priority": lease.priority, "weight": lease.weight,
+                "threads": lease.threads, "ts": time.time(),
+            })
+    return leases
+
+
+class Lease:
+    """A running job's share of the core budget."""
+
+    def __init__(self, stage, priority=INTERACTIVE, cost=1, status=None):
+        self.stage = stage
+        self.priority = priority
+        self.weight = WEIGHTS[priority] * cost
+        self.status = status  # status(message) gets problems the job itself does not fail on
+        self.threads = None
+        self._command = None
+        self._path = None
+
+    def acquire(self):
+        acquire_all([self])
+        return self
+
+    def release(self):
+        if self._path:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def apply(self, command):
+        """Sets decoder/encoder -threads and -filter_threads on an FfmpegCommand."""
+        self._command = command  # Its input and output size price the job's speed in observe()
+        if not self.threads:
+            return command
+        for item in command.inputs + command.outputs:
+            item.set("-threads", self.threads)
+        if "-filter_threads" in command.global_options:
+            index = command.global_options.index("-filter_threads")
+            command.global_options[index + 1] = str(self.threads)
+        else:
+            command.global_options += ["-filter_threads", str(self.threads)]
+        return command
+
+    def attach(self, process):
+        """Lowers CPU and I/O priority of a background job's process."""
+        if self.priority != BACKGROUND:
+            return
+        try:
+            import psutil
+        except ImportError:
+            psutil = None
+        try:
+            if psutil:
+                child = psutil.Process(process.pid)
+                child.nice(BACKGROUND_NICE if sys.platform != "win32" else psutil.BELOW_NORMAL_PRIORITY_CLASS)
+                if hasattr(psutil, "IOPRIO_CLASS_IDLE"):
+                    child.ionice(psutil.IOPRIO_CLASS_IDLE)
+                return
+            if hasattr(os, "setpriority"):
+                os.setpriority(os.PRIO_PROCESS, process.pid, BACKGROUND_NICE)
+            if sys.platform.startswith("linux") and shutil.which("ionice"):
+                subprocess.run(["ionice", "-c", "3", "-p", str(process.pid)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception as e:  # OSError, or psutil.Error when the process is gone / access denied
+            if self.status:
+                self.status(f"Could not lower the priority of background job {process.pid}: {e}")
+
+    def _pixel_rate(self):
+        # Megapixels per media second of the applied command's first input (scaled output), or None
+        if self._command is None or not self._command.inputs or not os.path.isfile(self._command.inputs[0].path):
+            return None
+        try:
+            info = ffmpeg_common.probe(self._command.inputs[0].path)
+        except ffmpeg_common.PROBE_ERRORS:
+            return None
+        return eta.job_features(self.stage, info, self._command)["pixel_rate"] / 1e6 or None
+
+    def observe(self, process):
+        """Records the speed of a finished job (called by TracedPopen)."""
+        speed = getattr(process, "speed", None)
+        if process.returncode != 0 or not speed:
+            return
+        pixel_rate = self._pixel_rate()
+        if pixel_rate:
+            record_speed(self.stage, self.threads, speed * pixel_rate, UNIT_PIXELS)
+        else:
+            record_speed(self.stage, self.threads, speed)
+
+
+def lease(stage, priority=INTERACTIVE, cost=1, status=None):
+    """Returns a Lease for use as a context manager."""
+    return Lease(stage, priority, cost, status)
+
+
+def _bench_round(ffmpeg_path, in_file, jobs, seconds, governed):
+    # Runs `jobs` concurrent x264 encodes to null; returns aggregate frames per second
+    import ffmpeg_metrics
+    from ffmpeg_command import FfmpegCommand
+
+    frames = [0] * jobs
+
+    def one(index):
+        command = FfmpegCommand(ffmpeg_path, "-hide_banner", "-nostdin")
+        command.add_input(in_file, {"-t": seconds})
+        command.add_output("-", {"-c:v": "libx264", "-preset": "veryfast", "-an": None, "-f": "null"})
+        budget = Lease("governor_bench", BACKGROUND)
+        with (budget if governed else contextlib.nullcontext()):
+            if governed:
+                budget.apply(command)
+            result = ffmpeg_metrics.run(command.build(), stage="governor_bench", capture_output=True, text=True,
+                                        lease=budget if governed else None)
+        matches = _FRAME_RE.findall(result.stderr or "")
+        frames[index] = int(matches[-1]) if matches else 0
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(frames) / (time.monotonic() - started)
+
+
+def benchmark(ffmpeg_path, in_file, jobs=None, seconds=20):
+    """Returns (ungoverned_fps, governed_fps) for `jobs` concurrent encodes of in_file."""
+    jobs = jobs or max(2, CORE_BUDGET // 2)
+    return (_bench_round(ffmpeg_path, in_file, jobs, seconds, governed=False),
+            _bench_round(ffmpeg_path, in_file, jobs, seconds, governed=True))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "bench":
+        print("usage: python governor.py bench INPUT [JOBS]")
+        sys.exit(2)
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    plain, governed = benchmark(shutil.which("ffmpeg") or "ffmpeg", sys.argv[2], count)
+    print(f"{count or max(2, CORE_BUDGET // 2)} concurrent jobs on {CORE_BUDGET} cores:")
+    print(f"  without governor: {plain:.1f} fps aggregate")
+    print(f"  with governor:    {governed:.1f} fps aggregate ({(governed / plain - 1) * 100 if plain else 0:+.0f}%)")
@@ -0,0 +1,79 @@
+"""Fast-start launcher for the converter tools.
+
+    python launcher.py              # tool chooser
+    python launcher.py convert      # open one tool directly
+    python launcher.py --check      # print ffmpeg capabilities (no GUI)
+
+The window appears before any ffmpeg subprocess runs: tool modules are
+imported only when opened and the capability check runs in the background
+against a cache. The --check path never imports tkinter.
+"""
+import importlib
+import sys
+
+# name -> (button label, module, factory taking the Tk master)
+TOOLS = {
+    "convert": ("Video Converter (YouTube)", "compress_video_for_youtube", "VideoConverterApp"),
+    "compress-audio": ("Audio Compressor", "compress_audio", "AudioCompressorApp"),
+    "replace-audio": ("Replace Video Audio", "replace_video_audio", "FfmpegApp"),
+    "merge-audio": ("Audio/Video Processor", "audiovideoreplace", "build_gui"),
+    "upscale": ("Video Upscaler", "upscale", "VideoUpscalerApp"),
+}
+
+
+def open_tool(master, name):
+    """Imports a tool's module on demand and builds it in master."""
+    _, module_name, factory = TOOLS[name]
+    module = importlib.import_module(module_name)
+    return getattr(module, factory)(master)
+
+
+def print_capabilities():
+    import capabilities
+    caps = capabilities.detect()
+    print(f"ffmpeg:  {caps['ffmpeg'] or 'not found'}")
+    print(f"ffprobe: {caps['ffprobe'] or 'not found'}")
+    print(f"version: {caps['version'] or caps.get('error', '')}")
+    print(f"nvenc:   {'yes' if capabilities.has_encoder(caps, 'h264_nvenc') else 'no'}")
+    print(f"libvmaf: {'yes' if capabilities.has_filter(caps, 'libvmaf') else 'no'}")
+    return 0 if caps["ffmpeg"] and caps["ffprobe"] else 1
+
+
+def main(argv):
+    if "--check" in argv:
+        return print_capabilities()
+
+    import tkinter as tk
+    from tkinter import messagebox
+
+    import capabilities
+    import ffmpeg_metrics
+
+    ffmpeg_metrics.serve_from_env()
+    root = tk.Tk()
+    selected = [arg for arg in argv if arg in TOOLS]
+    status = None
+    if selected:
+        open_tool(root, selected[0])
+    else:
+        root.title("FFmpeg Tools")
+        for name, (label, _, _) in TOOLS.items():
+            tk.Button(root, text=label, command=lambda n=name: open_tool(tk.Toplevel(root), n)).pack(
+                fill=tk.X, padx=20, pady=4)
+        status = tk.Label(root, text="Checking ffmpeg...", fg="grey")
+        status.pack(pady=5)
+
+    def on_capabilities(caps):
+        if not caps["ffmpeg"] or not caps["ffprobe"]:
+            messagebox.showerror("Error", "ffmpeg or ffprobe not found. Please install FFmpeg and add it to PATH.")
+        if status is not None:
+            status.config(text=caps["version"] or caps.get("error") or "ffmpeg not found")
+
+    # Warms the capability cache the tools read from
+    capabilities.detect_async(lambda caps: root.after(0, on_capabilities, caps))
+    root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
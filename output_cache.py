@@ -0,0 +1,204 @@
+"""Content-addressed cache of finished outputs.
+
+A job is keyed by the content of its source files, the normalized ffmpeg
+plan (commands with paths and log-only flags stripped) and the ffmpeg
+version, so rerunning an identical job reuses the earlier result instead of
+encoding again:
+
+    key = output_cache.job_key([in_file], [command])
+    if not output_cache.fetch(key, out_file):
+        ...run command...
+        output_cache.store(key, out_file)
+
+Hits are reflinked (copy-on-write clone) into place and fall back to a
+copy; never hardlinked, so editing an output cannot change the entry. A hit
+is checked against the entry's recorded size and sampled key
+(app_cache.partial_hash); verify() re-reads whole entries against their
+SHA-1. Entries are evicted least-recently-used once the cache exceeds
+FFMPEG_TOOLS_OUTPUT_CACHE_MB (default 10 GB; 0 disables the cache). The
+index is updated under a file lock, so several tool processes can share it.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import app_cache
+import capabilities
+from ffmpeg_command import FfmpegCommand
+
+LIMIT_BYTES = int(float(os.environ.get("FFMPEG_TOOLS_OUTPUT_CACHE_MB", "10240")) * 1024 * 1024)
+_LOG_ONLY_FLAGS = {"-y", "-n", "-hide_banner", "-stats", "-nostats", "-nostdin"}
+# Thread budgets (set by the governor per run) do not define the result either
+_LOG_ONLY_OPTIONS = {"-loglevel", "-v", "-progress", "-stats_period", "-threads", "-filter_threads"}
+_FICLONE = 0x40049409  # Linux ioctl: clone file extents (btrfs, xfs, ...)
+
+_lock = threading.Lock()
+
+
+def enabled():
+    return LIMIT_BYTES > 0
+
+
+def _index_path():
+    return os.path.join(app_cache.cache_dir("outputs"), "index.json")
+
+
+@contextlib.contextmanager
+def _index_lock():
+    # Threads of this process, then other processes
+    lock = app_cache.file_lock(os.path.join(app_cache.cache_dir("outputs"), "index.lock"))
+    with _lock, lock:
+        yield
+
+
+
+def _normalize(command, sources):
+    # Command argv with source paths replaced by content keys, other paths by
+    # their extension, and flags that only affect logging removed
+    if not isinstance(command, FfmpegCommand):
+        return command
+    paths = {item.path for item in command.inputs + command.outputs}
+    args = command.build()[1:]
+    normalized = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in _LOG_ONLY_OPTIONS:
+            skip = True
+        elif arg in _LOG_ONLY_FLAGS:
+            continue
+        elif arg in sources:
+            normalized.append(f"source:{sources[arg]}")
+        elif arg in paths:
+            normalized.append(f"file{os.path.splitext(arg)[1].lower()}")
+        else:
+            normalized.append(arg)
+    return normalized
+
+
+def job_key(source_files, plan):
+    """Returns the cache key for a job.
+
+    source_files are the real inputs (hashed by content); plan is a list of
+    FfmpegCommand objects and/or JSON-serializable settings describing the job.
+    """
+    sources = {path: app_cache.file_key(path) for path in source_files}
+    description = {
+        "sources": [sources[path] for path in source_files],
+        "plan": [_normalize(item, sources) for item in plan],
+        "ffmpeg": capabilities.detect()["version"],
+    }
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _place(source, target):
+    # Reflink, else plain copy: target never shares data that writes to it could change
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        import fcntl
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        if os.path.exists(target):
+            os.remove(target)
+    shutil.copyfile(source, target)
+    return "copy"
+
+
+def _verified(entry, path, full=False):
+    # Size and sampled key on every hit; the whole file against its SHA-1 when full
+    try:
+        if os.path.getsize(path) != entry["size"]:
+            return False
+        if full:
+            return app_cache.full_hash(path) == entry["sha1"]
+        return app_cache.partial_hash(path) == entry.get("partial")
+    except OSError:
+        return False
+
+
+def fetch(key, out_file):
+    """Places the cached output for key at out_file; returns "reflink"/"copy", or False on a miss or a corrupt entry."""
+    if not enabled():
+        return False
+    with _index_lock():
+        index = app_cache.load_json(_index_path(), {})
+        entry = index.get(key)
+        if not entry:
+            return False
+        cached = os.path.join(app_cache.cache_dir("outputs"), entry["file"])
+        if not _verified(entry, cached):
+            _remove(index, key)
+            app_cache.save_json(_index_path(), index)
+            return False
+        method = _place(cached, out_file)
+        entry["last_used"] = time.time()
+        app_cache.save_json(_index_path(), index)
+    return method
+
+
+def store(key, out_file):
+    """Adds a finished output to the cache and evicts old entries past the size limit; False if not stored."""
+    if not enabled() or not os.path.isfile(out_file) or os.path.getsize(out_file) > LIMIT_BYTES:
+        return False  # An output larger than the whole cache would only evict everything else
+    name = key + os.path.splitext(out_file)[1].lower()
+    cached = os.path.join(app_cache.cache_dir("outputs"), name)
+    # Copied and hashed outside the lock; only the rename and the index update are serialized
+    tmp_path = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _place(out_file, tmp_path)
+        entry = {"file": name, "size": os.path.getsize(tmp_path), "sha1": app_cache.full_hash(tmp_path)}
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False  # Full or read-only cache: the output itself is fine
+    with _index_lock():
+        index = app_cache.load_json(_index_path(), {})
+        try:
+            os.replace(tmp_path, cached)
+            entry.update(partial=app_cache.partial_hash(cached), last_used=time.time())
+        except OSError:
+            return False
+        index[key] = entry
+        _evict(index)
+        app_cache.save_json(_index_path(), index)
+    return True
+
+
+def verify():
+    """Checks every entry's full SHA-1, dropping corrupt ones; returns the keys removed."""
+    removed = []
+    with _index_lock():
+        index = app_cache.load_json(_index_path(), {})
+        for key, entry in list(index.items()):
+            if not _verified(entry, os.path.join(app_cache.cache_dir("outputs"), entry["file"]), full=True):
+                _remove(index, key)
+                removed.append(key)
+        if removed:
+            app_cache.save_json(_index_path(), index)
+    return removed
+
+
+def _remove(index, key):
+    entry = index.pop(key, None)
+    if entry:
+        try:
+            os.remove(os.path.join(app_cache.cache_dir("outputs"), entry["file"]))
+        except OSError:
+            pass
+
+
+def _evict(index):
+    total = sum(entry["size"] for entry in index.values())
+    for key in sorted(index, key=lambda k: index[k]["last_used"]):
+        if total <= LIMIT_BYTES:
+            break
+        total -= index[key]["size"]
+        _remove(index, key)
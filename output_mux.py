@@ -0,0 +1,36 @@
+"""Shared MP4/MOV output muxing options (faststart or fragmented) for every tool."""
+import os
+
+MUX_PLAIN = "plain"  # moov written at the end (ffmpeg default)
+MUX_FASTSTART = "faststart"  # moov relocated to the front after encoding
+MUX_FRAGMENTED = "fragmented"  # moof fragments, playable/streamable while being written
+
+MUX_MODES = (MUX_PLAIN, MUX_FASTSTART, MUX_FRAGMENTED)
+MOV_FAMILY_EXTENSIONS = {".mp4", ".m4v", ".m4a", ".mov"}
+
+DEFAULT_MODE = os.environ.get("FFMPEG_TOOLS_MUX_MODE", MUX_FASTSTART)
+
+_MOVFLAGS = {
+    MUX_FASTSTART: "+faststart",
+    MUX_FRAGMENTED: "frag_keyframe+empty_moov+default_base_moof",
+}
+
+
+def output_args(out_file, mode=None):
+    """Returns the muxer args to place right before out_file in an ffmpeg command.
+
+    Only MP4-family outputs take movflags; other containers get no extra args.
+    """
+    mode = mode or DEFAULT_MODE
+    if mode not in MUX_MODES:
+        raise ValueError(f"Unknown mux mode '{mode}'. Expected one of {', '.join(MUX_MODES)}.")
+    if os.path.splitext(out_file)[1].lower() not in MOV_FAMILY_EXTENSIONS:
+        return []
+    flags = _MOVFLAGS.get(mode)
+    return ["-movflags", flags] if flags else []
+
+
+def apply(output, mode=None):
+    """Sets the muxer options on an ffmpeg_command.Output for its path."""
+    args = output_args(output.path, mode)
+    return output.update(dict(zip(args[::2], args[1::2])))
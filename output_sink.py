@@ -0,0 +1,310 @@
+"""Output sinks: stream ffmpeg's fragmented MP4 from stdout to a file or an S3-style multipart upload.
+
+Remote targets are plain http(s) URLs of an S3-compatible endpoint that
+accepts unauthenticated (or presigned) multipart uploads. LocalUploadServer
+is a minimal stand-in for such an endpoint, for trying the pipeline locally:
+
+    python output_sink.py serve <directory> [port]
+"""
+import http.server
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import xml.etree.ElementTree as ET
+
+import ffmpeg_common
+import ffmpeg_metrics
+import output_mux
+
+PART_SIZE = 8 * 1024 * 1024  # S3 minimum part size is 5 MiB (except the last part)
+MAX_BUFFERED_PARTS = 2  # Parts held in memory waiting for upload
+UPLOAD_WORKERS = 2
+READ_CHUNK = 256 * 1024
+REQUEST_TIMEOUT = 60  # Seconds a request may stall before it fails
+PART_RETRIES = 3  # Extra attempts for a part after a connection error, timeout or 5xx reply
+RETRY_DELAY = 1.0  # Seconds before the first retry, doubled for each further one
+
+FRAGMENTED_MP4_OPTIONS = {"-f": "mp4", "-movflags": "frag_keyframe+empty_moov+default_base_moof"}
+
+
+def is_remote(target):
+    """True for http(s) upload targets."""
+    return target.lower().startswith(("http://", "https://"))
+
+
+def add_output(command, target, mode=None):
+    """Adds the output for target to an FfmpegCommand.
+
+    Remote targets get fragmented MP4 on stdout (for run_to_sink); local paths
+    get the shared faststart/fragmented layout from output_mux.
+    """
+    if is_remote(target):
+        return command.add_output("pipe:1", FRAGMENTED_MP4_OPTIONS)
+    return output_mux.apply(command.add_output(target), mode)
+
+
+def open_sink(target):
+    """Returns the sink for a local path or an http(s) URL."""
+    return HttpMultipartSink(target) if is_remote(target) else FileSink(target)
+
+
+class FileSink:
+    """Writes the stream to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+        return self.path
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class HttpMultipartSink:
+    """Uploads the stream as S3-style multipart parts with bounded in-memory buffering.
+
+    write() blocks once MAX_BUFFERED_PARTS full parts are waiting, which in turn
+    stalls ffmpeg on its stdout pipe instead of growing memory. A part is
+    retried PART_RETRIES times after a timeout, dropped connection or 5xx reply.
+    """
+
+    def __init__(self, url, part_size=PART_SIZE, max_buffered_parts=MAX_BUFFERED_PARTS, workers=UPLOAD_WORKERS):
+        self.url = url
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._parts = queue.Queue(maxsize=max_buffered_parts)
+        self._etags = {}
+        self._errors = []
+        self._next_part = 1
+        self.upload_id = self._initiate()
+        self._workers = [threading.Thread(target=self._upload_worker, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _request(self, method, query, data=None, headers=None):
+        url = f"{self.url}?{urllib.parse.urlencode(query)}" if query else self.url
+        request = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return response.headers, response.read()
+
+    def _initiate(self):
+        _, body = self._request("POST", {"uploads": ""})
+        match = re.search(rb"<UploadId>([^<]+)</UploadId>", body)
+        if not match:
+            raise RuntimeError(f"Upload endpoint did not return an UploadId: {body[:200]!r}")
+        return match.group(1).decode()
+
+    def _upload_part(self, number, data):
+        # Parts are idempotent: a transient failure is retried, a 4xx reply is final
+        for attempt in range(PART_RETRIES + 1):
+            try:
+                headers, _ = self._request("PUT", {"partNumber": number, "uploadId": self.upload_id}, data=data)
+                return headers.get("ETag", "")
+            except urllib.error.HTTPError as e:
+                if e.code < 500 or attempt == PART_RETRIES:
+                    raise
+            except OSError:  # Refused/reset connections and timeouts
+                if attempt == PART_RETRIES:
+                    raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+    def _upload_worker(self):
+        while True:
+            item = self._parts.get()
+            if item is None:
+                return
+            if self._errors:
+                continue  # The upload has failed: drain the queue so write() and close() return
+            number, data = item
+            try:
+                self._etags[number] = self._upload_part(number, data)
+            except Exception as e:
+                self._errors.append(e)
+
+    def _check_errors(self):
+        if self._errors:
+            raise RuntimeError(f"Part upload failed: {self._errors[0]}")
+
+    def _queue_part(self, data):
+        self._check_errors()
+        self._parts.put((self._next_part, bytes(data)))
+        self._next_part += 1
+
+    def write(self, data):
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.part_size:
+            self._queue_part(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+
+    def _stop_workers(self):
+        for _ in self._workers:
+            self._parts.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def close(self):
+        if self._buffer or self._next_part == 1:
+            self._queue_part(self._buffer)
+            self._buffer.clear()
+        self._stop_workers()
+        self._check_errors()
+        root = ET.Element("CompleteMultipartUpload")
+        for number in sorted(self._etags):
+            part = ET.SubElement(root, "Part")
+            ET.SubElement(part, "PartNumber").text = str(number)
+            ET.SubElement(part, "ETag").text = self._etags[number]
+        self._request("POST", {"uploadId": self.upload_id}, data=ET.tostring(root),
+                      headers={"Content-Type": "application/xml"})
+        return self.url
+
+    def abort(self):
+        self._stop_workers()
+        try:
+            self._request("DELETE", {"uploadId": self.upload_id})
+        except Exception:
+            pass
+
+
+def run_to_sink(command, sink, progress=None, stage="stream_upload", lease=None):
+    """Runs an ffmpeg command whose output is fragmented MP4 on pipe:1, writing it to sink.
+
+    Returns (returncode, stderr_text). The sink is finalized on success and
+    aborted otherwise.
+    """
+    process = ffmpeg_metrics.TracedPopen(
+        command,
+        stage=stage,
+        lease=lease,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **ffmpeg_common.hidden_window_kwargs()
+    )
+    stderr_lines = []
+
+    def drain_stderr():
+        # Read stderr separately so a full pipe never blocks ffmpeg
+        for raw in iter(process.stderr.readline, b""):
+            line = raw.decode("utf-8", errors="replace")
+            stderr_lines.append(line)
+            process.feed(line)
+            if progress and ("frame=" in line or "size=" in line):
+                progress(f"Streaming: {line.strip()}")
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+    try:
+        for chunk in iter(lambda: process.stdout.read(READ_CHUNK), b""):
+            sink.write(chunk)
+    except Exception:
+        process.kill()
+        process.wait()
+        sink.abort()
+        raise
+    returncode = process.wait()
+    stderr_thread.join()
+    if returncode == 0:
+        sink.close()
+    else:
+        sink.abort()
+    return returncode, "".join(stderr_lines)
+
+
+class LocalUploadServer(http.server.ThreadingHTTPServer):
+    """Local stand-in for an S3-compatible multipart endpoint, storing objects under a directory."""
+
+    def __init__(self, directory, port=0):
+        self.directory = directory
+        self.uploads = {}
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", port), _UploadHandler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _UploadHandler(http.server.BaseHTTPRequestHandler):
+    def _target(self):
+        parsed = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+        name = os.path.basename(urllib.parse.unquote(parsed.path)) or "upload.bin"
+        return name, query
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        name, query = self._target()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.uploads[upload_id] = {"name": name, "parts": {}}
+            self._reply(200, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>"
+                             "</InitiateMultipartUploadResult>".encode())
+            return
+        upload_id = query.get("uploadId", [""])[0]
+        self._body()
+        with self.server.lock:
+            upload = self.server.uploads.pop(upload_id, None)
+        if not upload:
+            self._reply(404)
+            return
+        with open(os.path.join(self.server.directory, upload["name"]), "wb") as f:
+            for number in sorted(upload["parts"]):
+                f.write(upload["parts"][number])
+        self._reply(200, b"<CompleteMultipartUploadResult/>")
+
+    def do_PUT(self):
+        _, query = self._target()
+        upload_id = query.get("uploadId", [""])[0]
+        data = self._body()
+        with self.server.lock:
+            upload = self.server.uploads.get(upload_id)
+            if upload is not None:
+                upload["parts"][int(query["partNumber"][0])] = data
+        if upload is None:
+            self._reply(404)
+        else:
+            self._reply(200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+
+    def do_DELETE(self):
+        _, query = self._target()
+        with self.server.lock:
+            self.server.uploads.pop(query.get("uploadId", [""])[0], None)
+        self._reply(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        server = LocalUploadServer(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 8000)
+        print(f"Accepting multipart uploads at {server.url}/<name> into {server.directory}")
+        server.serve_forever()
+    else:
+        print("Usage: python output_sink.py serve <directory> [port]")
@@ -0,0 +1,431 @@
+"""Declarative multi-stage pipelines over the tools' operations.
+
+A pipeline file (JSON, or YAML when PyYAML is installed) lists stages. Each
+names an operation, its inputs (file paths or ids of earlier stages) and,
+for results to keep, an output path:
+
+    {"stages": [
+        {"id": "wav", "op": "extract_audio", "input": "talk.mp4"},
+        {"id": "clean", "op": "command", "input": "wav", "stream": true,
+         "args": ["sox", "-t", "wav", "{input}", "-t", "wav", "{output}", "highpass", "80"]},
+        {"id": "mixed", "op": "replace_audio", "video": "talk.mp4", "audio": ["clean"]},
+        {"id": "final", "op": "convert", "input": "mixed", "output": "talk_youtube.mp4"}
+    ]}
+
+Operations build the same ffmpeg commands as the tools: extract_audio
+(FfmpegApp.extract_audio), replace_audio (FfmpegApp.replace_audio),
+compress_audio (run_compression), convert (_run_conversion, quality mode)
+and upscale (run_ffmpeg); command runs any external program, with {input}
+and {output} replaced by paths, or by "-" (stdin/stdout) for a stream stage.
+
+An edge runs as an OS pipe (WAV for audio, Matroska otherwise) when its
+producer feeds only that stage, keeps no output file of its own and the
+consumer reads the input front to back; the processes of such a chain run
+concurrently. Inputs that get probed or seeked (replace_audio's video,
+compress_audio, upscale, non-stream commands) are written to disk. Chains
+whose inputs are ready run in parallel.
+
+    python pipeline.py plan PIPELINE.json   # show chains and materialized edges
+    python pipeline.py run PIPELINE.json
+"""
+import concurrent.futures
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import capabilities
+import compliance
+import ffmpeg_common
+import ffmpeg_metrics
+import governor
+import output_mux
+import track_map
+from ffmpeg_command import FfmpegCommand
+
+PIPE_IN = "pipe:0"
+PIPE_OUT = "pipe:1"
+PIPE_FORMATS = {"wav": ".wav", "matroska": ".mkv"}
+# Relative CPU cost of an op's stage: a chain's leases are split by it (video encodes outweigh audio)
+STAGE_COSTS = {"convert": 4, "upscale": 4}
+STDERR_TAIL = 4000  # Characters of a failed stage's output kept for the error
+
+
+class PipelineError(ValueError):
+    """Raised when a pipeline definition is invalid."""
+
+
+# --- Operations: input roles, which roles must be files, output format, command builder ---
+
+def _extract_audio(ffmpeg_path, stage, inputs, output):
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    command.add_input(inputs[0])
+    command.add_output(output, {
+        "-vn": None,
+        "-acodec": "pcm_s16le",
+        "-ar": "44100",
+        "-ac": "2",
+    })
+    return command
+
+
+def _replace_audio(ffmpeg_path, stage, inputs, output):
+    video, audio = inputs[0], inputs[1:]
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    video_in = command.add_input(video)
+    out = command.add_output(output)
+    plan = track_map.TrackPlan(ffmpeg_common.probe(video))
+    codec = stage.params.get("codec", "aac")
+    plan.replace_audio_files(audio, codec, {"b": stage.params.get("bitrate", "192k")} if codec == "aac" else None)
+    plan.apply(command, video_in, out)
+    out.set("-shortest")
+    return command
+
+
+def _compress_audio(ffmpeg_path, stage, inputs, output):
+    # audio_batch's MP3 settings for every audio track, in a single pass
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    source = command.add_input(inputs[0])
+    out = command.add_output(output)
+    plan = track_map.TrackPlan(ffmpeg_common.probe(inputs[0]))
+    for track in plan.audio_tracks():
+        plan.transcode(track, "libmp3lame", {"q": "2", "ar": "44100", "ac": "2"})
+    plan.apply(command, source, out)
+    return command
+
+
+def _convert(ffmpeg_path, stage, inputs, output):
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner", "-stats")
+    source = command.add_input(inputs[0])
+    out = command.add_output(output)
+    out.map(source, "v:0").map(source, "a:0", optional=True)
+    plan = {"video": compliance.TRANSCODE, "audio": compliance.TRANSCODE}
+    if inputs[0] != PIPE_IN and stage.params.get("copy_compliant", True):
+        plan = compliance.plan_streams(ffmpeg_common.probe(inputs[0]))
+    if plan["video"] == compliance.COPY:
+        out.set("-c:v", "copy")
+    elif capabilities.has_encoder(capabilities.detect(), "h264_nvenc"):
+        out.update({"-c:v": "h264_nvenc", "-preset": "p6", "-rc": "vbr", "-cq": "23", "-qmin": "18", "-qmax": "28"})
+    else:
+        out.update({"-c:v": "libx264", "-preset": stage.params.get("preset", "ultrafast"),
+                    "-crf": stage.params.get("crf", "23")})
+    if plan["audio"] == compliance.COPY:
+        out.set("-c:a", "copy")
+    else:
+        out.update({"-c:a": "aac", "-b:a": "320k"})
+    if plan["video"] != compliance.COPY:
+        out.set("-pix_fmt", "yuv420p")
+    return command
+
+
+def _upscale(ffmpeg_path, stage, inputs, output):
+    video = ffmpeg_common.first_stream(ffmpeg_common.probe(inputs[0]), "video") or {}
+    return ffmpeg_common.upscale_command(
+        ffmpeg_path, inputs[0], output, video.get("width"), video.get("height"), ffmpeg_common.stream_frame_rate(video),
+        stage.params.get("resolution", "Source"), stage.params.get("fps", "Source"),
+        "h264_nvenc" if capabilities.has_encoder(capabilities.detect(), "h264_nvenc") else "libx264")
+
+
+def _external(ffmpeg_path, stage, inputs, output):
+    args = stage.params.get("args")
+    if not args:
+        raise PipelineError(f"Stage '{stage.id}': command needs 'args'.")
+    piped = {PIPE_IN: "-", PIPE_OUT: "-"}
+    return [str(arg).format(input=piped.get(inputs[0], inputs[0]) if inputs else "",
+                            output=piped.get(output, output)) for arg in args]
+
+
+# name -> (input roles (a trailing list role takes several), roles read by seeking, output format, builder)
+OPERATIONS = {
+    "extract_audio": (("input",), (), "wav", _extract_audio),
+    "replace_audio": (("video", "audio"), ("video",), "matroska", _replace_audio),
+    "compress_audio": (("input",), ("input",), "matroska", _compress_audio),
+    "convert": (("input",), (), "matroska", _convert),
+    "upscale": (("input",), ("input",), "matroska", _upscale),
+    "command": (("input",), (), None, _external),
+}
+
+
+class Stage:
+    """One node of the pipeline."""
+
+    def __init__(self, spec):
+        self.id = str(spec.get("id") or "")
+        self.op = spec.get("op")
+        if not self.id or self.op not in OPERATIONS:
+            raise PipelineError(f"Stage {spec!r} needs an id and an op from: {', '.join(OPERATIONS)}.")
+        roles, seek_roles, self.format, self.builder = OPERATIONS[self.op]
+        self.inputs = []  # (role, reference) in command order
+        for role in roles:
+            refs = spec.get(role)
+            if refs is None:
+                raise PipelineError(f"Stage '{self.id}' is missing '{role}'.")
+            for ref in refs if isinstance(refs, list) else [refs]:
+                self.inputs.append((role, str(ref)))
+        self.streams = bool(spec.get("stream")) if self.op == "command" else True
+        self.seek_roles = set(seek_roles) if self.streams else set(roles)
+        if self.op == "command":
+            self.format = spec.get("format", "wav")
+        self.output = spec.get("output")
+        self.params = {k: v for k, v in spec.items() if k not in ("id", "op", "output", "stream", "format") + roles}
+        # Set by plan(): where the result goes and which input comes in on stdin
+        self.target = None
+        self.piped_input = None
+        self.pipes_to = None
+
+    def __repr__(self):
+        return f"Stage({self.id}, {self.op})"
+
+
+class Pipeline:
+    def __init__(self, definition):
+        specs = definition.get("stages") if isinstance(definition, dict) else definition
+        if not specs:
+            raise PipelineError("Pipeline has no stages.")
+        self.stages = {}
+        for spec in specs:
+            stage = Stage(spec)
+            if stage.id in self.stages:
+                raise PipelineError(f"Duplicate stage id '{stage.id}'.")
+            self.stages[stage.id] = stage
+        self.order = self._topological_order()
+        self.chains = []
+        self._running = set()  # Processes of running chains, killed when another chain fails
+        self._aborted = False
+        self._running_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """Reads a .json pipeline, or .yaml/.yml with PyYAML installed."""
+        with open(path, "r", encoding="utf-8") as f:
+            if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+                try:
+                    import yaml
+                except ImportError:
+                    raise RuntimeError("YAML pipelines need PyYAML (pip install pyyaml); use JSON otherwise.")
+                return cls(yaml.safe_load(f))
+            return cls(json.load(f))
+
+    def consumers(self, stage_id):
+        return [(stage, role) for stage in self.stages.values() for role, ref in stage.inputs if ref == stage_id]
+
+    def _topological_order(self):
+        order, state = [], {}
+
+        def visit(stage_id, path):
+            if state.get(stage_id) == "done":
+                return
+            if state.get(stage_id) == "visiting":
+                raise PipelineError(f"Pipeline has a cycle: {' -> '.join(path + [stage_id])}.")
+            state[stage_id] = "visiting"
+            for _, ref in self.stages[stage_id].inputs:
+                if ref in self.stages:
+                    visit(ref, path + [stage_id])
+            state[stage_id] = "done"
+            order.append(self.stages[stage_id])
+
+        for stage_id in self.stages:
+            visit(stage_id, [])
+        return order
+
+    def plan(self, work_dir):
+        """Decides pipes vs files and groups piped stages into chains (head first)."""
+        for stage in self.order:
+            stage.piped_input = stage.pipes_to = None
+        for stage in self.order:
+            consumers = self.consumers(stage.id)
+            if len(consumers) == 1 and not stage.output and stage.streams:
+                consumer, role = consumers[0]
+                if role not in consumer.seek_roles and consumer.piped_input is None:
+                    stage.pipes_to = consumer
+                    consumer.piped_input = stage.id
+            if stage.pipes_to:
+                stage.target = PIPE_OUT
+            elif stage.output:
+                stage.target = stage.output
+            else:
+                stage.target = os.path.join(work_dir, stage.id + PIPE_FORMATS.get(stage.format, ".mkv"))
+        for stage in self.order:
+            for _, ref in stage.inputs:
+                if ref not in self.stages and not os.path.exists(ref):
+                    raise PipelineError(f"Stage '{stage.id}': input '{ref}' is neither a stage nor a file.")
+        self.chains = []
+        for stage in self.order:
+            if stage.piped_input is None:
+                chain = [stage]
+                while chain[-1].pipes_to:
+                    chain.append(chain[-1].pipes_to)
+                self.chains.append(chain)
+        return self.chains
+
+    def describe(self):
+        lines = []
+        for number, chain in enumerate(self.chains):
+            lines.append(f"chain {number}: " + " | ".join(f"{s.id} ({s.op})" for s in chain) + f" -> {chain[-1].target}")
+            for stage in chain:
+                for _, ref in stage.inputs:
+                    if ref in self.stages and ref != stage.piped_input:
+                        lines.append(f"  {stage.id} reads {ref} from disk")
+        return "\n".join(lines)
+
+    def _dependencies(self, chain):
+        # Stages in other chains whose files this chain reads
+        inside = {stage.id for stage in chain}
+        return {ref for stage in chain for _, ref in stage.inputs if ref in self.stages and ref not in inside}
+
+    def _command(self, stage, ffmpeg_path):
+        inputs = [PIPE_IN if ref == stage.piped_input else (self.stages[ref].target if ref in self.stages else ref)
+                  for _, ref in stage.inputs]
+        command = stage.builder(ffmpeg_path, stage, inputs, stage.target)
+        if isinstance(command, FfmpegCommand):
+            output = command.outputs[0]
+            if stage.target == PIPE_OUT:
+                output.set("-f", stage.format)
+            else:
+                output_mux.apply(output)
+        return command
+
+    def _abort(self):
+        # Stops every running stage so a failure does not wait for the other chains to finish
+        with self._running_lock:
+            self._aborted = True
+            for process in self._running:
+                if process.poll() is None:
+                    process.kill()
+
+    def _run_chain(self, chain, ffmpeg_path, timings, on_output=None):
+        # Starts every stage of the chain with stdout -> next stdin, then waits for all
+        processes, readers, outputs = [], [], []
+        previous = None
+        started = time.monotonic()
+        commands = [self._command(stage, ffmpeg_path) for stage in chain]
+        # The stages run at the same time: one grant splits the cores between them
+        leases = governor.acquire_all([governor.Lease(f"pipeline_{stage.op}", cost=STAGE_COSTS.get(stage.op, 1))
+                                       for stage in chain])
+        try:
+            for stage, command, lease in zip(chain, commands, leases):
+                if isinstance(command, FfmpegCommand):
+                    command = lease.apply(command).build()
+                output = []
+                process = ffmpeg_metrics.TracedPopen(
+                    command,
+                    stage=f"pipeline_{stage.op}",
+                    lease=lease,
+                    stdin=previous.stdout if previous else subprocess.DEVNULL,
+                    stdout=subprocess.PIPE if stage.pipes_to else subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    **ffmpeg_common.hidden_window_kwargs()
+                )
+                with self._running_lock:
+                    self._running.add(process)
+                    if self._aborted:
+                        process.kill()
+                if previous:
+                    previous.stdout.close()  # Only the consumer holds the read end (producer sees EPIPE if it dies)
+                reader = threading.Thread(target=_drain, args=(process, output, stage.id, on_output),
+                                          daemon=True)
+                reader.start()
+                processes.append(process)
+                readers.append(reader)
+                outputs.append(output)
+                previous = process
+            failures = []
+            for stage, process, reader, output in zip(chain, processes, readers, outputs):
+                return_code = process.wait()
+                reader.join()
+                timings[stage.id] = time.monotonic() - started
+                if return_code != 0:
+                    error = subprocess.CalledProcessError(return_code, process.args, output="".join(output)[-STDERR_TAIL:])
+                    error.stage = stage.id
+                    failures.append(error)
+            if failures:
+                # A producer whose consumer died only reports the broken pipe; blame the consumer
+                raise next((e for e in failures if "Broken pipe" not in e.output), failures[0])
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+            with self._running_lock:
+                self._running.difference_update(processes)
+            for lease in leases:
+                lease.release()
+        return chain[-1].target
+
+    def run(self, ffmpeg_path=None, work_dir=None, progress=None, on_output=None):
+        """Runs the pipeline; returns {stage id: seconds from its chain's start to its exit}.
+
+        Intermediate files go to work_dir (a temporary directory by default,
+        removed afterwards). progress(message) is called as chains start and finish;
+        on_output(stage_id, text) gets each stage's stderr as it arrives.
+        """
+        ffmpeg_path = ffmpeg_path or ffmpeg_common.find_ffmpeg() or "ffmpeg"
+        report = progress or (lambda message: None)
+        with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+            self.plan(temp_dir)
+            self._aborted = False
+            timings = {}
+            done = set()
+            remaining = list(self.chains)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.chains)) as pool:
+                running = {}
+                while remaining or running:
+                    for chain in [c for c in remaining if self._dependencies(c) <= done]:
+                        remaining.remove(chain)
+                        report("Starting " + " | ".join(s.id for s in chain))
+                        running[pool.submit(self._run_chain, chain, ffmpeg_path, timings, on_output)] = chain
+                    if not running:
+                        raise PipelineError("Pipeline cannot make progress (unresolved inputs).")
+                    finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        chain = running.pop(future)
+                        if future.exception() is not None:
+                            self._abort()  # Otherwise leaving the pool would wait for the other chains
+                            raise future.exception()
+                        done.update(stage.id for stage in chain)
+                        report(f"Finished {' | '.join(s.id for s in chain)} -> {chain[-1].target}")
+        return timings
+
+
+def _drain(process, output, stage_id=None, on_output=None):
+    # Keeps stderr moving (a full pipe would stall ffmpeg) and feeds the tracer
+    for chunk in iter(lambda: process.stderr.read1(4096), b""):
+        text = chunk.decode("utf-8", errors="replace")
+        output.append(text)
+        process.feed(text)
+        if on_output:
+            on_output(stage_id, text)
+    process.stderr.close()
+
+
+def run_file(path, ffmpeg_path=None, progress=print):
+    """Loads and runs a pipeline file; returns the per-stage timings."""
+    pipeline = Pipeline.load(path)
+    started = time.monotonic()
+    timings = pipeline.run(ffmpeg_path, progress=progress)
+    total = time.monotonic() - started
+    for stage_id, seconds in timings.items():
+        print(f"  {stage_id}: {seconds:.1f}s")
+    print(f"Pipeline finished in {total:.1f}s")
+    return timings
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("plan", "run"):
+        print("usage: python pipeline.py plan|run PIPELINE.json")
+        sys.exit(2)
+    if sys.argv[1] == "plan":
+        pipeline = Pipeline.load(sys.argv[2])
+        pipeline.plan(os.path.join(tempfile.gettempdir(), "pipeline"))
+        print(pipeline.describe())
+    else:
+        ffmpeg_metrics.serve_from_env()
+        try:
+            run_file(sys.argv[2], shutil.which("ffmpeg"))
+        except subprocess.CalledProcessError as e:
+            print(f"Stage '{getattr(e, 'stage', '?')}' failed (code {e.returncode}):\n{e.output}")
+            sys.exit(1)
@@ -0,0 +1,124 @@
+"""Deadline-driven x264 preset selection from measured per-preset throughput.
+
+The model is per machine and per ffmpeg version: a different ffmpeg build
+is benchmarked again rather than judged by the old build's speeds.
+"""
+import os
+import platform
+import time
+
+import app_cache
+import capabilities
+import ffmpeg_common
+import governor
+from ffmpeg_command import FfmpegCommand
+
+# Fastest to slowest
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+CALIBRATION_SIZE = (1280, 720)
+CALIBRATION_FPS = 30
+CALIBRATION_SECONDS = 4
+LEARNING_RATE = 0.3  # Weight of a finished job's timing in the stored throughput
+
+
+def _model_path():
+    return os.path.join(app_cache.cache_dir("presets"), f"throughput_{platform.node() or 'local'}.json")
+
+
+def _calibration_clip(ffmpeg_path):
+    # Lossless synthetic clip, generated once and reused for every benchmark
+    clip_path = os.path.join(app_cache.cache_dir("presets"), "calibration.mkv")
+    if not os.path.exists(clip_path):
+        width, height = CALIBRATION_SIZE
+        command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+        command.add_input(f"testsrc2=size={width}x{height}:rate={CALIBRATION_FPS}", {"-f": "lavfi"})
+        command.add_output(clip_path, {"-t": CALIBRATION_SECONDS, "-c:v": "ffv1", "-pix_fmt": "yuv420p"})
+        ffmpeg_common.run_command(command.build(), stage="preset_calibration")
+    return clip_path
+
+
+def calibrate(ffmpeg_path, status=None):
+    """Benchmarks every preset on the calibration clip; returns pixels/sec per preset.
+
+    The benchmark runs under a "convert" lease, so presets are timed with the
+    same -threads a real deadline job gets.
+    """
+    clip_path = _calibration_clip(ffmpeg_path)
+    width, height = CALIBRATION_SIZE
+    pixels = width * height * CALIBRATION_FPS * CALIBRATION_SECONDS
+    throughput = {}
+    with governor.lease("convert", status=status) as budget:
+        for preset in X264_PRESETS:
+            if status:
+                status(f"Benchmarking x264 preset '{preset}'...")
+            started = time.monotonic()
+            command = FfmpegCommand(ffmpeg_path, "-hide_banner")
+            command.add_input(clip_path)
+            command.add_output("-", {"-c:v": "libx264", "-preset": preset, "-crf": "23", "-f": "null"})
+            ffmpeg_common.run_command(budget.apply(command).build(), stage="preset_benchmark")
+            throughput[preset] = pixels / max(time.monotonic() - started, 1e-3)
+    return throughput
+
+
+def load_model(ffmpeg_path, status=None):
+    """Returns the stored throughput model, calibrating on first use and after an ffmpeg change."""
+    path = _model_path()
+    model = app_cache.load_json(path)
+    version = capabilities.detect()["version"]
+    if not model or set(model.get("throughput", {})) != set(X264_PRESETS) or model.get("ffmpeg") != version:
+        model = {"ffmpeg": version, "throughput": calibrate(ffmpeg_path, status)}
+        app_cache.save_json(path, model)
+    return model
+
+
+def job_pixels(in_file):
+    """Returns the number of pixels to encode for in_file."""
+    info = ffmpeg_common.probe(in_file)
+    video = ffmpeg_common.first_stream(info, "video") or {}
+    duration = ffmpeg_common.probe_duration(in_file, info)
+    fps = ffmpeg_common.stream_frame_rate(video) or CALIBRATION_FPS
+    return (video.get("width") or 0) * (video.get("height") or 0) * fps * duration, duration
+
+
+def parse_budget(value, duration):
+    """Converts '120' (seconds) or '2x' (realtime speed factor) into a wall-clock budget."""
+    value = value.strip().lower()
+    if value.endswith("x"):
+        factor = float(value[:-1])
+        if factor <= 0:
+            raise ValueError("Realtime factor must be positive.")
+        return duration / factor
+    seconds = float(value)
+    if seconds <= 0:
+        raise ValueError("Time budget must be positive.")
+    return seconds
+
+
+def pick_preset(ffmpeg_path, in_file, budget_value, status=None):
+    """Returns (preset, estimated_seconds, pixels) for the slowest preset that fits the budget.
+
+    Without a known frame size and duration nothing can be priced: the fastest
+    preset is returned with no estimate.
+    """
+    pixels, duration = job_pixels(in_file)
+    budget = parse_budget(budget_value, duration)
+    if pixels <= 0 or duration <= 0:
+        return X264_PRESETS[0], None, 0
+    model = load_model(ffmpeg_path, status)
+    chosen = X264_PRESETS[0]
+    for preset in X264_PRESETS:
+        if pixels / model["throughput"][preset] <= budget:
+            chosen = preset
+    return chosen, pixels / model["throughput"][chosen], pixels
+
+
+def record_job(preset, pixels, elapsed):
+    """Refines a preset's stored throughput with a finished job's timing."""
+    path = _model_path()
+    model = app_cache.load_json(path)
+    if not model or preset not in model.get("throughput", {}) or elapsed <= 0 or pixels <= 0:
+        return
+    observed = pixels / elapsed
+    old = model["throughput"][preset]
+    model["throughput"][preset] = (1 - LEARNING_RATE) * old + LEARNING_RATE * observed
+    app_cache.save_json(path, model)
@@ -0,0 +1,179 @@
+"""Low-resolution editing proxies, written in the same decode pass as the main encode.
+
+add_output() adds a proxy as a second output of an existing command, so
+the decoded frames feed both the full encode and the small one:
+
+    proxy.add_output(command, source, proxy.proxy_path(out_file), timecode=proxy.source_timecode(info))
+
+Proxies are PROXY_HEIGHT lines high (aspect kept) at the source's frame
+rate, with the source's timecode, metadata and first audio track, so NLEs
+relink them to the full-resolution file. MODE_INTRA (default) is all-intra
+H.264 for instant scrubbing; MODE_LOW_BITRATE is long-GOP H.264 at
+LOW_BITRATE for smaller files.
+
+For existing libraries, make_proxies() builds proxies only, at background
+priority, shortest predicted (eta) first, skipping files whose proxy is
+already up to date:
+
+    python proxy.py [--low-bitrate] FILE_OR_DIR ...
+"""
+import concurrent.futures
+import os
+import sys
+import time
+
+import eta
+import ffmpeg_common
+import ffmpeg_metrics
+import governor
+import output_mux
+from ffmpeg_command import FfmpegCommand
+
+PROXY_HEIGHT = 540
+PROXY_DIR = "proxies"
+MODE_INTRA = "intra"
+MODE_LOW_BITRATE = "low_bitrate"
+LOW_BITRATE = "2M"
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".mov", ".m4v", ".avi", ".webm", ".mxf", ".ts"}
+WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+_VIDEO_OPTIONS = {
+    MODE_INTRA: {"-c:v": "libx264", "-preset": "ultrafast", "-crf": "23", "-g": "1"},
+    MODE_LOW_BITRATE: {"-c:v": "libx264", "-preset": "veryfast", "-b:v": LOW_BITRATE, "-maxrate": LOW_BITRATE,
+                       "-bufsize": "4M", "-g": "30"},
+}
+
+
+def proxy_path(out_file):
+    """Proxy location for a file: <dir>/proxies/<name>_proxy.mp4."""
+    directory, name = os.path.split(out_file)
+    return os.path.join(directory, PROXY_DIR, os.path.splitext(name)[0] + "_proxy.mp4")
+
+
+def source_timecode(info):
+    """Start timecode from probe info (format or first video stream tags), or None."""
+    for tags in [info.get("format", {}).get("tags", {})] + [s.get("tags", {}) for s in info.get("streams", [])
+                                                             if s.get("codec_type") in ("video", "data")]:
+        if tags.get("timecode"):
+            return tags["timecode"]
+    return None
+
+
+def add_output(command, source, proxy_file, mode=MODE_INTRA, fps=None, timecode=None):
+    """Adds a proxy output reading the same decoded source as command's other outputs."""
+    if mode not in _VIDEO_OPTIONS:
+        raise ValueError(f"Unknown proxy mode '{mode}'. Expected {MODE_INTRA} or {MODE_LOW_BITRATE}.")
+    os.makedirs(os.path.dirname(proxy_file) or ".", exist_ok=True)
+    output = command.add_output(proxy_file)
+    output.map(source, "v:0").map(source, "a:0", optional=True)
+    output.set("-vf", f"scale=-2:{PROXY_HEIGHT}")
+    output.update(_VIDEO_OPTIONS[mode])
+    output.update({"-pix_fmt": "yuv420p", "-c:a": "aac", "-b:a": "128k", "-map_metadata": source.index})
+    if fps:
+        output.set("-r", fps)  # Same frame rate as the main output it stands in for
+    if timecode:
+        output.set("-timecode", timecode)
+    output_mux.apply(output)
+    return output
+
+
+def proxy_command(ffmpeg_path, in_file, proxy_file, mode=MODE_INTRA, info=None):
+    """A proxy-only command for an existing file."""
+    info = info if info is not None else ffmpeg_common.probe(in_file)
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner", "-nostdin")
+    source = command.add_input(in_file)
+    add_output(command, source, proxy_file, mode, timecode=source_timecode(info))
+    return command
+
+
+def is_current(in_file, proxy_file):
+    """True when proxy_file exists and is newer than in_file."""
+    try:
+        return os.path.getmtime(proxy_file) >= os.path.getmtime(in_file)
+    except OSError:
+        return False
+
+
+def _features(in_file, mode):
+    # (probe info, eta features) of a proxy job; (None, None) when the header is unreadable
+    try:
+        info = ffmpeg_common.probe(in_file)
+    except ffmpeg_common.PROBE_ERRORS:
+        return None, None  # proxy_command() probes again and reports it
+    return info, eta.job_features("proxy", info, encoder="libx264", preset=_VIDEO_OPTIONS[mode]["-preset"])
+
+
+def _make_one(ffmpeg_path, in_file, mode, info=None, features=None):
+    proxy_file = proxy_path(in_file)
+    if is_current(in_file, proxy_file):
+        return proxy_file, False
+    with governor.lease("proxy", governor.BACKGROUND) as budget:
+        command = budget.apply(proxy_command(ffmpeg_path, in_file, proxy_file + ".part.mp4", mode, info))
+        started = time.monotonic()
+        try:
+            ffmpeg_common.run_command(command.build(), stage="proxy", lease=budget)
+        except BaseException:
+            if os.path.exists(proxy_file + ".part.mp4"):
+                os.remove(proxy_file + ".part.mp4")
+            raise
+    if features:
+        eta.record(features, time.monotonic() - started)
+    os.replace(proxy_file + ".part.mp4", proxy_file)
+    return proxy_file, True
+
+
+def find_videos(paths):
+    """Expands directories (recursively, skipping proxy folders) into video files."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = [d for d in dirs if d != PROXY_DIR]
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def make_proxies(paths, ffmpeg_path="ffmpeg", mode=MODE_INTRA, workers=None, progress=None, order=eta.ORDER_SJF):
+    """Builds missing/outdated proxies for files and directories; returns {file: proxy path or error}.
+
+    progress(done, total, in_file) is called after each file. Files start in
+    eta order (order is one of eta.ORDERS).
+    """
+    if order not in eta.ORDERS:
+        raise ValueError(f"Unknown order '{order}'. Expected one of: {', '.join(eta.ORDERS)}.")
+    files = list(find_videos(paths))
+    jobs = {in_file: (None, None) if is_current(in_file, proxy_path(in_file)) else _features(in_file, mode)
+            for in_file in files}
+    predicted = {in_file: eta.predict(features) if features else None for in_file, (info, features) in jobs.items()}
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or WORKERS) as pool:
+        # The pool starts work in submission order
+        futures = {pool.submit(_make_one, ffmpeg_path, in_file, mode, *jobs[in_file]): in_file
+                   for in_file in eta.order(files, order, key=lambda in_file: {"predicted": predicted[in_file]})}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            in_file = futures[future]
+            try:
+                results[in_file] = future.result()[0]
+            except Exception as e:  # One bad file does not stop the library
+                results[in_file] = e
+            if progress:
+                progress(done, len(files), in_file)
+    return results
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    chosen_mode = MODE_LOW_BITRATE if "--low-bitrate" in args else MODE_INTRA
+    targets = [arg for arg in args if arg != "--low-bitrate"]
+    if not targets:
+        print("usage: python proxy.py [--low-bitrate] FILE_OR_DIR ...")
+        sys.exit(2)
+    ffmpeg_metrics.serve_from_env()
+    outcome = make_proxies(targets, ffmpeg_common.find_ffmpeg() or "ffmpeg", chosen_mode,
+                           progress=lambda done, total, name: print(f"[{done}/{total}] {name}"))
+    failed = {name: error for name, error in outcome.items() if isinstance(error, Exception)}
+    for name, error in failed.items():
+        print(f"Failed: {name}: {error}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,132 @@
+"""Target-size / target-bitrate encoding with cached first-pass stats."""
+import os
+
+import app_cache
+import ffmpeg_common
+import output_mux
+from ffmpeg_command import FfmpegCommand
+
+SIZE_TOLERANCE = 0.05  # Accept outputs within 5% under the target size
+MAX_SIZE_RETRIES = 2  # Extra second passes when the size misses the target
+MUX_OVERHEAD = 0.01  # Container overhead reserved from the bit budget
+
+
+class TargetSizeMissed(RuntimeError):
+    """The output is still over the size cap after the last retry."""
+
+    def __init__(self, out_file, actual_bytes, target_bytes):
+        super().__init__(f"{os.path.basename(out_file)} is {actual_bytes / (1024 * 1024):.2f} MB, over the "
+                         f"{target_bytes / (1024 * 1024):g} MB target after {MAX_SIZE_RETRIES + 1} attempts.")
+        self.out_file = out_file
+        self.actual_bytes = actual_bytes
+        self.target_bytes = target_bytes
+
+
+def _mb_to_kbit(size_mb):
+    return size_mb * 1024 * 1024 * 8 / 1000
+
+
+def video_kbps_for_size(target_mb, duration, audio_kbps):
+    """Returns the video bitrate (kbps) that fits target_mb over duration seconds."""
+    if duration <= 0:
+        raise ValueError("Cannot target a file size: input duration is unknown.")
+    total_kbps = _mb_to_kbit(target_mb) * (1 - MUX_OVERHEAD) / duration
+    video_kbps = int(total_kbps - audio_kbps)
+    if video_kbps < 50:
+        raise ValueError(f"Target of {target_mb} MB is too small for a {duration:.0f}s video.")
+    return video_kbps
+
+
+def audio_kbps_for_budget(total_kbps):
+    """Picks an AAC bitrate that leaves most of a small budget to video."""
+    return 320 if total_kbps >= 3200 else 128
+
+
+def first_pass_stats(ffmpeg_path, in_file, preset, video_kbps, status=None):
+    """Returns the x264 passlog prefix for in_file, running pass 1 only on a cache miss."""
+    stats_dir = app_cache.cache_dir("firstpass", app_cache.file_key(in_file))
+    prefix = os.path.join(stats_dir, f"x264_{preset}")
+    meta_path = prefix + ".json"
+    meta = app_cache.load_json(meta_path)
+    if meta and os.path.exists(prefix + "-0.log"):
+        return prefix, meta
+
+    if status:
+        status("Analyzing video (first pass)...")
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    source = command.add_input(in_file)
+    command.add_output("-").map(source, "v:0").update({
+        "-c:v": "libx264", "-preset": preset, "-b:v": f"{video_kbps}k",
+        "-pix_fmt": "yuv420p",
+        "-pass": "1", "-passlogfile": prefix,
+        "-an": None, "-f": "null",
+    })
+    ffmpeg_common.run_command(command.build(), stage="two_pass_first")
+    meta = {"preset": preset, "duration": ffmpeg_common.probe_duration(in_file)}
+    app_cache.save_json(meta_path, meta)
+    return prefix, meta
+
+
+def _second_pass_command(ffmpeg_path, in_file, out_file, video_kbps, audio_kbps, has_cuda, preset, prefix):
+    command = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner")
+    source = command.add_input(in_file)
+    output = command.add_output(out_file).map(source, "v:0").map(source, "a:0")
+    if has_cuda:
+        # NVENC runs both passes inside one invocation
+        output.update({
+            "-c:v": "h264_nvenc", "-preset": "p6", "-rc": "vbr", "-multipass": "fullres",
+            "-b:v": f"{video_kbps}k", "-maxrate": f"{int(video_kbps * 1.5)}k", "-bufsize": f"{video_kbps * 2}k",
+        })
+    else:
+        output.update({
+            "-c:v": "libx264", "-preset": preset, "-b:v": f"{video_kbps}k",
+            "-pass": "2", "-passlogfile": prefix,
+        })
+    output.update({"-c:a": "aac", "-b:a": f"{audio_kbps}k", "-pix_fmt": "yuv420p"})
+    output_mux.apply(output)
+    return command.build()
+
+
+def encode_to_target(ffmpeg_path, in_file, out_file, has_cuda, target_mb=None, target_kbps=None,
+                     preset="ultrafast", status=None):
+    """Encodes in_file to hit a target size (MB) or total bitrate (kbps).
+
+    Size targets are corrected with extra second passes (reusing the cached
+    first-pass stats) until the output lands within SIZE_TOLERANCE under the cap.
+    Returns the output size; raises TargetSizeMissed if the last attempt is
+    still over the cap.
+    """
+    duration = ffmpeg_common.probe_duration(in_file)
+    if target_mb:
+        total_kbps = _mb_to_kbit(target_mb) / duration if duration > 0 else 0
+        audio_kbps = audio_kbps_for_budget(total_kbps)
+        video_kbps = video_kbps_for_size(target_mb, duration, audio_kbps)
+    else:
+        audio_kbps = audio_kbps_for_budget(target_kbps)
+        video_kbps = max(50, int(target_kbps - audio_kbps))
+
+    prefix = None
+    if not has_cuda:
+        prefix, _ = first_pass_stats(ffmpeg_path, in_file, preset, video_kbps, status)
+
+    for attempt in range(MAX_SIZE_RETRIES + 1):
+        if status:
+            status(f"Encoding at {video_kbps} kbps video (pass {attempt + 2})...")
+        ffmpeg_common.run_command(
+            _second_pass_command(ffmpeg_path, in_file, out_file, video_kbps, audio_kbps, has_cuda, preset, prefix),
+            stage="two_pass_second",
+        )
+        if not target_mb:
+            break
+        target_bytes = target_mb * 1024 * 1024
+        actual_bytes = os.path.getsize(out_file)
+        if target_bytes * (1 - SIZE_TOLERANCE) <= actual_bytes <= target_bytes:
+            break
+        # Scale the video share of the budget by the observed miss
+        audio_bytes = audio_kbps * 1000 / 8 * duration
+        ratio = (target_bytes * (1 - SIZE_TOLERANCE / 2) - audio_bytes) / max(1, actual_bytes - audio_bytes)
+        video_kbps = max(50, int(video_kbps * ratio))
+    actual_bytes = os.path.getsize(out_file)
+    if target_mb and actual_bytes > target_mb * 1024 * 1024:
+        raise TargetSizeMissed(out_file, actual_bytes, target_mb * 1024 * 1024)
+    return actual_bytes
@@ -6,12 +6,23 @@ import json
 import os
 import sys
 import shutil
+import time
+
+import audio_extract
+import av_sync
+import engine
+import ffmpeg_common
+import ffmpeg_metrics
+import governor
+import output_mux
+import track_map
+from ffmpeg_command import FfmpegCommand
  
 class FfmpegApp:
   def __init__(self, master):
    self.master = master
    self.master.title("Simple FFmpeg GUI")
-   self.master.geometry("350x250")
+   self.master.geometry("350x310")
  
    self.info_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "video_info.json")
    self.video_info = {}
@@ -28,9 +39,21 @@ class FfmpegApp:
    self.extract_audio_button = tk.Button(master, text="2. Extract Audio to WAV", command=self.extract_audio)
    self.extract_audio_button.pack(pady=10, fill=tk.X, padx=20)
  
+   # extra formats written from the same decode as the WAV
+   formats_frame = tk.Frame(master)
+   formats_frame.pack()
+   tk.Label(formats_frame, text="Also extract:").pack(side=tk.LEFT)
+   self.extra_format_vars = {}
+   for fmt in ("mp3", "aac", "flac"):
+    self.extra_format_vars[fmt] = tk.BooleanVar(value=False)
+    tk.Checkbutton(formats_frame, text=fmt.upper(), variable=self.extra_format_vars[fmt]).pack(side=tk.LEFT)
+ 
    self.replace_audio_button = tk.Button(master, text="3. Replace Audio with WAV", command=self.replace_audio)
    self.replace_audio_button.pack(pady=10, fill=tk.X, padx=20)
  
+   self.auto_sync_var = tk.BooleanVar(value=True)
+   tk.Checkbutton(master, text="Auto-sync new audio to original", variable=self.auto_sync_var).pack()
+ 
   def check_ffmpeg(self):
    # check if ffmpeg and ffprobe are available
    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
@@ -64,11 +87,11 @@ class FfmpegApp:
     self.set_status(f"Failed to save info: {e}", "red")
     mb.showerror("Error", f"Could not save video info to {self.info_file_path}:\n{e}")
  
-  def run_command(self, command, success_msg, error_msg_prefix):
-   # execute ffmpeg/ffprobe commands
+  def run_command(self, command, success_msg, error_msg_prefix, stage="ffmpeg", lease=None):
+   # execute ffmpeg/ffprobe commands (traced for metrics)
    try:
     self.set_status("Processing...", "orange")
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    process = ffmpeg_metrics.TracedPopen(command, stage=stage, lease=lease, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
     stdout, stderr = process.communicate()
  
     if process.returncode == 0:
@@ -89,6 +112,29 @@ class FfmpegApp:
     mb.showerror("Error", f"An unexpected error occurred:\n{e}")
     return None
  
+  def run_engine(self, operation, success_msg, error_msg_prefix):
+   # run an engine operation (ffmpeg CLI or PyAV) with run_command's status and error reporting;
+   # text the operation returns is appended to the success message
+   try:
+    self.set_status("Processing...", "orange")
+    success_msg += operation() or ""
+   except subprocess.CalledProcessError as e:
+    self.set_status(f"{error_msg_prefix}: Error", "red")
+    lines = (e.output or e.stderr or "").strip().splitlines()
+    mb.showerror("Error", f"{error_msg_prefix}:\n{lines[-1] if lines else e}") # show last line of error
+    return False
+   except FileNotFoundError:
+    self.set_status("ffmpeg/ffprobe not found.", "red")
+    mb.showerror("Error", "ffmpeg or ffprobe not found. Ensure FFmpeg is installed and in PATH.")
+    return False
+   except Exception as e:
+    self.set_status(f"Command execution failed: {e}", "red")
+    mb.showerror("Error", f"An unexpected error occurred:\n{e}")
+    return False
+   self.set_status(success_msg, "green")
+   mb.showinfo("Success", success_msg)
+   return True
+ 
   def extract_info(self):
    # open file dialog to select video
    file_path = fd.askopenfilename(
@@ -100,20 +146,24 @@ class FfmpegApp:
     return
  
    self.set_status("Extracting video info...", "orange")
-   # use ffprobe to get stream info as json
-   command = [
-    "ffprobe",
-    "-v", "quiet",
-    "-print_format", "json",
-    "-show_streams",
-    file_path
-   ]
- 
-   info_json_str = self.run_command(command, "Video info extracted.", "Info extraction failed")
- 
-   if info_json_str:
+   # header parse for MP4/MKV, ffprobe for the rest
+   try:
+    info = ffmpeg_common.probe(file_path)
+   except FileNotFoundError:
+    self.set_status("ffmpeg/ffprobe not found.", "red")
+    mb.showerror("Error", "ffmpeg or ffprobe not found. Ensure FFmpeg is installed and in PATH.")
+    return
+   except subprocess.CalledProcessError as e:
+    self.set_status("Info extraction failed", "red")
+    mb.showerror("Error", f"Info extraction failed:\n{e.stderr or e}")
+    return
+   except json.JSONDecodeError:
+    self.set_status("Failed to parse video info.", "red")
+    mb.showerror("Error", "Could not parse video information from ffprobe.")
+    return
+ 
+   if info:
     try:
-     info = json.loads(info_json_str)
      streams = info.get('streams', [])
      video_stream = next((s for s in streams if s.get('codec_type') == 'video'), None)
      audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
@@ -127,17 +177,21 @@ class FfmpegApp:
       mb.showwarning("Warning", "Could not find an audio stream in the selected file.")
       # allow proceeding without audio info if needed, storing None
  
+     # record start offsets so the replacement audio keeps the original delay
+     start_time = float(info.get('format', {}).get('start_time', 0.0) or 0.0)
+     audio_start = float(audio_stream.get('start_time', start_time) or start_time) if audio_stream else start_time
+ 
      self.video_info = {
       'path': file_path,
       'video_codec': video_stream.get('codec_name'),
-      'audio_codec': audio_stream.get('codec_name') if audio_stream else None
+      'audio_codec': audio_stream.get('codec_name') if audio_stream else None,
+      'start_time': start_time,
+      'audio_start_offset': audio_start - start_time,
+      'probe': info # full stream list for the track map
      }
      self.save_video_info()
      self.set_status(f"Info saved for: {os.path.basename(file_path)}", "green")
  
-    except json.JSONDecodeError:
-     self.set_status("Failed to parse video info.", "red")
-     mb.showerror("Error", "Could not parse video information from ffprobe.")
     except Exception as e:
      self.set_status(f"Error processing info: {e}", "red")
      mb.showerror("Error", f"An unexpected error occurred while processing info:\n{e}")
@@ -153,20 +207,21 @@ class FfmpegApp:
    video_dir = os.path.dirname(video_path)
    output_wav_path = os.path.join(video_dir, "output_audio.wav")
  
-   self.set_status("Extracting audio to WAV...", "orange")
-   # ffmpeg command to extract audio as uncompressed pcm_s16le wav
-   command = [
-    "ffmpeg",
-    "-i", video_path,
-    "-vn",             # no video output
-    "-acodec", "pcm_s16le", # uncompressed 16-bit signed little-endian PCM
-    "-ar", "44100",      # sample rate (common standard)
-    "-ac", "2",          # channels (stereo)
-    "-y",              # overwrite output file without asking
-    output_wav_path
-   ]
- 
-   self.run_command(command, f"Audio extracted to {output_wav_path}", "Audio extraction failed")
+   # uncompressed pcm_s16le wav (44.1 kHz stereo), plus any checked formats from the same decode
+   outputs = [(output_wav_path, "wav")]
+   outputs += [(audio_extract.output_path(video_path, fmt), fmt) for fmt, var in self.extra_format_vars.items() if var.get()]
+   success_msg = f"Audio extracted to {', '.join(path for path, _ in outputs)}"
+ 
+   def extract():
+    started = time.monotonic()
+    processor.extract_audio(video_path, output_wav_path, "wav", also=outputs[1:])
+    if len(outputs) > 1:
+     seconds = time.monotonic() - started
+     return f"\n(one decode for {len(outputs)} formats in {seconds:.1f}s)"
+ 
+   self.set_status(f"Extracting audio ({', '.join(fmt.upper() for _, fmt in outputs)})...", "orange")
+   processor = engine.get(ffmpeg_path="ffmpeg") # ffmpeg CLI or PyAV (FFMPEG_TOOLS_ENGINE)
+   self.run_engine(extract, success_msg, "Audio extraction failed")
  
   def replace_audio(self):
    # check if video info is loaded
@@ -175,18 +230,17 @@ class FfmpegApp:
     mb.showerror("Error", "Please select a video and extract info first (Button 1).")
     return
  
-   # open file dialog to select modified wav
-   wav_path = fd.askopenfilename(
-    title="Select Modified WAV File",
+   # open file dialog to select one modified wav per audio track to replace
+   wav_paths = fd.askopenfilenames(
+    title="Select Modified WAV File(s)",
     filetypes=[("WAV Files", "*.wav"), ("All Files", "*.*")],
     initialdir=os.path.dirname(self.video_info['path']) # start in original video's dir
    )
-   if not wav_path:
+   if not wav_paths:
     self.set_status("No WAV file selected.", "grey")
     return
  
    video_path = self.video_info['path']
-   video_codec = self.video_info.get('video_codec', 'copy') # default to copy if somehow missing
    audio_codec = self.video_info.get('audio_codec') # get original audio codec
  
    video_dir = os.path.dirname(video_path)
@@ -197,53 +251,65 @@ class FfmpegApp:
  
    # Determine audio codec for output. Try original, fallback to aac if problematic/missing.
    # Using the original codec directly with WAV input might fail. AAC is safer.
-   # However, the request was to use the stored codec. Let's try it.
    # If audio_codec is None (e.g., original had no audio), default to AAC.
    output_audio_codec = audio_codec if audio_codec else 'aac'
-   # a common safe fallback: output_audio_codec = 'aac'
- 
-   # ffmpeg command to replace audio
-   command = [
-    "ffmpeg",
-    "-hwaccel", "auto", # attempt hardware acceleration for decoding
-    "-i", video_path,    # input 0: original video
-    "-i", wav_path,      # input 1: new audio
-    "-map", "0:v:0",     # map video stream from input 0
-    "-map", "1:a:0",     # map audio stream from input 1
-    "-c:v", "copy",      # copy video stream without re-encoding (fast)
-    "-c:a", output_audio_codec, # use original audio codec (or fallback)
-    # Optional: add bitrate if needed, e.g. "-b:a", "192k" if using aac
-    "-shortest",         # finish encoding when the shortest input stream ends (usually video)
-    "-y",                # overwrite output file without asking
-    output_video_path
-   ]
-   # if falling back to aac, add bitrate
-   if output_audio_codec == 'aac':
-     command.insert(-3, "-b:a") # insert before -shortest
-     command.insert(-3, "192k") # standard quality bitrate
+   options = {'b': '192k'} if output_audio_codec == 'aac' else None
+ 
+   # every source track is kept (video, other audio, subtitles, chapters, metadata);
+   # WAVs named like *_eng.wav replace the matching language, the rest go in track order
+   info = self.video_info.get('probe') or ffmpeg_common.probe(video_path)
+   plan = track_map.TrackPlan(info)
+   replaced = plan.replace_audio_files(wav_paths, output_audio_codec, options)
+ 
+   # measure offset/drift against each original track and correct it in this same pass
+   synced = []
+   if self.auto_sync_var.get() and audio_codec:
+    self.set_status("Measuring audio sync...", "orange")
+    for track in replaced:
+     if track.index is None:
+      continue # added track, nothing to align to
+     try:
+      track.filters, sync = av_sync.sync_filters(
+       "ffmpeg", video_path, track.source, base_delay=track.start_offset,
+       reference_stream=str(track.index))
+      synced.append(f"track {track.index}: offset {sync['offset']:+.4f}s, drift {sync['drift'] * 1e6:+.1f} ppm")
+      self.set_status(f"Auto-sync {synced[-1]}", "orange")
+     except (RuntimeError, ValueError, subprocess.CalledProcessError) as e: # ValueError: unreadable probe
+      mb.showwarning("Auto-sync skipped", f"Could not measure audio sync:\n{e}")
+      break
+ 
+   def build_command():
+    # ffmpeg command to replace audio
+    command = FfmpegCommand("ffmpeg", "-y") # overwrite output file without asking
+    video_in = command.add_input(video_path, {"-hwaccel": "auto"}) # input 0: original video, hw decode if available
+    output = command.add_output(output_video_path)
+    plan.apply(command, video_in, output) # replacement WAVs become inputs 1..n
+    output.set("-shortest") # finish encoding when the shortest input stream ends (usually video)
+    output_mux.apply(output) # faststart/fragmented MP4 layout
+    budget.apply(command) # thread budget shared with other running jobs
+    return command.build()
  
    success_msg = f"Video with new audio saved to {output_video_path}"
+   if synced:
+    success_msg += "\nAuto-sync " + "; ".join(synced)
    error_msg = "Audio replacement failed"
    
    # Run command, handle potential codec issues
-   if not self.run_command(command, success_msg, error_msg):
-       # Try again with a safer codec like AAC if the first attempt failed and wasn't already AAC
-       if output_audio_codec != 'aac':
-           mb.showwarning("Codec Warning", f"Encoding with '{output_audio_codec}' might have failed. Retrying with 'aac'.")
-           self.set_status("Retrying audio replacement with AAC codec...", "orange")
-           command[command.index("-c:a") + 1] = "aac" # change codec in command list
-           # ensure bitrate is set for aac if not already there
-           if "-b:a" not in command:
-               command.insert(-3, "-b:a") 
-               command.insert(-3, "192k")
-           else: # update bitrate if it exists but codec changed
-                aac_bitrate_index = command.index("-b:a") + 1
-                command[aac_bitrate_index] = "192k"
-                
-           self.run_command(command, success_msg, error_msg + " (AAC fallback)")
-       # if it still fails, the previous error message stands
+   with governor.lease("replace_audio") as budget:
+    if not self.run_command(build_command(), success_msg, error_msg, stage="replace_audio", lease=budget):
+        # Try again with a safer codec like AAC if the first attempt failed and wasn't already AAC
+        if output_audio_codec != 'aac':
+            mb.showwarning("Codec Warning", f"Encoding with '{output_audio_codec}' might have failed. Retrying with 'aac'.")
+            self.set_status("Retrying audio replacement with AAC codec...", "orange")
+            # switch every replaced track to aac (replaces any existing bitrate)
+            for track in replaced:
+                track.codec_options = {'c': 'aac', 'b': '192k'}
+                 
+            self.run_command(build_command(), success_msg, error_msg + " (AAC fallback)", stage="replace_audio", lease=budget)
+        # if it still fails, the previous error message stands
  
 if __name__ == "__main__":
+  ffmpeg_metrics.serve_from_env()
   root = tk.Tk()
   app = FfmpegApp(root)
   root.mainloop()
\ No newline at end of file
@@ -0,0 +1,23 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def ffmpeg_path():
+    path = shutil.which("ffmpeg")
+    if not path:
+        pytest.skip("ffmpeg not found")
+    return path
+
+
+@pytest.fixture(scope="session")
+def ffprobe_path():
+    path = shutil.which("ffprobe")
+    if not path:
+        pytest.skip("ffprobe not found")
+    return path
@@ -0,0 +1,66 @@
+import subprocess
+
+import pytest
+
+import audio_batch
+import eta
+
+
+def test_files_start_shortest_predicted_first(monkeypatch, tmp_path):
+    predictions = {"long.mkv": 300.0, "unknown.mkv": None, "short.mkv": 10.0, "medium.mkv": 60.0}
+    started = []
+
+    def prepare(self, ffmpeg_path, work_dir, number, segment_long=False):
+        self.predicted = predictions[self.in_file]
+
+    monkeypatch.setattr(audio_batch.FileJob, "prepare", prepare)
+    monkeypatch.setattr(audio_batch.FileJob, "run_remux", lambda self, priority=None: started.append(self.in_file))
+    items = [(name, str(tmp_path / name)) for name in predictions]
+    jobs = audio_batch.run_batch(items, remux_workers=1)
+    assert started == ["short.mkv", "medium.mkv", "long.mkv", "unknown.mkv"]
+    assert [job.in_file for job in jobs] == list(predictions)  # Reported in input order
+    started.clear()
+    audio_batch.run_batch(items, remux_workers=1, order=eta.ORDER_FIFO)
+    assert started == list(predictions)
+    with pytest.raises(ValueError):
+        audio_batch.run_batch(items, order="random")
+
+
+def test_parse_time_reads_the_last_position():
+    assert audio_batch.parse_time("size=  1kB time=00:00:01.50 bitrate=...\rsize=  2kB time=01:02:03.25 ") == 3723.25
+    assert audio_batch.parse_time("time=00:00:07 speed=1x") == 7.0
+    assert audio_batch.parse_time("Stream mapping: ...") is None
+    assert audio_batch.parse_time(None) is None
+
+
+def test_overall_progress_is_weighted_by_duration():
+    short, long = audio_batch.FileJob("short.mkv", "a"), audio_batch.FileJob("long.mkv", "b")
+    short.duration, long.duration = 10.0, 30.0
+    short.done = True
+    long.encode_progress = [1.0]
+    assert audio_batch.overall_progress([short, long]) == pytest.approx((10 + 30 * audio_batch.ENCODE_SHARE) / 40)
+    assert audio_batch.overall_progress([]) == 1.0
+
+
+def test_one_failing_file_does_not_stop_the_batch(monkeypatch, tmp_path):
+    remuxed = []
+
+    def prepare(self, ffmpeg_path, work_dir, number, segment_long=False):
+        if self.in_file == "unreadable.mkv":
+            raise ValueError("no streams")
+
+    def run_remux(self, priority=None):
+        if self.in_file == "broken.mkv":
+            raise subprocess.CalledProcessError(1, ["ffmpeg"], output="Invalid data found")
+        remuxed.append(self.in_file)
+
+    monkeypatch.setattr(audio_batch.FileJob, "prepare", prepare)
+    monkeypatch.setattr(audio_batch.FileJob, "run_remux", run_remux)
+    names = ["unreadable.mkv", "good.mkv", "broken.mkv", "also_good.mkv"]
+    jobs = audio_batch.run_batch([(name, str(tmp_path / name)) for name in names], remux_workers=1)
+    assert sorted(remuxed) == ["also_good.mkv", "good.mkv"]
+    assert all(job.done for job in jobs)
+    errors = {job.in_file: job.error for job in jobs}
+    assert errors["unreadable.mkv"] == "ValueError: no streams"
+    assert errors["broken.mkv"].startswith("ffmpeg failed (code 1)") and "Invalid data" in errors["broken.mkv"]
+    assert errors["good.mkv"] is None and errors["also_good.mkv"] is None
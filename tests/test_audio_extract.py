@@ -0,0 +1,11 @@
+import audio_extract
+import container_probe
+
+
+def test_extract_reports_its_time_without_printing(tmp_path, ffmpeg_path, capsys):
+    clip = container_probe.make_fixture(ffmpeg_path, str(tmp_path), "h264_aac.mp4")
+    outputs = [(audio_extract.output_path(clip, fmt), fmt) for fmt in ("wav", "mp3", "flac")]
+    result = audio_extract.extract(ffmpeg_path, clip, outputs)
+    assert all((tmp_path / path).exists() for path, _ in outputs)
+    assert list(result) == ["seconds"] and result["seconds"] > 0
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,66 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import app_cache
+import av_sync
+import ffmpeg_common
+
+RATE = av_sync.ANALYSIS_RATE
+
+
+def _speech_like(seconds, seed=1):
+    # Band-limited noise with a syllable-rate envelope: one clear correlation peak
+    rng = np.random.default_rng(seed)
+    samples = np.convolve(rng.standard_normal(int(seconds * RATE)), np.ones(4) / 4, "same")
+    return samples * (1.2 + np.sin(np.arange(samples.size) * 2 * np.pi * 4 / RATE))
+
+
+def _delayed(signal, seconds):
+    shift = int(round(seconds * RATE))
+    if shift >= 0:
+        return np.concatenate((np.zeros(shift), signal))[:signal.size]
+    return np.concatenate((signal[-shift:], np.zeros(-shift)))
+
+
+@pytest.mark.parametrize("delay", [0.5, -0.25, 2.0, 0.0])
+def test_lag_is_positive_when_the_other_track_is_late(delay):
+    reference = _speech_like(20)
+    lag, confidence = av_sync._lag_seconds(reference, _delayed(reference, delay))
+    assert lag == pytest.approx(delay, abs=1.0 / RATE)
+    assert confidence > 0.8
+
+
+def test_noisy_copy_still_matches():
+    reference = _speech_like(20)
+    noisy = _delayed(reference, 0.3) + np.random.default_rng(7).standard_normal(reference.size) * reference.std()
+    lag, confidence = av_sync._lag_seconds(reference, noisy)
+    assert lag == pytest.approx(0.3, abs=1.0 / RATE)
+    assert av_sync.MIN_CONFIDENCE < confidence < 0.9
+
+
+@pytest.mark.parametrize("other, message", [
+    (_speech_like(20, seed=2), "No clear match"),
+    (np.zeros(20 * RATE), "silent"),
+    (_speech_like(0.5), "Less than"),
+    (np.zeros(0), "Less than"),
+])
+def test_unusable_tracks_raise_sync_error(other, message):
+    with pytest.raises(av_sync.SyncError, match=message):
+        av_sync._lag_seconds(_speech_like(20), other)
+    assert issubclass(av_sync.SyncError, RuntimeError)  # What the GUIs catch
+
+
+def test_measure_reports_offset_and_confidence(monkeypatch, tmp_path):
+    reference = _speech_like(30)
+    tracks = {"video.mp4": reference, "late.wav": _delayed(reference, 1.25)}
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path))
+    monkeypatch.setattr(app_cache, "file_key", lambda path, full=None: path.replace(".", "_"))
+    monkeypatch.setattr(ffmpeg_common, "probe_duration", lambda path, info=None: 30.0)
+    monkeypatch.setattr(av_sync, "_read_pcm", lambda ffmpeg_path, path, start, seconds, stream="a:0": tracks[path])
+    result = av_sync.measure("ffmpeg", "video.mp4", "late.wav")
+    assert result["offset"] == pytest.approx(1.25, abs=1.0 / RATE)
+    assert result["drift"] == 0.0 and result["confidence"] > 0.8
+    # A late replacement has its head trimmed
+    assert av_sync.correction_filters(result["offset"], 0.0, 48000) == ["atrim=start_sample=60000,asetpts=PTS-STARTPTS"]
+    assert av_sync.correction_filters(-0.5, 0.0, 48000) == ["adelay=24000S:all=1"]
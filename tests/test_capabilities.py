@@ -0,0 +1,21 @@
+import app_cache
+import capabilities
+import ffmpeg_common
+
+
+def test_failed_check_is_returned_not_printed(monkeypatch, tmp_path, capsys):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("")
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path))
+    monkeypatch.setattr(capabilities, "_memo", {})
+    monkeypatch.setattr(ffmpeg_common, "find_ffmpeg", lambda: str(ffmpeg))
+    monkeypatch.setattr(ffmpeg_common, "find_ffprobe", lambda: None)
+
+    def broken(*args, **kwargs):
+        raise OSError("exec format error")
+    monkeypatch.setattr(ffmpeg_common, "run_command", broken)
+    caps = capabilities.detect()
+    assert caps["error"] == "Capability check failed: exec format error"
+    assert caps["encoders"] == [] and not capabilities.has_encoder(caps, "h264_nvenc")
+    assert capsys.readouterr().out == ""
+    assert app_cache.load_json(capabilities._cache_path(), {}) == {}  # Tried again on the next start
@@ -0,0 +1,68 @@
+import os
+import subprocess
+
+import pytest
+
+import app_cache
+import checkpoint
+import ffmpeg_metrics
+from ffmpeg_command import FfmpegCommand
+
+
+def _encode_job(ffmpeg_path, in_file, out_file, *input_options):
+    job = FfmpegCommand(ffmpeg_path, "-y", "-hide_banner", "-stats")
+    source = job.add_input(in_file, dict.fromkeys(input_options))
+    output = job.add_output(out_file, {"-c:v": "libx264", "-preset": "ultrafast", "-crf": "30",
+                                       "-pix_fmt": "yuv420p", "-c:a": "aac"})
+    output.map(source, "v:0").map(source, "a:0", optional=True)
+    return job
+
+
+def _video_packets(ffprobe_path, path):
+    result = subprocess.run([ffprobe_path, "-v", "error", "-select_streams", "v:0", "-show_entries",
+                             "packet=pts_time", "-of", "csv=p=0", path], capture_output=True, text=True, check=True)
+    return sorted(float(value.strip(",")) for value in result.stdout.split())
+
+
+@pytest.mark.parametrize("extension", [".mkv", ".mp4"])  # Variable and constant frame rate containers
+def test_killed_encode_resumes_to_the_same_frames(monkeypatch, tmp_path, ffmpeg_path, ffprobe_path, extension):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    # AAC priming starts the file before the first frame, off the frame grid
+    source = str(tmp_path / "source.mkv")
+    subprocess.run([ffmpeg_path, "-v", "error", "-f", "lavfi", "-i", "testsrc=size=160x120:rate=25:duration=6",
+                    "-f", "lavfi", "-i", "sine=duration=6", "-c:v", "libx264", "-preset", "ultrafast",
+                    "-c:a", "aac", source], check=True)
+    plain = str(tmp_path / ("plain" + extension))
+    subprocess.run(_encode_job(ffmpeg_path, source, plain).build(), capture_output=True, check=True)
+
+    resumed = str(tmp_path / ("resumed" + extension))
+    job = _encode_job(ffmpeg_path, source, resumed, "-re")  # Real time, so the kill lands mid-encode
+    processes = []
+
+    class Captured(ffmpeg_metrics.TracedPopen):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if self.stage == "convert":  # Not the segment probes
+                processes.append(self)
+
+    def kill_after_two_segments(message):
+        state = checkpoint.load_manifest(resumed)
+        if state and len(state["segments"]) >= 2:
+            processes[-1].kill()
+
+    monkeypatch.setattr(checkpoint.ffmpeg_metrics, "TracedPopen", Captured)
+    returncode, _ = checkpoint.run(job, segment_seconds=1, progress=kill_after_two_segments)
+    assert returncode != 0
+    assert not os.path.exists(resumed) or os.path.getsize(resumed) == 0
+    state = checkpoint.load_manifest(resumed)
+    assert 2 <= len(state["segments"]) < 6 and not state["complete"]
+
+    messages = []
+    monkeypatch.setattr(checkpoint.ffmpeg_metrics, "TracedPopen", ffmpeg_metrics.TracedPopen)
+    returncode, output = checkpoint.run(job, segment_seconds=1, progress=messages.append)
+    assert returncode == 0, output
+    assert any(message.startswith("Resuming at") for message in messages)
+    assert not os.path.exists(checkpoint.work_dir(resumed))
+    expected, actual = _video_packets(ffprobe_path, plain), _video_packets(ffprobe_path, resumed)
+    assert len(actual) == len(expected)
+    assert actual == pytest.approx(expected, abs=0.0015)  # Segments keep Matroska's milliseconds
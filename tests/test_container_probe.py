@@ -0,0 +1,68 @@
+import subprocess
+
+import pytest
+
+import app_cache
+import container_probe
+import ffmpeg_common
+
+
+@pytest.fixture(scope="session")
+def fixture_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("probe_fixtures")
+
+
+def _fixture(ffmpeg_path, directory, name):
+    path = directory / name
+    if not path.exists():
+        try:
+            container_probe.make_fixture(ffmpeg_path, str(directory), name)
+        except subprocess.CalledProcessError:
+            pytest.skip(f"ffmpeg cannot encode {name}")
+    return str(path)
+
+
+@pytest.mark.parametrize("name", sorted(container_probe.FIXTURES))
+def test_probe_matches_ffprobe(name, ffmpeg_path, ffprobe_path, fixture_dir):
+    path = _fixture(ffmpeg_path, fixture_dir, name)
+    assert container_probe.parity(path, ffprobe_path) == []
+
+
+@pytest.mark.parametrize("name, pix_fmt, color_range", [
+    ("h264_full_range.mp4", "yuvj420p", "pc"),
+    ("h264_tv_range.mkv", "yuv422p", "tv"),
+    ("hevc_full_range.mkv", "yuvj420p", "pc"),
+    ("h264_aac.mp4", "yuv420p", None),
+    ("hevc_10bit.mp4", "yuv420p10le", "tv"),
+])
+def test_pix_fmt_and_color_range(name, pix_fmt, color_range, ffmpeg_path, fixture_dir):
+    video = container_probe.probe(_fixture(ffmpeg_path, fixture_dir, name))["streams"][0]
+    assert (video["pix_fmt"], video.get("color_range")) == (pix_fmt, color_range)
+
+
+def test_unknown_container_falls_back(tmp_path):
+    path = tmp_path / "clip.avi"
+    path.write_bytes(b"RIFF\x00\x00\x00\x00AVI LIST" + bytes(64))
+    assert container_probe.probe(str(path)) is None
+
+
+def test_truncated_header_falls_back(tmp_path, ffmpeg_path, fixture_dir):
+    data = open(_fixture(ffmpeg_path, fixture_dir, "h264_subs.mkv"), "rb").read()
+    path = tmp_path / "truncated.mkv"
+    path.write_bytes(data[:200])
+    assert container_probe.probe(str(path)) is None
+
+
+def test_parsed_headers_skip_the_file_key(monkeypatch, tmp_path, ffmpeg_path, fixture_dir):
+    keyed = []
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path))
+    monkeypatch.setattr(app_cache, "file_key", lambda path, full=None: keyed.append(path) or "key")
+    path = _fixture(ffmpeg_path, fixture_dir, "h264_aac.mp4")
+    assert ffmpeg_common.probe(path)["streams"][0]["codec_type"] == "video"
+    assert keyed == []
+    other = tmp_path / "clip.avi"
+    other.write_bytes(b"RIFF" + b"\0" * 60)
+    monkeypatch.setattr(ffmpeg_common.ffmpeg_metrics, "run", lambda *args, **kwargs: subprocess.CompletedProcess(
+        args, 0, stdout='{"format": {}, "streams": []}'))
+    assert ffmpeg_common.probe(str(other)) == {"format": {}, "streams": []}
+    assert keyed == [str(other)]  # The ffprobe fallback is keyed and cached
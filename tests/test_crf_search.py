@@ -0,0 +1,42 @@
+import concurrent.futures
+
+import pytest
+
+import app_cache
+import container_probe
+import crf_search
+import governor
+
+
+@pytest.fixture
+def clip(tmp_path, monkeypatch, ffmpeg_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    return container_probe.make_fixture(ffmpeg_path, str(tmp_path), "h264_aac.mp4")
+
+
+def test_pool_stays_within_the_lease(monkeypatch, clip, ffmpeg_path):
+    monkeypatch.setattr(governor, "ENABLED", True)
+    monkeypatch.setattr(governor, "CORE_BUDGET", 4)
+    sizes = []
+    pool_class = concurrent.futures.ProcessPoolExecutor
+
+    def pool(max_workers=None):
+        sizes.append(max_workers)
+        return pool_class(max_workers=max_workers)
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", pool)
+    crf, metric, worst = crf_search.search_crf(ffmpeg_path, clip, crfs=(23, 32))
+    assert sizes == [2]  # Two sample jobs, four leased threads
+    assert crf in (23, 32) and set(worst) == {23, 32}
+
+
+def test_repeated_search_is_cached(monkeypatch, clip, ffmpeg_path):
+    first = crf_search.search_crf(ffmpeg_path, clip, crfs=(23, 32), max_workers=2)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("searched again")
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", no_pool)
+    assert crf_search.search_crf(ffmpeg_path, clip, crfs=(23, 32)) == first
+    with pytest.raises(AssertionError):
+        crf_search.search_crf(ffmpeg_path, clip, floor=0.5, crfs=(23, 32))  # Other inputs search again
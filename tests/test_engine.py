@@ -0,0 +1,59 @@
+import subprocess
+import sys
+
+import pytest
+
+import container_probe
+import engine
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory, ffmpeg_path):
+    return container_probe.make_fixture(ffmpeg_path, str(tmp_path_factory.mktemp("engine")), "h264_aac.mp4")
+
+
+@pytest.fixture(params=sorted(engine.ENGINES))
+def processor(request, ffmpeg_path):
+    chosen = engine.get(request.param, ffmpeg_path)
+    if chosen.name != request.param:
+        pytest.skip(f"{request.param} engine not available")
+    return chosen
+
+
+def test_extract_audio_writes_every_format(processor, clip, tmp_path, ffprobe_path):
+    wav, mp3, flac = tmp_path / "a.wav", tmp_path / "a.mp3", tmp_path / "a.flac"
+    processor.extract_audio(clip, str(wav), "wav", also=[(str(mp3), "mp3"), (str(flac), "flac")])
+    for path, codec in ((wav, "pcm_s16le"), (mp3, "mp3"), (flac, "flac")):
+        info = container_probe._ffprobe(ffprobe_path, str(path))
+        assert info["streams"][0]["codec_name"] == codec
+        assert abs(float(info["format"]["duration"]) - 3.0) < 0.1
+
+
+def test_get_falls_back_to_cli_without_output(monkeypatch, capsys):
+    def unavailable(ffmpeg_path=None):
+        raise RuntimeError("The PyAV engine needs PyAV (pip install av).")
+
+    monkeypatch.setitem(engine.ENGINES, "pyav", unavailable)
+    assert engine.get("pyav").name == "cli"
+    assert capsys.readouterr().out == ""
+
+
+def test_cli_frames_raise_on_decoder_failure(monkeypatch, ffmpeg_path, clip):
+    pytest.importorskip("numpy")
+    cli = engine.CliEngine(ffmpeg_path)
+
+    def failing_decoder(*args, **kwargs):
+        # Some audio, then a decode error
+        script = "import sys; sys.stdout.buffer.write(bytes(80000)); sys.exit(1)"
+        return subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE)
+
+    monkeypatch.setattr(cli, "_decoder", failing_decoder)
+    received = []
+    with pytest.raises(subprocess.CalledProcessError):
+        for samples in cli.audio_frames(clip):
+            received.append(samples)
+    assert received
+    monkeypatch.undo()
+    frames = cli.audio_frames(clip)
+    next(frames)
+    frames.close()  # Stopping early is not an error
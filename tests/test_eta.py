@@ -0,0 +1,71 @@
+import pytest
+
+import app_cache
+import eta
+
+
+@pytest.fixture(autouse=True)
+def history(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path))
+
+
+def _features(**changes):
+    features = {"stage": "convert", "machine": "box", "encoder": "libx264", "preset": "medium", "video_codec": "h264",
+                "audio_codec": "aac", "height": 1080, "pixel_rate": 1920 * 1080 * 30.0, "duration": 60.0}
+    features.update(changes)
+    return features
+
+
+def test_predict_needs_history():
+    assert eta.predict(_features()) is None
+    assert eta.predict(_features(duration=0.0)) is None
+
+
+def test_predict_takes_the_median_realtime_factor():
+    for seconds in (30.0, 60.0, 600.0):  # 0.5x, 1x and an outlier
+        eta.record(_features(), seconds)
+    assert eta.predict(_features(duration=120.0)) == pytest.approx(120.0)
+
+
+def test_predict_scales_with_pixel_rate():
+    for _ in range(eta.MIN_RUNS):
+        eta.record(_features(), 60.0)
+    assert eta.predict(_features(height=2160, pixel_rate=3840 * 2160 * 30.0)) == pytest.approx(240.0)
+
+
+def test_predict_falls_back_to_less_specific_history():
+    eta.record(_features(machine="other", encoder="libx265", preset="slow"), 30.0)
+    assert eta.predict(_features()) == pytest.approx(30.0)  # Only the stage matches: one run is enough
+    assert eta.predict(_features(stage="upscale")) is None
+    assert eta.predict(_features(pixel_rate=0.0)) is None  # Video history does not price audio-only jobs
+
+
+def test_order_policies():
+    jobs = [{"name": "a", "predicted": None, "deadline": 50}, {"name": "b", "predicted": 30.0},
+            {"name": "c", "predicted": 10.0, "deadline": 100}, {"name": "d", "predicted": 10.0}]
+    names = lambda ordered: [job["name"] for job in ordered]
+    assert names(eta.order(jobs, eta.ORDER_FIFO)) == ["a", "b", "c", "d"]
+    assert names(eta.order(jobs, eta.ORDER_SJF)) == ["c", "d", "b", "a"]
+    assert names(eta.order(jobs, eta.ORDER_DEADLINE)) == ["a", "c", "d", "b"]
+    assert eta.order(["x", "y"], eta.ORDER_SJF, key=lambda name: {"predicted": {"x": 5, "y": 1}[name]}) == ["y", "x"]
+
+
+def test_batch_seconds():
+    assert eta.batch_seconds([4.0, 3.0, 2.0, 1.0]) == 10.0
+    assert eta.batch_seconds([4.0, 3.0, 2.0, 1.0], workers=2) == 5.0
+    assert eta.batch_seconds([4.0, None], workers=0) == 4.0
+    assert eta.batch_seconds([]) == 0.0
+
+
+def test_progress_moves_from_the_prediction_to_the_live_rate(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(eta.time, "monotonic", lambda: clock[0])
+    predicted, unknown = eta.Progress(10.0, predicted=100.0), eta.Progress(10.0)
+    assert predicted.remaining() == 100.0
+    assert unknown.remaining() is None
+    clock[0] = 10.0
+    assert predicted.update("frame=1 time=00:00:05.00 speed=0.5x") == 0.5
+    assert unknown.update("time=00:00:05.00") == 0.5
+    assert unknown.remaining() == pytest.approx(10.0)
+    assert predicted.remaining() == pytest.approx(0.5 * 90.0 + 0.5 * 10.0)
+    assert predicted.update("no stats here") is None
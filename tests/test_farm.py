@@ -0,0 +1,93 @@
+import os
+import threading
+import urllib.request
+
+import pytest
+
+import eta
+import farm
+import ffmpeg_common
+import pipeline
+
+
+@pytest.fixture
+def coordinator(request):
+    server = farm.Coordinator("127.0.0.1", 0, token=getattr(request, "param", None))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post_raw(url, path, body):
+    request = urllib.request.Request(url + path, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+@pytest.mark.parametrize("path", ["/tmp/in.mkv", "../in.mkv", "clips/../../in.mkv", "C:\\in.mkv", "D:in.mkv"])
+def test_paths_outside_the_shared_root_are_refused(path):
+    with pytest.raises(pipeline.PipelineError):
+        farm.job_op({"op": "convert", "input": path, "output": "out.mkv"})
+    with pytest.raises(pipeline.PipelineError):
+        farm.job_op({"op": "convert", "input": "in.mkv", "output": path})
+
+
+def test_submit_rejects_unsafe_jobs_with_400(coordinator):
+    status, reply = farm._call(coordinator.url, "/submit", {"jobs": [
+        {"op": "convert", "input": "a.mkv", "output": "a.mp4"},
+        {"op": "convert", "input": "/etc/passwd", "output": "b.mp4"}]})
+    assert status == 400
+    assert coordinator.jobs == {}  # Nothing queued from a rejected batch
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[1, 2]", b"\xff\xfe", b"{}"])
+def test_malformed_requests_get_400(coordinator, body):
+    assert _post_raw(coordinator.url, "/submit", body) == 400
+
+
+@pytest.mark.parametrize("coordinator", ["secret"], indirect=True)
+def test_token_is_required(coordinator):
+    assert farm._call(coordinator.url, "/status")[0] == 401
+    assert farm._call(coordinator.url, "/status", token="wrong")[0] == 401
+    assert farm._call(coordinator.url, "/status", token="secret")[0] == 200
+
+
+def test_public_bind_needs_a_token(monkeypatch):
+    monkeypatch.setattr(farm, "TOKEN", None)
+    with pytest.raises(ValueError):
+        farm.Coordinator("0.0.0.0", 0)
+
+
+def test_worker_refuses_a_symlink_out_of_the_shared_root(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    (shared / "escape").symlink_to(tmp_path)
+    worker = farm.Worker("http://127.0.0.1:1", str(shared), encoders=[], ffmpeg_path="ffmpeg")
+    assert worker._path("clips/in.mkv") == os.path.join(str(shared), "clips", "in.mkv")
+    with pytest.raises(pipeline.PipelineError):
+        worker._path("escape/in.mkv")
+
+
+def test_probe_failure_runs_the_job_without_features(monkeypatch, tmp_path):
+    def failing_probe(path, *args, **kwargs):
+        raise ValueError("unreadable header")
+
+    def fake_run(self, ffmpeg_path=None, work_dir=None, progress=None, on_output=None):
+        with open(self.stages["job1"].output, "wb") as f:
+            f.write(b"done")
+
+    recorded = []
+    (tmp_path / "in.mkv").write_bytes(b"")
+    monkeypatch.setattr(ffmpeg_common, "probe", failing_probe)
+    monkeypatch.setattr(pipeline.Pipeline, "run", fake_run)
+    monkeypatch.setattr(eta, "record", lambda *args: recorded.append(args))
+    worker = farm.Worker("http://127.0.0.1:1", str(tmp_path), encoders=[], ffmpeg_path="ffmpeg")
+    result = worker.run_job({"id": "job1", "op": "convert",
+                             "spec": {"op": "convert", "input": "in.mkv", "output": "out/in.mp4"}})
+    assert result["ok"], result
+    assert (tmp_path / "out" / "in.mp4").read_bytes() == b"done"
+    assert recorded == []
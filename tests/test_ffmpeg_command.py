@@ -0,0 +1,72 @@
+import pytest
+
+from ffmpeg_command import CommandError, FfmpegCommand
+
+
+def _command():
+    command = FfmpegCommand("ffmpeg", "-y", "-hide_banner")
+    video = command.add_input("in.mkv", {"-ss": 5})
+    audio = command.add_input("in.wav")
+    output = command.add_output("out.mp4")
+    output.map(video, "v:0").map(audio, "a:0", optional=True)
+    return command, video, audio, output
+
+
+def test_build_orders_globals_inputs_graph_maps_options_path():
+    command, video, audio, output = _command()
+    command.set_filter_complex("[0:v]scale=1280:-2[v]")
+    output.update({"-c:v": "libx264", "-an": None})
+    command.add_output("thumb.jpg", {"-frames:v": 1}).map("[v]")
+    assert command.build() == [
+        "ffmpeg", "-y", "-hide_banner",
+        "-ss", "5", "-i", "in.mkv", "-i", "in.wav",
+        "-filter_complex", "[0:v]scale=1280:-2[v]",
+        "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "libx264", "-an", "out.mp4",
+        "-map", "[v]", "-frames:v", "1", "thumb.jpg"]
+    assert command.key() == tuple(command.build())
+    assert str(command).startswith("ffmpeg -y -hide_banner -ss 5 -i in.mkv")
+
+
+def test_set_replaces_in_place():
+    command, video, audio, output = _command()
+    output.set("-c:v", "libx264").set("-crf", 23).set("-c:v", "copy")
+    assert output.items() == [("-c:v", "copy"), ("-crf", "23")]
+    assert output.get("-crf") == "23" and output.get("-preset", "medium") == "medium"
+
+
+def test_repeated_flags_keep_every_value():
+    command, video, audio, output = _command()
+    output.append("-metadata", "title=Talk").set("-c:a", "aac").append("-metadata", "artist=Me")
+    output.append("-disposition:a:0", "default").append("-disposition:a:0", "forced")
+    assert command.build()[-11:-1] == ["-metadata", "title=Talk", "-c:a", "aac", "-metadata", "artist=Me",
+                                     "-disposition:a:0", "default", "-disposition:a:0", "forced"]
+    assert output.get_all("-metadata") == ["title=Talk", "artist=Me"]
+    assert output.get("-metadata") == "artist=Me"
+    copy = FfmpegCommand().add_output("copy.mp4").extend(output.items())
+    assert copy.items() == output.items()
+    output.set("-metadata", "title=Only")
+    assert output.get_all("-metadata") == ["title=Only"]
+    assert output.items()[0] == ("-metadata", "title=Only")
+    output.unset("-disposition:a:0")
+    assert "-disposition:a:0" not in output and "-c:a" in output
+
+
+@pytest.mark.parametrize("break_it, message", [
+    (lambda command, output: command.outputs.clear(), "no outputs"),
+    (lambda command, output: command.inputs.clear(), "no inputs"),
+    (lambda command, output: output.map("2:v:0"), "existing input"),
+    (lambda command, output: output.map("[missing]"), "filter graph label"),
+])
+def test_invalid_commands_are_refused(break_it, message):
+    command, video, audio, output = _command()
+    break_it(command, output)
+    with pytest.raises(CommandError, match=message):
+        command.build()
+
+
+def test_flags_need_a_dash():
+    command, video, audio, output = _command()
+    with pytest.raises(CommandError):
+        output.set("c:v", "copy")
+    with pytest.raises(CommandError):
+        output.append("metadata", "title=x")
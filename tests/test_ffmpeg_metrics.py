@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import ffmpeg_metrics
+
+
+def _entry(number):
+    return {"stage": "test", "exit_code": 0, "duration_s": 0.1, "n": number}
+
+
+def test_file_is_rotated_past_the_cap(monkeypatch, tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setattr(ffmpeg_metrics, "METRICS_PATH", str(path))
+    monkeypatch.setattr(ffmpeg_metrics, "METRICS_MAX_BYTES", 200)
+    for number in range(20):
+        ffmpeg_metrics.record(_entry(number))
+    assert path.stat().st_size < 200 + 100
+    assert (tmp_path / "metrics.jsonl.1").stat().st_size >= 200
+    assert json.loads(path.read_text().splitlines()[-1])["n"] == 19
+
+
+def test_unwritable_path_drops_the_line(monkeypatch, tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    monkeypatch.setattr(ffmpeg_metrics, "METRICS_PATH", str(blocker / "metrics.jsonl"))
+    ffmpeg_metrics.record(_entry(1))  # No exception
+    result = ffmpeg_metrics.run([sys.executable, "-c", "pass"], stage="test")
+    assert result.returncode == 0
+
+
+def test_each_family_is_one_block(monkeypatch, tmp_path):
+    monkeypatch.setattr(ffmpeg_metrics, "METRICS_PATH", str(tmp_path / "metrics.jsonl"))
+    monkeypatch.setattr(ffmpeg_metrics, "_totals", {})
+    ffmpeg_metrics.record(dict(_entry(1), stage="convert", cpu_user_s=1.5, peak_rss_kb=2048))
+    ffmpeg_metrics.record(dict(_entry(2), stage="probe", exit_code=1))
+    lines = ffmpeg_metrics.prometheus_text().splitlines()
+    families = [line.split()[2] for line in lines if line.startswith("# TYPE")]
+    assert families == ["ffmpeg_jobs_total", "ffmpeg_job_seconds_total", "ffmpeg_cpu_seconds_total",
+                        "ffmpeg_peak_rss_kilobytes"]
+    for family in families:
+        start = lines.index(next(line for line in lines if line.startswith(f"# TYPE {family} ")))
+        assert [line.split("{")[0] for line in lines[start + 1:start + 3]] == [family, family]
+    assert 'ffmpeg_cpu_seconds_total{stage="convert",result="ok"} 1.500' in lines
+    assert 'ffmpeg_jobs_total{stage="probe",result="error"} 1' in lines
+
+
+def test_import_does_not_serve(monkeypatch):
+    monkeypatch.setenv("FFMPEG_TOOLS_METRICS_PORT", "1")
+    code = "import ffmpeg_metrics; assert ffmpeg_metrics._server is None"
+    assert subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(ffmpeg_metrics.__file__)).returncode == 0
+    monkeypatch.delenv("FFMPEG_TOOLS_METRICS_PORT")
+    assert ffmpeg_metrics.serve_from_env() is None
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app_cache
+import governor
+
+
+@pytest.fixture
+def budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path))
+    monkeypatch.setattr(governor, "ENABLED", True)
+    monkeypatch.setattr(governor, "CORE_BUDGET", 8)
+    return 8
+
+
+def test_each_lease_gets_its_weighted_share_of_the_demand(budget):
+    first = governor.lease("convert").acquire()
+    second = governor.lease("convert").acquire()
+    assert (first.threads, second.threads) == (8, 4)  # Alone: every core; then half of two equal jobs
+    first.release()
+    second.release()
+    batch = governor.lease("convert", governor.BACKGROUND).acquire()
+    interactive = governor.lease("convert").acquire()
+    later_batch = governor.lease("convert", governor.BACKGROUND).acquire()
+    assert interactive.threads == 5  # Two thirds of the demand, not what the batch left free
+    assert later_batch.threads == 2  # Rebalanced: a quarter once the interactive job runs
+    assert interactive.threads > later_batch.threads
+    for lease in (batch, interactive, later_batch):
+        lease.release()
+    assert governor.active_leases() == []
+
+
+def test_leases_granted_together_split_the_cores(budget):
+    chain = [governor.Lease("pipeline_extract_audio"), governor.Lease("pipeline_convert", cost=3)]
+    governor.acquire_all(chain)
+    assert [lease.threads for lease in chain] == [2, 6]
+    assert sum(lease.threads for lease in chain) <= budget
+    for lease in chain:
+        lease.release()
+
+
+def test_grants_stay_under_the_measured_knee(budget):
+    for threads, speed in ((2, 1.0), (4, 1.6), (8, 1.65)):
+        governor.record_speed("convert", threads, speed)
+    with governor.lease("convert") as lease:
+        assert lease.threads == 4
+
+
+def test_knee_compares_pixel_rates(budget, monkeypatch):
+    # 2 threads on a 480p input run 4x realtime, 8 threads on 1080p only 1x: per pixel 8 threads win
+    def finished(threads, speed, size):
+        lease = governor.Lease("convert")
+        lease.threads = threads
+        monkeypatch.setattr(lease, "_pixel_rate", lambda: size[0] * size[1] * 30 / 1e6)
+        lease.observe(type("Process", (), {"returncode": 0, "speed": speed})())
+
+    finished(2, 4.0, (854, 480))
+    finished(8, 1.0, (1920, 1080))
+    with governor.lease("convert") as lease:
+        assert lease.threads == 8
+
+
+def test_priority_failure_goes_to_status(budget, capsys):
+    messages = []
+    lease = governor.Lease("convert", governor.BACKGROUND, status=messages.append)
+    lease.attach(type("Process", (), {"pid": 2 ** 22 + 12345})())  # No such process
+    assert messages and capsys.readouterr().out == ""
+
+
+def test_concurrent_processes_see_each_other(tmp_path):
+    # Each process takes a lease, prints its threads and holds it until stdin closes
+    script = ("import sys, governor; lease = governor.lease('convert').acquire(); "
+              "print(lease.threads, flush=True); sys.stdin.read(); lease.release()")
+    environment = dict(os.environ, FFMPEG_TOOLS_CACHE=str(tmp_path), FFMPEG_TOOLS_CORES="16",
+                       FFMPEG_TOOLS_GOVERNOR="1", PYTHONPATH=os.path.dirname(os.path.abspath(governor.__file__)))
+    processes = [subprocess.Popen([sys.executable, "-c", script], env=environment, text=True,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE) for _ in range(4)]
+    grants = sorted(int(process.stdout.readline()) for process in processes)
+    for process in processes:
+        process.communicate("")
+    assert grants == [4, 5, 8, 16]  # 16 alone, then 2/4, 2/6 and 2/8 of the cores
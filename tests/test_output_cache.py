@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app_cache
+import output_cache
+
+
+def test_hit_is_a_private_copy(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(output_cache, "LIMIT_BYTES", 1024 * 1024)
+    first, second = tmp_path / "first.mkv", tmp_path / "second.mkv"
+    first.write_bytes(b"encoded output")
+    assert output_cache.store("key", str(first))
+    assert output_cache.fetch("key", str(second)) in ("reflink", "copy")
+    with open(second, "r+b") as f:
+        f.write(b"EDITED")  # In place, as a tag editor would
+    assert output_cache.fetch("key", str(tmp_path / "third.mkv"))
+    assert (tmp_path / "third.mkv").read_bytes() == b"encoded output"
+    assert capsys.readouterr().out == ""
+
+
+def test_miss_and_corrupt_entry(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(output_cache, "LIMIT_BYTES", 1024 * 1024)
+    out = tmp_path / "out.mkv"
+    assert not output_cache.fetch("missing", str(out))
+    out.write_bytes(b"encoded output")
+    output_cache.store("key", str(out))
+    (tmp_path / "cache" / "outputs" / "key.mkv").write_bytes(b"damaged")
+    assert not output_cache.fetch("key", str(tmp_path / "again.mkv"))
+    assert not output_cache.fetch("key", str(tmp_path / "again.mkv"))  # Dropped from the index
+
+
+def test_same_size_damage_is_caught_without_a_full_hash(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(output_cache, "LIMIT_BYTES", 1024 * 1024)
+    out = tmp_path / "out.mkv"
+    out.write_bytes(b"encoded output")
+    output_cache.store("key", str(out))
+    monkeypatch.setattr(app_cache, "full_hash", lambda path: pytest.fail("full hash on a hit"))
+    assert output_cache.fetch("key", str(tmp_path / "hit.mkv"))
+    (tmp_path / "cache" / "outputs" / "key.mkv").write_bytes(b"ENCODED OUTPUT")
+    assert not output_cache.fetch("key", str(tmp_path / "miss.mkv"))
+
+
+def test_verify_reads_what_sampling_skips(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(output_cache, "LIMIT_BYTES", 64 * 1024 * 1024)
+    size = app_cache.BLOCK_SIZE * app_cache.SAMPLE_BLOCKS * 4
+    out = tmp_path / "out.mkv"
+    out.write_bytes(bytes(size))
+    output_cache.store("key", str(out))
+    output_cache.store("other", str(out))
+    cached = tmp_path / "cache" / "outputs" / "key.mkv"
+    stat = cached.stat()
+    sampled = set(app_cache._sample_offsets(size))
+    offset = next(o for o in range(0, size, app_cache.BLOCK_SIZE)
+                  if all(not s <= o < s + app_cache.BLOCK_SIZE for s in sampled))
+    with open(cached, "r+b") as f:
+        f.seek(offset)
+        f.write(b"x")
+    os.utime(cached, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert output_cache.fetch("key", str(tmp_path / "sampled.mkv"))  # Missed by the sampled key
+    assert output_cache.verify() == ["key"]
+    assert not output_cache.fetch("key", str(tmp_path / "gone.mkv"))
+    assert output_cache.fetch("other", str(tmp_path / "kept.mkv"))
+
+
+def test_output_larger_than_the_cache_is_not_copied(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(output_cache, "LIMIT_BYTES", 8)
+    out = tmp_path / "out.mkv"
+    out.write_bytes(b"encoded output")
+    monkeypatch.setattr(output_cache, "_place", lambda *args: pytest.fail("copied"))
+    assert not output_cache.store("key", str(out))
+    assert not os.listdir(app_cache.cache_dir("outputs"))
+
+
+def test_stores_from_several_processes_share_the_index(tmp_path):
+    script = ("import sys, app_cache, output_cache\n"
+              "app_cache.CACHE_ROOT = sys.argv[1]\n"
+              "for i in range(20):\n"
+              "    output_cache.store(f'{sys.argv[2]}{i}', sys.argv[3])\n")
+    out = tmp_path / "out.mkv"
+    out.write_bytes(b"encoded output")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    children = [subprocess.Popen([sys.executable, "-c", script, str(tmp_path / "cache"), name, str(out)], cwd=root)
+                for name in ("a", "b")]
+    assert [child.wait() for child in children] == [0, 0]
+    index = app_cache.load_json(str(tmp_path / "cache" / "outputs" / "index.json"), {})
+    assert sorted(index) == sorted(f"{name}{i}" for name in "ab" for i in range(20))
@@ -0,0 +1,46 @@
+import pytest
+
+import output_mux
+import output_sink
+from ffmpeg_command import FfmpegCommand
+
+
+@pytest.mark.parametrize("mode, movflags", [
+    (output_mux.MUX_FASTSTART, "+faststart"),
+    (output_mux.MUX_FRAGMENTED, "frag_keyframe+empty_moov+default_base_moof"),
+])
+def test_mp4_family_gets_the_mode_movflags(mode, movflags):
+    for name in ("out.mp4", "OUT.MOV", "out.m4v", "out.m4a"):
+        assert output_mux.output_args(name, mode) == ["-movflags", movflags]
+
+
+def test_plain_mode_and_other_containers_get_no_flags():
+    assert output_mux.output_args("out.mp4", output_mux.MUX_PLAIN) == []
+    for name in ("out.mkv", "out.webm", "out.ts", "out"):
+        assert output_mux.output_args(name, output_mux.MUX_FRAGMENTED) == []
+    with pytest.raises(ValueError):
+        output_mux.output_args("out.mp4", "streaming")
+
+
+def test_default_mode_is_used_when_none_is_given(monkeypatch):
+    monkeypatch.setattr(output_mux, "DEFAULT_MODE", output_mux.MUX_FRAGMENTED)
+    assert output_mux.output_args("out.mp4") == output_mux.output_args("out.mp4", output_mux.MUX_FRAGMENTED)
+
+
+def test_apply_places_movflags_before_the_output_path():
+    command = FfmpegCommand("ffmpeg", "-y")
+    source = command.add_input("in.mkv")
+    output = command.add_output("out.mp4", {"-c:v": "libx264"}).map(source, "v:0")
+    assert output_mux.apply(output, output_mux.MUX_FASTSTART) is output
+    assert command.build() == ["ffmpeg", "-y", "-i", "in.mkv", "-map", "0:v:0",
+                               "-c:v", "libx264", "-movflags", "+faststart", "out.mp4"]
+    output_mux.apply(output, output_mux.MUX_FRAGMENTED)  # Replaces, never repeats
+    assert output.get_all("-movflags") == ["frag_keyframe+empty_moov+default_base_moof"]
+
+
+def test_remote_outputs_are_fragmented_on_stdout():
+    command = FfmpegCommand("ffmpeg")
+    command.add_input("in.mkv")
+    output = output_sink.add_output(command, "https://example.invalid/upload", output_mux.MUX_FASTSTART)
+    assert output.path == "pipe:1"
+    assert "frag_keyframe" in output.get("-movflags")
@@ -0,0 +1,130 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import app_cache
+import output_sink
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path / "cache"))  # run_to_sink's metrics
+    monkeypatch.setattr(output_sink, "RETRY_DELAY", 0.0)
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    server = output_sink.LocalUploadServer(str(upload_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _failing_puts(monkeypatch, replies):
+    # The next PUTs get the given status codes (or sleep for a float), then the server behaves
+    original = output_sink._UploadHandler.do_PUT
+
+    def do_put(handler):
+        if not replies:
+            return original(handler)
+        reply = replies.pop(0)
+        handler._body()
+        if isinstance(reply, float):
+            time.sleep(reply)
+            return original(handler)
+        handler._reply(reply)
+    monkeypatch.setattr(output_sink._UploadHandler, "do_PUT", do_put)
+
+
+def test_file_sink_writes_and_aborts(tmp_path):
+    sink = output_sink.FileSink(str(tmp_path / "out.mp4"))
+    sink.write(b"abc")
+    sink.write(b"def")
+    assert sink.close() == str(tmp_path / "out.mp4")
+    assert (tmp_path / "out.mp4").read_bytes() == b"abcdef"
+    sink = output_sink.FileSink(str(tmp_path / "broken.mp4"))
+    sink.write(b"abc")
+    sink.abort()
+    assert not (tmp_path / "broken.mp4").exists()
+
+
+def test_parts_are_assembled_in_order(server, tmp_path):
+    data = bytes(range(256)) * 40
+    sink = output_sink.HttpMultipartSink(server.url + "/clip.mp4", part_size=1000, workers=4)
+    for start in range(0, len(data), 333):
+        sink.write(data[start:start + 333])
+    assert sink.close() == server.url + "/clip.mp4"
+    assert (tmp_path / "uploads" / "clip.mp4").read_bytes() == data
+    assert server.uploads == {}
+
+
+def test_empty_stream_uploads_an_empty_object(server, tmp_path):
+    output_sink.HttpMultipartSink(server.url + "/empty.mp4").close()
+    assert (tmp_path / "uploads" / "empty.mp4").read_bytes() == b""
+
+
+def test_transient_part_failures_are_retried(server, tmp_path, monkeypatch):
+    _failing_puts(monkeypatch, [503, 500, 502])
+    sink = output_sink.HttpMultipartSink(server.url + "/clip.mp4", part_size=4, workers=1)
+    sink.write(b"0123456789")
+    sink.close()
+    assert (tmp_path / "uploads" / "clip.mp4").read_bytes() == b"0123456789"
+
+
+def test_a_stalled_part_times_out_and_is_retried(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(output_sink, "REQUEST_TIMEOUT", 0.2)
+    _failing_puts(monkeypatch, [1.0])
+    sink = output_sink.HttpMultipartSink(server.url + "/clip.mp4", part_size=4, workers=1)
+    sink.write(b"0123")
+    sink.close()
+    assert (tmp_path / "uploads" / "clip.mp4").read_bytes() == b"0123"
+
+
+@pytest.mark.parametrize("replies", [[403], [503] * (output_sink.PART_RETRIES + 1)])
+def test_failed_parts_fail_the_upload(server, tmp_path, monkeypatch, replies):
+    _failing_puts(monkeypatch, list(replies))
+    sink = output_sink.HttpMultipartSink(server.url + "/clip.mp4", part_size=4, workers=1)
+    sink.write(b"0123")
+    with pytest.raises(RuntimeError, match="Part upload failed"):
+        sink.close()
+    assert not (tmp_path / "uploads" / "clip.mp4").exists()
+
+
+def test_abort_discards_the_upload(server, tmp_path):
+    sink = output_sink.HttpMultipartSink(server.url + "/clip.mp4", part_size=4)
+    sink.write(b"01234567")
+    sink.abort()
+    assert server.uploads == {}
+    assert not (tmp_path / "uploads" / "clip.mp4").exists()
+
+
+def _writer(script):
+    return [sys.executable, "-c", "import sys\n" + script]
+
+
+def test_run_to_sink_uploads_stdout(server, tmp_path):
+    returncode, stderr = output_sink.run_to_sink(
+        _writer("sys.stdout.buffer.write(b'x' * 100000); sys.stderr.write('frame=1 size=97kB\\n')"),
+        output_sink.HttpMultipartSink(server.url + "/clip.mp4", part_size=30000))
+    assert returncode == 0 and "frame=1" in stderr
+    assert (tmp_path / "uploads" / "clip.mp4").read_bytes() == b"x" * 100000
+
+
+def test_run_to_sink_aborts_when_the_command_fails(server, tmp_path):
+    returncode, stderr = output_sink.run_to_sink(
+        _writer("sys.stdout.buffer.write(b'partial'); sys.stderr.write('Conversion failed'); sys.exit(1)"),
+        output_sink.HttpMultipartSink(server.url + "/clip.mp4"))
+    assert returncode == 1 and "Conversion failed" in stderr
+    assert server.uploads == {}
+    assert not (tmp_path / "uploads" / "clip.mp4").exists()
+
+
+def test_run_to_sink_stops_the_command_when_the_upload_fails(server, tmp_path, monkeypatch):
+    _failing_puts(monkeypatch, [403])
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="Part upload failed"):
+        output_sink.run_to_sink(_writer("import time\nwhile True:\n    sys.stdout.buffer.write(b'x' * 4096); time.sleep(0.01)"),
+                                output_sink.HttpMultipartSink(server.url + "/clip.mp4", part_size=4096, workers=1))
+    assert time.monotonic() - started < 30
+    assert server.uploads == {}
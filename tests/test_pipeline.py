@@ -0,0 +1,100 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+import capabilities
+import ffmpeg_common
+import pipeline
+
+
+def test_upscale_stage_builds_without_dimensions(monkeypatch):
+    monkeypatch.setattr(ffmpeg_common, "probe", lambda path: {"streams": [
+        {"codec_type": "video", "width": None, "height": None}]})
+    monkeypatch.setattr(capabilities, "detect", lambda: {"encoders": []})
+    stage = pipeline.Stage({"id": "up", "op": "upscale", "input": "in.mkv", "resolution": "1080p", "fps": "60fps"})
+    command = pipeline.OPERATIONS["upscale"][3]("ffmpeg", stage, ["in.mkv"], "out.mkv").build()
+    assert command[command.index("-vf") + 1] == "scale=1920:1080"
+    assert command[command.index("-r") + 1] == "60"
+    assert command[command.index("-c:v") + 1] == "libx264"
+
+
+def test_upscale_matches_the_upscaler_command():
+    command = ffmpeg_common.upscale_command("ffmpeg", "in.mkv", "out.mkv", 1920, 1080, 30.0, "1080p", "30fps",
+                                            "h264_nvenc").build()
+    assert command == ["ffmpeg", "-hide_banner", "-y", "-i", "in.mkv",
+                       "-c:v", "h264_nvenc", "-preset", "fast", "-cq", "23", "-c:a", "copy", "out.mkv"]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "talk.mp4"
+    path.write_bytes(b"")
+    return str(path)
+
+
+def _chains(definition, tmp_path):
+    chains = pipeline.Pipeline(definition).plan(str(tmp_path / "work"))
+    return [[stage.id for stage in chain] for chain in chains], {stage.id: stage for chain in chains for stage in chain}
+
+
+def test_single_consumer_edges_become_one_chain(source, tmp_path):
+    chains, stages = _chains({"stages": [
+        {"id": "wav", "op": "extract_audio", "input": source},
+        {"id": "clean", "op": "command", "input": "wav", "stream": True, "args": ["sox", "{input}", "{output}"]},
+        {"id": "mixed", "op": "replace_audio", "video": source, "audio": ["clean"]},
+        {"id": "final", "op": "convert", "input": "mixed", "output": "final.mp4"},
+    ]}, tmp_path)
+    assert chains == [["wav", "clean", "mixed", "final"]]
+    assert [stages[name].target for name in ("wav", "clean", "mixed")] == [pipeline.PIPE_OUT] * 3
+    assert stages["final"].target == "final.mp4"
+    assert stages["clean"].piped_input == "wav"
+
+
+def test_seeked_shared_and_kept_results_go_to_disk(source, tmp_path):
+    chains, stages = _chains({"stages": [
+        {"id": "wav", "op": "extract_audio", "input": source},
+        {"id": "mp3", "op": "command", "input": "wav", "args": ["lame", "{input}", "{output}"]},  # Not a stream
+        {"id": "conv", "op": "convert", "input": source},
+        {"id": "up", "op": "upscale", "input": "conv", "output": "up.mkv"},  # upscale probes its input
+        {"id": "kept", "op": "extract_audio", "input": source, "output": "kept.wav"},
+        {"id": "a", "op": "convert", "input": "kept"},
+        {"id": "b", "op": "convert", "input": "kept"},
+    ]}, tmp_path)
+    assert sorted(chains) == [["a"], ["b"], ["conv"], ["kept"], ["mp3"], ["up"], ["wav"]]
+    assert stages["wav"].target == str(tmp_path / "work" / "wav.wav")
+    assert stages["conv"].target == str(tmp_path / "work" / "conv.mkv")
+    assert stages["kept"].target == "kept.wav"
+
+
+def test_missing_input_is_reported(tmp_path):
+    with pytest.raises(pipeline.PipelineError):
+        pipeline.Pipeline([{"id": "wav", "op": "extract_audio", "input": str(tmp_path / "missing.mp4")}]).plan(str(tmp_path))
+
+
+def _python(script):
+    return {"op": "command", "args": [sys.executable, "-c", script, "{input}", "{output}"]}
+
+
+def test_run_pipes_between_processes(source, tmp_path):
+    out = tmp_path / "out.txt"
+    pipeline.Pipeline([
+        dict(_python("import sys; sys.stdout.write('piped')"), id="produce", input=source, stream=True),
+        dict(_python("import sys; open(sys.argv[2], 'w').write(sys.stdin.read().upper())"), id="consume",
+             input="produce", stream=True, output=str(out)),
+    ]).run("ffmpeg")
+    assert out.read_text() == "PIPED"
+
+
+def test_failure_stops_the_other_chains(source, tmp_path):
+    started = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError) as failure:
+        pipeline.Pipeline([
+            dict(_python("import sys; sys.stderr.write('bad input'); sys.exit(3)"), id="broken", input=source,
+                 output=str(tmp_path / "broken.txt")),
+            dict(_python("import time; time.sleep(60)"), id="slow", input=source, output=str(tmp_path / "slow.txt")),
+        ]).run("ffmpeg")
+    assert failure.value.stage == "broken"
+    assert failure.value.returncode == 3 and "bad input" in failure.value.output
+    assert time.monotonic() - started < 30
@@ -0,0 +1,42 @@
+import pytest
+
+import app_cache
+import capabilities
+import ffmpeg_common
+import governor
+import preset_budget
+
+
+def test_model_is_recalibrated_for_another_ffmpeg(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path))
+    calibrations = []
+    monkeypatch.setattr(preset_budget, "calibrate", lambda ffmpeg_path, status=None: calibrations.append(1) or
+                        {preset: 1e6 * (len(preset_budget.X264_PRESETS) - i) for i, preset in enumerate(preset_budget.X264_PRESETS)})
+    version = ["ffmpeg version 6.1"]
+    monkeypatch.setattr(capabilities, "detect", lambda refresh=False: {"version": version[0]})
+    preset_budget.load_model("ffmpeg")
+    preset_budget.load_model("ffmpeg")
+    assert len(calibrations) == 1
+    version[0] = "ffmpeg version 7.1"
+    assert preset_budget.load_model("ffmpeg")["ffmpeg"] == "ffmpeg version 7.1"
+    assert len(calibrations) == 2
+
+
+def test_unknown_size_or_duration_falls_back_to_the_fastest_preset(monkeypatch):
+    monkeypatch.setattr(preset_budget, "load_model", lambda *args, **kwargs: pytest.fail("nothing to price"))
+    for pixels, duration in [(0, 10.0), (0, 0.0)]:
+        monkeypatch.setattr(preset_budget, "job_pixels", lambda in_file: (pixels, duration))
+        assert preset_budget.pick_preset("ffmpeg", "in.mkv", "2x") == ("ultrafast", None, 0)
+        assert preset_budget.pick_preset("ffmpeg", "in.mkv", "120") == ("ultrafast", None, 0)
+
+
+def test_calibration_runs_under_a_convert_lease(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_cache, "CACHE_ROOT", str(tmp_path))
+    monkeypatch.setattr(preset_budget, "_calibration_clip", lambda ffmpeg_path: "clip.mkv")
+    monkeypatch.setattr(governor, "acquire_all", lambda leases: [setattr(lease, "threads", 3) for lease in leases])
+    commands = []
+    monkeypatch.setattr(ffmpeg_common, "run_command", lambda command, stage=None: commands.append(command))
+    assert set(preset_budget.calibrate("ffmpeg")) == set(preset_budget.X264_PRESETS)
+    for command in commands:
+        assert command[command.index("-threads") + 1] == "3"
+        assert command[command.index("-filter_threads") + 1] == "3"
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+import output_mux
+import proxy
+from ffmpeg_command import FfmpegCommand
+
+
+def test_proxy_is_a_second_output_of_the_same_decode(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_mux, "DEFAULT_MODE", output_mux.MUX_FASTSTART)
+    command = FfmpegCommand("ffmpeg", "-y")
+    source = command.add_input("in.mov")
+    command.add_output(str(tmp_path / "out.mkv"), {"-c:v": "libx265"}).map(source, "v:0")
+    proxy_file = proxy.proxy_path(str(tmp_path / "out.mkv"))
+    proxy.add_output(command, source, proxy_file, fps="30000/1001", timecode="01:00:00:00")
+    assert proxy_file == os.path.join(str(tmp_path), "proxies", "out_proxy.mp4")
+    assert os.path.isdir(os.path.dirname(proxy_file))
+    built = command.build()
+    assert built.count("-i") == 1
+    assert built[built.index(str(tmp_path / "out.mkv")) + 1:] == [
+        "-map", "0:v:0", "-map", "0:a:0?", "-vf", "scale=-2:540",
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-g", "1",
+        "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "128k", "-map_metadata", "0",
+        "-r", "30000/1001", "-timecode", "01:00:00:00", "-movflags", "+faststart", proxy_file]
+
+
+def test_low_bitrate_proxy_options(tmp_path):
+    command = proxy.proxy_command("ffmpeg", "in.mkv", str(tmp_path / "in_proxy.mp4"), proxy.MODE_LOW_BITRATE,
+                                  info={"format": {"tags": {"timecode": "00:59:58:00"}}, "streams": []})
+    output = command.outputs[0]
+    assert command.global_options[:1] == ["-y"] and len(command.outputs) == 1
+    assert output.get("-b:v") == output.get("-maxrate") == proxy.LOW_BITRATE
+    assert output.get("-g") == "30" and "-crf" not in output
+    assert output.get("-timecode") == "00:59:58:00"
+    assert "-r" not in output  # A proxy-only encode keeps the source's own frame rate
+
+
+def test_source_timecode_and_unknown_mode(tmp_path):
+    info = {"format": {"tags": {}}, "streams": [{"codec_type": "audio", "tags": {"timecode": "bad"}},
+                                                {"codec_type": "data", "tags": {"timecode": "10:00:00;00"}}]}
+    assert proxy.source_timecode(info) == "10:00:00;00"
+    assert proxy.source_timecode({}) is None
+    command = FfmpegCommand("ffmpeg")
+    with pytest.raises(ValueError):
+        proxy.add_output(command, command.add_input("in.mkv"), str(tmp_path / "p.mp4"), mode="lossless")
@@ -0,0 +1,48 @@
+import pytest
+
+import ffmpeg_common
+import rate_control
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def fake_encoder(monkeypatch):
+    # Each "second pass" writes the next size from sizes (bytes) to the output
+    sizes = []
+
+    def run_command(command, stage="ffmpeg", lease=None):
+        with open(command[-1], "wb") as f:
+            f.write(bytes(sizes.pop(0)))
+        return ""
+
+    monkeypatch.setattr(ffmpeg_common, "probe_duration", lambda path, info=None: 60.0)
+    monkeypatch.setattr(ffmpeg_common, "run_command", run_command)
+    return sizes
+
+
+def test_retries_until_under_the_cap(fake_encoder, tmp_path):
+    fake_encoder.extend([int(10.8 * MB), int(9.8 * MB)])
+    out_file = str(tmp_path / "out.mp4")
+    assert rate_control.encode_to_target("ffmpeg", "in.mp4", out_file, True, target_mb=10) == int(9.8 * MB)
+    assert not fake_encoder
+
+
+def test_over_the_cap_after_last_attempt_raises(fake_encoder, tmp_path):
+    fake_encoder.extend([int(11 * MB)] * (rate_control.MAX_SIZE_RETRIES + 1))
+    with pytest.raises(rate_control.TargetSizeMissed) as missed:
+        rate_control.encode_to_target("ffmpeg", "in.mp4", str(tmp_path / "out.mp4"), True, target_mb=10)
+    assert missed.value.actual_bytes == int(11 * MB)
+    assert missed.value.target_bytes == 10 * MB
+
+
+def test_undershoot_after_last_attempt_is_accepted(fake_encoder, tmp_path):
+    fake_encoder.extend([int(8 * MB)] * (rate_control.MAX_SIZE_RETRIES + 1))
+    out_file = str(tmp_path / "out.mp4")
+    assert rate_control.encode_to_target("ffmpeg", "in.mp4", out_file, True, target_mb=10) == int(8 * MB)
+
+
+def test_bitrate_target_runs_one_pass(fake_encoder, tmp_path):
+    fake_encoder.extend([5 * MB])
+    rate_control.encode_to_target("ffmpeg", "in.mp4", str(tmp_path / "out.mp4"), True, target_kbps=2000)
+    assert not fake_encoder
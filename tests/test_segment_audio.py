@@ -0,0 +1,74 @@
+import random
+import subprocess
+import time
+
+import pytest
+
+import segment_audio
+
+
+def _fake_encode_range(ffmpeg_path, pcm_path, start, count, codec, out_path, priority):
+    # One tagged "frame" per codec frame of the range; later chunks finish first
+    frame_size = segment_audio.CODECS[codec][0]
+    first = start // frame_size
+    time.sleep(random.uniform(0, 0.02))
+    return [f"{first + i};".encode() for i in range(-(-count // frame_size))]
+
+
+def test_chunks_join_in_order_without_gaps(monkeypatch, tmp_path):
+    monkeypatch.setattr(segment_audio, "_encode_range", _fake_encode_range)
+    frame_size = segment_audio.CODECS["mp3"][0]
+    total_frames = 1000
+    out_file = tmp_path / "joined.mp3"
+    chunks = segment_audio.encode_pcm("ffmpeg", "unused.pcm", total_frames * frame_size - 100, str(out_file),
+                                      "mp3", segment_seconds=(60 * frame_size + 0.5) / segment_audio.SAMPLE_RATE, workers=4)
+    assert chunks == -(-total_frames // 60)
+    assert out_file.read_bytes() == b"".join(f"{i};".encode() for i in range(total_frames))
+
+
+def test_finished_chunks_are_released(monkeypatch, tmp_path):
+    held, peak = set(), [0]
+
+    class Frames(list):
+        def __init__(self, frames, key):
+            super().__init__(frames)
+            self.key = key
+            held.add(key)
+            peak[0] = max(peak[0], len(held))
+
+        def __del__(self):
+            held.discard(self.key)
+
+    def encode_range(*args):
+        return Frames(_fake_encode_range(*args), args[2])
+
+    monkeypatch.setattr(segment_audio, "_encode_range", encode_range)
+    frame_size = segment_audio.CODECS["mp3"][0]
+    segment_audio.encode_pcm("ffmpeg", "unused.pcm", 2000 * frame_size, str(tmp_path / "out.mp3"), "mp3",
+                             segment_seconds=(20 * frame_size + 0.5) / segment_audio.SAMPLE_RATE, workers=2)
+    assert peak[0] < 20  # 100 chunks, only a few in flight at any time
+
+
+@pytest.fixture(scope="module")
+def long_input(tmp_path_factory, ffmpeg_path):
+    path = tmp_path_factory.mktemp("segment") / "input.wav"
+    subprocess.run([ffmpeg_path, "-v", "error", "-y", "-f", "lavfi", "-i",
+                    "aevalsrc=0.3*sin(2*PI*(220+40*sin(t))*t)+0.05*random(0)|0.3*sin(2*PI*330*t):s=44100",
+                    "-t", "150", str(path)], check=True)
+    return str(path)
+
+
+@pytest.mark.parametrize("codec", ["mp3", "aac"])
+def test_segmented_encode_matches_single_pass(codec, ffmpeg_path, long_input):
+    pytest.importorskip("numpy")
+    report = segment_audio.verify(ffmpeg_path, long_input, codec, segment_seconds=60)
+    assert report["joins"] == 2
+    assert report["samples_segmented"] == report["samples_single"]
+    assert report["ok"], report
+
+
+def test_verify_detects_a_seam(monkeypatch, ffmpeg_path, long_input):
+    pytest.importorskip("numpy")
+    monkeypatch.setitem(segment_audio.PREROLL_FRAMES, "mp3", 0)
+    monkeypatch.setattr(segment_audio, "POSTROLL_FRAMES", 0)
+    assert not segment_audio.verify(ffmpeg_path, long_input, "mp3", segment_seconds=60)["ok"]
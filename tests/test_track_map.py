@@ -0,0 +1,101 @@
+import json
+import subprocess
+
+import pytest
+
+import container_probe
+import track_map
+from ffmpeg_command import FfmpegCommand
+
+INFO = {"format": {"start_time": "0.000000"}, "streams": [
+    {"index": 0, "codec_type": "video", "codec_name": "h264"},
+    {"index": 1, "codec_type": "audio", "codec_name": "aac", "tags": {"language": "eng", "title": "Main"},
+     "disposition": {"default": 1, "forced": 0}},
+    {"index": 2, "codec_type": "audio", "codec_name": "aac", "start_time": "0.500000", "tags": {"language": "fre"},
+     "disposition": {"default": 0, "forced": 1}},
+    {"index": 3, "codec_type": "subtitle", "codec_name": "subrip"},
+    {"index": 4, "codec_type": "subtitle", "codec_name": "hdmv_pgs_subtitle"},
+    {"index": 5, "codec_type": "data", "codec_name": "bin_data"},
+    {"index": 6, "codec_type": "attachment", "codec_name": "ttf"},
+]}
+
+
+def _options(output):
+    return dict(output.items())
+
+
+def test_replacement_files_go_to_language_then_free_tracks():
+    plan = track_map.TrackPlan(INFO)
+    replaced = plan.replace_audio_files(["dub_fre.wav", "mix.wav", "extra_ger.wav"], "aac", {"b": "192k"})
+    assert [(t.index, t.source) for t in replaced] == [(1, "mix.wav"), (2, "dub_fre.wav"), (None, "extra_ger.wav")]
+    assert replaced[-1].language == "ger"
+    assert replaced[1].start_offset == 0.5
+    assert replaced[0].codec_options == {"c": "aac", "b": "192k"}
+
+
+def test_apply_carries_tags_and_disposition_to_replacements():
+    plan = track_map.TrackPlan(INFO)
+    plan.replace(plan.audio_tracks()[1], "dub.wav")
+    plan.add_track("extra.wav", language="ger")
+    command = FfmpegCommand("ffmpeg")
+    source = command.add_input("in.mkv")
+    output = plan.apply(command, source, command.add_output("out.mkv"))
+    assert [item.path for item in command.inputs] == ["in.mkv", "dub.wav", "extra.wav"]
+    assert output.maps == ["0:0", "0:1", "1:a:0", "0:3", "0:4", "0:6", "2:a:0"]  # Data dropped in Matroska
+    options = _options(output)
+    assert options["-disposition:2"] == "forced"
+    assert options["-map_metadata:s:2"] == "0:s:2"  # Title and other tags of the replaced track
+    assert options["-metadata:s:2"] == "language=fre"
+    assert options["-c:2"] == "aac" and options["-c:1"] == "copy"
+    assert [options[f"-map_metadata:s:{n}"] for n in range(6)] == ["0:s:0", "0:s:1", "0:s:2", "0:s:3", "0:s:4", "0:s:6"]
+    assert "-map_metadata:s:6" not in options and "-disposition:6" not in options  # The added track
+    assert options["-metadata:s:6"] == "language=ger"
+    assert options["-map_metadata"] == "0" and options["-map_chapters"] == "0"
+
+
+def test_unknown_disposition_is_left_to_ffmpeg():
+    info = {"streams": [{"index": 0, "codec_type": "audio", "codec_name": "aac"}]}
+    plan = track_map.TrackPlan(info)
+    plan.replace(plan.tracks[0], "dub.wav")
+    command = FfmpegCommand("ffmpeg")
+    output = plan.apply(command, command.add_input("in.mp4"), command.add_output("out.mp4"))
+    assert "-disposition:0" not in output
+
+
+@pytest.mark.parametrize("out_file, format_name, expected", [
+    ("out.mp4", None, {3: ("transcode", "mov_text"), 4: "drop", 5: "drop", 6: "drop"}),
+    ("out.bin", "mov", {3: ("transcode", "mov_text"), 4: "drop", 5: "drop", 6: "drop"}),
+    ("out.mkv", None, {3: "copy", 4: "copy", 5: "drop", 6: "copy"}),
+    ("out.webm", None, {3: ("transcode", "webvtt"), 4: "drop", 5: "drop", 6: "drop"}),
+    ("out.avi", None, {3: "drop", 4: "drop", 5: "drop", 6: "drop"}),
+    ("out.ts", None, {3: "drop", 4: "drop", 5: "copy", 6: "drop"}),
+    ("out.nut", None, {3: "copy", 4: "copy", 5: "copy", 6: "copy"}),
+])
+def test_fit_container(out_file, format_name, expected):
+    plan = track_map.TrackPlan(INFO)
+    plan.fit_container(out_file, format_name)
+    result = {t.index: t.action if t.action != "transcode" else (t.action, t.codec_options["c"]) for t in plan.tracks}
+    assert result == {0: "copy", 1: "copy", 2: "copy", **expected}
+
+
+def test_mov_text_becomes_srt_outside_mp4():
+    plan = track_map.TrackPlan({"streams": [{"index": 0, "codec_type": "subtitle", "codec_name": "mov_text"}]})
+    plan.fit_container("out.mkv")
+    assert plan.tracks[0].codec_options == {"c": "srt"}
+
+
+def test_replaced_track_keeps_title_and_disposition(ffmpeg_path, ffprobe_path, tmp_path):
+    clip = container_probe.make_fixture(ffmpeg_path, str(tmp_path), "titled_tracks.mkv")
+    wav = str(tmp_path / "commentary.wav")
+    subprocess.run([ffmpeg_path, "-v", "error", "-f", "lavfi", "-i", "sine=f=440", "-t", "2", wav], check=True)
+    plan = track_map.TrackPlan(container_probe.probe(clip))
+    plan.replace(plan.audio_tracks()[1], wav)
+    command = FfmpegCommand(ffmpeg_path, "-v", "error", "-y")
+    source = command.add_input(clip)
+    plan.apply(command, source, command.add_output(str(tmp_path / "out.mkv")))
+    subprocess.run(command.build(), check=True)
+    streams = json.loads(subprocess.run([ffprobe_path, "-v", "quiet", "-print_format", "json", "-show_streams",
+                                         str(tmp_path / "out.mkv")], capture_output=True, check=True).stdout)["streams"]
+    audio = [s for s in streams if s["codec_type"] == "audio"]
+    assert [(s["tags"].get("title"), s["tags"].get("language"), s["disposition"]["default"]) for s in audio] == [
+        ("Main", None, 1), ("Commentary", "fre", 0)]
@@ -0,0 +1,178 @@
+"""Track mapping for single-pass muxes: copy, replace, transcode or drop every source stream.
+
+A TrackPlan starts with every stream of the source copied (plus its chapters
+and global metadata), then individual tracks are replaced by external audio
+files, transcoded or dropped. apply() adds the replacement inputs, stream
+maps and per-output-stream codec/filter/metadata options to an FfmpegCommand.
+Each output stream takes its tags (title, language...) from the source stream
+it comes from or replaces, and a replacement also keeps the disposition
+(default, forced...) of the track it replaces.
+"""
+import os
+import re
+
+import ffmpeg_common
+import output_mux
+
+COPY = "copy"
+REPLACE = "replace"
+TRANSCODE = "transcode"
+DROP = "drop"
+
+TEXT_SUBTITLE_CODECS = {"subrip", "srt", "ass", "ssa", "webvtt", "mov_text", "text"}
+# Output container -> (stream kinds it cannot hold, subtitle codecs it takes (None: any but
+# mov_text), codec text subtitles are converted to (None: dropped))
+CONTAINER_LIMITS = {
+    "mov": ({"data", "attachment"}, {"mov_text"}, "mov_text"),
+    "matroska": ({"data"}, None, "srt"),
+    "webm": ({"data", "attachment"}, {"webvtt"}, "webvtt"),
+    "avi": ({"data", "attachment", "subtitle"}, set(), None),
+    "mpegts": ({"attachment"}, {"dvb_subtitle", "dvb_teletext"}, None),
+}
+_CONTAINER_FORMATS = {"mp4": "mov", "mov": "mov", "ipod": "mov", "matroska": "matroska", "webm": "webm",
+                      "avi": "avi", "mpegts": "mpegts"}
+_CONTAINER_EXTENSIONS = dict({ext: "mov" for ext in output_mux.MOV_FAMILY_EXTENSIONS},
+                             **{".mkv": "matroska", ".mka": "matroska", ".webm": "webm", ".avi": "avi",
+                                ".ts": "mpegts", ".m2ts": "mpegts"})
+_LANGUAGE_RE = re.compile(r"[._\-]([a-z]{2,3})$", re.IGNORECASE)
+
+
+class Track:
+    """One output track: a source stream (index) or a new track from an external file."""
+
+    def __init__(self, stream, start_time=0.0):
+        self.index = stream.get("index")
+        self.kind = stream.get("codec_type")
+        self.codec = stream.get("codec_name")
+        self.language = stream.get("tags", {}).get("language")
+        self.disposition = stream.get("disposition")  # {"default": 1, ...} from probe, None if unknown
+        # Stream delay relative to the container start (kept when the track is replaced)
+        self.start_offset = float(stream.get("start_time", start_time) or start_time) - start_time
+        self.action = COPY
+        self.source = None  # replacement file for REPLACE
+        self.codec_options = {}  # e.g. {"c": "aac", "b": "192k"}, set per output stream
+        self.filters = []
+
+    def __repr__(self):
+        return f"Track({self.index}, {self.kind}, {self.codec}, {self.language}, {self.action})"
+
+
+def language_from_name(path):
+    """Returns a language code from a file name like 'episode_eng.wav', or None."""
+    match = _LANGUAGE_RE.search(os.path.splitext(os.path.basename(path))[0])
+    return match.group(1).lower() if match else None
+
+
+class TrackPlan:
+    def __init__(self, info):
+        start_time = float(info.get("format", {}).get("start_time", 0.0) or 0.0)
+        self.tracks = [Track(s, start_time) for s in info.get("streams", [])
+                       if s.get("codec_type") in ("video", "audio", "subtitle", "data", "attachment")]
+        self.keep_metadata = True
+        self.keep_chapters = True
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(ffmpeg_common.probe(path))
+
+    def audio_tracks(self):
+        return [t for t in self.tracks if t.kind == "audio"]
+
+    def replace(self, track, path, codec="aac", options=None, filters=None):
+        track.action = REPLACE
+        track.source = path
+        track.codec_options = dict({"c": codec}, **(options or {}))
+        track.filters = list(filters or [])
+        return track
+
+    def add_track(self, path, codec="aac", language=None, options=None):
+        """Adds a new audio track from path after the existing ones."""
+        track = Track({"codec_type": "audio", "tags": {"language": language} if language else {}})
+        self.tracks.append(track)
+        return self.replace(track, path, codec, options)
+
+    def transcode(self, track, codec, options=None):
+        track.action = TRANSCODE
+        track.codec_options = dict({"c": codec}, **(options or {}))
+        return track
+
+    def drop(self, track):
+        track.action = DROP
+        return track
+
+    def replace_audio_files(self, paths, codec="aac", options=None):
+        """Assigns replacement files to audio tracks in one go.
+
+        Files whose name ends in a language code (e.g. '_eng', '.de') replace
+        the track with that language; the rest fill the remaining audio tracks
+        in order, and any left over are added as new tracks.
+        """
+        unassigned = []
+        for path in paths:
+            language = language_from_name(path)
+            match = next((t for t in self.audio_tracks()
+                          if language and t.language == language and t.action != REPLACE), None)
+            if match:
+                self.replace(match, path, codec, options)
+            else:
+                unassigned.append(path)
+        free = [t for t in self.audio_tracks() if t.action != REPLACE]
+        for track, path in zip(free, unassigned):
+            self.replace(track, path, codec, options)
+        for path in unassigned[len(free):]:
+            self.add_track(path, codec, language_from_name(path), options)
+        return [t for t in self.tracks if t.action == REPLACE]
+
+    def fit_container(self, out_file, format_name=None):
+        """Adjusts copied tracks the output container cannot hold (e.g. SRT or PGS subtitles in MP4).
+
+        Containers are told apart by format_name (-f) or the file extension
+        (CONTAINER_LIMITS); in others only MP4's mov_text is converted (to SRT).
+        """
+        container = _CONTAINER_FORMATS.get(format_name) or _CONTAINER_EXTENSIONS.get(os.path.splitext(out_file)[1].lower())
+        refused, subtitles, text_codec = CONTAINER_LIMITS.get(container, (set(), None, "srt"))
+        for track in self.tracks:
+            if track.action != COPY:
+                continue
+            if track.kind in refused:
+                self.drop(track)
+            elif track.kind == "subtitle" and (track.codec == "mov_text" if subtitles is None
+                                               else track.codec not in subtitles):
+                if text_codec and track.codec in TEXT_SUBTITLE_CODECS:
+                    self.transcode(track, text_codec)
+                else:
+                    self.drop(track)  # Bitmap subtitles have no mapping here
+
+    def apply(self, command, source, output):
+        """Adds maps/options for every kept track to output (source is the FfmpegCommand input)."""
+        self.fit_container(output.path, output.get("-f"))
+        out_index = 0
+        for track in self.tracks:
+            if track.action == DROP:
+                continue
+            if track.action == REPLACE:
+                replacement = command.add_input(track.source)
+                output.map(replacement, "a:0")
+                if track.index is not None and track.disposition is not None:
+                    flags = [flag for flag, on in track.disposition.items() if on]
+                    output.set(f"-disposition:{out_index}", "+".join(flags) or "0")
+            else:
+                output.map(source, track.index)
+            if track.index is not None:
+                # Any per-stream mapping turns off ffmpeg's automatic copy for all streams, so every
+                # stream from the source is mapped; a replacement takes the replaced stream's tags
+                output.set(f"-map_metadata:s:{out_index}", f"{source.index}:s:{track.index}")
+            if track.action == REPLACE and track.language:
+                output.set(f"-metadata:s:{out_index}", f"language={track.language}")
+            if track.action == COPY:
+                output.set(f"-c:{out_index}", "copy")
+            for key, value in track.codec_options.items():
+                output.set(f"-{key}:{out_index}", value)
+            if track.filters:
+                output.set(f"-filter:{out_index}", ",".join(track.filters))
+            out_index += 1
+        if self.keep_metadata:
+            output.set("-map_metadata", source.index)
+        if self.keep_chapters:
+            output.set("-map_chapters", source.index)
+        return output
@@ -1,37 +1,33 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import subprocess
-import json
 import os
 import threading
 import sys
+import time
+
+import capabilities
+import checkpoint
+import eta
+import ffmpeg_common
+import ffmpeg_metrics
+import governor
+import output_cache
+import output_mux
+import proxy
+from ffmpeg_common import FRAME_RATES, RESOLUTIONS
 
 # // --- Constants ---
-RESOLUTIONS = {
-    "Source": None,
-    "720p": (1280, 720),
-    "1080p": (1920, 1080),
-    "1440p": (2560, 1440),
-    "4k": (3840, 2160),
-}
-FRAME_RATES = {
-    "Source": None,
-    "30fps": 30,
-    "60fps": 60,
-}
 FFMPEG_PATH = "ffmpeg"  # // Assume in PATH
-FFPROBE_PATH = "ffprobe" # // Assume in PATH
 
 # // --- Helper Functions ---
-def check_ffmpeg():
-    """Checks if ffmpeg and ffprobe are accessible."""
-    try:
-        subprocess.run([FFMPEG_PATH, "-version"], capture_output=True, check=True, startupinfo=get_startup_info())
-        subprocess.run([FFPROBE_PATH, "-version"], capture_output=True, check=True, startupinfo=get_startup_info())
+def check_ffmpeg(caps=None):
+    """Checks if ffmpeg and ffprobe are accessible (cached capability check)."""
+    caps = caps or capabilities.detect()
+    if caps["ffmpeg"] and caps["ffprobe"]:
         return True
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        messagebox.showerror("Error", "ffmpeg or ffprobe not found. Please install ffmpeg and ensure it's in your system's PATH.")
-        return False
+    messagebox.showerror("Error", "ffmpeg or ffprobe not found. Please install ffmpeg and ensure it's in your system's PATH.")
+    return False
 
 def get_startup_info():
     """Hides console window on Windows when running subprocess."""
@@ -47,15 +43,7 @@ def get_video_info(filepath):
     if not filepath:
         return None, None, None
     try:
-        command = [
-            FFPROBE_PATH,
-            "-v", "quiet",
-            "-print_format", "json",
-            "-show_streams",
-            filepath
-        ]
-        result = subprocess.run(command, capture_output=True, text=True, check=True, startupinfo=get_startup_info())
-        data = json.loads(result.stdout)
+        data = ffmpeg_common.probe(filepath) # // Cached per file content (app_cache.file_key)
 
         video_stream = next((stream for stream in data.get("streams", []) if stream.get("codec_type") == "video"), None)
 
@@ -85,13 +73,15 @@ class VideoUpscalerApp:
     def __init__(self, master):
         self.master = master
         master.title("Video Upscaler")
-        master.geometry("550x400")
+        master.geometry("550x430")
 
         self.filepath = tk.StringVar()
         self.source_resolution = tk.StringVar(value="N/A")
         self.source_framerate = tk.StringVar(value="N/A")
         self.target_resolution = tk.StringVar(value=list(RESOLUTIONS.keys())[0])
         self.target_framerate = tk.StringVar(value=list(FRAME_RATES.keys())[0])
+        self.proxy_var = tk.BooleanVar(value=False)
+        self.resumable_var = tk.BooleanVar(value=False)
         self.status = tk.StringVar(value="Ready. Select a video file.")
         self.processing_thread = None
         self.source_info = {'width': None, 'height': None, 'fps': None}
@@ -120,6 +110,8 @@ class VideoUpscalerApp:
         tk.Label(settings_frame, text="Target Frame Rate:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
         self.fps_dropdown = ttk.Combobox(settings_frame, textvariable=self.target_framerate, values=list(FRAME_RATES.keys()), state="readonly")
         self.fps_dropdown.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        tk.Checkbutton(settings_frame, text="Also write 540p editing proxy", variable=self.proxy_var).grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        tk.Checkbutton(settings_frame, text="Resumable (checkpointed segments)", variable=self.resumable_var).grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky="w")
 
         # // Action Button
         self.process_button = tk.Button(master, text="Start Processing", command=self.start_processing, state="disabled")
@@ -192,7 +184,7 @@ class VideoUpscalerApp:
         # // Run in thread
         self.processing_thread = threading.Thread(
             target=self.run_ffmpeg,
-            args=(input_file, output_file, res_key, fps_key),
+            args=(input_file, output_file, res_key, fps_key, self.proxy_var.get(), self.resumable_var.get()),
             daemon=True
         )
         self.processing_thread.start()
@@ -208,87 +200,93 @@ class VideoUpscalerApp:
             self.process_button.config(state="normal") # // Re-enable button
 
 
-    def run_ffmpeg(self, input_file, output_file, res_key, fps_key):
+    def run_ffmpeg(self, input_file, output_file, res_key, fps_key, make_proxy=False, resumable=False):
         """Constructs and executes the ffmpeg command."""
-        target_res = RESOLUTIONS.get(res_key)
-        target_fps = FRAME_RATES.get(fps_key)
-
         if output_file == input_file:
              messagebox.showerror("Error", "Output file cannot be the same as input file.")
              self.status.set("Error: Output file conflict.")
              return
 
-        command = [FFMPEG_PATH, "-hide_banner", "-y"] # // -y overwrites
-
-        # // --- Input and Hardware Acceleration (Attempt) ---
-        # // Simple attempt, may need specific checks per platform/build
-        # // Add '-hwaccel cuda', '-hwaccel qsv', etc. *before* -i if desired
-        # // command.extend(["-hwaccel", "cuda"]) # // Example: uncomment if needed
-        command.extend(["-i", input_file])
-
-        # // --- Video Filters ---
-        vf_options = []
-        # // Scaling
-        if target_res:
-            # // Only scale up
-            if target_res[0] > self.source_info['width'] or target_res[1] > self.source_info['height']:
-                 # // Simple scale to fit within target, may add bars depending on source aspect ratio
-                 # // To force exact dimensions and potentially crop/distort: scale={target_res[0]}:{target_res[1]}
-                 # // To letter/pillarbox: scale=w={target_res[0]}:h={target_res[1]}:force_original_aspect_ratio=decrease,pad={target_res[0]}:{target_res[1]}:(ow-iw)/2:(oh-ih)/2:color=black
-                 scale_filter = f"scale={target_res[0]}:{target_res[1]}"
-                 vf_options.append(scale_filter)
-            else:
-                 print(f"Skipping resolution change: Target {res_key} is not larger than source.")
-
-
-        if vf_options:
-            command.extend(["-vf", ",".join(vf_options)])
-
-        # // --- Frame Rate ---
-        if target_fps:
-             # // Only change if different and greater than source (optional check)
-             if target_fps != self.source_info['fps']: # and target_fps > self.source_info['fps']:
-                 command.extend(["-r", str(target_fps)])
-
-
-        # // --- Encoding ---
-        # // Try hardware encoder first (NVIDIA example)
-        encoder = "h264_nvenc" # // NVIDIA HW encoder
-        # // encoder = "h264_qsv" # // Intel HW encoder
-        # // encoder = "hevc_nvenc" # // NVIDIA HEVC HW encoder
-        # // encoder = "libx264" # // Software fallback
-        # // Need a way to check availability, falling back to libx264 for now if HW fails
-        command.extend(["-c:v", encoder])
-        command.extend(["-preset", "fast"]) # // Adjust preset as needed
-        command.extend(["-cq", "23"])       # // Adjust quality as needed
-
-        # // --- Audio ---
-        command.extend(["-c:a", "copy"]) # // Copy audio stream
+        # // Scale up only (plain scale, may distort another aspect ratio), new frame rate only if it
+        # // differs, copy audio; NVENC when this ffmpeg has it, libx264 otherwise (shared with pipeline.py)
+        encoder = "h264_nvenc" if capabilities.has_encoder(capabilities.detect(), "h264_nvenc") else "libx264"
+        command = ffmpeg_common.upscale_command(FFMPEG_PATH, input_file, output_file, self.source_info['width'],
+                                                self.source_info['height'], self.source_info['fps'],
+                                                res_key, fps_key, encoder)
+        source, output = command.inputs[0], command.outputs[0]
 
         # // --- Output ---
-        command.append(output_file)
+        output_mux.apply(output) # // faststart/fragmented MP4 layout
+        cache_key = output_cache.job_key([input_file], [command])
 
         # // --- Execute ---
         try:
-            print("Executing FFmpeg command:")
-            print(" ".join(command)) # // For debugging
-            process = subprocess.Popen(command,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE,
-                                     text=True,
-                                     creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0,
-                                     startupinfo=get_startup_info())
-
-            # // Simple wait, no live progress yet
-            stdout, stderr = process.communicate()
-
-            if process.returncode == 0:
+            # // Same input, settings and ffmpeg version as an earlier run: reuse its output
+            if output_cache.fetch(cache_key, output_file):
+                if make_proxy and not proxy.is_current(output_file, proxy.proxy_path(output_file)):
+                    ffmpeg_common.run_command(proxy.proxy_command(FFMPEG_PATH, output_file, proxy.proxy_path(output_file)).build(), stage="proxy")
+                self.status.set(f"Processing complete (cached)! Saved as {os.path.basename(output_file)}")
+                messagebox.showinfo("Success", f"Video processed successfully!\nOutput: {output_file}")
+                return
+
+            # // Checkpointed segments: rerunning the same job after a crash resumes it
+            resumable = resumable and checkpoint.supports(command)
+            # // Probed once for the proxy timecode and the ETA; an unreadable header only loses those
+            try:
+                info = ffmpeg_common.probe(input_file)
+            except ffmpeg_common.PROBE_ERRORS:
+                info = None
+            if make_proxy and not resumable:
+                # // 540p proxy from the same decode, at the output frame rate (cache key covers the main output only)
+                proxy.add_output(command, source, proxy.proxy_path(output_file), fps=output.get("-r"),
+                                 timecode=proxy.source_timecode(info) if info is not None else None)
+
+            # // ETA from earlier runs, refined by the live progress below
+            features = eta.job_features("upscale", info, command) if info is not None else None
+            tracker = eta.Progress(features["duration"], eta.predict(features)) if features else None
+            if tracker and tracker.predicted is not None:
+                self.master.after(0, self.status.set, f"Processing... about {eta.format_seconds(tracker.predicted)}")
+            started = time.monotonic()
+
+            with governor.lease("upscale") as budget:
+                budget.apply(command) # // -threads share of the core budget
+                print("Executing FFmpeg command:")
+                print(" ".join(command.build())) # // For debugging
+                if resumable:
+                    returncode, stderr = checkpoint.run(command, lease=budget, stage="upscale",
+                                                        progress=lambda text: self.master.after(0, self.status.set, text))
+                else:
+                    process = ffmpeg_metrics.TracedPopen(command.build(), stage="upscale", lease=budget,
+                                             stdout=subprocess.DEVNULL,
+                                             stderr=subprocess.PIPE,
+                                             text=True,
+                                             creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0,
+                                             startupinfo=get_startup_info())
+
+                    # // Live progress from ffmpeg's stats lines (text mode splits on their \r)
+                    stderr = ""
+                    for line in process.stderr:
+                        stderr += line
+                        process.feed(line)
+                        if tracker and tracker.update(line) is not None:
+                            self.master.after(0, self.status.set, f"Processing... {tracker.describe()}")
+                    returncode = process.wait()
+            elapsed = time.monotonic() - started
+            if resumable or make_proxy:
+                features = None # // Partial (resumed) or proxy-laden runs would skew the ETA history
+
+            if returncode == 0 and make_proxy and resumable:
+                ffmpeg_common.run_command(proxy.proxy_command(FFMPEG_PATH, output_file, proxy.proxy_path(output_file)).build(), stage="proxy")
+            if returncode == 0:
+                output_cache.store(cache_key, output_file)
+                if features:
+                    eta.record(features, elapsed)
                 self.status.set(f"Processing complete! Saved as {os.path.basename(output_file)}")
                 messagebox.showinfo("Success", f"Video processed successfully!\nOutput: {output_file}")
             else:
                 # // Try fallback encoder if specific HW encoder failed? (more complex)
                 # // For now, just report error.
-                error_message = f"FFmpeg Error (code {process.returncode}):\n{stderr[-500:]}" # // Show last bit of stderr
+                error_message = f"FFmpeg Error (code {returncode}):\n{stderr[-500:]}" # // Show last bit of stderr
                 print(error_message)
                 self.status.set("Error during processing.")
                 messagebox.showerror("FFmpeg Error", error_message)
@@ -302,10 +300,21 @@ class VideoUpscalerApp:
 
 
 # // --- Main Execution ---
-if __name__ == "__main__":
-    if not check_ffmpeg():
-        sys.exit(1) # // Exit if ffmpeg/ffprobe missing
-
+def main():
+    """Shows the window first, then checks ffmpeg/ffprobe in the background."""
+    ffmpeg_metrics.serve_from_env()
     root = tk.Tk()
     app = VideoUpscalerApp(root)
+
+    def on_capabilities(caps):
+        if not check_ffmpeg(caps):
+            root.destroy() # // Exit if ffmpeg/ffprobe missing
+        elif caps.get("error"):
+            app.status.set(caps["error"]) # // Runs without the encoder list (libx264)
+
+    capabilities.detect_async(lambda caps: root.after(0, on_capabilities, caps))
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()